@@ -8,6 +8,7 @@ from app.api.deps import get_db, get_current_superuser
 from app.models.metadata import User
 from app.schemas.user import UserListOut, UserStatusUpdate, UserUpdateByAdmin, UsersListResponse
 from app.core.security import get_password_hash
+from app.services.vanna.vector_store_maintenance import VectorStoreMaintenance
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -229,3 +230,64 @@ def update_user(
     )
     
     return user
+
+
+# ========== 向量存储维护 ==========
+
+@router.get("/vector-store/stats")
+def get_vector_store_stats(
+    current_user: User = Depends(get_current_superuser)
+):
+    """
+    获取 PGVector 向量表和索引的大小统计
+
+    权限：仅超级管理员
+    """
+    try:
+        return VectorStoreMaintenance.get_storage_stats()
+    except Exception as e:
+        logger.error(f"获取向量存储统计失败: {e}")
+        raise HTTPException(status_code=500, detail=f"获取向量存储统计失败: {str(e)}")
+
+
+@router.post("/vector-store/indexes")
+def ensure_vector_store_indexes(
+    method: Optional[str] = Query(None, description="向量索引类型: hnsw, ivfflat, none，默认使用配置值"),
+    fix_dimension: bool = Query(False, description="将未声明维度的 embedding 列收紧为 vector(N)（锁表并重写整张表）"),
+    current_user: User = Depends(get_current_superuser)
+):
+    """
+    创建缺失的向量索引并返回校验结果
+
+    embedding 列未声明维度时需要 fix_dimension=true 才会创建向量索引：ALTER TABLE 持有
+    ACCESS EXCLUSIVE 锁并重写共享的向量表，应在维护窗口执行。
+
+    权限：仅超级管理员
+    """
+    try:
+        result = VectorStoreMaintenance.ensure_indexes(method, fix_dimension=fix_dimension)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        logger.error(f"创建向量索引失败: {e}")
+        raise HTTPException(status_code=500, detail=f"创建向量索引失败: {str(e)}")
+
+    logger.warning(f"Admin {current_user.email} 创建/校验向量索引，method={method}, fix_dimension={fix_dimension}")
+    return result
+
+
+@router.post("/vector-store/vacuum")
+def vacuum_vector_store(
+    current_user: User = Depends(get_current_superuser)
+):
+    """
+    对向量表执行 VACUUM (ANALYZE)，回收已删除向量占用的空间
+
+    权限：仅超级管理员
+    """
+    try:
+        VectorStoreMaintenance.vacuum()
+        return VectorStoreMaintenance.get_storage_stats()
+    except Exception as e:
+        logger.error(f"向量表 VACUUM 失败: {e}")
+        raise HTTPException(status_code=500, detail=f"向量表 VACUUM 失败: {str(e)}")
@@ -1,24 +1,29 @@
 from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import StreamingResponse, Response
+from fastapi.responses import FileResponse, StreamingResponse, Response
 from sqlalchemy.orm import Session, selectinload
 import pandas as pd
+import asyncio
 import json
 import uuid
 from datetime import datetime
+from typing import IO, Any, Dict, Iterator, Optional, Tuple
 
-from app.db.session import get_db
+from app.db.session import get_db, SessionLocal
 from app.api.deps import get_current_user, apply_ownership_filter
-from app.models.metadata import User, Dataset, ChatSession, ChatMessage
+from app.models.metadata import User, Dataset, ChatSession, ChatMessage, ExportJob
 from app.schemas.chat import (
     ChatRequest, ChatResponse, FeedbackRequest, FeedbackResponse,
     SummaryRequest, SummaryResponse, InputSuggestRequest, InputSuggestResponse,
-    FollowupSuggestRequest, FollowupSuggestResponse, ExportRequest
+    FollowupSuggestRequest, FollowupSuggestResponse, ExportRequest, ExportJobResponse
 )
 from app.services.vanna import VannaSqlGenerator, VannaAnalystService, VannaTrainingService
 from app.services.vanna_manager import VannaAgentManager
 from app.services.data_exporter import DataExporter
 from app.services.input_suggester import InputSuggester
 from app.services.enhanced_exporter import EnhancedExporter
+from app.services.query_exporter import COLUMNAR_FORMATS, QueryExporter
+from app.services.excel_writer import iter_file
+from app.services.export_job_service import ExportJobService
 from app.core.logger import get_logger
 from app.core.config import settings
 
@@ -504,6 +509,66 @@ async def agent_chat_simple(
 # 数据导出 API (Export)
 # =============================================================================
 
+def _load_export_target(
+    db: Session, current_user: User, dataset_id: Any, sql: str
+) -> Tuple[Dataset, Dict[str, Any], str]:
+    """
+    服务端重新执行导出 SQL 前的校验：数据集访问权限、SQL 必须为单条只读查询
+    
+    Returns:
+        tuple: (数据集, 执行目标, 校验后的 SQL)
+    """
+    ds_query = db.query(Dataset).filter(Dataset.id == dataset_id)
+    ds_query = apply_ownership_filter(ds_query, Dataset, current_user)
+    dataset = ds_query.first()
+    
+    if not dataset:
+        raise HTTPException(status_code=404, detail="Dataset not found or access denied")
+    
+    try:
+        sql = QueryExporter.validate_sql(sql)
+        target = QueryExporter.resolve_target(dataset)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return dataset, target, sql
+
+
+async def _open_export_frames(target: Dict[str, Any], sql: str) -> Iterator[pd.DataFrame]:
+    """重新执行 SQL 并返回分块迭代器（第一块读取失败时返回 400）"""
+    try:
+        return await asyncio.to_thread(QueryExporter.open_frames, target, sql)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"SQL 执行错误: {str(e)}")
+
+
+def _file_response(file: IO[bytes], filename: str, media_type: str) -> StreamingResponse:
+    """按块读取导出的临时文件返回，发送完成后关闭文件"""
+    return StreamingResponse(
+        iter_file(file),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}",
+            "Access-Control-Expose-Headers": "Content-Disposition"
+        }
+    )
+
+
+async def _stream_csv_export(target: Dict[str, Any], sql: str, filename: str) -> StreamingResponse:
+    """重新执行 SQL 并以 CSV 流返回（第一块读取失败时返回 400）"""
+    try:
+        stream = await asyncio.to_thread(QueryExporter.open_csv_stream, target, sql)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"SQL 执行错误: {str(e)}")
+    return StreamingResponse(
+        stream,
+        media_type="text/csv",
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}",
+            "Access-Control-Expose-Headers": "Content-Disposition"
+        }
+    )
+
+
 @router.post("/export/excel")
 async def export_to_excel(
     request: dict,
@@ -517,6 +582,7 @@ async def export_to_excel(
         request: {
             "dataset_id": int,
             "question": str,
+            "sql": str (optional，提供时在服务端重新执行 SQL 导出完整结果，忽略 columns / rows),
             "columns": List[str],
             "rows": List[Dict],
             "filename_prefix": str (optional)
@@ -531,6 +597,24 @@ async def export_to_excel(
         rows = request.get("rows", [])
         question = request.get("question", "分析结果")
         
+        if request.get("sql"):
+            # 服务端重新执行 SQL，按块写入 Excel 临时文件后流式返回
+            _, target, sql = _load_export_target(db, current_user, dataset_id, request["sql"])
+            frames = await _open_export_frames(target, sql)
+            filename = DataExporter.generate_filename(question, "xlsx")
+            output, _ = await asyncio.to_thread(
+                DataExporter.export_frames_to_excel, frames, None, question[:20]
+            )
+            logger.info(
+                "Excel export completed",
+                user_id=current_user.id,
+                dataset_id=dataset_id,
+                filename=filename
+            )
+            return _file_response(
+                output, filename, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            )
+        
         # 验证Dataset访问权限
         ds_query = db.query(Dataset).filter(Dataset.id == dataset_id)
         ds_query = apply_ownership_filter(ds_query, Dataset, current_user)
@@ -592,6 +676,7 @@ async def export_to_csv(
         request: {
             "dataset_id": int,
             "question": str,
+            "sql": str (optional，提供时在服务端重新执行 SQL 并分块流式输出完整结果，忽略 columns / rows),
             "columns": List[str],
             "rows": List[Dict],
             "filename_prefix": str (optional)
@@ -606,6 +691,17 @@ async def export_to_csv(
         rows = request.get("rows", [])
         question = request.get("question", "分析结果")
         
+        if request.get("sql"):
+            _, target, sql = _load_export_target(db, current_user, dataset_id, request["sql"])
+            filename = DataExporter.generate_filename(question, "csv")
+            logger.info(
+                "CSV export started",
+                user_id=current_user.id,
+                dataset_id=dataset_id,
+                filename=filename
+            )
+            return await _stream_csv_export(target, sql, filename)
+        
         # 验证Dataset访问权限
         ds_query = db.query(Dataset).filter(Dataset.id == dataset_id)
         ds_query = apply_ownership_filter(ds_query, Dataset, current_user)
@@ -813,6 +909,8 @@ async def export_result(
     - excel_with_chart: Excel 文件（含图表，暂时等同于 excel）
     - pdf: PDF 报告（含数据分析和洞察）
     - csv: CSV 文件（仅数据）
+    - parquet: Parquet 文件（仅数据，列式）
+    - arrow: Arrow IPC 文件（仅数据，列式）
     
     导出内容包括：
     - 查询数据
@@ -821,6 +919,9 @@ async def export_result(
     - 数据解读
     - 波动归因分析
     
+    请求同时包含 sql 和 dataset_id 时，在服务端重新执行 SQL 导出完整结果（CSV 分块流式输出），
+    否则使用请求中的 columns / rows。大结果的 PDF / Excel 建议使用 /chat/export-jobs 异步导出。
+    
     Args:
         request: 包含问题、数据、分析结果的导出请求
         db: 数据库会话
@@ -830,12 +931,51 @@ async def export_result(
         StreamingResponse 或 Response: 文件流
     """
     try:
+        columns, rows = request.columns, request.rows
+        if request.sql and request.dataset_id is not None:
+            _, target, sql = _load_export_target(db, current_user, request.dataset_id, request.sql)
+            if request.format == "csv":
+                filename = DataExporter.generate_filename(request.question, "csv")
+                logger.info("Export started", user_id=current_user.id, format=request.format, filename=filename)
+                return await _stream_csv_export(target, sql, filename)
+            if request.format in ("excel", "excel_with_chart"):
+                # 按块写入 Excel 临时文件后流式返回
+                frames = await _open_export_frames(target, sql)
+                output, filename = await asyncio.to_thread(
+                    EnhancedExporter.export_excel_file,
+                    request.question, request.sql, frames, request.chart_type,
+                    request.insight, request.data_interpretation, request.fluctuation_analysis
+                )
+                logger.info("Export completed", user_id=current_user.id, format=request.format, filename=filename)
+                return _file_response(
+                    output, filename, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                )
+            if request.format in COLUMNAR_FORMATS:
+                # DuckDB / 数据库游标直接生成 Arrow 列式数据写入临时文件，不经过 pandas
+                try:
+                    output, row_count = await asyncio.to_thread(
+                        QueryExporter.open_columnar, target, sql, request.format
+                    )
+                except Exception as e:
+                    raise HTTPException(status_code=400, detail=f"SQL 执行错误: {str(e)}")
+                filename = DataExporter.generate_filename(request.question, COLUMNAR_FORMATS[request.format])
+                logger.info(
+                    "Export completed", user_id=current_user.id, format=request.format,
+                    filename=filename, rows=row_count
+                )
+                return _file_response(output, filename, ExportJobService.media_type(filename))
+            try:
+                df = await asyncio.to_thread(QueryExporter.fetch_all, target, sql)
+            except Exception as e:
+                raise HTTPException(status_code=400, detail=f"SQL 执行错误: {str(e)}")
+            columns, rows = df.columns.tolist(), df.to_dict(orient="records")
+        
         # 调用增强导出服务
         file_bytes, filename = await EnhancedExporter.export_with_metadata(
             question=request.question,
             sql=request.sql,
-            columns=request.columns,
-            rows=request.rows,
+            columns=columns,
+            rows=rows,
             chart_type=request.chart_type,
             chart_data=request.chart_data,
             insight=request.insight,
@@ -844,13 +984,8 @@ async def export_result(
             export_format=request.format
         )
         
-        # 确定 MIME 类型
-        if request.format == "pdf":
-            media_type = "application/pdf"
-        elif request.format == "csv":
-            media_type = "text/csv"
-        else:  # excel 和 excel_with_chart
-            media_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        # 按实际文件名确定 MIME 类型（PDF / 列式导出失败时会降级为 Excel）
+        media_type = ExportJobService.media_type(filename)
         
         logger.info(
             "Export completed",
@@ -870,6 +1005,8 @@ async def export_result(
             }
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(
             "Export failed",
@@ -879,3 +1016,117 @@ async def export_result(
             exc_info=True
         )
         raise HTTPException(status_code=500, detail=f"导出失败: {str(e)}")
+
+
+# ========== 异步导出任务 ==========
+
+def _get_owned_export_job(db: Session, job_id: int, current_user: User) -> ExportJob:
+    job = db.query(ExportJob).filter(ExportJob.id == job_id).first()
+    if not job or (job.owner_id != current_user.id and not current_user.is_superuser):
+        raise HTTPException(status_code=404, detail="导出任务不存在")
+    return job
+
+
+@router.post("/export-jobs", response_model=ExportJobResponse, status_code=202)
+async def create_export_job(
+    request: ExportRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    创建异步导出任务
+    
+    请求需要包含 sql 和 dataset_id：导出文件在进程池中重新执行 SQL 渲染，不阻塞其他请求。
+    相同查询、数据版本、格式和报告内容的导出文件已存在时，任务直接完成（from_cache 为真）。
+    状态通过 GET /chat/export-jobs/{job_id} 轮询或 GET /chat/export-jobs/{job_id}/events（SSE）获取，
+    完成后通过 GET /chat/export-jobs/{job_id}/download 下载。
+    """
+    if not request.sql or request.dataset_id is None:
+        raise HTTPException(status_code=400, detail="异步导出需要提供 sql 和 dataset_id")
+    
+    dataset, target, sql = _load_export_target(db, current_user, request.dataset_id, request.sql)
+    params = request.model_dump(
+        mode="json",
+        include={"question", "chart_type", "insight", "data_interpretation", "fluctuation_analysis"}
+    )
+    try:
+        job = ExportJobService.create_job(db, current_user.id, dataset, sql, request.format, params)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if job.status == "pending":
+        ExportJobService.start(job.id, target)
+    return ExportJobResponse(**ExportJobService.to_dict(job))
+
+
+@router.get("/export-jobs/{job_id}", response_model=ExportJobResponse)
+async def get_export_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """查询导出任务状态"""
+    job = _get_owned_export_job(db, job_id, current_user)
+    return ExportJobResponse(**ExportJobService.to_dict(job))
+
+
+def _load_export_job_payload(job_id: int) -> Optional[Dict]:
+    """读取导出任务状态（在线程中执行，避免同步查询阻塞事件循环）"""
+    session = SessionLocal()
+    try:
+        job = session.query(ExportJob).filter(ExportJob.id == job_id).first()
+        return ExportJobResponse(**ExportJobService.to_dict(job)).model_dump(mode="json") if job else None
+    finally:
+        session.close()
+
+
+@router.get("/export-jobs/{job_id}/events")
+async def stream_export_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """以 Server-Sent Events 推送导出任务状态，任务结束后关闭连接"""
+    _get_owned_export_job(db, job_id, current_user)
+    
+    async def event_stream():
+        last_payload = None
+        while True:
+            payload = await asyncio.to_thread(_load_export_job_payload, job_id)
+            if payload is None:
+                break
+            if payload != last_payload:
+                yield f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+                last_payload = payload
+            if payload["status"] in ExportJobService.TERMINAL_STATUSES:
+                break
+            await asyncio.sleep(settings.EXPORT_JOB_POLL_INTERVAL)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.get("/export-jobs/{job_id}/download")
+async def download_export_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """下载已完成任务的导出文件"""
+    job = _get_owned_export_job(db, job_id, current_user)
+    if job.status != "completed":
+        raise HTTPException(status_code=409, detail=f"导出任务尚未完成，当前状态: {job.status}")
+    
+    path = ExportJobService.artifact_path(job)
+    if path is None:
+        raise HTTPException(status_code=410, detail="导出文件已过期，请重新导出")
+    
+    return FileResponse(
+        path,
+        media_type=ExportJobService.media_type(job.filename),
+        filename=job.filename,
+        headers={"Access-Control-Expose-Headers": "Content-Disposition"}
+    )
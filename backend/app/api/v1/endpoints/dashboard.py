@@ -1,26 +1,41 @@
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import List
-from datetime import datetime, date
-from decimal import Decimal
-import pandas as pd
+from datetime import datetime
+import asyncio
+import json
 import logging
+import time
 
 from app.db.session import get_db
 from app.api.deps import get_current_user, apply_ownership_filter
-from app.models.metadata import Dashboard, DashboardCard, Dataset, User, DashboardTemplate
+from app.models.metadata import (
+    Dashboard,
+    DashboardCard,
+    Dataset,
+    User,
+    DashboardTemplate,
+    DashboardSchedule,
+    DashboardRefreshRun
+)
 from app.schemas.dashboard import (
     DashboardCreate,
     DashboardResponse,
     DashboardCardCreate,
     DashboardCardResponse,
     DashboardCardDataResponse,
+    DashboardCardRefreshUpdate,
     DashboardTemplateCreate,
     DashboardTemplateUpdate,
     DashboardTemplateResponse,
-    DashboardTemplateListResponse
+    DashboardTemplateListResponse,
+    DashboardScheduleUpdate,
+    DashboardScheduleResponse,
+    DashboardRefreshRunResponse
 )
-from app.services.db_inspector import DBInspector
+from app.services.dashboard_service import DashboardService, is_connection_error
+from app.services.dashboard_scheduler import compute_next_run, validate_schedule
 from sqlalchemy import or_
 
 router = APIRouter()
@@ -122,7 +137,10 @@ def add_card(
         dataset_id=card_in.dataset_id,
         sql=card_in.sql,
         chart_type=card_in.chart_type,
-        layout=card_in.layout
+        layout=card_in.layout,
+        refresh_mode=card_in.refresh_mode or "full",
+        time_column=card_in.time_column,
+        incremental_window_days=card_in.incremental_window_days
     )
     db.add(card)
     
@@ -135,39 +153,39 @@ def add_card(
 
 
 @router.get("/cards/{id}/data", response_model=DashboardCardDataResponse)
-def get_card_data(
+async def get_card_data(
     id: int,
+    refresh: bool = False,
+    full: bool = False,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """
     刷新卡片数据 - 执行 SQL 并返回结果
-    """
-    # 获取卡片
-    card = db.query(DashboardCard).filter(DashboardCard.id == id).first()
-    if not card:
-        raise HTTPException(status_code=404, detail="Card not found")
     
-    # 获取关联的数据集
-    dataset = db.query(Dataset).filter(Dataset.id == card.dataset_id).first()
-    if not dataset:
-        raise HTTPException(status_code=404, detail="Dataset not found")
+    结果按卡片 SQL + 数据版本缓存：新鲜期内直接返回缓存，过期后先返回旧结果并在后台刷新，
+    响应中的 cache_status / data_age_seconds 表示数据新旧。refresh=true 时强制重新查询。
     
-    # 获取数据源
-    datasource = dataset.datasource
-    if not datasource:
-        raise HTTPException(status_code=404, detail="DataSource not found")
+    折线图/面积图/散点图等结果超过 CHART_MAX_POINTS 行时返回降采样后的图表数据
+    （downsample_method 为降采样方法，row_count 为完整行数），full=true 时返回完整结果。
+    """
+    # 一次查询获取卡片、数据集和数据源（同步的数据库查询和引擎创建在线程中执行，不阻塞事件循环）
+    try:
+        query = await asyncio.to_thread(DashboardService.load_card_query, db, id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    if not query:
+        raise HTTPException(status_code=404, detail="Card not found")
     
-    # 执行 SQL
+    # 执行 SQL（或读取缓存）
     try:
-        engine = DBInspector.get_engine(datasource)
-        df = pd.read_sql(card.sql, engine)
+        return await DashboardService.get_card_data(query, refresh=refresh, full=full)
     except Exception as e:
         error_msg = str(e)
         logger.error(f"SQL Execution failed for card {id}: {error_msg}")
         
         # 区分错误类型：SQL 语法错误 vs 数据库连接错误
-        if "Lost connection" in error_msg or "Connection reset" in error_msg:
+        if is_connection_error(e):
             # 数据库连接问题，500 错误
             raise HTTPException(
                 status_code=500,
@@ -179,27 +197,62 @@ def get_card_data(
                 status_code=400,
                 detail=f"SQL 执行错误: {error_msg}"
             )
+
+
+def _load_dashboard_queries(db: Session, id: int, current_user: User) -> List[dict]:
+    """校验看板权限并加载全部卡片的查询"""
+    query = db.query(Dashboard).filter(Dashboard.id == id)
+    query = apply_ownership_filter(query, Dashboard, current_user)
+    if not query.first():
+        raise HTTPException(status_code=404, detail="Dashboard not found or access denied")
+    return DashboardService.load_dashboard_queries(db, id)
+
+
+@router.get("/{id}/data")
+async def get_dashboard_data(
+    id: int,
+    refresh: bool = False,
+    full: bool = False,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    批量刷新看板全部卡片
     
-    # 数据序列化
-    def serialize(obj):
-        if isinstance(obj, (date, datetime)):
-            return obj.isoformat()
-        if isinstance(obj, Decimal):
-            return float(obj)
-        return obj
-    
-    rows = df.to_dict(orient='records')
-    cleaned_rows = []
-    for row in rows:
-        new_row = {}
-        for k, v in row.items():
-            new_row[k] = serialize(v)
-        cleaned_rows.append(new_row)
-    
-    return {
-        "columns": df.columns.tolist(),
-        "rows": cleaned_rows
-    }
+    一次查询加载所有卡片的元数据，并发执行卡片 SQL（同一数据源的并发数受
+    DASHBOARD_DATASOURCE_CONCURRENCY 限制），每张卡片执行完成即输出一行 NDJSON：
+    
+    - {"type": "card", "card_id", "title", "chart_type", "columns", "rows", "row_count", "elapsed_ms", "error",
+      "downsample_method", "cache_status", "cached_at", "data_age_seconds"}
+    - 最后一行 {"type": "done", "cards", "errors", "elapsed_ms"}
+    
+    单张卡片失败时 error 为错误信息，其他卡片照常返回。卡片结果缓存和降采样规则同 /cards/{id}/data，
+    refresh=true 时全部重新查询。
+    """
+    # 同步的数据库查询和引擎创建在线程中执行，不阻塞事件循环
+    card_queries = await asyncio.to_thread(_load_dashboard_queries, db, id, current_user)
+    
+    async def generate_stream():
+        start = time.perf_counter()
+        errors = 0
+        async for result in DashboardService.iter_card_results(card_queries, refresh=refresh, full=full):
+            errors += 1 if result["error"] else 0
+            yield json.dumps({"type": "card", **result}, ensure_ascii=False, default=str) + "\n"
+        yield json.dumps({
+            "type": "done",
+            "cards": len(card_queries),
+            "errors": errors,
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 2)
+        }) + "\n"
+    
+    return StreamingResponse(
+        generate_stream(),
+        media_type="application/x-ndjson",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # 禁用 Nginx 缓冲
+        }
+    )
 
 
 @router.delete("/cards/{id}")
@@ -239,6 +292,136 @@ def delete_card(
     return {"message": "Card deleted successfully"}
 
 
+@router.patch("/cards/{id}/refresh", response_model=DashboardCardResponse)
+def update_card_refresh(
+    id: int,
+    refresh_in: DashboardCardRefreshUpdate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    设置卡片刷新方式
+    
+    incremental：按时间分组的卡片只重算最近 incremental_window_days 天的时间桶，与缓存中更早的时间桶合并；
+    没有可用缓存、数据版本变化、结果列变化或距上次全量重算超过 DASHBOARD_INCREMENTAL_FULL_REFRESH_SECONDS 时全量重算。
+    """
+    card = db.query(DashboardCard).filter(DashboardCard.id == id).first()
+    if not card:
+        raise HTTPException(status_code=404, detail="Card not found")
+    
+    dashboard = _get_editable_dashboard(db, card.dashboard_id, current_user)
+    
+    card.refresh_mode = refresh_in.refresh_mode
+    card.time_column = refresh_in.time_column
+    card.incremental_window_days = refresh_in.incremental_window_days
+    dashboard.updated_at = datetime.utcnow()
+    
+    db.commit()
+    db.refresh(card)
+    return card
+
+
+# ============ 看板预计算计划 ============
+
+def _get_editable_dashboard(db: Session, id: int, current_user: User) -> Dashboard:
+    query = db.query(Dashboard).filter(Dashboard.id == id)
+    query = apply_ownership_filter(query, Dashboard, current_user)
+    dashboard = query.first()
+    
+    if not dashboard:
+        raise HTTPException(status_code=404, detail="Dashboard not found or access denied")
+    
+    # 额外检查：公共资源只有超级管理员可以修改
+    if dashboard.owner_id is None and not current_user.is_superuser:
+        raise HTTPException(status_code=403, detail="Cannot modify public resources")
+    return dashboard
+
+
+@router.get("/{id}/schedule", response_model=DashboardScheduleResponse)
+def get_dashboard_schedule(
+    id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """获取看板预计算计划"""
+    query = db.query(Dashboard).filter(Dashboard.id == id)
+    query = apply_ownership_filter(query, Dashboard, current_user)
+    dashboard = query.first()
+    
+    if not dashboard or not dashboard.schedule:
+        raise HTTPException(status_code=404, detail="Schedule not found")
+    return dashboard.schedule
+
+
+@router.put("/{id}/schedule", response_model=DashboardScheduleResponse)
+def set_dashboard_schedule(
+    id: int,
+    schedule_in: DashboardScheduleUpdate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    设置看板预计算计划
+    
+    预计算工作进程（run_dashboard_scheduler.py）按 cron 表达式或固定间隔刷新看板全部卡片并写入结果缓存，
+    结果在下次计划刷新前都视为新鲜。cron 按 DASHBOARD_SCHEDULE_TIMEZONE 时区解释，
+    jitter_seconds 为每次执行的随机延后上限。
+    """
+    dashboard = _get_editable_dashboard(db, id, current_user)
+    try:
+        validate_schedule(schedule_in.cron, schedule_in.interval_seconds)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    schedule = dashboard.schedule or DashboardSchedule(dashboard_id=id)
+    schedule.cron = schedule_in.cron
+    schedule.interval_seconds = None if schedule_in.cron else schedule_in.interval_seconds
+    schedule.jitter_seconds = schedule_in.jitter_seconds
+    schedule.enabled = schedule_in.enabled
+    schedule.next_run_at = compute_next_run(schedule)
+    db.add(schedule)
+    db.commit()
+    db.refresh(schedule)
+    return schedule
+
+
+@router.delete("/{id}/schedule")
+def delete_dashboard_schedule(
+    id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """删除看板预计算计划"""
+    dashboard = _get_editable_dashboard(db, id, current_user)
+    if not dashboard.schedule:
+        raise HTTPException(status_code=404, detail="Schedule not found")
+    db.delete(dashboard.schedule)
+    db.commit()
+    return {"message": "Schedule deleted successfully"}
+
+
+@router.get("/{id}/refresh-runs", response_model=List[DashboardRefreshRunResponse])
+def list_dashboard_refresh_runs(
+    id: int,
+    limit: int = 20,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """获取看板预计算执行记录（最新的在前）"""
+    query = db.query(Dashboard).filter(Dashboard.id == id)
+    query = apply_ownership_filter(query, Dashboard, current_user)
+    if not query.first():
+        raise HTTPException(status_code=404, detail="Dashboard not found or access denied")
+    
+    return (
+        db.query(DashboardRefreshRun)
+        .filter(DashboardRefreshRun.dashboard_id == id)
+        .order_by(DashboardRefreshRun.id.desc())
+        .limit(limit)
+        .all()
+    )
+
+
 @router.delete("/{id}")
 def delete_dashboard(
     id: int,
@@ -295,7 +478,10 @@ def save_dashboard_as_template(
             "dataset_id": card.dataset_id,
             "sql": card.sql,
             "chart_type": card.chart_type,
-            "layout": card.layout
+            "layout": card.layout,
+            "refresh_mode": card.refresh_mode,
+            "time_column": card.time_column,
+            "incremental_window_days": card.incremental_window_days
         })
 
     # 创建模板
@@ -410,7 +596,10 @@ def create_dashboard_from_template(
             dataset_id=card_config["dataset_id"],
             sql=card_config["sql"],
             chart_type=card_config["chart_type"],
-            layout=card_config.get("layout")
+            layout=card_config.get("layout"),
+            refresh_mode=card_config.get("refresh_mode") or "full",
+            time_column=card_config.get("time_column"),
+            incremental_window_days=card_config.get("incremental_window_days")
         )
         db.add(card)
 
@@ -26,6 +26,7 @@ from app.schemas.data_table import (
 from app.services.file_etl import FileETLService
 from app.services.data_table_service import DataTableService
 from app.services.vanna import VannaTrainingService
+from app.utils.file_handler import spool_upload
 from app.core.logger import get_logger
 
 logger = get_logger(__name__)
@@ -169,15 +170,16 @@ async def preview_excel(
 ):
     """预览Excel文件"""
     try:
-        # 读取文件内容
-        file_content = await file.read()
-        file_size = len(file_content)
-        
-        # 验证文件
-        FileETLService.validate_file(file.filename, file_size)
+        # 按块写入临时文件并校验
+        upload = await spool_upload(
+            file,
+            allowed_extensions=FileETLService.SUPPORTED_EXTENSIONS,
+            max_size=FileETLService.MAX_FILE_SIZE
+        )
         
         # 预览文件
-        preview_data = FileETLService.preview_excel(file_content, file.filename)
+        with upload:
+            preview_data = FileETLService.preview_excel(upload.path, file.filename)
         
         logger.info("Excel previewed", filename=file.filename, user_id=current_user.id)
         return preview_data
@@ -227,29 +229,34 @@ async def create_data_table(
                     user_id=current_user.id
                 )
             
-            # 读取文件
-            file_content = await file.read()
-            
-            # 解析并预览（获取字段配置）
-            _, fields_info = FileETLService.parse_file_with_types(file_content, file.filename)
-            
-            # 创建字段配置对象
-            from app.schemas.data_table import TableFieldConfig
-            fields_config = [TableFieldConfig(**field) for field in fields_info]
-            
-            # 创建数据表
-            data_table = DataTableService.create_data_table_from_excel(
-                display_name=display_name,
-                file_content=file_content,
-                filename=file.filename,
-                fields_config=fields_config,
-                datasource_id=datasource_id,
-                folder_id=folder_id,
-                description=description,
-                user=current_user,
-                db_session=db
+            # 按块写入临时文件并校验
+            upload = await spool_upload(
+                file,
+                allowed_extensions=FileETLService.SUPPORTED_EXTENSIONS,
+                max_size=FileETLService.MAX_FILE_SIZE
             )
             
+            with upload:
+                # 解析并预览（获取字段配置）
+                _, fields_info = FileETLService.parse_file_with_types(upload.path, file.filename)
+                
+                # 创建字段配置对象
+                from app.schemas.data_table import TableFieldConfig
+                fields_config = [TableFieldConfig(**field) for field in fields_info]
+                
+                # 创建数据表
+                data_table = DataTableService.create_data_table_from_excel(
+                    display_name=display_name,
+                    file_content=upload.path,
+                    filename=file.filename,
+                    fields_config=fields_config,
+                    datasource_id=datasource_id,
+                    folder_id=folder_id,
+                    description=description,
+                    user=current_user,
+                    db_session=db
+                )
+            
             # ===== 新增：自动创建并训练数据集 =====
             
             # 1. 创建 Dataset 记录
@@ -299,6 +306,8 @@ async def create_data_table(
         
     except HTTPException:
         raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error("Failed to create data table", error=str(e), exc_info=True)
         raise HTTPException(status_code=500, detail=f"创建数据表失败: {str(e)}")
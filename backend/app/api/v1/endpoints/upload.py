@@ -2,18 +2,34 @@
 文件上传API端点 - 处理Excel/CSV文件上传和自动分析
 """
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, BackgroundTasks, Form
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List, Dict
+from typing import List, Dict, Optional
+import asyncio
+import json
 import uuid
-import re
 
 from app.db.session import get_db, SessionLocal
 from app.api.deps import get_current_user
-from app.models.metadata import User, Dataset, DataSource
-from app.schemas.upload import FileUploadResponse, UploadedDatasetInfo, MultiFileUploadResponse
+from app.models.metadata import User, Dataset, DataSource, IngestJob
+from app.schemas.upload import (
+    FileUploadResponse,
+    UploadedDatasetInfo,
+    MultiFileUploadResponse,
+    FileImportResult,
+    IngestJobResponse,
+    AppendUploadResponse,
+)
 from app.services.file_etl import FileETLService
-from app.services.duckdb_service import DuckDBService
-from app.services.vanna import VannaTrainingService
+from app.services.ingest_job_service import (
+    IngestJobService,
+    append_to_dataset,
+    build_import_entries,
+    import_or_reuse_dataset,
+    train_uploaded_dataset,
+)
+from app.utils.file_handler import spool_upload
+from app.core.config import settings
 from app.core.logger import get_logger
 
 router = APIRouter()
@@ -24,6 +40,7 @@ logger = get_logger(__name__)
 async def upload_excel_file(
     background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
+    sheet_name: Optional[str] = Form(None),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -32,14 +49,14 @@ async def upload_excel_file(
     
     工作流程：
     1. 验证文件格式和大小
-    2. 解析文件内容为DataFrame
-    3. 创建或获取上传数据源
-    4. 将数据写入数据库（专用Schema）
+    2. 创建或获取上传数据源
+    3. 分批解析文件并写入数据库（专用Schema），内存占用与文件大小无关
     5. 创建Dataset记录
     6. 后台触发Vanna训练
     
     Args:
         file: 上传的文件
+        sheet_name: Excel 工作表名称或序号（从 1 开始），为空时导入第一个工作表
         db: 数据库会话
         current_user: 当前用户
         
@@ -54,45 +71,52 @@ async def upload_excel_file(
     )
     
     try:
-        # 读取文件内容
-        file_content = await file.read()
-        file_size = len(file_content)
-        
-        # 1. 验证文件
-        FileETLService.validate_file(file.filename, file_size)
-        
-        # 2. 解析文件
-        df = FileETLService.parse_file(file_content, file.filename)
-        row_count = len(df)
-        column_count = len(df.columns)
+        # 1. 按块写入临时文件并校验（格式、文件头、大小）
+        upload = await spool_upload(
+            file,
+            allowed_extensions=FileETLService.SUPPORTED_EXTENSIONS,
+            max_size=FileETLService.MAX_STREAM_FILE_SIZE
+        )
         
-        # 3. 创建或获取上传数据源
+        # 2. 创建或获取上传数据源
         datasource = FileETLService.create_upload_datasource(
             db=db,
             user=current_user,
             datasource_name=f"{current_user.username}_uploads"
         )
         
-        # 4. 生成表名并写入数据库
+        # 3. 生成表名，分批解析并写入数据库
         table_name = FileETLService.generate_table_name(
             user_id=current_user.id,
             filename=file.filename
         )
         
-        FileETLService.write_to_database(
-            df=df,
-            table_name=table_name,
-            datasource=datasource,
-            db_session=db
-        )
+        def load_file():
+            sheet = FileETLService.resolve_sheets(upload.path, file.filename, sheet_name)[0]
+            parse_settings = FileETLService.detect_parse_settings(upload.path, file.filename, sheet)
+            stats = FileETLService.write_batches_to_database(
+                batches=FileETLService.iter_file_batches(upload.path, file.filename, parse_settings=parse_settings),
+                table_name=table_name,
+                datasource=datasource,
+                db_session=db,
+                progress_callback=_log_ingest_progress(file.filename)
+            )
+            return parse_settings, stats
         
-        # 5. 创建Dataset记录
+        # 解析和写入是同步的 CPU / IO 操作，在线程中执行，不阻塞事件循环
+        with upload:
+            parse_settings, stats = await asyncio.to_thread(load_file)
+        row_count = stats["rows"]
+        column_count = stats["columns"]
+        
+        # 4. 创建Dataset记录
         collection_name = f"vanna_{uuid.uuid4().hex[:16]}"
         dataset = Dataset(
             name=file.filename,
             datasource_id=datasource.id,
             collection_name=collection_name,
             schema_config=[table_name],  # 只包含上传的表
+            ingest_config={table_name: parse_settings},
             status="pending",
             owner_id=current_user.id
         )
@@ -108,9 +132,9 @@ async def upload_excel_file(
             user_id=current_user.id
         )
         
-        # 6. 后台触发训练
+        # 5. 后台触发训练
         background_tasks.add_task(
-            _train_uploaded_dataset,
+            train_uploaded_dataset,
             dataset_id=dataset.id,
             table_names=[table_name]
         )
@@ -123,7 +147,9 @@ async def upload_excel_file(
             datasource_id=datasource.id,
             table_name=table_name,
             row_count=row_count,
-            column_count=column_count
+            column_count=column_count,
+            parse_settings=parse_settings,
+            rows_per_second=stats["rows_per_second"]
         )
         
     except ValueError as e:
@@ -185,13 +211,10 @@ async def list_uploaded_datasets(
         
         if table_name:
             try:
-                from sqlalchemy import create_engine, inspect
-                from app.core.security import decrypt_password
+                from sqlalchemy import inspect, text
                 
-                # 构建数据库连接
-                password = decrypt_password(upload_datasource.password_encrypted)
-                db_url = f"mysql+pymysql://{upload_datasource.username}:{password}@{upload_datasource.host}:{upload_datasource.port}/{upload_datasource.database_name}?charset=utf8mb4"
-                engine = create_engine(db_url)
+                # 复用缓存的数据库引擎
+                engine = FileETLService._get_upload_engine(upload_datasource)
                 
                 # 获取表信息
                 inspector = inspect(engine)
@@ -201,7 +224,8 @@ async def list_uploaded_datasets(
                     
                     # 查询行数
                     with engine.connect() as conn:
-                        result_proxy = conn.execute(f"SELECT COUNT(*) FROM {table_name}")
+                        quoted = engine.dialect.identifier_preparer.quote(table_name)
+                        result_proxy = conn.execute(text(f"SELECT COUNT(*) FROM {quoted}"))
                         row_count = result_proxy.scalar()
             except Exception as e:
                 logger.warning(
@@ -224,78 +248,11 @@ async def list_uploaded_datasets(
     return result
 
 
-def _train_uploaded_dataset(dataset_id: int, table_names: List[str]):
-    """
-    后台任务：训练上传的数据集
-    
-    Args:
-        dataset_id: 数据集ID
-        table_names: 表名列表
-    """
-    from app.db.session import SessionLocal
-    
-    db = SessionLocal()
-    try:
-        logger.info(
-            "Starting background training for uploaded dataset",
-            dataset_id=dataset_id,
-            tables=table_names
-        )
-        
-        # 调用训练服务
-        VannaTrainingService.train_dataset(
-            dataset_id=dataset_id,
-            table_names=table_names,
-            db_session=db
-        )
-        
-        logger.info(
-            "Background training completed",
-            dataset_id=dataset_id
-        )
-        
-    except Exception as e:
-        logger.error(
-            "Background training failed",
-            dataset_id=dataset_id,
-            error=str(e),
-            exc_info=True
-        )
-    finally:
-        db.close()
-
-
-def _sanitize_table_name(filename: str) -> str:
-    """
-    清理文件名以生成合法的表名
-    
-    Args:
-        filename: 原始文件名
-        
-    Returns:
-        str: 清理后的表名
-    """
-    # 移除扩展名
-    name = filename.rsplit('.', 1)[0]
-    
-    # 替换特殊字符为下划线
-    name = re.sub(r'[^\w\u4e00-\u9fa5]', '_', name)
-    
-    # 移除多余的下划线
-    name = re.sub(r'_+', '_', name)
-    
-    # 移除首尾下划线
-    name = name.strip('_')
-    
-    # 如果以数字开头，添加前缀
-    if name and name[0].isdigit():
-        name = 'tbl_' + name
-    
-    # 限制长度
-    if len(name) > 50:
-        name = name[:50]
-    
-    return name.lower()
+def _log_ingest_progress(filename: str):
+    """生成分批导入的进度回调（记录已导入行数）"""
+    def callback(rows: int):
+        logger.info("Ingest progress", filename=filename, rows=rows)
+    return callback
 
 
 @router.post("/multi-files", response_model=MultiFileUploadResponse)
@@ -303,6 +260,8 @@ async def upload_multiple_files(
     background_tasks: BackgroundTasks,
     files: List[UploadFile] = File(...),
     dataset_name: str = Form(...),
+    sheets: Optional[str] = Form(None),
+    reuse_existing: bool = Form(False),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -310,16 +269,20 @@ async def upload_multiple_files(
     批量上传多个 Excel/CSV 文件并创建 Dataset
     
     工作流程：
-    1. 验证所有文件（格式、大小）
-    2. 解析为 DataFrame
-    3. 创建 DuckDB 数据库
-    4. 导入所有表
-    5. 创建 Dataset 记录
-    6. 后台触发 AI 关系推理和训练
+    1. 验证所有文件（格式、大小），落盘时计算内容哈希
+    2. 生成导入项（表名、工作表）
+    3. 开启 reuse_existing 且内容与已有数据集相同时直接复用；否则创建 Dataset 和 DuckDB 数据库，多个文件并行解析后导入
+    4. 后台触发训练（复用时跳过）
+    
+    大文件建议使用 /upload/jobs 异步导入，避免请求超时。
     
     Args:
         files: 上传的文件列表
         dataset_name: 数据集名称
+        sheets: Excel 工作表选择：为空只导入第一个工作表，"*" 导入所有非空工作表，
+            或逗号分隔的工作表名称/序号；每个工作表导入为一张表
+        reuse_existing: 内容（文件、工作表、表名）与自己已有的数据集相同时是否直接复用（默认关闭），
+            复用时返回已有数据集（沿用原名称），不再创建新数据集
         db: 数据库会话
         current_user: 当前用户
         
@@ -340,94 +303,61 @@ async def upload_multiple_files(
         raise HTTPException(status_code=400, detail="单次最多上传 10 个文件")
     
     try:
-        # 1. 验证和解析所有文件
-        dataframes: Dict[str, 'pd.DataFrame'] = {}
-        file_info = []
-        
-        for file in files:
-            content = await file.read()
-            file_size = len(content)
-            
-            # 验证文件
-            FileETLService.validate_file(file.filename, file_size)
-            
-            # 解析文件
-            df = FileETLService.parse_file(content, file.filename)
-            
-            # 生成表名
-            table_name = _sanitize_table_name(file.filename)
-            
-            # 如果表名重复，添加后缀
-            if table_name in dataframes:
-                counter = 1
-                while f"{table_name}_{counter}" in dataframes:
-                    counter += 1
-                table_name = f"{table_name}_{counter}"
+        # 1. 所有文件先按块落盘并校验，校验失败时不会创建任何数据
+        uploads = []
+        try:
+            for file in files:
+                uploads.append(await spool_upload(
+                    file,
+                    allowed_extensions=FileETLService.SUPPORTED_EXTENSIONS,
+                    max_size=FileETLService.MAX_STREAM_FILE_SIZE
+                ))
             
-            dataframes[table_name] = df
-            file_info.append({
-                "filename": file.filename,
-                "table_name": table_name,
-                "rows": len(df),
-                "columns": len(df.columns)
-            })
+            # 2. 生成导入项（Excel 的每个选中工作表导入为一张表）
+            entries = build_import_entries([(upload.path, upload.filename) for upload in uploads], sheets)
+            table_names = [entry[2] for entry in entries]
             
-            logger.info(
-                f"Parsed file: {file.filename} -> {table_name}",
-                rows=len(df),
-                columns=len(df.columns)
+            # 3. 开启复用且内容相同则复用已有数据集；否则创建 Dataset 和 DuckDB 数据库，多个文件在进程池中并行解析，解析完成即导入
+            dataset, file_results, elapsed_ms, reused = await import_or_reuse_dataset(
+                db,
+                current_user.id,
+                dataset_name,
+                entries,
+                {upload.path: upload.sha256 for upload in uploads},
+                reuse_existing=reuse_existing
             )
-        
-        # 2. 创建 Dataset 记录
-        dataset = Dataset(
-            name=dataset_name,
-            datasource_id=None,  # DuckDB 数据集不需要传统数据源
-            status="pending",
-            owner_id=current_user.id,
-            schema_config=list(dataframes.keys())
-        )
-        db.add(dataset)
-        db.commit()
-        db.refresh(dataset)
-        
-        # 生成 collection_name（必须在获取dataset.id之后）
-        dataset.collection_name = f"vec_ds_{dataset.id}"
-        
-        # 3. 创建 DuckDB 数据库并导入数据
-        db_path = DuckDBService.create_dataset_database(dataset.id)
-        stats = DuckDBService.import_dataframes(db_path, dataframes)
-        
-        # 4. 更新 Dataset 元数据（包括 collection_name 和 duckdb_path）
-        dataset.duckdb_path = db_path
-        db.commit()  # 这里会同时保存 collection_name 和 duckdb_path
-        db.refresh(dataset)
-        
-        logger.info(
-            "Dataset created successfully",
-            dataset_id=dataset.id,
-            duckdb_path=db_path,
-            tables=list(stats.keys())
-        )
-        
-        # 5. 后台任务：训练 DDL（暂不做关系推理，在用户确认建模后再做）
-        background_tasks.add_task(
-            _train_uploaded_dataset,
-            dataset_id=dataset.id,
-            table_names=list(dataframes.keys())
-        )
+            db_path = dataset.duckdb_path
+            stats: Dict[str, int] = {item["table_name"]: item["rows"] for item in file_results}
+        finally:
+            for upload in uploads:
+                upload.cleanup()
         
         # 计算总行数
         total_rows = sum(stats.values())
         
+        if reused:
+            message = f"检测到内容相同的数据集 [{dataset.name}]，已直接复用（共 {total_rows} 行数据）"
+        else:
+            # 4. 后台任务：训练 DDL（暂不做关系推理，在用户确认建模后再做）
+            background_tasks.add_task(
+                train_uploaded_dataset,
+                dataset_id=dataset.id,
+                table_names=table_names
+            )
+            message = f"成功上传 {len(files)} 个文件（{len(stats)} 张表），共 {total_rows} 行数据"
+        
         return MultiFileUploadResponse(
             success=True,
-            message=f"成功上传 {len(files)} 个文件，共 {total_rows} 行数据",
+            message=message,
             dataset_id=dataset.id,
             dataset_name=dataset.name,
             tables=stats,
             total_files=len(files),
             total_rows=total_rows,
-            duckdb_path=db_path
+            duckdb_path=db_path,
+            files=[FileImportResult(**item) for item in file_results],
+            elapsed_ms=elapsed_ms,
+            reused=reused
         )
         
     except ValueError as e:
@@ -448,3 +378,218 @@ async def upload_multiple_files(
         )
         raise HTTPException(status_code=500, detail=f"文件上传失败: {str(e)}")
 
+
+
+@router.post("/datasets/{dataset_id}/append", response_model=AppendUploadResponse)
+async def append_to_uploaded_dataset(
+    dataset_id: int,
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    table_name: str = Form(...),
+    key_columns: Optional[str] = Form(None),
+    allow_schema_change: bool = Form(False),
+    sheet_name: Optional[str] = Form(None),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    向已有的上传数据集追加数据，或按主键更新（upsert）
+
+    - 上传文件的列必须与目标表兼容；出现新列或需要放宽列类型时，需显式传 allow_schema_change
+    - 成功后数据集的数据版本递增，清除查询结果缓存
+    - 只有表结构变化时才重新训练，仅数据变化时保留训练结果和问题到 SQL 的缓存
+
+    Args:
+        table_name: 目标表名
+        key_columns: 主键列（逗号分隔），为空时直接追加
+        allow_schema_change: 是否允许新增列/放宽列类型
+        sheet_name: Excel 工作表名称或序号（从 1 开始）
+    """
+    from app.services.vanna import VannaCacheService
+
+    dataset = db.query(Dataset).filter(Dataset.id == dataset_id).first()
+    if not dataset or (dataset.owner_id != current_user.id and not current_user.is_superuser):
+        raise HTTPException(status_code=404, detail="数据集不存在")
+
+    keys = [k.strip() for k in key_columns.split(",") if k.strip()] if key_columns else None
+
+    try:
+        upload = await spool_upload(
+            file,
+            allowed_extensions=FileETLService.SUPPORTED_EXTENSIONS,
+            max_size=FileETLService.MAX_STREAM_FILE_SIZE
+        )
+        with upload:
+            stats = await asyncio.to_thread(
+                append_to_dataset,
+                db,
+                dataset,
+                table_name,
+                upload.path,
+                file.filename,
+                keys,
+                allow_schema_change,
+                sheet_name,
+            )
+    except ValueError as e:
+        logger.error(
+            "Dataset append validation failed",
+            dataset_id=dataset_id,
+            table_name=table_name,
+            error=str(e)
+        )
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(
+            "Dataset append failed",
+            dataset_id=dataset_id,
+            table_name=table_name,
+            error=str(e),
+            exc_info=True
+        )
+        raise HTTPException(status_code=500, detail=f"追加数据失败: {str(e)}")
+
+    schema_changed = stats["schema_changed"]
+    await VannaCacheService.clear_cache(dataset.id, include_sql=schema_changed)
+    if schema_changed:
+        background_tasks.add_task(
+            train_uploaded_dataset,
+            dataset_id=dataset.id,
+            table_names=list(dataset.schema_config or [])
+        )
+
+    return AppendUploadResponse(
+        success=True,
+        message=f"已{'更新' if keys else '追加'} {stats['rows']} 行到表 [{table_name}]",
+        dataset_id=dataset.id,
+        table_name=table_name,
+        rows=stats["rows"],
+        inserted=stats["inserted"],
+        updated=stats["updated"],
+        schema_changed=schema_changed,
+        schema_changes=stats["schema_changes"],
+        data_version=stats["data_version"],
+        retraining=schema_changed
+    )
+
+
+# ========== 异步导入任务 ==========
+
+def _get_owned_job(db: Session, job_id: int, current_user: User) -> IngestJob:
+    job = db.query(IngestJob).filter(IngestJob.id == job_id).first()
+    if not job or (job.owner_id != current_user.id and not current_user.is_superuser):
+        raise HTTPException(status_code=404, detail="导入任务不存在")
+    return job
+
+
+@router.post("/jobs", response_model=IngestJobResponse, status_code=202)
+async def create_ingest_job(
+    files: List[UploadFile] = File(...),
+    dataset_name: str = Form(...),
+    sheets: Optional[str] = Form(None),
+    reuse_existing: bool = Form(False),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    异步导入多个 Excel/CSV 文件
+    
+    请求只负责把文件落盘并创建任务，立即返回任务 ID；导入由独立的导入工作进程（run_ingest_worker.py）执行，
+    进度通过 GET /upload/jobs/{job_id} 轮询或 GET /upload/jobs/{job_id}/events（SSE）获取。
+    reuse_existing 为真（默认关闭）且内容与已有数据集相同时，任务直接复用已有数据集（沿用原名称，结果中 reused 为真）。
+    """
+    if len(files) == 0:
+        raise HTTPException(status_code=400, detail="请至少上传一个文件")
+    
+    if len(files) > 10:
+        raise HTTPException(status_code=400, detail="单次最多上传 10 个文件")
+    
+    uploads = []
+    try:
+        for file in files:
+            uploads.append(await spool_upload(
+                file,
+                allowed_extensions=FileETLService.SUPPORTED_EXTENSIONS,
+                max_size=FileETLService.MAX_STREAM_FILE_SIZE
+            ))
+        job = IngestJobService.create_job(
+            db,
+            current_user.id,
+            dataset_name,
+            uploads,
+            options={"sheets": sheets, "reuse_existing": reuse_existing}
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        # 已移动到任务目录的文件不受影响
+        for upload in uploads:
+            upload.cleanup()
+    
+    return IngestJobResponse(**IngestJobService.to_dict(job))
+
+
+@router.get("/jobs/{job_id}", response_model=IngestJobResponse)
+async def get_ingest_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """查询导入任务状态和进度"""
+    job = _get_owned_job(db, job_id, current_user)
+    return IngestJobResponse(**IngestJobService.to_dict(job))
+
+
+def _load_job_payload(job_id: int) -> Optional[Dict]:
+    """读取任务状态（在线程中执行，避免同步查询阻塞事件循环）"""
+    session = SessionLocal()
+    try:
+        job = session.query(IngestJob).filter(IngestJob.id == job_id).first()
+        return IngestJobResponse(**IngestJobService.to_dict(job)).model_dump(mode="json") if job else None
+    finally:
+        session.close()
+
+
+@router.get("/jobs/{job_id}/events")
+async def stream_ingest_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """以 Server-Sent Events 推送导入任务进度，任务结束后关闭连接"""
+    _get_owned_job(db, job_id, current_user)
+    
+    async def event_stream():
+        last_payload = None
+        while True:
+            payload = await asyncio.to_thread(_load_job_payload, job_id)
+            if payload is None:
+                break
+            if payload != last_payload:
+                yield f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+                last_payload = payload
+            if payload["status"] in IngestJobService.TERMINAL_STATUSES:
+                break
+            await asyncio.sleep(settings.INGEST_JOB_POLL_INTERVAL)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.post("/jobs/{job_id}/retry", response_model=IngestJobResponse, status_code=202)
+async def retry_ingest_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """把失败的导入任务重新放回队列，由导入工作进程从落盘的文件重新执行"""
+    job = _get_owned_job(db, job_id, current_user)
+    try:
+        IngestJobService.retry(db, job)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    db.refresh(job)
+    return IngestJobResponse(**IngestJobService.to_dict(job))
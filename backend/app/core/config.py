@@ -74,6 +74,34 @@ class Settings(BaseSettings):
     VECTOR_STORE_TYPE: str = "pgvector"  # 固定值，不再支持 ChromaDB
     VECTOR_N_RESULTS: int = 10  # 向量检索返回结果数量
 
+    # Embedding 模型配置（CPU 推理）
+    # 后端可选: torch（默认）, torch_int8（动态量化）, onnx, onnx_int8（需 pip install 'sentence-transformers[onnx]'）
+    # 切换后端前建议先运行 scripts/benchmark_embedding_backends.py 验证召回一致性
+    EMBEDDING_MODEL: str = "all-MiniLM-L6-v2"
+    EMBEDDING_BACKEND: str = "torch"
+    EMBEDDING_ONNX_INT8_FILE: str = "onnx/model_qint8_avx2.onnx"  # onnx_int8 使用的量化模型文件
+
+    # 进程内向量索引：将每个活跃数据集的 collection 镜像到内存，top-k 检索不再访问 PGVector
+    VECTOR_INDEX_ENABLED: bool = False
+    VECTOR_INDEX_HNSW_THRESHOLD: int = 5000  # 向量数超过该值时使用 HNSW（需安装 hnswlib），否则用 NumPy 稠密矩阵
+    VECTOR_INDEX_TTL: int = 300  # 索引重新加载周期（秒），用于感知其他进程写入，0 表示不过期
+
+    # PGVector 索引维护（langchain_pg_embedding 由所有数据集共享）
+    # 索引由管理员通过 POST /admin/vector-store/indexes 或 scripts/ensure_vector_indexes.py 显式创建
+    PGVECTOR_INDEX_METHOD: str = "hnsw"  # 向量索引类型: hnsw, ivfflat, none
+    PGVECTOR_HNSW_M: int = 16
+    PGVECTOR_HNSW_EF_CONSTRUCTION: int = 64
+    PGVECTOR_VACUUM_THRESHOLD: int = 1000  # 单次删除的向量数达到该值时在后台自动 VACUUM
+    # 按数据集过滤的向量检索开启迭代扫描（pgvector >= 0.8），避免小数据集返回的结果少于 k 条
+    PGVECTOR_ITERATIVE_SCAN: str = "relaxed_order"  # off, strict_order, relaxed_order（ivfflat 只支持 relaxed_order）
+
+    # ========== 启动预热配置 ==========
+    # 启动时预加载 embedding 模型，并为最近活跃的数据集创建 Vanna 实例、打开数据源连接
+    # /ready 在预热完成（或超时）后才返回 200
+    WARMUP_ENABLED: bool = True
+    WARMUP_DATASET_LIMIT: int = 5  # 预热最近活跃的数据集数量（按聊天记录时间）
+    WARMUP_TIMEOUT: int = 120  # 预热超时（秒），超时后直接标记就绪
+
     # ========== Vanna API模式配置 ==========
     # 控制使用 Legacy API 还是 Agent API
     VANNA_API_MODE: str = "legacy"  # 可选: "legacy", "agent"
@@ -82,6 +110,62 @@ class Settings(BaseSettings):
     # 用于多表分析的 DuckDB 数据库存储目录
     DUCKDB_DATABASE_DIR: str = "./duckdb_storage"  # DuckDB 数据库文件存储目录
 
+    # ========== 文件上传配置 ==========
+    # 上传文件按块写入临时文件后再解析，避免整个文件读入内存
+    UPLOAD_TEMP_DIR: str = ""  # 临时文件目录，为空时使用系统临时目录
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024  # 每次从请求中读取的字节数
+    # 分批流式导入：按固定行数分批写入 DuckDB/数据库，内存占用与文件大小无关
+    UPLOAD_MAX_FILE_SIZE_MB: int = 2048  # 单个文件大小上限（MB）
+    UPLOAD_BATCH_ROWS: int = 50000  # 每批行数
+    UPLOAD_PARSE_WORKERS: int = 0  # 多文件上传的并行解析进程数，0 表示 CPU 核数，1 表示不并行
+    # 异步导入任务
+    INGEST_JOB_POLL_INTERVAL: float = 1.0  # SSE 推送进度的轮询间隔（秒）
+    INGEST_JOB_RETENTION_HOURS: int = 24  # 失败任务的落盘文件保留时长（小时），期间可重试
+    # 导入工作进程（python run_ingest_worker.py）：与 API 服务共享 UPLOAD_TEMP_DIR 和 DUCKDB_DATABASE_DIR
+    INGEST_WORKER_POLL_SECONDS: float = 2.0  # 认领待执行任务的间隔（秒）
+    INGEST_WORKER_CONCURRENCY: int = 2  # 每个工作进程同时执行的任务数
+    # 后台任务心跳（导入/导出任务）：执行期间定期刷新心跳，启动时只回收本实例或心跳超时的任务
+    JOB_WORKER_ID: str = ""  # 实例标识，为空时使用 主机名:进程号；每个进程的标识必须唯一
+    JOB_HEARTBEAT_INTERVAL: float = 15.0  # 心跳间隔（秒）
+    JOB_HEARTBEAT_TIMEOUT: int = 120  # 心跳超过该时长（秒）未更新的任务视为已中断
+
+    # ========== 图表降采样 ==========
+    # 折线图/面积图/散点图的数据点超过上限时在服务端降采样（LTTB / 分桶最小最大值 / 网格抽稀），
+    # 直方图（数值横轴、可加指标）分箱；完整结果仍用于导出
+    CHART_MAX_POINTS: int = 1000
+    CHART_HISTOGRAM_BINS: int = 50  # 直方图分箱数
+
+    # ========== 看板配置 ==========
+    # 批量刷新看板时并发执行卡片 SQL，同一数据源同时执行的查询数有上限，避免压垮数据库
+    DASHBOARD_DATASOURCE_CONCURRENCY: int = 4
+    # 卡片结果缓存（按卡片 SQL + 数据版本）：新鲜期内直接返回；过期但未超过最大缓存时长时
+    # 先返回旧结果并在后台刷新（stale-while-revalidate）
+    DASHBOARD_CACHE_FRESH_SECONDS: int = 60  # 新鲜期（秒），0 表示不使用缓存
+    DASHBOARD_CACHE_MAX_AGE_SECONDS: int = 3600  # 最大缓存时长（秒），超过后必须重新查询
+    # 增量刷新（refresh_mode=incremental 的时间序列卡片）：只重算最近的时间窗口，与缓存中更早的时间桶合并
+    DASHBOARD_INCREMENTAL_WINDOW_DAYS: int = 3  # 默认重算窗口（天），卡片可单独设置
+    DASHBOARD_INCREMENTAL_FULL_REFRESH_SECONDS: int = 86400  # 距上次全量重算超过该时长时全量重算（修正窗口外的迟到数据）
+    # 看板预计算（独立工作进程：python run_dashboard_scheduler.py）
+    DASHBOARD_SCHEDULER_POLL_SECONDS: int = 30  # 检查到期计划的间隔（秒）
+    DASHBOARD_SCHEDULER_CONCURRENCY: int = 4  # 同时刷新的看板数
+    DASHBOARD_SCHEDULE_TIMEZONE: str = "Asia/Shanghai"  # cron 表达式使用的时区
+    DASHBOARD_REFRESH_HISTORY_LIMIT: int = 100  # 每个看板保留的执行记录条数
+
+    # ========== 数据导出配置 ==========
+    # 导出时在服务端重新执行 SQL，按块读取并流式输出（每块行数）
+    EXPORT_BATCH_ROWS: int = 10000
+    # Excel 导出按前 N 行估算列宽
+    EXPORT_EXCEL_WIDTH_SAMPLE_ROWS: int = 1000
+    # 导出文件先写入临时文件，超过该大小（字节）后从内存转存到磁盘
+    EXPORT_SPOOL_MAX_BYTES: int = 16 * 1024 * 1024
+    # 异步导出任务：PDF / Excel 在进程池中渲染，导出文件按查询、数据版本和格式缓存到本地磁盘
+    EXPORT_JOB_WORKERS: int = 2  # 渲染进程数，0 表示在线程中渲染（不使用进程池）
+    EXPORT_JOB_POLL_INTERVAL: float = 1.0  # SSE 推送任务状态的轮询间隔（秒）
+    EXPORT_ARTIFACT_DIR: str = ""  # 导出文件存储目录，为空时使用系统临时目录下的 export_artifacts
+    EXPORT_ARTIFACT_TTL_HOURS: int = 24  # DuckDB 数据集的导出文件保留时长（数据变化时数据版本递增，缓存自动失效）
+    EXPORT_ARTIFACT_DATASOURCE_TTL_SECONDS: int = 300  # 外部数据源没有数据版本，导出文件只在该时长内复用
+    EXPORT_ARTIFACT_PRUNE_INTERVAL_SECONDS: int = 600  # 创建导出任务时，距上次清理超过该时长（秒）则在后台清理过期的导出文件
+
     class Config:
         case_sensitive = True
         env_file = ".env"  # 统一从.env文件读取配置
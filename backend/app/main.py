@@ -1,8 +1,10 @@
+import asyncio
 import time
 import uuid
 import warnings
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from asgi_correlation_id import CorrelationIdMiddleware
 import structlog
@@ -12,6 +14,9 @@ from app.core.logger import setup_logging, get_logger
 from app.core.redis import redis_service
 from app.db.session import engine
 from app.models import metadata
+from app.services.warmup_service import WarmupService
+from app.services.parallel_ingest import shutdown_ingest_pool
+from app.services.export_job_service import ExportJobService, shutdown_export_pool
 
 # === 安全检查 ===
 DEFAULT_SECRET_KEY = "change_this_to_a_secure_random_key_in_production"
@@ -48,6 +53,23 @@ metadata.Base.metadata.create_all(bind=engine)
 setup_logging()
 logger = get_logger(__name__)
 
+# 启动时创建的后台任务，保留引用避免被垃圾回收
+_background_tasks: set = set()
+
+
+def _start_background_task(coro, name: str):
+    """创建后台任务，结束时移除引用并记录异常"""
+    task = asyncio.create_task(coro, name=name)
+    _background_tasks.add(task)
+
+    def done(finished):
+        _background_tasks.discard(finished)
+        if not finished.cancelled() and finished.exception() is not None:
+            logger.warning("Background task failed", task=name, error=str(finished.exception()))
+
+    task.add_done_callback(done)
+    return task
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -59,12 +81,23 @@ async def lifespan(app: FastAPI):
         logger.info("Redis initialized successfully")
     except Exception as e:
         logger.warning("Redis initialization failed, running without cache", error=str(e))
+
+    # 上次退出时未完成的导出任务标记为失败，并清理过期的导出文件
+    try:
+        await asyncio.to_thread(ExportJobService.recover_interrupted)
+    except Exception as e:
+        logger.warning("Export job recovery failed", error=str(e))
+
+    # 后台预热模型和活跃数据集，完成后 /ready 返回就绪
+    _start_background_task(WarmupService.run(), "warmup")
     
     yield
     
     # 关闭事件
     logger.info("Shutting down Universal BI service")
     await redis_service.close()
+    shutdown_ingest_pool()
+    shutdown_export_pool()
     logger.info("Service stopped")
 
 
@@ -167,3 +200,16 @@ app.include_router(data_table.router, prefix=f"{settings.API_V1_STR}/data-tables
 @app.get("/")
 def root():
     return {"message": "Welcome to Universal BI API"}
+
+
+@app.get(f"{settings.API_V1_STR}/health")
+def health():
+    """存活检查：进程可以响应请求即返回 200"""
+    return {"status": "ok"}
+
+
+@app.get(f"{settings.API_V1_STR}/ready")
+def ready():
+    """就绪检查：启动预热完成前返回 503"""
+    status = WarmupService.get_status()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
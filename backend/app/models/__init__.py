@@ -13,7 +13,10 @@ from app.models.metadata import (
     ChatSession,
     ChatMessage,
     ComputedMetric,
-    DashboardTemplate
+    DashboardTemplate,
+    IngestJob,
+    DashboardSchedule,
+    DashboardRefreshRun
 )
 from app.models.data_table import (
     Folder,
@@ -34,6 +37,9 @@ __all__ = [
     "ChatMessage",
     "ComputedMetric",
     "DashboardTemplate",
+    "IngestJob",
+    "DashboardSchedule",
+    "DashboardRefreshRun",
     "Folder",
     "DataTable",
     "TableField"
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, JSON, Text, Boolean
+from sqlalchemy import Column, Integer, BigInteger, String, ForeignKey, DateTime, JSON, Text, Boolean
 from sqlalchemy.orm import relationship
 from app.models.base import Base
 from datetime import datetime
@@ -48,6 +48,9 @@ class Dataset(Base):
     error_msg = Column(Text, nullable=True)
     last_train_at = Column(DateTime, nullable=True)
     duckdb_path = Column(String(500), nullable=True, comment="DuckDB 数据库文件路径，用于多表分析")
+    ingest_config = Column(JSON, nullable=True, comment="上传文件时检测到的解析参数，按表名存储")
+    data_version = Column(Integer, default=1, comment="数据版本，追加/更新数据后递增，用于缓存失效")
+    content_hash = Column(String(64), nullable=True, index=True, comment="上传内容指纹（文件哈希+工作表+表名），用于复用重复上传")
     owner_id = Column(Integer, ForeignKey("users.id"), nullable=True)  # 为 None 则为公共资源
     
     datasource = relationship("DataSource", back_populates="datasets")
@@ -67,6 +70,8 @@ class Dashboard(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     cards = relationship("DashboardCard", back_populates="dashboard", cascade="all, delete-orphan")
+    schedule = relationship("DashboardSchedule", back_populates="dashboard", uselist=False, cascade="all, delete-orphan")
+    refresh_runs = relationship("DashboardRefreshRun", cascade="all, delete-orphan")
     owner = relationship("User")
 
 
@@ -92,6 +97,9 @@ class DashboardCard(Base):
     sql = Column(Text)
     chart_type = Column(String(50))  # bar/line/pie/table
     layout = Column(JSON, nullable=True)  # {x, y, w, h}
+    refresh_mode = Column(String(20), default="full")  # full: 全量重算, incremental: 只重算最近的时间窗口
+    time_column = Column(String(255), nullable=True)  # 增量刷新的时间列，为空时自动识别
+    incremental_window_days = Column(Integer, nullable=True)  # 增量重算窗口（天），为空时使用默认值
     created_at = Column(DateTime, default=datetime.utcnow)
     
     dashboard = relationship("Dashboard", back_populates="cards")
@@ -185,3 +193,90 @@ class DashboardTemplate(Base):
 
     source_dashboard = relationship("Dashboard")
     owner = relationship("User")
+
+
+class IngestJob(Base):
+    """文件导入任务 - 异步导入上传文件并记录进度，失败后可从落盘的文件重试"""
+    __tablename__ = "ingest_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    dataset_id = Column(Integer, ForeignKey("datasets.id", ondelete="SET NULL"), nullable=True)  # 导入成功后创建的数据集
+    dataset_name = Column(String(255), nullable=False)
+    status = Column(String(50), default="pending", index=True)  # pending, running, completed, failed
+    files = Column(JSON, nullable=False)  # [{"path", "filename", "size"}]，落盘文件保留到任务成功
+    options = Column(JSON, nullable=True)  # 导入选项，如 {"sheets": "*"}
+    total_bytes = Column(BigInteger, default=0)
+    bytes_processed = Column(BigInteger, default=0)
+    rows_processed = Column(Integer, default=0)
+    result = Column(JSON, nullable=True)  # 每个文件的导入结果
+    error_msg = Column(Text, nullable=True)
+    attempts = Column(Integer, default=0)
+    worker_id = Column(String(255), nullable=True)  # 执行任务的实例标识
+    heartbeat_at = Column(DateTime, nullable=True)  # 执行期间定期刷新，启动时据此判断任务是否已中断
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    owner = relationship("User")
+    dataset = relationship("Dataset")
+
+
+class DashboardSchedule(Base):
+    """看板预计算计划 - 按 cron 或固定间隔在后台刷新看板卡片结果并写入结果缓存"""
+    __tablename__ = "dashboard_schedules"
+
+    id = Column(Integer, primary_key=True, index=True)
+    dashboard_id = Column(Integer, ForeignKey("dashboards.id", ondelete="CASCADE"), unique=True, nullable=False)
+    cron = Column(String(100), nullable=True)  # 5 段 cron 表达式（分 时 日 月 周），与 interval_seconds 二选一
+    interval_seconds = Column(Integer, nullable=True)  # 固定间隔（秒）
+    jitter_seconds = Column(Integer, default=0)  # 随机延后 0~N 秒，避免多个看板同时刷新
+    enabled = Column(Boolean, default=True, index=True)
+    next_run_at = Column(DateTime, nullable=True, index=True)  # 下次执行时间（UTC）
+    last_run_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    dashboard = relationship("Dashboard", back_populates="schedule")
+
+
+class DashboardRefreshRun(Base):
+    """看板预计算执行记录"""
+    __tablename__ = "dashboard_refresh_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    dashboard_id = Column(Integer, ForeignKey("dashboards.id", ondelete="CASCADE"), nullable=False, index=True)
+    status = Column(String(50), default="running")  # running, completed, partial（部分卡片失败）, failed
+    cards_total = Column(Integer, default=0)
+    cards_failed = Column(Integer, default=0)
+    elapsed_ms = Column(Integer, nullable=True)
+    details = Column(JSON, nullable=True)  # 每张卡片的结果 [{"card_id", "row_count", "elapsed_ms", "error"}]
+    error_msg = Column(Text, nullable=True)
+    started_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class ExportJob(Base):
+    """导出任务 - 在进程池中渲染 PDF / Excel 等导出文件，结果按查询、数据版本和格式缓存到本地磁盘"""
+    __tablename__ = "export_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    owner_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    dataset_id = Column(Integer, ForeignKey("datasets.id", ondelete="SET NULL"), nullable=True)
+    format = Column(String(50), nullable=False)  # excel, excel_with_chart, pdf, csv
+    status = Column(String(50), default="pending", index=True)  # pending, running, completed, failed
+    cache_key = Column(String(64), nullable=False, index=True)  # sha256(查询 + 数据版本 + 格式 + 报告内容)
+    params = Column(JSON, nullable=True)  # 导出参数：question, sql, chart_type, insight 等
+    filename = Column(String(255), nullable=True)  # 下载文件名
+    row_count = Column(Integer, nullable=True)
+    size_bytes = Column(BigInteger, nullable=True)
+    from_cache = Column(Boolean, default=False)  # 直接复用了已缓存的导出文件
+    error_msg = Column(Text, nullable=True)
+    worker_id = Column(String(255), nullable=True)  # 执行任务的实例标识
+    heartbeat_at = Column(DateTime, nullable=True)  # 执行期间定期刷新，启动时据此判断任务是否已中断
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    owner = relationship("User")
+    dataset = relationship("Dataset")
@@ -25,6 +25,9 @@ class ChatResponse(BaseModel):
     data_interpretation: Optional['DataInterpretation'] = None  # 数据解读
     fluctuation_analysis: Optional['FluctuationAnalysis'] = None  # 波动归因
     followup_questions: Optional[List[str]] = None  # 后续推荐问题
+    total_rows: Optional[int] = None  # 查询结果总行数（图表数据降采样时大于 rows 的行数）
+    downsample_method: Optional[str] = None  # 图表数据降采样方法：lttb / minmax / grid / binning
+    export_sql: Optional[str] = None  # 导出完整结果使用的 SQL（未自动追加 LIMIT）
 
 class SummaryRequest(BaseModel):
     dataset_id: int
@@ -88,14 +91,32 @@ class FollowupSuggestResponse(BaseModel):
 class ExportRequest(BaseModel):
     question: str
     sql: Optional[str] = None
-    columns: List[str]
-    rows: List[Dict[str, Any]]
+    dataset_id: Optional[int] = None  # 与 sql 同时提供时在服务端重新执行 SQL 导出完整结果
+    columns: List[str] = []
+    rows: List[Dict[str, Any]] = []
     chart_type: str
     chart_data: Optional[Dict] = None
     insight: Optional[str] = None
     data_interpretation: Optional[DataInterpretation] = None
     fluctuation_analysis: Optional[FluctuationAnalysis] = None
-    format: str  # "excel" | "excel_with_chart" | "pdf" | "csv"
+    format: str  # "excel" | "excel_with_chart" | "pdf" | "csv" | "parquet" | "arrow"
+
+
+class ExportJobResponse(BaseModel):
+    """异步导出任务状态"""
+    job_id: int
+    status: str  # pending, running, completed, failed
+    format: str
+    dataset_id: Optional[int] = None
+    filename: Optional[str] = None
+    row_count: Optional[int] = None
+    size_bytes: Optional[int] = None
+    from_cache: bool = False  # 直接复用了已缓存的导出文件
+    download_ready: bool = False  # 导出文件可下载（已完成且未过期清理）
+    error_msg: Optional[str] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
 
 
 # ============ 会话管理相关 Schema ============
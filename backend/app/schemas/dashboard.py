@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 
@@ -10,12 +10,22 @@ class DashboardCardBase(BaseModel):
     sql: str
     chart_type: str
     layout: Optional[Dict[str, Any]] = None
+    # 增量刷新：只重算最近 incremental_window_days 天的时间桶，与缓存中更早的时间桶合并
+    refresh_mode: Optional[str] = Field("full", pattern="^(full|incremental)$")
+    time_column: Optional[str] = None  # 时间列，为空时自动识别结果中的日期/时间列
+    incremental_window_days: Optional[int] = Field(None, ge=1)
 
 
 class DashboardCardCreate(DashboardCardBase):
     pass
 
 
+class DashboardCardRefreshUpdate(BaseModel):
+    refresh_mode: str = Field(..., pattern="^(full|incremental)$")
+    time_column: Optional[str] = None
+    incremental_window_days: Optional[int] = Field(None, ge=1)
+
+
 class DashboardCardResponse(DashboardCardBase):
     id: int
     dashboard_id: int
@@ -28,6 +38,11 @@ class DashboardCardResponse(DashboardCardBase):
 class DashboardCardDataResponse(BaseModel):
     columns: List[str]
     rows: List[Dict[str, Any]]
+    row_count: Optional[int] = None  # 完整结果行数（图表数据降采样时大于 rows 的行数）
+    downsample_method: Optional[str] = None  # 降采样方法：lttb / minmax / grid / binning
+    cache_status: Optional[str] = None  # fresh: 新鲜缓存, stale: 旧缓存（后台刷新中）, miss: 刚查询
+    cached_at: Optional[datetime] = None  # 数据查询时间（UTC）
+    data_age_seconds: Optional[float] = None  # 数据已存在的时长（秒）
 
 
 # Dashboard Schemas
@@ -50,6 +65,48 @@ class DashboardResponse(DashboardBase):
         from_attributes = True
 
 
+# ============ 看板预计算计划 Schema ============
+
+class DashboardScheduleUpdate(BaseModel):
+    """设置看板预计算计划（cron 与 interval_seconds 二选一）"""
+    cron: Optional[str] = None  # 5 段 cron 表达式，如 "0 7 * * 1-5"（工作日 7:00）
+    interval_seconds: Optional[int] = None
+    jitter_seconds: int = Field(default=0, ge=0)
+    enabled: bool = True
+
+
+class DashboardScheduleResponse(BaseModel):
+    """看板预计算计划"""
+    id: int
+    dashboard_id: int
+    cron: Optional[str] = None
+    interval_seconds: Optional[int] = None
+    jitter_seconds: int = 0
+    enabled: bool
+    next_run_at: Optional[datetime] = None
+    last_run_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class DashboardRefreshRunResponse(BaseModel):
+    """看板预计算执行记录"""
+    id: int
+    dashboard_id: int
+    status: str
+    cards_total: int = 0
+    cards_failed: int = 0
+    elapsed_ms: Optional[int] = None
+    details: Optional[List[Dict[str, Any]]] = None
+    error_msg: Optional[str] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
 # ============ 看板模板相关 Schema ============
 
 class DashboardTemplateCreate(BaseModel):
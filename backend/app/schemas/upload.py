@@ -2,7 +2,8 @@
 Excel/CSV文件上传相关的Schema定义
 """
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Any
+from datetime import datetime
 
 class FileUploadResponse(BaseModel):
     """文件上传成功响应"""
@@ -14,11 +15,24 @@ class FileUploadResponse(BaseModel):
     table_name: str  # 物理表名
     row_count: int  # 导入行数
     column_count: int  # 列数
+    parse_settings: Dict[str, Any] = {}  # 检测到的解析参数（编码、分隔符、表头等）
+    rows_per_second: Optional[float] = None  # 写入速度
     
     class Config:
         from_attributes = True
 
 
+class FileImportResult(BaseModel):
+    """单个文件的导入结果"""
+    filename: str
+    table_name: str
+    rows: int
+    columns: int
+    parse_ms: float  # 解析和类型推断耗时
+    load_ms: float  # 复制到数据集 DuckDB 的耗时
+    parse_settings: Dict[str, Any] = {}  # 检测到的解析参数（编码、分隔符、表头等）
+
+
 class MultiFileUploadResponse(BaseModel):
     """多文件批量上传成功响应"""
     success: bool
@@ -29,11 +43,50 @@ class MultiFileUploadResponse(BaseModel):
     total_files: int
     total_rows: int
     duckdb_path: str
+    files: List[FileImportResult] = []  # 每个文件的导入耗时
+    elapsed_ms: Optional[float] = None  # 导入总耗时
+    reused: bool = False  # 内容与已有数据集相同，直接复用了已有数据集
     
     class Config:
         from_attributes = True
 
 
+class AppendUploadResponse(BaseModel):
+    """向已有数据集追加/更新数据的结果"""
+    success: bool
+    message: str
+    dataset_id: int
+    table_name: str
+    rows: int  # 上传的行数
+    inserted: int  # 新增行数
+    updated: int  # 按主键替换的行数
+    schema_changed: bool
+    schema_changes: List[Dict[str, Any]] = []
+    data_version: int
+    retraining: bool  # 表结构变化时会重新训练
+
+
+class IngestJobResponse(BaseModel):
+    """异步导入任务状态"""
+    job_id: int
+    status: str  # pending, running, completed, failed
+    progress: int  # 进度百分比 0-100（按已读取字节数估算）
+    rows_processed: int
+    bytes_processed: int
+    total_bytes: int
+    dataset_id: Optional[int] = None  # 导入成功后的数据集
+    dataset_name: str
+    error_msg: Optional[str] = None
+    attempts: int = 0
+    retryable: bool = False  # 失败且落盘文件仍在，可直接重试
+    files: Optional[List[FileImportResult]] = None  # 每个文件的导入结果（完成后）
+    elapsed_ms: Optional[float] = None
+    reused: bool = False  # 内容与已有数据集相同，直接复用了已有数据集
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+
 class UploadedDatasetInfo(BaseModel):
     """上传数据集信息"""
     dataset_id: int
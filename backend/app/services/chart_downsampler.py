@@ -0,0 +1,245 @@
+"""
+图表降采样服务 - 序列化之前按图表类型缩减数据点，控制返回给前端的数据量和渲染时间
+
+- 折线图/面积图：单个数值序列使用 LTTB（保留视觉形状），多个数值序列使用分桶最小/最大值（保留峰谷）；
+  有分类列时按分类拆成多条序列分别降采样
+- 散点图：按网格抽稀，每个网格保留一个点（保留离群点和分布形状）
+- 直方图（图表类型明确为 histogram）：数值横轴等宽分箱，数值列按箱求和；只有一个数值列时统计每箱的行数。
+  平均值、比率等不可加的指标求和没有意义，此时不分箱；普通柱状图的每根柱子都是独立的类别或取值，不做处理
+
+降采样只影响图表数据，完整结果仍用于导出。
+"""
+import re
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.core.config import settings
+from app.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class ChartDownsampler:
+    """图表数据降采样器"""
+
+    METHOD_LTTB = "lttb"
+    METHOD_MINMAX = "minmax"
+    METHOD_GRID = "grid"
+    METHOD_BINNING = "binning"
+
+    # 列名表示平均值、比率、占比等不可加指标（按箱求和没有意义）
+    _NON_ADDITIVE_PATTERN = re.compile(
+        r"avg|mean|average|median|rate|ratio|pct|percent|share|均|率|占比|比例|中位", re.IGNORECASE
+    )
+
+    @staticmethod
+    def reduce(
+        df: pd.DataFrame,
+        chart_type: str,
+        max_points: Optional[int] = None,
+    ) -> Tuple[pd.DataFrame, Optional[str]]:
+        """
+        按图表类型降采样
+
+        Args:
+            df: 查询结果
+            chart_type: 图表类型
+            max_points: 最多保留的数据点数，默认 CHART_MAX_POINTS
+
+        Returns:
+            (降采样后的数据, 降采样方法)，不需要或无法降采样时返回 (原数据, None)
+        """
+        max_points = max_points or settings.CHART_MAX_POINTS
+        if df is None or len(df) <= max_points or max_points < 4:
+            return df, None
+
+        try:
+            if chart_type in ("line", "area"):
+                result = ChartDownsampler._reduce_series(df, max_points)
+            elif chart_type == "scatter":
+                result = ChartDownsampler._reduce_scatter(df, max_points)
+            elif chart_type == "histogram":
+                result = ChartDownsampler._reduce_histogram(df)
+            else:
+                result = None
+        except Exception as e:
+            logger.warning("Chart downsampling failed", chart_type=chart_type, rows=len(df), error=str(e))
+            result = None
+
+        if result is None:
+            return df, None
+        reduced, method = result
+        logger.info("Chart data downsampled", chart_type=chart_type, method=method, rows=len(df), points=len(reduced))
+        return reduced, method
+
+    # ========== 列识别 ==========
+
+    @staticmethod
+    def _numeric_columns(df: pd.DataFrame, exclude: Optional[str] = None) -> List[str]:
+        return [
+            col for col in df.columns
+            if col != exclude and pd.api.types.is_numeric_dtype(df[col]) and not pd.api.types.is_bool_dtype(df[col])
+        ]
+
+    @staticmethod
+    def _axis(df: pd.DataFrame) -> Optional[Tuple[str, np.ndarray]]:
+        """
+        识别横轴：第一个日期/时间列（包括可解析为日期的文本列），否则第一个数值列
+
+        Returns:
+            (列名, 用于排序和计算的浮点数组)
+        """
+        for col in df.columns:
+            series = df[col]
+            if series.dtype == object:
+                series = pd.to_datetime(series, errors="coerce", format="mixed", utc=True)
+                if series.notna().mean() < 0.9:
+                    continue
+            elif not pd.api.types.is_datetime64_any_dtype(series):
+                continue
+            # 转换为相对最早时间的秒数（缺失值为 NaN）
+            return col, (series - series.min()).dt.total_seconds().to_numpy(dtype=float)
+        numeric = ChartDownsampler._numeric_columns(df)
+        if numeric:
+            return numeric[0], df[numeric[0]].to_numpy(dtype=float)
+        return None
+
+    # ========== 折线图 ==========
+
+    @staticmethod
+    def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+        """
+        Largest-Triangle-Three-Buckets：保留首尾点，中间每个桶选取与前一个选中点、下一个桶均值构成
+        最大三角形面积的点
+
+        Args:
+            x, y: 已按 x 排序的数据
+            threshold: 输出点数
+        """
+        n = len(x)
+        if threshold >= n or threshold < 3:
+            return np.arange(n)
+
+        selected = np.empty(threshold, dtype=np.int64)
+        selected[0], selected[-1] = 0, n - 1
+        edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+        previous = 0
+        for i in range(threshold - 2):
+            start, end = edges[i], max(edges[i + 1], edges[i] + 1)
+            next_start, next_end = edges[i + 1], edges[i + 2] if i + 2 < len(edges) else n
+            next_end = max(next_end, next_start + 1)
+            avg_x, avg_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+            area = np.abs(
+                (x[previous] - avg_x) * (y[start:end] - y[previous])
+                - (x[previous] - x[start:end]) * (avg_y - y[previous])
+            )
+            previous = start + int(np.argmax(area))
+            selected[i + 1] = previous
+        return selected
+
+    @staticmethod
+    def minmax_indices(values: np.ndarray, buckets: int) -> np.ndarray:
+        """
+        分桶最小/最大值：按位置等分为 buckets 个桶，保留每个桶内每列的最小值和最大值所在行，以及首尾行
+
+        Args:
+            values: 已按横轴排序的二维数组（行 × 数值列）
+        """
+        n = len(values)
+        keep = {0, n - 1}
+        for bucket in np.array_split(np.arange(n), buckets):
+            if len(bucket) == 0:
+                continue
+            chunk = values[bucket]
+            keep.update(bucket[np.nanargmin(chunk, axis=0)].tolist())
+            keep.update(bucket[np.nanargmax(chunk, axis=0)].tolist())
+        return np.array(sorted(keep), dtype=np.int64)
+
+    @staticmethod
+    def _reduce_series(df: pd.DataFrame, max_points: int) -> Optional[Tuple[pd.DataFrame, str]]:
+        axis = ChartDownsampler._axis(df)
+        if axis is None:
+            return None
+        x_col, x = axis
+        y_cols = ChartDownsampler._numeric_columns(df, exclude=x_col)
+        if not y_cols:
+            return None
+        series_cols = [col for col in df.columns if col != x_col and col not in y_cols]
+
+        frame = df.assign(_x=x).dropna(subset=["_x"]).sort_values("_x", kind="stable")
+        groups = [frame] if not series_cols else [group for _, group in frame.groupby(series_cols, sort=False, dropna=False)]
+        budget = max_points // len(groups)
+        if budget < 4:
+            # 序列太多，每条序列分不到足够的点
+            return None
+
+        method = ChartDownsampler.METHOD_LTTB if len(y_cols) == 1 else ChartDownsampler.METHOD_MINMAX
+        parts = []
+        for group in groups:
+            if len(group) <= budget:
+                parts.append(group)
+                continue
+            values = group[y_cols].to_numpy(dtype=float)
+            if np.isnan(values).any():
+                # 缺失值无法参与三角形面积计算，改用分桶最小/最大值
+                method = ChartDownsampler.METHOD_MINMAX
+                values = np.where(np.isnan(values), np.nanmean(values, axis=0), values)
+            if method == ChartDownsampler.METHOD_LTTB:
+                indices = ChartDownsampler.lttb_indices(group["_x"].to_numpy(), values[:, 0], budget)
+            else:
+                indices = ChartDownsampler.minmax_indices(values, max(1, budget // (2 * len(y_cols))))
+            parts.append(group.iloc[indices])
+
+        # 保持原结果的行顺序
+        reduced = pd.concat(parts).sort_index(kind="stable")
+        return reduced.drop(columns="_x"), method
+
+    # ========== 散点图 ==========
+
+    @staticmethod
+    def _reduce_scatter(df: pd.DataFrame, max_points: int) -> Optional[Tuple[pd.DataFrame, str]]:
+        numeric = ChartDownsampler._numeric_columns(df)
+        if len(numeric) < 2:
+            return None
+        x = df[numeric[0]].to_numpy(dtype=float)
+        y = df[numeric[1]].to_numpy(dtype=float)
+        grid = int(np.sqrt(max_points))
+
+        def cells(values: np.ndarray) -> np.ndarray:
+            low, high = np.nanmin(values), np.nanmax(values)
+            if high <= low:
+                return np.zeros(len(values), dtype=np.int64)
+            scaled = np.nan_to_num((values - low) / (high - low) * (grid - 1), nan=0)
+            return scaled.astype(np.int64)
+
+        _, first = np.unique(cells(x) * grid + cells(y), return_index=True)
+        return df.iloc[np.sort(first)], ChartDownsampler.METHOD_GRID
+
+    # ========== 直方图 ==========
+
+    @staticmethod
+    def _reduce_histogram(df: pd.DataFrame) -> Optional[Tuple[pd.DataFrame, str]]:
+        numeric = ChartDownsampler._numeric_columns(df)
+        # 横轴必须是数值列（分类横轴的柱状图不能分箱）
+        if not numeric or df.columns[0] != numeric[0]:
+            return None
+        x_col = numeric[0]
+        y_cols = numeric[1:]
+        non_additive = [col for col in y_cols if ChartDownsampler._NON_ADDITIVE_PATTERN.search(str(col))]
+        if non_additive:
+            logger.info("Histogram binning skipped for non-additive measures", columns=non_additive)
+            return None
+        low, high = df[x_col].min(), df[x_col].max()
+        if pd.isna(low) or high <= low:
+            return None
+        edges = np.linspace(low, high, settings.CHART_HISTOGRAM_BINS + 1)
+        bins = pd.cut(df[x_col], bins=edges, include_lowest=True)
+        labels = bins.cat.categories
+        if y_cols:
+            grouped = df[y_cols].groupby(bins, observed=False).sum()
+        else:
+            grouped = df[[x_col]].groupby(bins, observed=False).size().to_frame("count")
+        grouped.index = [f"{interval.left:g} ~ {interval.right:g}" for interval in labels]
+        return grouped.rename_axis(x_col).reset_index(), ChartDownsampler.METHOD_BINNING
@@ -0,0 +1,327 @@
+"""
+看板预计算调度
+
+在独立的工作进程中运行（python run_dashboard_scheduler.py），按每个看板的 cron 表达式或固定间隔
+刷新全部卡片并写入卡片结果缓存，预计算结果在下次计划刷新之前都视为新鲜，打开看板时直接命中缓存。
+
+- 每次计算下次执行时间时加入 0~jitter_seconds 的随机延后，避免大量看板在同一时刻刷新
+- 同一数据源同时执行的查询数沿用 DASHBOARD_DATASOURCE_CONCURRENCY 限制
+- 每次执行写入 dashboard_refresh_runs，保留最近 DASHBOARD_REFRESH_HISTORY_LIMIT 条
+- 多个工作进程同时运行时，通过条件更新 next_run_at 认领计划，同一次计划只会执行一次
+- 每个看板的刷新是独立的后台任务，同时刷新的看板数受 DASHBOARD_SCHEDULER_CONCURRENCY 限制；
+  主循环不等待刷新完成，继续按间隔认领到期计划（仍在刷新的看板不会被重复认领）
+"""
+
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Set
+from zoneinfo import ZoneInfo
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.logger import get_logger
+from app.db.session import SessionLocal
+from app.models.metadata import DashboardRefreshRun, DashboardSchedule
+from app.services.dashboard_service import DashboardService
+
+logger = get_logger(__name__)
+
+MIN_INTERVAL_SECONDS = 60
+
+
+class CronExpression:
+    """
+    5 段 cron 表达式（分 时 日 月 周），支持 *、数字、范围 a-b、步长 */n 和 a-b/n、逗号列表
+
+    周字段 0 和 7 都表示周日；日和周都不是 * 时，任一匹配即可（与标准 cron 一致）。
+    """
+
+    FIELD_RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expression: str):
+        parts = expression.split()
+        if len(parts) != 5:
+            raise ValueError(f"cron 表达式需要 5 段（分 时 日 月 周）: {expression}")
+        self.expression = expression
+        fields = [self._parse_field(part, low, high) for part, (low, high) in zip(parts, self.FIELD_RANGES)]
+        self.minutes, self.hours, self.days, self.months, weekdays = fields
+        # cron 中 0/7 为周日，转换为 Python weekday（周一为 0）
+        self.weekdays = {(day - 1) % 7 for day in weekdays}
+        self.any_day = parts[2] == "*"
+        self.any_weekday = parts[4] == "*"
+
+    @staticmethod
+    def _parse_field(field: str, low: int, high: int) -> Set[int]:
+        values = set()
+        for item in field.split(","):
+            step = 1
+            if "/" in item:
+                item, step_text = item.split("/", 1)
+                if not step_text.isdigit() or int(step_text) == 0:
+                    raise ValueError(f"cron 步长无效: {field}")
+                step = int(step_text)
+            if item == "*":
+                start, end = low, high
+            elif "-" in item:
+                start_text, end_text = item.split("-", 1)
+                if not (start_text.isdigit() and end_text.isdigit()):
+                    raise ValueError(f"cron 范围无效: {field}")
+                start, end = int(start_text), int(end_text)
+            elif item.isdigit():
+                start = end = int(item)
+            else:
+                raise ValueError(f"cron 字段无效: {field}")
+            if start < low or end > high or start > end:
+                raise ValueError(f"cron 字段超出范围 {low}-{high}: {field}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, day: datetime) -> bool:
+        if day.month not in self.months:
+            return False
+        day_ok = day.day in self.days
+        weekday_ok = day.weekday() in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day_ok and weekday_ok
+        return day_ok or weekday_ok
+
+    def next_after(self, after: datetime) -> datetime:
+        """
+        计算 after 之后（不含）的下一个匹配时间
+
+        Args:
+            after: 带时区的时间，按该时区解释 cron 表达式
+        """
+        start = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        day = start.replace(hour=0, minute=0)
+        # 最多向后查找 5 年（覆盖 2 月 29 日这类表达式）
+        for _ in range(366 * 5):
+            if self._day_matches(day):
+                for hour in sorted(self.hours):
+                    for minute in sorted(self.minutes):
+                        candidate = day.replace(hour=hour, minute=minute)
+                        if candidate >= start:
+                            return candidate
+            day = (day + timedelta(days=1)).replace(hour=0, minute=0)
+        raise ValueError(f"cron 表达式没有可执行的时间: {self.expression}")
+
+
+def validate_schedule(cron: Optional[str], interval_seconds: Optional[int]):
+    """
+    校验计划配置：cron 和固定间隔必须二选一
+
+    Raises:
+        ValueError: 配置无效
+    """
+    if bool(cron) == bool(interval_seconds):
+        raise ValueError("cron 和 interval_seconds 必须且只能设置一个")
+    if cron:
+        CronExpression(cron)
+    elif interval_seconds < MIN_INTERVAL_SECONDS:
+        raise ValueError(f"刷新间隔不能小于 {MIN_INTERVAL_SECONDS} 秒")
+
+
+def compute_next_run(schedule: DashboardSchedule, after: Optional[datetime] = None) -> datetime:
+    """
+    计算下次执行时间（UTC，不带时区，与其他时间字段一致），包含随机延后
+
+    cron 按 DASHBOARD_SCHEDULE_TIMEZONE 时区解释。
+    """
+    after = after or datetime.utcnow()
+    if schedule.cron:
+        tz = ZoneInfo(settings.DASHBOARD_SCHEDULE_TIMEZONE)
+        local = after.replace(tzinfo=timezone.utc).astimezone(tz)
+        next_run = CronExpression(schedule.cron).next_after(local).astimezone(timezone.utc).replace(tzinfo=None)
+    else:
+        next_run = after + timedelta(seconds=schedule.interval_seconds)
+    if schedule.jitter_seconds:
+        next_run += timedelta(seconds=random.uniform(0, schedule.jitter_seconds))
+    return next_run
+
+
+class DashboardScheduler:
+    """看板预计算调度器"""
+
+    @classmethod
+    def claim_due(cls, db: Session, now: Optional[datetime] = None, exclude: Iterable[int] = ()) -> List[Dict]:
+        """
+        认领到期的计划并推进下次执行时间
+
+        先推进 next_run_at 再执行：执行过程中进程退出只会跳过本次，不会在重启后重复执行；
+        条件更新保证多个工作进程不会认领同一次计划。
+
+        Args:
+            exclude: 不认领的看板 ID（本进程中仍在刷新的看板）
+
+        Returns:
+            [{"dashboard_id", "fresh_until"}, ...]，fresh_until 为下次执行时间（时间戳）
+        """
+        now = now or datetime.utcnow()
+        query = db.query(DashboardSchedule).filter(
+            DashboardSchedule.enabled.is_(True), DashboardSchedule.next_run_at <= now
+        )
+        exclude = list(exclude)
+        if exclude:
+            query = query.filter(DashboardSchedule.dashboard_id.notin_(exclude))
+        due = query.all()
+        claimed = []
+        for schedule in due:
+            next_run = compute_next_run(schedule, now)
+            updated = (
+                db.query(DashboardSchedule)
+                .filter(DashboardSchedule.id == schedule.id, DashboardSchedule.next_run_at == schedule.next_run_at)
+                .update({"next_run_at": next_run, "last_run_at": now}, synchronize_session=False)
+            )
+            db.commit()
+            if updated:
+                claimed.append({
+                    "dashboard_id": schedule.dashboard_id,
+                    "fresh_until": next_run.replace(tzinfo=timezone.utc).timestamp(),
+                })
+        return claimed
+
+    @classmethod
+    async def refresh_dashboard(cls, dashboard_id: int, fresh_until: Optional[float] = None) -> DashboardRefreshRun:
+        """刷新看板全部卡片并写入缓存，记录执行结果"""
+        db = SessionLocal()
+        try:
+            run = DashboardRefreshRun(dashboard_id=dashboard_id, status="running", started_at=datetime.utcnow())
+            db.add(run)
+            db.commit()
+            db.refresh(run)
+
+            start = time.perf_counter()
+            try:
+                queries = DashboardService.plan_shared_queries(
+                    DashboardService.load_dashboard_queries(db, dashboard_id)
+                )
+                details = await asyncio.gather(*[cls._precompute_card(query, fresh_until) for query in queries])
+            except Exception as e:
+                db.rollback()
+                run.status = "failed"
+                run.error_msg = str(e)
+                details = []
+                logger.error("Dashboard precompute failed", dashboard_id=dashboard_id, error=str(e), exc_info=True)
+            else:
+                failed = sum(1 for item in details if item["error"])
+                run.status = "completed" if failed == 0 else ("failed" if failed == len(details) else "partial")
+
+            run.details = list(details)
+            run.cards_total = len(details)
+            run.cards_failed = sum(1 for item in details if item["error"])
+            run.elapsed_ms = int((time.perf_counter() - start) * 1000)
+            run.finished_at = datetime.utcnow()
+            db.commit()
+            cls._prune_history(db, dashboard_id)
+
+            logger.info(
+                "Dashboard precomputed",
+                dashboard_id=dashboard_id,
+                status=run.status,
+                cards=run.cards_total,
+                failed=run.cards_failed,
+                elapsed_ms=run.elapsed_ms,
+            )
+            db.refresh(run)
+            db.expunge(run)
+            return run
+        finally:
+            db.close()
+
+    @classmethod
+    async def _precompute_card(cls, query: Dict, fresh_until: Optional[float]) -> Dict:
+        detail = {"card_id": query["card_id"], "row_count": 0, "elapsed_ms": 0.0, "error": query.get("error")}
+        if detail["error"]:
+            return detail
+        try:
+            detail.update(await DashboardService.precompute(query, fresh_until))
+        except Exception as e:
+            detail["error"] = str(e)
+            logger.warning("Card precompute failed", card_id=query["card_id"], error=str(e))
+        return detail
+
+    @classmethod
+    def _prune_history(cls, db: Session, dashboard_id: int):
+        """只保留最近 DASHBOARD_REFRESH_HISTORY_LIMIT 条执行记录"""
+        stale_ids = [
+            run_id for (run_id,) in (
+                db.query(DashboardRefreshRun.id)
+                .filter(DashboardRefreshRun.dashboard_id == dashboard_id)
+                .order_by(DashboardRefreshRun.id.desc())
+                .offset(settings.DASHBOARD_REFRESH_HISTORY_LIMIT)
+                .all()
+            )
+        ]
+        if stale_ids:
+            db.query(DashboardRefreshRun).filter(DashboardRefreshRun.id.in_(stale_ids)).delete(
+                synchronize_session=False
+            )
+            db.commit()
+
+    @classmethod
+    def _claim(cls, now: Optional[datetime] = None, exclude: Iterable[int] = ()) -> List[Dict]:
+        db = SessionLocal()
+        try:
+            return cls.claim_due(db, now, exclude)
+        finally:
+            db.close()
+
+    @classmethod
+    def _new_semaphore(cls) -> asyncio.Semaphore:
+        return asyncio.Semaphore(max(1, settings.DASHBOARD_SCHEDULER_CONCURRENCY))
+
+    @classmethod
+    async def _refresh_limited(cls, semaphore: asyncio.Semaphore, item: Dict) -> DashboardRefreshRun:
+        async with semaphore:
+            return await cls.refresh_dashboard(item["dashboard_id"], item["fresh_until"])
+
+    @classmethod
+    async def run_due(cls, now: Optional[datetime] = None) -> List[DashboardRefreshRun]:
+        """执行所有到期的计划并等待完成（同时刷新的看板数受 DASHBOARD_SCHEDULER_CONCURRENCY 限制）"""
+        claimed = await asyncio.to_thread(cls._claim, now)
+        if not claimed:
+            return []
+        semaphore = cls._new_semaphore()
+        return await asyncio.gather(*[cls._refresh_limited(semaphore, item) for item in claimed])
+
+    @classmethod
+    async def run_forever(cls):
+        """
+        调度主循环：每 DASHBOARD_SCHEDULER_POLL_SECONDS 秒检查一次到期计划
+
+        到期的看板作为后台任务刷新，主循环不等待刷新完成；本进程中仍在刷新（或排队等待）的看板不再认领。
+        """
+        logger.info(
+            "Dashboard scheduler started",
+            poll_seconds=settings.DASHBOARD_SCHEDULER_POLL_SECONDS,
+            concurrency=settings.DASHBOARD_SCHEDULER_CONCURRENCY,
+        )
+        semaphore = cls._new_semaphore()
+        running: Dict[int, asyncio.Task] = {}
+
+        def done(dashboard_id: int, task: asyncio.Task):
+            running.pop(dashboard_id, None)
+            if not task.cancelled() and task.exception() is not None:
+                logger.error("Dashboard refresh task failed", dashboard_id=dashboard_id, error=str(task.exception()))
+
+        try:
+            while True:
+                try:
+                    for item in await asyncio.to_thread(cls._claim, None, set(running)):
+                        dashboard_id = item["dashboard_id"]
+                        task = asyncio.create_task(
+                            cls._refresh_limited(semaphore, item), name=f"dashboard-refresh-{dashboard_id}"
+                        )
+                        running[dashboard_id] = task
+                        task.add_done_callback(lambda finished, dashboard_id=dashboard_id: done(dashboard_id, finished))
+                except Exception as e:
+                    logger.error("Dashboard scheduler iteration failed", error=str(e), exc_info=True)
+                await asyncio.sleep(settings.DASHBOARD_SCHEDULER_POLL_SECONDS)
+        finally:
+            tasks = list(running.values())
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,573 @@
+"""
+看板数据服务
+
+- 一次查询加载看板的全部卡片及其数据集、数据源，并在请求线程中解析好执行目标（引擎 / DuckDB 文件）
+- 并发执行卡片 SQL，同一数据源同时执行的查询数受 DASHBOARD_DATASOURCE_CONCURRENCY 限制
+- 按完成顺序返回每张卡片的结果，单张卡片失败不影响其他卡片
+- 卡片结果缓存在 Redis 中，键为卡片 SQL + 数据集数据版本：新鲜期内直接返回；过期但未超过最大缓存时长时
+  立即返回旧结果并在后台刷新（stale-while-revalidate），数据库负载取决于刷新频率而不是访问人数。
+  相同查询同时只执行一次
+- 计划任务预计算的结果在下次计划刷新之前都视为新鲜
+- 增量刷新（refresh_mode=incremental）：按时间分组的卡片只重算缓存中最新时间桶往前 N 天的窗口，
+  与缓存中更早的时间桶合并。窗口查询把卡片 SQL 作为子查询并按时间列过滤，时间列是分组键，
+  数据库会把过滤条件下推到聚合之前，只扫描最近几天的数据。没有缓存、数据版本变化（缓存键变化）、
+  结果列变化或距上次全量重算超过 DASHBOARD_INCREMENTAL_FULL_REFRESH_SECONDS 时全量重算
+- 跨卡片去重：缓存键使用规范化后的 SQL，只有空白、注释、关键字大小写不同的卡片共享同一次查询和缓存；
+  FROM / WHERE / GROUP BY 完全相同、只有投影不同的卡片合并为一个查询，各卡片从结果中取自己的列
+- 图表数据降采样：结果超过 CHART_MAX_POINTS 行时，写入缓存前按图表类型生成降采样后的图表数据，
+  默认返回降采样结果；缓存中保留完整结果，full=True 时返回完整结果（导出、明细表格）
+"""
+
+import asyncio
+import math
+import time
+import weakref
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import pandas as pd
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.logger import get_logger
+from app.core.redis import generate_cache_key, redis_service
+from app.models.metadata import DashboardCard, DataSource, Dataset
+from app.services.chart_downsampler import ChartDownsampler
+from app.services.db_inspector import DBInspector
+from app.services.duckdb_service import DuckDBService
+from app.utils.sql_canonical import canonicalize_sql, has_row_limit, split_grouped_select
+
+logger = get_logger(__name__)
+
+CARD_CACHE_PREFIX = "bi:card_cache"
+
+# 每个事件循环一组状态（asyncio 对象只能在创建它的事件循环中使用）：
+# semaphores 为数据源并发信号量，inflight 为正在执行的卡片查询（按缓存键）
+_loop_state: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, Dict]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _state(name: str) -> Dict:
+    loop = asyncio.get_running_loop()
+    return _loop_state.setdefault(loop, {"semaphores": {}, "inflight": {}})[name]
+
+
+def serialize_value(value: Any) -> Any:
+    """把查询结果中的值转换为 JSON 可序列化的类型（缺失值转换为 None）"""
+    if value is pd.NaT or (isinstance(value, float) and math.isnan(value)):
+        return None
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def frame_to_payload(df: pd.DataFrame) -> Dict[str, Any]:
+    """DataFrame 转换为卡片数据 {columns, rows}"""
+    rows = [
+        {key: serialize_value(value) for key, value in row.items()}
+        for row in df.to_dict(orient="records")
+    ]
+    return {"columns": df.columns.tolist(), "rows": rows}
+
+
+def detect_time_column(df: pd.DataFrame) -> Optional[str]:
+    """识别结果中的时间列：第一个日期/时间类型的列"""
+    for column in df.columns:
+        series = df[column]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            return column
+        if series.dtype == object:
+            values = series.dropna()
+            if len(values) and all(isinstance(value, (date, datetime)) for value in values):
+                return column
+    return None
+
+
+def parse_times(values: List[Any]) -> pd.Series:
+    """解析缓存结果中的时间值（ISO 字符串），无法解析的为 NaT；带时区的保留本地时间"""
+    times = pd.to_datetime(pd.Series(values, dtype=object), errors="coerce", format="ISO8601")
+    if getattr(times.dt, "tz", None) is not None:
+        times = times.dt.tz_localize(None)
+    return times
+
+
+def is_connection_error(error: Exception) -> bool:
+    """区分数据库连接问题（可重试）与 SQL 错误"""
+    message = str(error)
+    return "Lost connection" in message or "Connection reset" in message
+
+
+class DashboardService:
+    """看板卡片查询"""
+
+    @classmethod
+    def build_card_query(cls, card: DashboardCard, dataset: Dataset, datasource: Optional[DataSource]) -> Dict:
+        """
+        生成卡片的执行信息（与数据库会话解绑，可在工作线程中使用）
+
+        Returns:
+            dict: {card_id, title, chart_type, sql, dataset_id, data_version,
+                   duckdb_path, engine, source_key, refresh_mode, time_column, window_days}
+
+        Raises:
+            ValueError: 数据集既没有 DuckDB 文件也没有数据源
+        """
+        if dataset.duckdb_path:
+            engine, source_key = None, f"duckdb:{dataset.duckdb_path}"
+        elif datasource is not None:
+            engine, source_key = DBInspector.get_engine(datasource), f"datasource:{datasource.id}"
+        else:
+            raise ValueError("DataSource not found")
+
+        return {
+            "card_id": card.id,
+            "title": card.title,
+            "chart_type": card.chart_type,
+            "sql": card.sql,
+            "dataset_id": dataset.id,
+            "data_version": dataset.data_version or 1,
+            "duckdb_path": dataset.duckdb_path,
+            "engine": engine,
+            "source_key": source_key,
+            "refresh_mode": card.refresh_mode or "full",
+            "time_column": card.time_column,
+            "window_days": card.incremental_window_days or settings.DASHBOARD_INCREMENTAL_WINDOW_DAYS,
+        }
+
+    @classmethod
+    def load_card_query(cls, db: Session, card_id: int) -> Optional[Dict]:
+        """加载单张卡片的执行信息，卡片或数据集不存在时返回 None"""
+        row = (
+            db.query(DashboardCard, Dataset, DataSource)
+            .join(Dataset, Dataset.id == DashboardCard.dataset_id)
+            .outerjoin(DataSource, DataSource.id == Dataset.datasource_id)
+            .filter(DashboardCard.id == card_id)
+            .first()
+        )
+        return cls.build_card_query(*row) if row else None
+
+    @classmethod
+    def load_dashboard_queries(cls, db: Session, dashboard_id: int) -> List[Dict]:
+        """
+        一次查询加载看板全部卡片及其数据集、数据源
+
+        无法执行的卡片（数据源缺失）也会返回，附带 error 字段，由调用方原样输出。
+        """
+        rows = (
+            db.query(DashboardCard, Dataset, DataSource)
+            .join(Dataset, Dataset.id == DashboardCard.dataset_id)
+            .outerjoin(DataSource, DataSource.id == Dataset.datasource_id)
+            .filter(DashboardCard.dashboard_id == dashboard_id)
+            .order_by(DashboardCard.id)
+            .all()
+        )
+        queries = []
+        for card, dataset, datasource in rows:
+            try:
+                queries.append(cls.build_card_query(card, dataset, datasource))
+            except Exception as e:
+                queries.append({"card_id": card.id, "title": card.title, "chart_type": card.chart_type, "error": str(e)})
+        return queries
+
+    @classmethod
+    def execute_card_query(cls, query: Dict) -> pd.DataFrame:
+        """执行卡片 SQL（同步，在工作线程中调用）"""
+        if query["duckdb_path"]:
+            return DuckDBService.execute_query(query["duckdb_path"], query["sql"], read_only=True)
+        return pd.read_sql(query["sql"], query["engine"])
+
+    # ========== 增量刷新 ==========
+
+    @classmethod
+    def _incremental_cutoff(cls, query: Dict, base: Optional[Dict]) -> Optional[pd.Timestamp]:
+        """
+        计算增量重算窗口的起点：缓存中最新的时间桶往前推 window_days 天
+
+        卡片 SQL 用 LIMIT / OFFSET 截取结果时（如 ORDER BY ... LIMIT 30 的最近 N 天）全量重算：
+        窗口重算结果与缓存合并后行数会超过 LIMIT，且窗口外被挤出的行无法在合并时去掉。
+
+        Returns:
+            窗口起点，None 表示需要全量重算
+        """
+        if query.get("refresh_mode") != "incremental" or not isinstance(base, dict):
+            return None
+        if has_row_limit(query["sql"]):
+            return None
+        column = base.get("time_column")
+        if not column or column not in base.get("columns", []) or not base.get("rows"):
+            return None
+        if query.get("time_column") and query["time_column"] != column:
+            return None
+        if time.time() - (base.get("full_computed_at") or 0) > settings.DASHBOARD_INCREMENTAL_FULL_REFRESH_SECONDS:
+            return None
+        latest = parse_times([row.get(column) for row in base["rows"]]).max()
+        if pd.isna(latest):
+            return None
+        return latest - pd.Timedelta(days=query["window_days"])
+
+    @classmethod
+    def _window_sql(cls, query: Dict, column: str, cutoff: pd.Timestamp) -> str:
+        """卡片 SQL 作为子查询，只取时间列不早于 cutoff 的时间桶"""
+        if query["engine"] is not None:
+            quoted = query["engine"].dialect.identifier_preparer.quote(column)
+        else:
+            quoted = '"' + column.replace('"', '""') + '"'
+        if cutoff == cutoff.normalize():
+            literal = cutoff.strftime("%Y-%m-%d")
+        else:
+            literal = cutoff.strftime("%Y-%m-%d %H:%M:%S")
+        sql = query["sql"].strip().rstrip(";")
+        return f"SELECT * FROM ({sql}) AS _card WHERE {quoted} >= '{literal}'"
+
+    @classmethod
+    def _merge_window(cls, base: Dict, window_rows: List[Dict], column: str, cutoff: pd.Timestamp) -> List[Dict]:
+        """
+        保留缓存中窗口之前（以及时间为空）的行，窗口内的行替换为重算结果
+
+        原结果按时间排序时合并结果保持相同的顺序。
+        """
+        base_times = parse_times([row.get(column) for row in base["rows"]])
+        kept = [row for row, value in zip(base["rows"], base_times) if pd.isna(value) or value < cutoff]
+        rows = kept + window_rows
+        ascending = base_times.is_monotonic_increasing
+        if ascending or base_times.is_monotonic_decreasing:
+            times = parse_times([row.get(column) for row in rows])
+            order = times.sort_values(ascending=ascending, kind="stable", na_position="last").index
+            rows = [rows[i] for i in order]
+        return rows
+
+    @classmethod
+    def compute_card_data(cls, query: Dict, base: Optional[Dict] = None) -> Dict:
+        """
+        执行卡片查询（同步，在工作线程中调用），增量刷新的卡片有可用缓存时只重算最近的时间窗口
+
+        Args:
+            base: 当前缓存的结果，作为增量合并的基础
+
+        Returns:
+            dict: {columns, rows, row_count, time_column, full_computed_at, incremental}
+        """
+        cutoff = cls._incremental_cutoff(query, base)
+        if cutoff is not None:
+            column = base["time_column"]
+            window_df = cls.execute_card_query(dict(query, sql=cls._window_sql(query, column, cutoff)))
+            if window_df.columns.tolist() == base["columns"]:
+                rows = cls._merge_window(base, frame_to_payload(window_df)["rows"], column, cutoff)
+                return {
+                    "columns": base["columns"],
+                    "rows": rows,
+                    "row_count": len(rows),
+                    "time_column": column,
+                    "full_computed_at": base["full_computed_at"],
+                    "incremental": True,
+                }
+            logger.info("Card result columns changed, full recompute", card_id=query["card_id"])
+
+        df = cls.execute_card_query(query)
+        time_column = None
+        if query.get("refresh_mode") == "incremental":
+            time_column = query.get("time_column") or detect_time_column(df)
+            if time_column not in df.columns:
+                logger.warning("Card time column not found, incremental refresh disabled",
+                               card_id=query["card_id"], time_column=time_column)
+                time_column = None
+        return {
+            **frame_to_payload(df),
+            "row_count": len(df),
+            "time_column": time_column,
+            "full_computed_at": time.time(),
+            "incremental": False,
+        }
+
+    @classmethod
+    def _semaphore(cls, source_key: str) -> asyncio.Semaphore:
+        semaphores = _state("semaphores")
+        semaphore = semaphores.get(source_key)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(max(1, settings.DASHBOARD_DATASOURCE_CONCURRENCY))
+            semaphores[source_key] = semaphore
+        return semaphore
+
+    # ========== 跨卡片共享查询 ==========
+
+    @classmethod
+    def plan_shared_queries(cls, queries: List[Dict]) -> List[Dict]:
+        """
+        找出共享同一个分组基础查询的卡片，为每组生成一个合并投影的查询
+
+        同一数据源、数据集和数据版本下，FROM 及之后的部分（WHERE / GROUP BY / HAVING / ORDER BY / LIMIT）
+        规范化后完全相同、只有投影不同的卡片合并为一组；组内同名输出列必须是相同的表达式。
+        组内的卡片附带 shared 字段 {query, positions}，执行时改为执行合并查询并按位置取列。
+        完全相同的 SQL 不需要合并，由缓存键和单飞执行去重。增量刷新的卡片不参与合并。
+
+        Returns:
+            新的查询列表（顺序不变）
+        """
+        groups: Dict[tuple, List[tuple]] = {}
+        for index, query in enumerate(queries):
+            if query.get("error") or query.get("refresh_mode") == "incremental":
+                continue
+            parsed = split_grouped_select(query["sql"])
+            if parsed is None:
+                continue
+            key = (query["source_key"], query["dataset_id"], query["data_version"], parsed.base)
+            groups.setdefault(key, []).append((index, parsed))
+
+        planned = list(queries)
+        for (_, _, _, base), members in groups.items():
+            if len({tuple(parsed.items) for _, parsed in members}) < 2:
+                continue
+            items: List[str] = []
+            names: Dict[str, str] = {}
+            mergeable = []
+            for index, parsed in members:
+                # 同名输出列对应不同表达式时无法合并
+                if any(names.get(name.lower(), item) != item for item, name in zip(parsed.items, parsed.names)):
+                    continue
+                for item, name in zip(parsed.items, parsed.names):
+                    if name.lower() not in names:
+                        names[name.lower()] = item
+                        items.append(item)
+                mergeable.append((index, parsed))
+            if len(mergeable) < 2:
+                continue
+
+            first = queries[mergeable[0][0]]
+            shared_query = dict(
+                first,
+                card_id=None,
+                title=None,
+                sql=f"SELECT {', '.join(items)} {base}",
+                refresh_mode="full",
+            )
+            for index, parsed in mergeable:
+                positions = [items.index(item) for item in parsed.items]
+                planned[index] = dict(queries[index], shared={"query": shared_query, "positions": positions})
+            logger.info(
+                "Cards share grouped base query",
+                cards=[queries[index]["card_id"] for index, _ in mergeable],
+                columns=len(items),
+            )
+        return planned
+
+    @classmethod
+    async def _execute_projection(cls, query: Dict) -> Dict:
+        """执行（或复用正在执行的）合并查询，取出本卡片的列"""
+        shared = query["shared"]
+        merged = await cls._execute_shared(shared["query"])
+        columns = [merged["columns"][position] for position in shared["positions"]]
+        rows = [{column: row[column] for column in columns} for row in merged["rows"]]
+        return {
+            "columns": columns,
+            "rows": rows,
+            "row_count": len(rows),
+            "time_column": None,
+            "full_computed_at": time.time(),
+            "incremental": False,
+        }
+
+    @classmethod
+    def chart_payload(cls, chart_type: str, columns: List[str], rows: List[Dict]) -> Optional[Dict]:
+        """
+        生成降采样后的图表数据（同步，在工作线程中调用）
+
+        Returns:
+            dict: {columns, rows, method}，不需要降采样时返回 None
+        """
+        if len(rows) <= settings.CHART_MAX_POINTS:
+            return None
+        reduced, method = ChartDownsampler.reduce(pd.DataFrame(rows, columns=columns), chart_type)
+        if method is None:
+            return None
+        return {**frame_to_payload(reduced), "method": method}
+
+    # ========== 结果缓存 ==========
+
+    # 后台刷新任务，保留引用避免被垃圾回收
+    _tasks: set = set()
+
+    @classmethod
+    def cache_key(cls, query: Dict) -> str:
+        """卡片结果缓存键：数据集 + 数据版本 + 规范化的 SQL（数据版本变化后自动失效）"""
+        return generate_cache_key(
+            f"{CARD_CACHE_PREFIX}:{query['dataset_id']}", query["data_version"], canonicalize_sql(query["sql"])
+        )
+
+    @classmethod
+    async def _execute(cls, query: Dict, fresh_until: Optional[float] = None) -> Dict:
+        """
+        在数据源并发上限内执行卡片 SQL 并写入缓存
+
+        Args:
+            fresh_until: 预计算结果在此时间戳之前都视为新鲜（到下次计划刷新为止）
+        """
+        if query.get("shared"):
+            data = await cls._execute_projection(query)
+        else:
+            base = None
+            if query.get("refresh_mode") == "incremental":
+                base = await redis_service.get(cls.cache_key(query))
+            async with cls._semaphore(query["source_key"]):
+                data = await asyncio.to_thread(cls.compute_card_data, query, base)
+        data["chart"] = await asyncio.to_thread(
+            cls.chart_payload, query["chart_type"], data["columns"], data["rows"]
+        )
+        now = time.time()
+        data.update(cached_at=now, fresh_until=fresh_until)
+        if settings.DASHBOARD_CACHE_FRESH_SECONDS > 0 or fresh_until:
+            expire = max(settings.DASHBOARD_CACHE_MAX_AGE_SECONDS, settings.DASHBOARD_CACHE_FRESH_SECONDS)
+            if fresh_until:
+                expire += max(0, int(fresh_until - now))
+            if data["time_column"]:
+                # 增量刷新的结果在下次全量重算之前都可作为合并基础
+                expire = max(expire, settings.DASHBOARD_INCREMENTAL_FULL_REFRESH_SECONDS)
+            await redis_service.set(cls.cache_key(query), data, expire=expire)
+        return data
+
+    @classmethod
+    async def precompute(cls, query: Dict, fresh_until: Optional[float] = None) -> Dict:
+        """
+        预计算卡片结果并写入缓存（计划任务调用），查询失败时抛出异常
+
+        Returns:
+            dict: {row_count, elapsed_ms, incremental}
+        """
+        start = time.perf_counter()
+        data = await cls._execute(query, fresh_until)
+        return {
+            "row_count": data["row_count"],
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 2),
+            "incremental": data["incremental"],
+        }
+
+    @classmethod
+    def _execute_shared(cls, query: Dict) -> "asyncio.Future":
+        """相同查询正在执行时复用同一个任务，否则启动新任务"""
+        inflight = _state("inflight")
+        key = cls.cache_key(query)
+        task = inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(cls._execute(query))
+            inflight[key] = task
+
+            def forget(finished):
+                inflight.pop(key, None)
+                # 等待方都已取消时由这里取走异常，避免 "exception was never retrieved"
+                if not finished.cancelled():
+                    finished.exception()
+
+            task.add_done_callback(forget)
+        return task
+
+    @classmethod
+    def _refresh_in_background(cls, query: Dict):
+        if cls.cache_key(query) in _state("inflight"):
+            return
+        task = cls._execute_shared(query)
+        cls._tasks.add(task)
+
+        def done(finished):
+            cls._tasks.discard(finished)
+            if not finished.cancelled() and finished.exception() is not None:
+                logger.warning("Background card refresh failed", card_id=query["card_id"], error=str(finished.exception()))
+
+        task.add_done_callback(done)
+
+    @classmethod
+    async def get_card_data(cls, query: Dict, refresh: bool = False, full: bool = False) -> Dict:
+        """
+        获取卡片数据（优先使用缓存）
+
+        Args:
+            refresh: 忽略缓存，强制重新查询
+            full: 返回完整结果，不使用降采样后的图表数据
+
+        Returns:
+            dict: {columns, rows, row_count, downsample_method, cache_status, cached_at, data_age_seconds}
+                row_count 为完整结果的行数，降采样时 rows 少于 row_count；
+                cache_status 为 fresh（新鲜缓存）、stale（旧缓存，后台刷新中）或 miss（刚查询）
+
+        Raises:
+            Exception: 查询失败（仅在没有可用缓存时）
+        """
+        cached = None
+        if not refresh:
+            cached = await redis_service.get(cls.cache_key(query))
+
+        status = "miss"
+        if isinstance(cached, dict) and "cached_at" in cached:
+            age = time.time() - cached["cached_at"]
+            if age <= settings.DASHBOARD_CACHE_FRESH_SECONDS or time.time() <= (cached.get("fresh_until") or 0):
+                data, status = cached, "fresh"
+            elif age <= settings.DASHBOARD_CACHE_MAX_AGE_SECONDS:
+                data, status = cached, "stale"
+                cls._refresh_in_background(query)
+
+        if status == "miss":
+            # shield：请求取消（客户端断开）时查询继续执行并写入缓存
+            data = await asyncio.shield(cls._execute_shared(query))
+
+        chart = None if full else data.get("chart")
+        return {
+            "columns": chart["columns"] if chart else data["columns"],
+            "rows": chart["rows"] if chart else data["rows"],
+            "row_count": data["row_count"],
+            "downsample_method": chart["method"] if chart else None,
+            "cache_status": status,
+            "cached_at": datetime.utcfromtimestamp(data["cached_at"]).isoformat(),
+            "data_age_seconds": round(max(0.0, time.time() - data["cached_at"]), 1),
+        }
+
+    @classmethod
+    async def run_card_query(cls, query: Dict, refresh: bool = False, full: bool = False) -> Dict:
+        """
+        获取一张卡片的数据，异常转换为结果中的 error
+
+        Returns:
+            dict: {card_id, title, chart_type, columns, rows, row_count, elapsed_ms, error,
+                   downsample_method, cache_status, cached_at, data_age_seconds}
+        """
+        result = {
+            "card_id": query["card_id"],
+            "title": query["title"],
+            "chart_type": query["chart_type"],
+            "columns": [],
+            "rows": [],
+            "row_count": 0,
+            "elapsed_ms": 0.0,
+            "error": query.get("error"),
+            "downsample_method": None,
+            "cache_status": None,
+            "cached_at": None,
+            "data_age_seconds": None,
+        }
+        if result["error"]:
+            return result
+
+        start = time.perf_counter()
+        try:
+            result.update(await cls.get_card_data(query, refresh, full))
+        except Exception as e:
+            logger.error("Card query failed", card_id=query["card_id"], error=str(e))
+            result["error"] = "数据库连接失败，请稍后重试" if is_connection_error(e) else f"SQL 执行错误: {e}"
+        result["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        return result
+
+    @classmethod
+    async def iter_card_results(
+        cls, queries: List[Dict], refresh: bool = False, full: bool = False
+    ) -> AsyncIterator[Dict]:
+        """并发获取多张卡片的数据，按完成顺序逐个产出结果（共享分组基础查询的卡片只查询一次）"""
+        queries = cls.plan_shared_queries(queries)
+        tasks = [asyncio.ensure_future(cls.run_card_query(query, refresh, full)) for query in queries]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # 客户端断开时取消尚未完成的等待（已开始的查询继续执行并写入缓存）
+            for task in tasks:
+                task.cancel()
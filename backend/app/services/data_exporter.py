@@ -4,8 +4,9 @@
 import pandas as pd
 import io
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import IO, Any, Dict, Iterable, List, Optional
 from app.core.logger import get_logger
+from app.services.excel_writer import StreamingExcelWriter
 
 logger = get_logger(__name__)
 
@@ -30,31 +31,33 @@ class DataExporter:
         Returns:
             tuple: (文件内容bytes, 文件名)
         """
-        try:
-            # 转换为DataFrame
-            df = pd.DataFrame(data, columns=columns)
-            
-            # 创建BytesIO对象
-            output = io.BytesIO()
-            
-            # 使用openpyxl引擎写入Excel
-            with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                df.to_excel(writer, index=False, sheet_name='数据')
-                
-                # 获取工作表
-                worksheet = writer.sheets['数据']
-                
-                # 自动调整列宽
-                for idx, col in enumerate(df.columns):
-                    max_length = max(
-                        df[col].astype(str).apply(len).max(),
-                        len(str(col))
-                    )
-                    # 设置列宽（最大50）
-                    worksheet.column_dimensions[chr(65 + idx)].width = min(max_length + 2, 50)
+        output, filename = DataExporter.export_frames_to_excel(
+            [pd.DataFrame(data, columns=columns)], columns, filename_prefix
+        )
+        with output:
+            return output.read(), filename
+    
+    @staticmethod
+    def export_frames_to_excel(
+        frames: Iterable[pd.DataFrame],
+        columns: Optional[List[str]] = None,
+        filename_prefix: str = "分析结果"
+    ) -> tuple[IO[bytes], str]:
+        """
+        按数据块流式导出为Excel（write-only 模式，列宽按样本行估算，内容写入临时文件）
+        
+        Args:
+            frames: 数据块
+            columns: 列名列表，默认使用第一块的列名
+            filename_prefix: 文件名前缀
             
-            # 获取字节内容
-            excel_bytes = output.getvalue()
+        Returns:
+            tuple: (已定位到开头的临时文件，调用方负责关闭, 文件名)
+        """
+        try:
+            writer = StreamingExcelWriter()
+            row_count = writer.write_frames(frames, columns)
+            output = writer.save()
             
             # 生成文件名
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -62,13 +65,13 @@ class DataExporter:
             
             logger.info(
                 "Data exported to Excel",
-                rows=len(df),
-                columns=len(df.columns),
+                rows=row_count,
                 filename=filename,
-                size_kb=len(excel_bytes) / 1024
+                size_kb=output.seek(0, io.SEEK_END) / 1024
             )
+            output.seek(0)
             
-            return excel_bytes, filename
+            return output, filename
             
         except Exception as e:
             logger.error(f"Excel export failed: {e}", exc_info=True)
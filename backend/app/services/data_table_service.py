@@ -4,7 +4,7 @@
 """
 import pandas as pd
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Union
 from sqlalchemy import create_engine, MetaData, Table, Column, Integer, inspect, text
 from sqlalchemy.orm import Session
 
@@ -24,7 +24,7 @@ class DataTableService:
     @staticmethod
     def create_data_table_from_excel(
         display_name: str,
-        file_content: bytes,
+        file_content: Union[bytes, str],
         filename: str,
         fields_config: List[TableFieldConfig],
         datasource_id: int,
@@ -38,7 +38,7 @@ class DataTableService:
         
         Args:
             display_name: 显示名称
-            file_content: 文件内容
+            file_content: 文件内容（字节）或已落盘的文件路径
             filename: 文件名
             fields_config: 字段配置列表
             datasource_id: 数据源ID
@@ -1,3 +1,4 @@
+import threading
 from urllib.parse import quote_plus
 from sqlalchemy import create_engine, text, MetaData, Table, select, inspect
 from sqlalchemy.schema import CreateTable
@@ -11,6 +12,10 @@ import logging
 logger = logging.getLogger(__name__)
 
 class DBInspector:
+    # 引擎缓存：同一数据源复用连接池，{url: engine}
+    _engines: dict = {}
+    _engines_lock = threading.Lock()
+
     @staticmethod
     def _build_url(type_: str, user: str, password: str, host: str, port: int, db: str) -> str:
         if type_ == "sqlite":
@@ -53,6 +58,9 @@ class DBInspector:
     def get_engine(cls, ds: DataSource):
         """
         获取数据库引擎，配置连接池参数防止连接超时
+
+        引擎按连接 URL 缓存，同一数据源的所有请求复用一个连接池；
+        数据源连接信息修改后 URL 变化，会自动创建新引擎。
         """
         password = ""
         if ds.password_encrypted:
@@ -70,6 +78,19 @@ class DBInspector:
             ds.database_name or ""
         )
         
+        engine = cls._engines.get(url)
+        if engine is not None:
+            return engine
+
+        with cls._engines_lock:
+            engine = cls._engines.get(url)
+            if engine is None:
+                engine = cls._create_engine(ds.type, url)
+                cls._engines[url] = engine
+        return engine
+
+    @classmethod
+    def _create_engine(cls, type_: str, url: str):
         # 配置连接池参数
         pool_config = {
             "pool_size": 5,              # 连接池大小
@@ -80,7 +101,7 @@ class DBInspector:
         }
         
         # MySQL 特殊配置
-        if ds.type == "mysql":
+        if type_ == "mysql":
             connect_args = {
                 "connect_timeout": 10,
                 "read_timeout": 30,
@@ -89,7 +110,7 @@ class DBInspector:
             return create_engine(url, **pool_config, connect_args=connect_args)
         
         # PostgreSQL 配置
-        elif ds.type == "postgresql":
+        elif type_ == "postgresql":
             connect_args = {
                 "connect_timeout": 10,
             }
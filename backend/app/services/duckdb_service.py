@@ -5,7 +5,8 @@ DuckDB 服务 - 处理多表数据的存储和查询
 import duckdb
 import pandas as pd
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterable, Callable
+import time
 import logging
 from sqlalchemy.orm import Session
 
@@ -113,6 +114,279 @@ class DuckDBService:
         
         return stats
     
+    # 分批导入时的类型放宽顺序：整数 -> 定点数 -> 浮点 -> 字符串
+    _INTEGER_TYPES = {"TINYINT", "SMALLINT", "INTEGER", "BIGINT", "HUGEINT",
+                      "UTINYINT", "USMALLINT", "UINTEGER", "UBIGINT"}
+    _FLOAT_TYPES = {"FLOAT", "DOUBLE"}
+
+    @classmethod
+    def _widen_type(cls, current: str, incoming: str) -> str:
+        """返回能同时容纳两种类型的列类型"""
+        if current == incoming:
+            return current
+        if current in cls._INTEGER_TYPES and incoming in cls._INTEGER_TYPES:
+            return "BIGINT"
+        # 各批次的定点数精度不同（按批内数据推断），放宽为 DECIMAL(38, 最大小数位) 而不是 DOUBLE，避免丢失有效数字
+        decimals = [t for t in (current, incoming) if t.startswith("DECIMAL")]
+        if decimals and all(t in decimals or (t in cls._INTEGER_TYPES and t != "HUGEINT") for t in (current, incoming)):
+            scale = max(int(t[t.index(",") + 1:-1]) for t in decimals)
+            return f"DECIMAL(38,{scale})"
+        numeric = cls._INTEGER_TYPES | cls._FLOAT_TYPES
+        if all(t in numeric or t.startswith("DECIMAL") for t in (current, incoming)):
+            return "DOUBLE"
+        if all(t == "DATE" or t.startswith("TIMESTAMP") for t in (current, incoming)):
+            return "TIMESTAMP"
+        return "VARCHAR"
+
+    @classmethod
+    def import_batches(
+        cls,
+        db_path: str,
+        table_name: str,
+        batches: Iterable[pd.DataFrame],
+        progress_callback: Optional[Callable[[int], None]] = None
+    ) -> Dict[str, Any]:
+        """分批流式导入一张表，内存占用只与批大小有关
+
+        首批数据决定初始表结构；后续批次若出现不兼容的类型（如整数列中出现小数或文本），
+        通过 ALTER COLUMN 放宽列类型后继续导入。全表导入在一个事务中完成，失败时不会留下半张表。
+
+        Args:
+            db_path: DuckDB 数据库路径
+            table_name: 表名
+            batches: DataFrame 批次迭代器（各批次列名一致）
+            progress_callback: 每批导入后回调，参数为已导入行数
+
+        Returns:
+            {"rows": 行数, "columns": 列数, "batches": 批次数, "elapsed_ms": 耗时}
+        """
+        start = time.perf_counter()
+        quoted_table = f'"{table_name}"'
+        conn = duckdb.connect(db_path)
+        rows = 0
+        batch_count = 0
+        column_types: Dict[str, str] = {}
+
+        try:
+            conn.execute("BEGIN TRANSACTION")
+            for batch in batches:
+                conn.register('batch_df', batch)
+                if batch_count == 0:
+                    conn.execute(f"CREATE OR REPLACE TABLE {quoted_table} AS SELECT * FROM batch_df")
+                    column_types = {
+                        row[0]: row[1] for row in conn.execute(f"DESCRIBE {quoted_table}").fetchall()
+                    }
+                else:
+                    incoming = {row[0]: row[1] for row in conn.execute("DESCRIBE SELECT * FROM batch_df").fetchall()}
+                    for column, incoming_type in incoming.items():
+                        current = column_types.get(column)
+                        # 整批为空的列不参与类型推断
+                        if current is None or batch[column].isna().all():
+                            continue
+                        widened = cls._widen_type(current, incoming_type)
+                        if widened != current:
+                            conn.execute(f'ALTER TABLE {quoted_table} ALTER COLUMN "{column}" TYPE {widened}')
+                            column_types[column] = widened
+                            logger.info(f"Widened column {table_name}.{column}: {current} -> {widened}")
+                    conn.execute(f"INSERT INTO {quoted_table} BY NAME SELECT * FROM batch_df")
+                conn.unregister('batch_df')
+
+                rows += len(batch)
+                batch_count += 1
+                if progress_callback:
+                    progress_callback(rows)
+
+            if batch_count == 0:
+                raise ValueError(f"文件内容为空: {table_name}")
+            conn.execute("COMMIT")
+
+        except Exception as e:
+            conn.execute("ROLLBACK")
+            logger.error(f"Failed to import batches into {table_name}: {e}", exc_info=True)
+            raise
+        finally:
+            conn.close()
+
+        elapsed_ms = round((time.perf_counter() - start) * 1000, 2)
+        logger.info(f"Imported table {table_name}: {rows} rows in {batch_count} batches ({elapsed_ms} ms)")
+        return {"rows": rows, "columns": len(column_types), "batches": batch_count, "elapsed_ms": elapsed_ms}
+
+    @classmethod
+    def merge_batches(
+        cls,
+        db_path: str,
+        table_name: str,
+        batches: Iterable[pd.DataFrame],
+        key_columns: Optional[List[str]] = None,
+        allow_schema_change: bool = False,
+        progress_callback: Optional[Callable[[int], None]] = None
+    ) -> Dict[str, Any]:
+        """向已有表追加数据，或按主键列更新插入（upsert）
+
+        新数据先分批写入临时表，校验与目标表的结构兼容后，在同一事务中合并：
+        - 未指定 key_columns：直接追加
+        - 指定 key_columns：删除目标表中键相同的行后插入（同一批数据中键重复时保留最后一行）
+
+        结构兼容规则：上传数据缺少的列填充 NULL；新增列或需要放宽列类型时，
+        只有 allow_schema_change=True 才会执行 ALTER，否则报错。
+
+        Args:
+            db_path: DuckDB 数据库路径
+            table_name: 目标表名（必须已存在）
+            batches: DataFrame 批次迭代器
+            key_columns: 主键列，为空表示追加
+            allow_schema_change: 是否允许新增列和放宽列类型
+            progress_callback: 每批写入临时表后回调，参数为已读取行数
+
+        Returns:
+            {"rows", "inserted", "updated", "schema_changed", "schema_changes", "elapsed_ms"}
+
+        Raises:
+            ValueError: 目标表不存在、结构不兼容或主键列缺失
+        """
+        start = time.perf_counter()
+        quoted_table = f'"{table_name}"'
+        staging = "__merge_staging"
+        conn = duckdb.connect(db_path)
+        rows = 0
+        staging_types: Dict[str, str] = {}
+
+        try:
+            table_types = {
+                row[0]: row[1] for row in conn.execute(
+                    "SELECT column_name, data_type FROM information_schema.columns "
+                    "WHERE table_name = ? ORDER BY ordinal_position", [table_name]
+                ).fetchall()
+            }
+            if not table_types:
+                raise ValueError(f"表不存在: {table_name}")
+
+            conn.execute("BEGIN TRANSACTION")
+
+            # 1. 分批写入临时表（与 import_batches 相同的类型放宽规则）
+            for batch in batches:
+                conn.register('batch_df', batch)
+                if not staging_types:
+                    conn.execute(f'CREATE TEMP TABLE "{staging}" AS SELECT * FROM batch_df')
+                    staging_types = {row[0]: row[1] for row in conn.execute(f'DESCRIBE "{staging}"').fetchall()}
+                else:
+                    incoming = {row[0]: row[1] for row in conn.execute("DESCRIBE SELECT * FROM batch_df").fetchall()}
+                    for column, incoming_type in incoming.items():
+                        current = staging_types.get(column)
+                        if current is None or batch[column].isna().all():
+                            continue
+                        widened = cls._widen_type(current, incoming_type)
+                        if widened != current:
+                            conn.execute(f'ALTER TABLE "{staging}" ALTER COLUMN "{column}" TYPE {widened}')
+                            staging_types[column] = widened
+                    conn.execute(f'INSERT INTO "{staging}" BY NAME SELECT * FROM batch_df')
+                conn.unregister('batch_df')
+                rows += len(batch)
+                if progress_callback:
+                    progress_callback(rows)
+
+            if not staging_types:
+                raise ValueError("文件内容为空")
+
+            # 2. 结构兼容校验
+            missing_keys = [col for col in (key_columns or []) if col not in table_types or col not in staging_types]
+            if missing_keys:
+                raise ValueError(f"主键列不存在: {', '.join(missing_keys)}")
+
+            schema_changes = []
+            for column, incoming_type in staging_types.items():
+                current = table_types.get(column)
+                if current is None:
+                    schema_changes.append({"column": column, "change": "add", "type": incoming_type})
+                    continue
+                # 全为空的列不参与类型比较
+                if conn.execute(f'SELECT count("{column}") FROM "{staging}"').fetchone()[0] == 0:
+                    continue
+                widened = cls._widen_type(current, incoming_type)
+                if widened != current:
+                    schema_changes.append({"column": column, "change": "widen", "from": current, "type": widened})
+
+            if schema_changes and not allow_schema_change:
+                details = "; ".join(
+                    f"新增列 {c['column']} ({c['type']})" if c["change"] == "add"
+                    else f"列 {c['column']} 类型 {c['from']} -> {c['type']}"
+                    for c in schema_changes
+                )
+                raise ValueError(f"上传数据与表结构不兼容: {details}")
+
+            for change in schema_changes:
+                if change["change"] == "add":
+                    conn.execute(f'ALTER TABLE {quoted_table} ADD COLUMN "{change["column"]}" {change["type"]}')
+                else:
+                    conn.execute(f'ALTER TABLE {quoted_table} ALTER COLUMN "{change["column"]}" TYPE {change["type"]}')
+
+            # 3. 合并
+            updated = 0
+            source = f'"{staging}"'
+            if key_columns:
+                keys = ", ".join(f'"{col}"' for col in key_columns)
+                # 同一批数据中键重复时保留最后一行
+                conn.execute(
+                    f'CREATE TEMP TABLE "{staging}_dedup" AS SELECT * EXCLUDE (__row) FROM ('
+                    f'SELECT *, row_number() OVER () AS __row FROM "{staging}") '
+                    f'QUALIFY row_number() OVER (PARTITION BY {keys} ORDER BY __row DESC) = 1'
+                )
+                source = f'"{staging}_dedup"'
+                match = " AND ".join(f'{quoted_table}."{col}" = s."{col}"' for col in key_columns)
+                updated = conn.execute(
+                    f"DELETE FROM {quoted_table} WHERE EXISTS (SELECT 1 FROM {source} s WHERE {match})"
+                ).fetchone()[0]
+
+            inserted = conn.execute(f"INSERT INTO {quoted_table} BY NAME SELECT * FROM {source}").fetchone()[0]
+            conn.execute("COMMIT")
+
+        except Exception as e:
+            try:
+                conn.execute("ROLLBACK")
+            except duckdb.Error:
+                pass  # 尚未开始事务
+            logger.error(f"Failed to merge batches into {table_name}: {e}")
+            raise
+        finally:
+            conn.close()
+
+        elapsed_ms = round((time.perf_counter() - start) * 1000, 2)
+        logger.info(
+            f"Merged into table {table_name}: {rows} rows read, {inserted} inserted, "
+            f"{updated} replaced ({elapsed_ms} ms)"
+        )
+        return {
+            "rows": rows,
+            "inserted": inserted - updated,
+            "updated": updated,
+            "schema_changed": bool(schema_changes),
+            "schema_changes": schema_changes,
+            "elapsed_ms": elapsed_ms,
+        }
+
+    @classmethod
+    def copy_table(cls, db_path: str, source_db_path: str, table_name: str) -> float:
+        """将另一个 DuckDB 文件中的表整表复制到目标数据库
+
+        用于并行导入：各文件先在独立的暂存库中完成解析和类型推断，
+        再按列存格式直接复制，避免在目标库的单写者连接上重复解析。
+
+        Returns:
+            float: 复制耗时（毫秒）
+        """
+        start = time.perf_counter()
+        conn = duckdb.connect(db_path)
+        try:
+            source_literal = str(source_db_path).replace("'", "''")
+            conn.execute(f"ATTACH '{source_literal}' AS staging (READ_ONLY)")
+            try:
+                conn.execute(f'CREATE OR REPLACE TABLE "{table_name}" AS SELECT * FROM staging."{table_name}"')
+            finally:
+                conn.execute("DETACH staging")
+        finally:
+            conn.close()
+        return round((time.perf_counter() - start) * 1000, 2)
+
     @classmethod
     def execute_query(
         cls,
@@ -330,6 +604,28 @@ class DuckDBService:
             logger.error(f"Failed to list tables: {e}", exc_info=True)
             raise
     
+    @classmethod
+    def get_table_shapes(cls, db_path: str) -> Dict[str, Dict[str, int]]:
+        """获取数据库中每张表的行数和列数
+        
+        Args:
+            db_path: DuckDB 数据库路径
+            
+        Returns:
+            Dict[str, Dict[str, int]]: {表名: {"rows": 行数, "columns": 列数}}
+        """
+        conn = duckdb.connect(db_path, read_only=True)
+        try:
+            shapes = {}
+            for table_name, column_count in conn.execute(
+                "SELECT table_name, column_count FROM duckdb_tables()"
+            ).fetchall():
+                rows = conn.execute(f'SELECT count(*) FROM "{table_name}"').fetchone()[0]
+                shapes[table_name] = {"rows": int(rows), "columns": int(column_count)}
+            return shapes
+        finally:
+            conn.close()
+    
     @classmethod
     def table_exists(cls, db_path: str, table_name: str) -> bool:
         """检查表是否存在
@@ -1,14 +1,16 @@
 """
-增强导出服务 - 支持带图表的 Excel/PDF 导出
+增强导出服务 - 支持带图表的 Excel/PDF 导出，以及 Parquet / Arrow IPC 数据导出
 """
 import io
 import json
 from datetime import datetime
-from typing import List, Dict, Any, Optional, Tuple
+from typing import IO, List, Dict, Any, Iterable, Optional, Tuple
 import pandas as pd
 
 from app.core.logger import get_logger
 from app.services.data_exporter import DataExporter
+from app.services.excel_writer import StreamingExcelWriter
+from app.services.query_exporter import COLUMNAR_FORMATS, rows_to_columnar
 
 logger = get_logger(__name__)
 
@@ -43,7 +45,7 @@ class EnhancedExporter:
             insight: AI 洞察
             data_interpretation: 数据解读
             fluctuation_analysis: 波动归因
-            export_format: 导出格式（"excel", "excel_with_chart", "pdf", "csv"）
+            export_format: 导出格式（"excel", "excel_with_chart", "pdf", "csv", "parquet", "arrow"）
             
         Returns:
             Tuple[bytes, str]: (文件内容, 文件名)
@@ -51,6 +53,8 @@ class EnhancedExporter:
         try:
             if export_format == "csv":
                 return cls._export_csv_simple(question, columns, rows)
+            elif export_format in COLUMNAR_FORMATS:
+                return cls._export_columnar(question, columns, rows, export_format)
             elif export_format == "excel":
                 return cls._export_excel_with_metadata(
                     question, sql, columns, rows, chart_type,
@@ -84,6 +88,18 @@ class EnhancedExporter:
         """导出为简单 CSV"""
         return DataExporter.export_to_csv(rows, columns, question[:20])
     
+    @classmethod
+    def _export_columnar(
+        cls,
+        question: str,
+        columns: List[str],
+        rows: List[Dict[str, Any]],
+        export_format: str
+    ) -> Tuple[bytes, str]:
+        """导出为 Parquet / Arrow IPC（仅数据，按列构造，不经过 DataFrame）"""
+        content = rows_to_columnar(columns, rows, export_format)
+        return content, DataExporter.generate_filename(question[:20], COLUMNAR_FORMATS[export_format])
+    
     @classmethod
     def _export_excel_with_metadata(
         cls,
@@ -98,165 +114,167 @@ class EnhancedExporter:
     ) -> Tuple[bytes, str]:
         """导出为带元数据的 Excel（多 sheet）"""
         try:
-            from openpyxl import Workbook
-            from openpyxl.styles import Font, Alignment, PatternFill
-            from openpyxl.utils.dataframe import dataframe_to_rows
-            
-            # 创建工作簿
-            wb = Workbook()
-            
-            # === Sheet 1: 数据 ===
-            ws_data = wb.active
-            ws_data.title = "数据"
-            
-            df = pd.DataFrame(rows, columns=columns)
-            
-            # 写入数据
-            for r_idx, row in enumerate(dataframe_to_rows(df, index=False, header=True), 1):
-                for c_idx, value in enumerate(row, 1):
-                    cell = ws_data.cell(row=r_idx, column=c_idx, value=value)
-                    
-                    # 表头样式
-                    if r_idx == 1:
-                        cell.font = Font(bold=True, color="FFFFFF")
-                        cell.fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-                        cell.alignment = Alignment(horizontal="center", vertical="center")
-            
-            # 自动调整列宽
-            for column in ws_data.columns:
-                max_length = 0
-                column_letter = column[0].column_letter
-                for cell in column:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-                adjusted_width = min(max_length + 2, 50)
-                ws_data.column_dimensions[column_letter].width = adjusted_width
-            
-            # === Sheet 2: 分析报告 ===
-            ws_report = wb.create_sheet(title="分析报告")
-            
-            # 标题
-            ws_report['A1'] = "数据分析报告"
-            ws_report['A1'].font = Font(size=16, bold=True)
-            ws_report.merge_cells('A1:D1')
-            
-            row_num = 3
-            
-            # 问题
-            ws_report[f'A{row_num}'] = "问题："
-            ws_report[f'A{row_num}'].font = Font(bold=True)
-            ws_report[f'B{row_num}'] = question
-            ws_report.merge_cells(f'B{row_num}:D{row_num}')
-            row_num += 2
-            
-            # SQL
-            if sql:
-                ws_report[f'A{row_num}'] = "SQL 查询："
-                ws_report[f'A{row_num}'].font = Font(bold=True)
-                row_num += 1
-                ws_report[f'A{row_num}'] = sql
-                ws_report.merge_cells(f'A{row_num}:D{row_num}')
-                ws_report[f'A{row_num}'].alignment = Alignment(wrap_text=True)
-                row_num += 2
-            
-            # 数据摘要
-            ws_report[f'A{row_num}'] = "数据摘要："
-            ws_report[f'A{row_num}'].font = Font(bold=True)
-            row_num += 1
-            ws_report[f'A{row_num}'] = f"共 {len(rows)} 行数据，{len(columns)} 个字段"
-            row_num += 1
-            ws_report[f'A{row_num}'] = f"图表类型：{chart_type}"
-            row_num += 2
-            
-            # AI 洞察
-            if insight:
-                ws_report[f'A{row_num}'] = "AI 洞察："
-                ws_report[f'A{row_num}'].font = Font(bold=True)
-                row_num += 1
-                ws_report[f'A{row_num}'] = insight
-                ws_report.merge_cells(f'A{row_num}:D{row_num}')
-                ws_report[f'A{row_num}'].alignment = Alignment(wrap_text=True)
-                row_num += 2
-            
-            # 数据解读
-            if data_interpretation:
-                ws_report[f'A{row_num}'] = "数据解读："
-                ws_report[f'A{row_num}'].font = Font(bold=True)
-                row_num += 1
-                
-                summary = data_interpretation.get('summary', '')
-                ws_report[f'A{row_num}'] = summary
-                ws_report.merge_cells(f'A{row_num}:D{row_num}')
-                ws_report[f'A{row_num}'].alignment = Alignment(wrap_text=True)
-                row_num += 1
-                
-                key_findings = data_interpretation.get('key_findings', [])
-                if key_findings:
-                    ws_report[f'A{row_num}'] = "关键发现："
-                    ws_report[f'A{row_num}'].font = Font(bold=True, size=11)
-                    row_num += 1
-                    for finding in key_findings:
-                        ws_report[f'A{row_num}'] = f"• {finding}"
-                        row_num += 1
-                
-                row_num += 1
-            
-            # 波动归因
-            if fluctuation_analysis and fluctuation_analysis.get('has_fluctuation'):
-                ws_report[f'A{row_num}'] = "波动归因分析："
-                ws_report[f'A{row_num}'].font = Font(bold=True)
-                row_num += 1
-                
-                attribution = fluctuation_analysis.get('attribution', {})
-                detailed_analysis = attribution.get('detailed_analysis', '')
-                if detailed_analysis:
-                    ws_report[f'A{row_num}'] = detailed_analysis
-                    ws_report.merge_cells(f'A{row_num}:D{row_num}')
-                    ws_report[f'A{row_num}'].alignment = Alignment(wrap_text=True)
-                    row_num += 1
-                
-                main_factors = attribution.get('main_factors', [])
-                if main_factors:
-                    ws_report[f'A{row_num}'] = "主要因素："
-                    ws_report[f'A{row_num}'].font = Font(bold=True, size=11)
-                    row_num += 1
-                    for factor in main_factors:
-                        ws_report[f'A{row_num}'] = f"• {factor}"
-                        row_num += 1
-            
-            # 调整列宽
-            ws_report.column_dimensions['A'].width = 20
-            ws_report.column_dimensions['B'].width = 60
-            ws_report.column_dimensions['C'].width = 20
-            ws_report.column_dimensions['D'].width = 20
-            
-            # 保存到字节流
-            output = io.BytesIO()
-            wb.save(output)
-            excel_bytes = output.getvalue()
-            
-            # 生成文件名
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"{question[:20]}_{timestamp}.xlsx"
-            
-            logger.info(
-                "Enhanced Excel export completed",
-                rows=len(rows),
-                columns=len(columns),
-                filename=filename,
-                size_kb=len(excel_bytes) / 1024
+            output, filename = cls.export_excel_file(
+                question, sql, [pd.DataFrame(rows, columns=columns)], chart_type,
+                insight, data_interpretation, fluctuation_analysis, columns=columns
             )
-            
-            return excel_bytes, filename
+            with output:
+                return output.read(), filename
             
         except Exception as e:
             logger.error(f"Enhanced Excel export failed: {e}", exc_info=True)
             # 降级到基础导出
             return DataExporter.export_to_excel(rows, columns, question[:20])
     
+    @classmethod
+    def export_excel_file(
+        cls,
+        question: str,
+        sql: Optional[str],
+        frames: Iterable[pd.DataFrame],
+        chart_type: str,
+        insight: Optional[str] = None,
+        data_interpretation: Optional[Dict] = None,
+        fluctuation_analysis: Optional[Dict] = None,
+        columns: Optional[List[str]] = None
+    ) -> Tuple[IO[bytes], str]:
+        """
+        按数据块流式导出带元数据的 Excel（数据 + 分析报告两个 sheet）
+        
+        使用 write-only 模式逐行写入，列宽按样本行估算，内容写入临时文件，内存占用与行数无关。
+        
+        Returns:
+            Tuple[IO[bytes], str]: (已定位到开头的临时文件，调用方负责关闭, 文件名)
+        """
+        # 接口传入的是 pydantic 模型
+        if hasattr(data_interpretation, "model_dump"):
+            data_interpretation = data_interpretation.model_dump()
+        if hasattr(fluctuation_analysis, "model_dump"):
+            fluctuation_analysis = fluctuation_analysis.model_dump()
+        
+        writer = StreamingExcelWriter()
+        
+        # === Sheet 1: 数据 ===
+        row_count = writer.write_frames(frames, columns, title="数据")
+        
+        # === Sheet 2: 分析报告 ===
+        cls._write_report_sheet(
+            writer.create_sheet("分析报告"), question, sql, len(writer.columns), row_count,
+            chart_type, insight, data_interpretation, fluctuation_analysis
+        )
+        
+        output = writer.save()
+        
+        # 生成文件名
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f"{question[:20]}_{timestamp}.xlsx"
+        
+        logger.info(
+            "Enhanced Excel export completed",
+            rows=row_count,
+            columns=len(writer.columns),
+            filename=filename,
+            size_kb=output.seek(0, io.SEEK_END) / 1024
+        )
+        output.seek(0)
+        
+        return output, filename
+    
+    @classmethod
+    def _write_report_sheet(
+        cls,
+        ws,
+        question: str,
+        sql: Optional[str],
+        column_count: int,
+        row_count: int,
+        chart_type: str,
+        insight: Optional[str],
+        data_interpretation: Optional[Dict],
+        fluctuation_analysis: Optional[Dict]
+    ):
+        """写入分析报告 sheet（write-only 工作表只能按行顺序追加，列宽在写入前设置）"""
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.styles import Font, Alignment
+        
+        # 调整列宽
+        for letter, width in zip("ABCD", (20, 60, 20, 20)):
+            ws.column_dimensions[letter].width = width
+        
+        bold = Font(bold=True)
+        sub_heading = Font(bold=True, size=11)
+        row_num = 0
+        
+        def cell(value, font=None, wrap=False):
+            c = WriteOnlyCell(ws, value=value)
+            if font:
+                c.font = font
+            if wrap:
+                c.alignment = Alignment(wrap_text=True)
+            return c
+        
+        def append(*cells, merge_from: Optional[str] = None):
+            """追加一行，merge_from 指定从哪一列合并到 D 列"""
+            nonlocal row_num
+            row_num += 1
+            ws.append(list(cells))
+            if merge_from:
+                ws.merged_cells.add(f"{merge_from}{row_num}:D{row_num}")
+        
+        # 标题
+        append(cell("数据分析报告", Font(size=16, bold=True)), merge_from="A")
+        append()
+        
+        # 问题
+        append(cell("问题：", bold), question, merge_from="B")
+        append()
+        
+        # SQL
+        if sql:
+            append(cell("SQL 查询：", bold))
+            append(cell(sql, wrap=True), merge_from="A")
+            append()
+        
+        # 数据摘要
+        append(cell("数据摘要：", bold))
+        append(f"共 {row_count} 行数据，{column_count} 个字段")
+        append(f"图表类型：{chart_type}")
+        append()
+        
+        # AI 洞察
+        if insight:
+            append(cell("AI 洞察：", bold))
+            append(cell(insight, wrap=True), merge_from="A")
+            append()
+        
+        # 数据解读
+        if data_interpretation:
+            append(cell("数据解读：", bold))
+            append(cell(data_interpretation.get('summary', ''), wrap=True), merge_from="A")
+            
+            key_findings = data_interpretation.get('key_findings', [])
+            if key_findings:
+                append(cell("关键发现：", sub_heading))
+                for finding in key_findings:
+                    append(f"• {finding}")
+            
+            append()
+        
+        # 波动归因
+        if fluctuation_analysis and fluctuation_analysis.get('has_fluctuation'):
+            append(cell("波动归因分析：", bold))
+            
+            attribution = fluctuation_analysis.get('attribution', {})
+            detailed_analysis = attribution.get('detailed_analysis', '')
+            if detailed_analysis:
+                append(cell(detailed_analysis, wrap=True), merge_from="A")
+            
+            main_factors = attribution.get('main_factors', [])
+            if main_factors:
+                append(cell("主要因素：", sub_heading))
+                for factor in main_factors:
+                    append(f"• {factor}")
+    
     @classmethod
     def _export_excel_with_chart(
         cls,
@@ -0,0 +1,145 @@
+"""
+流式 Excel 写入 - openpyxl write-only 模式逐行写入，内存占用与行数无关
+
+- 数据按 DataFrame 块写入，行写入后立即输出到 openpyxl 的临时文件，不在内存中保留单元格对象
+- 列宽根据表头和前 EXPORT_EXCEL_WIDTH_SAMPLE_ROWS 行估算，不遍历全部单元格
+- 超过 Excel 单个工作表的行数上限时自动续写到新的工作表（数据_2、数据_3 ...）
+- 保存到 SpooledTemporaryFile：小文件留在内存，超过 EXPORT_SPOOL_MAX_BYTES 后转存到磁盘
+"""
+import itertools
+import tempfile
+from typing import IO, Iterable, Iterator, List, Optional
+
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Font, PatternFill
+from openpyxl.utils import get_column_letter
+
+from app.core.config import settings
+from app.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Excel 单个工作表最多 1048576 行（含表头）
+EXCEL_MAX_ROWS = 1048576
+MAX_COLUMN_WIDTH = 50
+
+
+def column_widths(columns: List[str], sample: pd.DataFrame) -> List[float]:
+    """根据表头和样本行估算列宽（最大 50）"""
+    widths = []
+    for idx, col in enumerate(columns):
+        length = len(str(col))
+        if len(sample) and idx < sample.shape[1]:
+            values = sample.iloc[:, idx]
+            length = max(length, int(values[values.notna()].astype(str).str.len().max() or 0))
+        widths.append(min(length + 2, MAX_COLUMN_WIDTH))
+    return widths
+
+
+def _excel_values(frame: pd.DataFrame) -> Iterator[tuple]:
+    """转换为 openpyxl 可写入的行：缺失值写为空单元格，带时区的时间去掉时区（Excel 不支持时区）"""
+    frame = frame.copy(deep=False)
+    for col in range(frame.shape[1]):
+        series = frame.iloc[:, col]
+        if isinstance(series.dtype, pd.DatetimeTZDtype):
+            frame.isetitem(col, series.dt.tz_localize(None))
+        elif pd.api.types.is_timedelta64_dtype(series):
+            frame.isetitem(col, series.astype(str).where(series.notna(), None))
+    frame = frame.astype(object).where(frame.notna(), None)
+    return frame.itertuples(index=False, name=None)
+
+
+def iter_file(file: IO[bytes], chunk_size: int = 1024 * 1024) -> Iterator[bytes]:
+    """按块读取文件用于流式响应，读完后关闭文件"""
+    try:
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        file.close()
+
+
+class StreamingExcelWriter:
+    """write-only 模式的 Excel 写入器"""
+
+    HEADER_FONT = Font(bold=True, color="FFFFFF")
+    HEADER_FILL = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
+    HEADER_ALIGNMENT = Alignment(horizontal="center", vertical="center")
+
+    def __init__(self):
+        self.workbook = Workbook(write_only=True)
+        self.columns: List[str] = []
+
+    def create_sheet(self, title: str):
+        """创建 write-only 工作表（只能逐行 append，列宽等设置必须在写入行之前完成）"""
+        return self.workbook.create_sheet(title=title)
+
+    def _start_data_sheet(self, title: str, columns: List[str], widths: List[float]):
+        ws = self.create_sheet(title)
+        for idx, width in enumerate(widths, 1):
+            ws.column_dimensions[get_column_letter(idx)].width = width
+        ws.freeze_panes = "A2"
+        header = []
+        for col in columns:
+            cell = WriteOnlyCell(ws, value=str(col))
+            cell.font = self.HEADER_FONT
+            cell.fill = self.HEADER_FILL
+            cell.alignment = self.HEADER_ALIGNMENT
+            header.append(cell)
+        ws.append(header)
+        return ws
+
+    def write_frames(
+        self,
+        frames: Iterable[pd.DataFrame],
+        columns: Optional[List[str]] = None,
+        title: str = "数据",
+    ) -> int:
+        """
+        逐块写入数据工作表
+
+        Args:
+            frames: 数据块（列顺序一致）
+            columns: 表头，默认使用第一块的列名
+            title: 工作表名称
+
+        Returns:
+            int: 写入的数据行数
+        """
+        frames = iter(frames)
+        first = next(frames, None)
+        if first is None:
+            first = pd.DataFrame(columns=columns or [])
+        columns = list(columns) if columns is not None else [str(col) for col in first.columns]
+        widths = column_widths(columns, first.head(settings.EXPORT_EXCEL_WIDTH_SAMPLE_ROWS))
+        self.columns = columns
+
+        sheets = 1
+        ws = self._start_data_sheet(title, columns, widths)
+        sheet_rows = total = 0
+        for frame in itertools.chain([first], frames):
+            for row in _excel_values(frame):
+                if sheet_rows >= EXCEL_MAX_ROWS - 1:
+                    sheets += 1
+                    logger.info("Excel sheet row limit reached", title=title, sheet=sheets, rows=total)
+                    ws = self._start_data_sheet(f"{title}_{sheets}", columns, widths)
+                    sheet_rows = 0
+                ws.append(row)
+                sheet_rows += 1
+                total += 1
+        return total
+
+    def save(self) -> IO[bytes]:
+        """保存工作簿，返回已定位到开头的临时文件（调用方负责关闭）"""
+        output = tempfile.SpooledTemporaryFile(max_size=settings.EXPORT_SPOOL_MAX_BYTES)
+        try:
+            self.workbook.save(output)
+        except Exception:
+            output.close()
+            raise
+        output.seek(0)
+        return output
@@ -0,0 +1,487 @@
+"""
+异步导出任务
+
+PDF 和带分析报告的 Excel 渲染是 CPU 密集的同步操作，在请求中执行会阻塞事件循环，并且每次点击都重新生成：
+- 导出请求只创建任务并立即返回，渲染在进程池的工作进程中完成（EXPORT_JOB_WORKERS 为 0 时在线程中执行），
+  工作进程自己重新执行导出 SQL，数据不经过主进程
+- 导出文件存储在本地磁盘，键为 sha256(规范化 SQL + 数据集 + 数据版本 + 格式 + 报告内容)，
+  相同的导出直接复用已有文件；同一个键同时只渲染一次
+- 任务状态写入 export_jobs 表，供轮询和 SSE 推送，完成后通过下载接口读取导出文件
+- DuckDB 数据集的数据变化时数据版本递增，旧文件不会再被命中，保留 EXPORT_ARTIFACT_TTL_HOURS 后清理；
+  外部数据源没有数据版本，导出文件只在 EXPORT_ARTIFACT_DATASOURCE_TTL_SECONDS 内复用
+- 过期文件在服务启动时清理，运行期间创建任务时最多每 EXPORT_ARTIFACT_PRUNE_INTERVAL_SECONDS 秒在后台线程中清理一次
+- 任务执行期间定期刷新心跳，服务启动时只回收本实例或心跳超时的任务（见 job_heartbeat）
+"""
+
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+import pandas as pd
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.logger import get_logger
+from app.db.session import SessionLocal
+from app.models.metadata import Dataset, ExportJob
+from app.services.data_exporter import DataExporter
+from app.services import job_heartbeat
+from app.services.enhanced_exporter import EnhancedExporter
+from app.services.query_exporter import COLUMNAR_FORMATS, QueryExporter
+from app.utils.sql_canonical import canonicalize_sql
+
+logger = get_logger(__name__)
+
+EXPORT_FORMATS = ("excel", "excel_with_chart", "pdf", "csv", "parquet", "arrow")
+
+MEDIA_TYPES = {
+    ".xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    ".pdf": "application/pdf",
+    ".csv": "text/csv",
+    ".parquet": "application/vnd.apache.parquet",
+    ".arrow": "application/vnd.apache.arrow.file",
+}
+
+# 只包含数据的格式，不受报告内容影响
+DATA_ONLY_FORMATS = ("csv", "parquet", "arrow")
+
+# 报告内容参与缓存键
+REPORT_FIELDS = ("question", "chart_type", "insight", "data_interpretation", "fluctuation_analysis")
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def get_export_pool() -> Optional[ProcessPoolExecutor]:
+    """获取进程级共享的导出渲染进程池（首次使用时创建），EXPORT_JOB_WORKERS 为 0 时返回 None"""
+    global _pool
+    if settings.EXPORT_JOB_WORKERS <= 0:
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # 使用 spawn：服务进程中有线程和数据库连接池，fork 可能继承到已加锁的状态
+                _pool = ProcessPoolExecutor(
+                    max_workers=settings.EXPORT_JOB_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+                logger.info("Export process pool created", workers=settings.EXPORT_JOB_WORKERS)
+    return _pool
+
+
+def shutdown_export_pool():
+    """关闭导出渲染进程池（服务退出时调用）"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+class ExportArtifactStore:
+    """本地磁盘上的导出文件存储：{key}{扩展名} 为导出文件，{key}.json 为元数据"""
+
+    @classmethod
+    def root(cls) -> Path:
+        root = Path(settings.EXPORT_ARTIFACT_DIR or Path(tempfile.gettempdir()) / "export_artifacts")
+        root.mkdir(parents=True, exist_ok=True)
+        return root
+
+    @classmethod
+    def lookup(cls, key: str) -> Optional[Dict]:
+        """
+        查找未过期的导出文件
+
+        Returns:
+            dict: {path, filename, row_count, size_bytes, expires_at}，不存在或已过期时返回 None
+        """
+        try:
+            meta = json.loads((cls.root() / f"{key}.json").read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if meta["expires_at"] < time.time() or not os.path.exists(meta["path"]):
+            return None
+        return meta
+
+    @staticmethod
+    def save(root: str, key: str, source_path: Path, filename: str, row_count: int, ttl_seconds: int) -> Dict:
+        """把渲染完成的临时文件移入存储并写入元数据（先移动文件再写元数据，读取方不会看到不完整的文件）"""
+        path = Path(root) / f"{key}{Path(filename).suffix}"
+        os.replace(source_path, path)
+        meta = {
+            "path": str(path),
+            "filename": filename,
+            "row_count": row_count,
+            "size_bytes": path.stat().st_size,
+            "expires_at": time.time() + ttl_seconds,
+        }
+        meta_tmp = Path(root) / f"{key}.json.{os.getpid()}.tmp"
+        meta_tmp.write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+        os.replace(meta_tmp, Path(root) / f"{key}.json")
+        return meta
+
+    @classmethod
+    def prune(cls) -> int:
+        """删除过期的导出文件和渲染中断遗留的临时文件，返回删除的导出文件数"""
+        root = cls.root()
+        now = time.time()
+        removed = 0
+        for meta_path in root.glob("*.json"):
+            try:
+                meta = json.loads(meta_path.read_text(encoding="utf-8"))
+                expired = meta["expires_at"] < now
+            except (OSError, ValueError, KeyError):
+                meta, expired = {}, True
+            if expired:
+                if meta.get("path"):
+                    Path(meta["path"]).unlink(missing_ok=True)
+                meta_path.unlink(missing_ok=True)
+                removed += 1
+        stale_before = now - settings.EXPORT_ARTIFACT_TTL_HOURS * 3600
+        for tmp_path in root.glob("*.tmp"):
+            if tmp_path.stat().st_mtime < stale_before:
+                tmp_path.unlink(missing_ok=True)
+        return removed
+
+
+class _CountingFrames:
+    """统计经过的数据行数"""
+
+    def __init__(self, frames: Iterable[pd.DataFrame]):
+        self.frames = frames
+        self.rows = 0
+
+    def __iter__(self) -> Iterator[pd.DataFrame]:
+        for frame in self.frames:
+            self.rows += len(frame)
+            yield frame
+
+
+def render_export(
+    target: Dict[str, Any],
+    sql: str,
+    export_format: str,
+    params: Dict[str, Any],
+    key: str,
+    root: str,
+    ttl_seconds: int,
+) -> Dict:
+    """
+    重新执行 SQL 并渲染导出文件，写入导出文件存储（在进程池的工作进程中执行）
+
+    Args:
+        target: 执行目标（进程池中为 QueryExporter.portable_target 的返回值）
+        params: 报告内容 {question, chart_type, insight, data_interpretation, fluctuation_analysis}
+
+    Returns:
+        dict: 导出文件元数据
+    """
+    tmp_path = Path(root) / f"{key}.{os.getpid()}.tmp"
+    question = params.get("question") or "分析结果"
+    chart_type = params.get("chart_type") or "table"
+    try:
+        if export_format == "csv":
+            frames = _CountingFrames(QueryExporter.open_frames(target, sql))
+            with open(tmp_path, "wb") as f:
+                for index, frame in enumerate(frames):
+                    if index == 0:
+                        f.write(frame.to_csv(index=False).encode("utf-8-sig"))
+                    else:
+                        f.write(frame.to_csv(index=False, header=False).encode("utf-8"))
+            filename, row_count = DataExporter.generate_filename(question, "csv"), frames.rows
+        elif export_format in ("excel", "excel_with_chart"):
+            frames = _CountingFrames(QueryExporter.open_frames(target, sql))
+            output, filename = EnhancedExporter.export_excel_file(
+                question, sql, frames, chart_type, params.get("insight"),
+                params.get("data_interpretation"), params.get("fluctuation_analysis")
+            )
+            with output, open(tmp_path, "wb") as f:
+                while chunk := output.read(1024 * 1024):
+                    f.write(chunk)
+            row_count = frames.rows
+        elif export_format in COLUMNAR_FORMATS:
+            row_count = QueryExporter.write_columnar(target, sql, export_format, str(tmp_path))
+            filename = DataExporter.generate_filename(question, COLUMNAR_FORMATS[export_format])
+        else:
+            # PDF 报告需要完整结果计算摘要；reportlab 不可用时 EnhancedExporter 会降级为 Excel，扩展名以返回的文件名为准
+            df = QueryExporter.fetch_all(target, sql)
+            content, filename = asyncio.run(EnhancedExporter.export_with_metadata(
+                question=question,
+                sql=sql,
+                columns=df.columns.tolist(),
+                rows=df.to_dict(orient="records"),
+                chart_type=chart_type,
+                insight=params.get("insight"),
+                data_interpretation=params.get("data_interpretation"),
+                fluctuation_analysis=params.get("fluctuation_analysis"),
+                export_format=export_format,
+            ))
+            tmp_path.write_bytes(content)
+            row_count = len(df)
+        return ExportArtifactStore.save(root, key, tmp_path, filename, row_count, ttl_seconds)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+class ExportJobService:
+    """异步导出任务"""
+
+    TERMINAL_STATUSES = ("completed", "failed")
+
+    # 正在执行的任务，保留引用避免被垃圾回收
+    _tasks: set = set()
+    # 正在渲染的导出文件（缓存键 -> Future），同一个键同时只渲染一次
+    _inflight: Dict[str, asyncio.Future] = {}
+    # 上次清理过期导出文件的时间
+    _last_prune: float = 0.0
+    _prune_lock = threading.Lock()
+
+    @staticmethod
+    def cache_key(dataset_id: int, data_version: int, sql: str, export_format: str, params: Dict) -> str:
+        """导出文件的存储键：sha256(规范化 SQL + 数据集 + 数据版本 + 格式 + 报告内容)"""
+        report = {} if export_format in DATA_ONLY_FORMATS else {field: params.get(field) for field in REPORT_FIELDS}
+        payload = json.dumps(
+            {
+                "dataset_id": dataset_id,
+                "data_version": data_version,
+                "sql": canonicalize_sql(sql),
+                "format": export_format,
+                "report": report,
+            },
+            sort_keys=True,
+            ensure_ascii=False,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def artifact_ttl(target: Dict[str, Any]) -> int:
+        """导出文件的保留时长（秒）"""
+        if target["duckdb_path"]:
+            return settings.EXPORT_ARTIFACT_TTL_HOURS * 3600
+        return settings.EXPORT_ARTIFACT_DATASOURCE_TTL_SECONDS
+
+    @classmethod
+    def create_job(
+        cls,
+        db: Session,
+        owner_id: int,
+        dataset: Dataset,
+        sql: str,
+        export_format: str,
+        params: Dict[str, Any],
+    ) -> ExportJob:
+        """
+        创建导出任务：导出文件已缓存时任务直接完成（from_cache 为真），否则返回待执行的任务
+
+        Raises:
+            ValueError: 导出格式不支持
+        """
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"不支持的导出格式: {export_format}")
+
+        key = cls.cache_key(dataset.id, dataset.data_version or 1, sql, export_format, params)
+        job = ExportJob(
+            owner_id=owner_id,
+            dataset_id=dataset.id,
+            format=export_format,
+            status="pending",
+            cache_key=key,
+            params={**params, "sql": sql},
+        )
+        job_heartbeat.claim(job)
+        meta = ExportArtifactStore.lookup(key)
+        if meta:
+            job.started_at = datetime.utcnow()
+            cls._complete(job, meta, from_cache=True)
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        cls.schedule_prune()
+
+        logger.info("Export job created", job_id=job.id, format=export_format, from_cache=bool(meta))
+        return job
+
+    @classmethod
+    def schedule_prune(cls) -> Optional[threading.Thread]:
+        """距上次清理超过 EXPORT_ARTIFACT_PRUNE_INTERVAL_SECONDS 时在后台线程中清理过期的导出文件"""
+        now = time.time()
+        with cls._prune_lock:
+            if now - cls._last_prune < settings.EXPORT_ARTIFACT_PRUNE_INTERVAL_SECONDS:
+                return None
+            cls._last_prune = now
+        thread = threading.Thread(target=cls._prune_artifacts, name="export-artifact-prune", daemon=True)
+        thread.start()
+        return thread
+
+    @classmethod
+    def _prune_artifacts(cls):
+        try:
+            removed = ExportArtifactStore.prune()
+        except Exception as e:
+            logger.warning("Export artifact prune failed", error=str(e))
+            return
+        if removed:
+            logger.info("Expired export artifacts removed", removed=removed)
+
+    @classmethod
+    def start(cls, job_id: int, target: Dict[str, Any]):
+        """在事件循环中启动任务"""
+        task = asyncio.create_task(cls.run(job_id, target))
+        cls._tasks.add(task)
+        task.add_done_callback(cls._tasks.discard)
+        return task
+
+    @classmethod
+    async def run(cls, job_id: int, target: Dict[str, Any]):
+        """执行导出任务：渲染（或复用）导出文件并更新状态"""
+        db = SessionLocal()
+        try:
+            job = db.query(ExportJob).filter(ExportJob.id == job_id).first()
+            if job is None:
+                return
+            job.status = "running"
+            job.started_at = datetime.utcnow()
+            job_heartbeat.claim(job)
+            db.commit()
+
+            start = time.perf_counter()
+            params = dict(job.params or {})
+            try:
+                async with job_heartbeat.heartbeat(SessionLocal, ExportJob, job_id):
+                    meta = await cls._render(job.cache_key, target, params.pop("sql"), job.format, params)
+            except Exception as e:
+                db.rollback()
+                job = db.query(ExportJob).filter(ExportJob.id == job_id).first()
+                job.status = "failed"
+                job.error_msg = str(e)
+                job.finished_at = datetime.utcnow()
+                db.commit()
+                logger.error("Export job failed", job_id=job_id, format=job.format, error=str(e), exc_info=True)
+                return
+
+            cls._complete(job, meta, from_cache=False)
+            db.commit()
+            logger.info(
+                "Export job completed",
+                job_id=job_id,
+                format=job.format,
+                rows=job.row_count,
+                size_kb=(job.size_bytes or 0) / 1024,
+                elapsed_ms=round((time.perf_counter() - start) * 1000, 2),
+            )
+        finally:
+            db.close()
+
+    @classmethod
+    async def _render(cls, key: str, target: Dict[str, Any], sql: str, export_format: str, params: Dict) -> Dict:
+        """渲染导出文件；同一个键已在渲染时等待已有的结果"""
+        meta = ExportArtifactStore.lookup(key)
+        if meta:
+            return meta
+
+        future = cls._inflight.get(key)
+        if future is None:
+            pool = get_export_pool()
+            future = asyncio.get_running_loop().run_in_executor(
+                pool,
+                render_export,
+                QueryExporter.portable_target(target) if pool else target,
+                sql,
+                export_format,
+                params,
+                key,
+                str(ExportArtifactStore.root()),
+                cls.artifact_ttl(target),
+            )
+            cls._inflight[key] = future
+            future.add_done_callback(lambda _: cls._inflight.pop(key, None))
+        # 一个等待方被取消时不取消共享的渲染
+        return await asyncio.shield(future)
+
+    @staticmethod
+    def job_filename(job: ExportJob, meta: Dict) -> str:
+        """
+        任务的下载文件名
+
+        只含数据的格式的缓存键不包含问题，导出文件可能由其他任务渲染，文件名按本任务的问题重新生成（扩展名以导出文件为准）。
+        """
+        if job.format not in DATA_ONLY_FORMATS:
+            return meta["filename"]
+        question = (job.params or {}).get("question") or "分析结果"
+        return DataExporter.generate_filename(question, Path(meta["filename"]).suffix.lstrip("."))
+
+    @classmethod
+    def _complete(cls, job: ExportJob, meta: Dict, from_cache: bool):
+        job.status = "completed"
+        job.filename = cls.job_filename(job, meta)
+        job.row_count = meta["row_count"]
+        job.size_bytes = meta["size_bytes"]
+        job.from_cache = from_cache
+        job.finished_at = datetime.utcnow()
+
+    @classmethod
+    def artifact_path(cls, job: ExportJob) -> Optional[str]:
+        """已完成任务的导出文件路径，文件已过期清理时返回 None"""
+        if job.status != "completed":
+            return None
+        meta = ExportArtifactStore.lookup(job.cache_key)
+        return meta["path"] if meta else None
+
+    @staticmethod
+    def media_type(filename: str) -> str:
+        return MEDIA_TYPES.get(Path(filename).suffix, "application/octet-stream")
+
+    @classmethod
+    def to_dict(cls, job: ExportJob) -> Dict:
+        return {
+            "job_id": job.id,
+            "status": job.status,
+            "format": job.format,
+            "dataset_id": job.dataset_id,
+            "filename": job.filename,
+            "row_count": job.row_count,
+            "size_bytes": job.size_bytes,
+            "from_cache": bool(job.from_cache),
+            "download_ready": cls.artifact_path(job) is not None,
+            "error_msg": job.error_msg,
+            "created_at": job.created_at,
+            "started_at": job.started_at,
+            "finished_at": job.finished_at,
+        }
+
+    @classmethod
+    def recover_interrupted(cls):
+        """
+        服务启动时处理遗留任务
+
+        - 本实例上次退出时未完成、或心跳超时的任务标记为失败；其他实例正在执行（心跳未超时）的任务不受影响
+        - 删除过期的导出文件
+        """
+        db = SessionLocal()
+        try:
+            interrupted = db.query(ExportJob).filter(
+                ExportJob.status.in_(("pending", "running")),
+                job_heartbeat.orphaned(ExportJob)
+            ).all()
+            for job in interrupted:
+                job.status = "failed"
+                job.error_msg = "服务重启导致任务中断，请重新导出"
+                job.finished_at = datetime.utcnow()
+            db.commit()
+        finally:
+            db.close()
+
+        cls._last_prune = time.time()
+        removed = ExportArtifactStore.prune()
+        if interrupted or removed:
+            logger.info("Export jobs recovered", interrupted=len(interrupted), artifacts_removed=removed)
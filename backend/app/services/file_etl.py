@@ -3,7 +3,12 @@
 """
 import pandas as pd
 import io
-from typing import Dict, Any, Tuple
+import csv
+import time
+import codecs
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+from typing import Dict, Any, Tuple, Union, Iterator, Optional, Callable, Iterable, BinaryIO
 from datetime import datetime
 from sqlalchemy import create_engine, MetaData, Table, Column, Integer, String, Float, DateTime, Boolean, Text, inspect
 from sqlalchemy.orm import Session
@@ -22,12 +27,21 @@ class FileETLService:
     # 支持的文件类型
     SUPPORTED_EXTENSIONS = {'.xlsx', '.xls', '.csv'}
     
-    # 文件大小限制（字节）
+    # 文件大小限制（字节）：整表读入内存的路径（预览、数据表创建）
     MAX_FILE_SIZE = 20 * 1024 * 1024  # 20MB
     
-    # 行数限制
+    # 行数限制：整表读入内存的路径
     MAX_ROWS = 50000
     
+    # 分批流式导入的限制：内存占用只与批大小有关，因此可以处理百万行级别的文件
+    MAX_STREAM_FILE_SIZE = settings.UPLOAD_MAX_FILE_SIZE_MB * 1024 * 1024
+    INGEST_BATCH_ROWS = settings.UPLOAD_BATCH_ROWS
+    
+    # CSV 编码候选（按顺序尝试）、分隔符候选，以及用于检测的样本大小
+    CSV_ENCODINGS = ('utf-8', 'gbk', 'gb18030', 'latin1')
+    CSV_DELIMITERS = ',\t;|'
+    ENCODING_SAMPLE_BYTES = 256 * 1024
+    
     @staticmethod
     def validate_file(filename: str, file_size: int) -> None:
         """
@@ -52,12 +66,22 @@ class FileETLService:
             raise ValueError(f"文件大小超过限制。最大允许: {max_mb}MB")
     
     @staticmethod
-    def parse_file(file_content: bytes, filename: str) -> pd.DataFrame:
+    def _open_source(file_content: Union[bytes, str, Path, BinaryIO]):
+        """字节内容包装为 BytesIO，文件对象回到开头，文件路径直接交给解析器读取"""
+        if isinstance(file_content, (bytes, bytearray)):
+            return io.BytesIO(file_content)
+        if hasattr(file_content, 'read'):
+            file_content.seek(0)
+            return file_content
+        return str(file_content)
+
+    @staticmethod
+    def parse_file(file_content: Union[bytes, str, Path], filename: str) -> pd.DataFrame:
         """
         解析Excel或CSV文件为DataFrame
         
         Args:
-            file_content: 文件内容（字节）
+            file_content: 文件内容（字节）或已落盘的文件路径（推荐，避免整个文件读入内存）
             filename: 文件名
             
         Returns:
@@ -70,23 +94,20 @@ class FileETLService:
         ext = os.path.splitext(filename)[1].lower()
         
         try:
-            # 创建BytesIO对象
-            file_like = io.BytesIO(file_content)
+            source = FileETLService._open_source(file_content)
             
             # 根据文件类型解析
-            if ext in ['.xlsx', '.xls']:
-                df = pd.read_excel(file_like, engine='openpyxl' if ext == '.xlsx' else 'xlrd')
+            if ext == '.xlsx':
+                df = FileETLService.read_xlsx(source, max_rows=FileETLService.MAX_ROWS)
+            elif ext == '.xls':
+                # xlrd 不支持流式读取，整表读取（.xls 最多 65536 行）
+                df = pd.read_excel(source, engine='xlrd')
             elif ext == '.csv':
-                # 尝试多种编码
-                for encoding in ['utf-8', 'gbk', 'gb2312', 'latin1']:
-                    try:
-                        file_like.seek(0)
-                        df = pd.read_csv(file_like, encoding=encoding)
-                        break
-                    except UnicodeDecodeError:
-                        continue
-                else:
-                    raise ValueError("无法解码CSV文件，请确保文件编码正确")
+                # 从样本检测编码和格式后解析；样本之后出现无法解码的字节时换用后备编码重新解析
+                dialect = FileETLService.sniff_csv(file_content)
+                df = FileETLService._read_csv_with_fallback(file_content, dialect)
+                if not dialect['has_header']:
+                    df.columns = FileETLService._default_column_names(df.columns)
             else:
                 raise ValueError(f"不支持的文件格式: {ext}")
             
@@ -101,8 +122,8 @@ class FileETLService:
             # 清理列名（去除空格，替换特殊字符）
             df.columns = [FileETLService._clean_column_name(col) for col in df.columns]
             
-            # 处理缺失值
-            df = df.fillna('')
+            # 推断并转换列类型（缺失值保留为空，不再填充空字符串，以保留数值和日期类型）
+            df, _ = FileETLService.apply_inferred_types(df)
             
             logger.info(
                 "File parsed successfully",
@@ -122,6 +143,443 @@ class FileETLService:
             )
             raise ValueError(f"文件解析失败: {str(e)}")
     
+    # ========== 分批流式解析 ==========
+    
+    @staticmethod
+    def _unique_column_names(headers) -> list:
+        """清理列名并为重复列名添加后缀"""
+        columns = []
+        seen = {}
+        for header in headers:
+            name = FileETLService._clean_column_name('' if header is None else header)
+            if name in seen:
+                seen[name] += 1
+                name = f"{name}_{seen[name]}"
+            else:
+                seen[name] = 0
+            columns.append(name)
+        return columns
+    
+    @staticmethod
+    def _read_sample(file_content: Union[bytes, str, Path, BinaryIO]) -> bytes:
+        """读取文件开头的有界样本"""
+        if isinstance(file_content, (bytes, bytearray)):
+            return bytes(file_content[:FileETLService.ENCODING_SAMPLE_BYTES])
+        if hasattr(file_content, 'read'):
+            file_content.seek(0)
+            return file_content.read(FileETLService.ENCODING_SAMPLE_BYTES)
+        with open(file_content, 'rb') as f:
+            return f.read(FileETLService.ENCODING_SAMPLE_BYTES)
+    
+    @staticmethod
+    def _looks_numeric(value: str) -> bool:
+        try:
+            float(value.replace(',', ''))
+            return True
+        except ValueError:
+            return False
+    
+    @staticmethod
+    def sniff_csv(file_content: Union[bytes, str, Path, BinaryIO]) -> Dict[str, Any]:
+        """
+        从文件开头的有界样本中一次性检测 CSV 的编码、分隔符、引号字符和是否有表头
+        
+        检测结果用于只解析一次文件，不再按编码逐个重试整表解析。
+        
+        Args:
+            file_content: 文件内容（字节）、文件路径或可 seek 的二进制文件对象
+            
+        Returns:
+            {"encoding", "delimiter", "quotechar", "has_header"}
+            
+        Raises:
+            ValueError: 如果所有候选编码都无法解码
+        """
+        sample = FileETLService._read_sample(file_content)
+        
+        if sample.startswith(codecs.BOM_UTF8):
+            encoding = 'utf-8-sig'
+        else:
+            for encoding in FileETLService.CSV_ENCODINGS:
+                try:
+                    # final=False：容忍样本末尾被截断的多字节字符
+                    codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+                    break
+                except UnicodeDecodeError:
+                    continue
+            else:
+                raise ValueError("无法解码CSV文件，请确保文件编码正确")
+        
+        text = codecs.getincrementaldecoder(encoding)(errors='ignore').decode(sample, final=False)
+        # 样本被截断时只保留完整的行
+        if len(sample) >= FileETLService.ENCODING_SAMPLE_BYTES and '\n' in text:
+            text = text[:text.rindex('\n') + 1]
+        
+        sniffer = csv.Sniffer()
+        try:
+            dialect = sniffer.sniff(text, delimiters=FileETLService.CSV_DELIMITERS)
+            delimiter, quotechar = dialect.delimiter, dialect.quotechar or '"'
+        except csv.Error:
+            delimiter, quotechar = ',', '"'
+        
+        # 首行没有数值时视为表头；否则交给 Sniffer 按列类型判断（如年份作为列名）
+        first_row = next(csv.reader(io.StringIO(text), delimiter=delimiter, quotechar=quotechar), [])
+        if not any(FileETLService._looks_numeric(value.strip()) for value in first_row if value.strip()):
+            has_header = True
+        else:
+            try:
+                has_header = sniffer.has_header(text)
+            except csv.Error:
+                has_header = True
+        
+        return {
+            'encoding': encoding,
+            'delimiter': delimiter,
+            'quotechar': quotechar,
+            'has_header': has_header
+        }
+    
+    @staticmethod
+    def _csv_read_kwargs(dialect: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        将检测到的 CSV 参数转换为 pd.read_csv 参数
+        
+        所有列按文本读取，类型由 apply_inferred_types 推断转换：pandas 自动解析会把 "00123" 这类编码读成整数 123。
+        """
+        return {
+            'encoding': dialect['encoding'],
+            'sep': dialect['delimiter'],
+            'quotechar': dialect['quotechar'],
+            'header': 0 if dialect['has_header'] else None,
+            'dtype': str
+        }
+    
+    @staticmethod
+    def _encoding_attempts(encoding: str) -> list:
+        """
+        解码顺序：检测到的编码，以及候选列表中排在它之后的后备编码
+        
+        编码只在文件开头的样本上检测，样本之后出现无法解码的字节（如前 256KB 都是 ASCII 的 GBK 文件）时依次换用后备编码；
+        latin1 可以解码任意字节，排在最后。
+        """
+        candidates = FileETLService.CSV_ENCODINGS
+        if encoding in candidates:
+            return list(candidates[candidates.index(encoding):])
+        return [encoding, *candidates[1:]]
+    
+    @staticmethod
+    def _read_csv_with_fallback(file_content: Union[bytes, str, Path, BinaryIO], dialect: Dict[str, Any]) -> pd.DataFrame:
+        """整表解析 CSV，解码失败时换用后备编码重新解析（dialect['encoding'] 更新为实际使用的编码）"""
+        attempts = FileETLService._encoding_attempts(dialect['encoding'])
+        for index, encoding in enumerate(attempts):
+            dialect['encoding'] = encoding
+            try:
+                return pd.read_csv(FileETLService._open_source(file_content), **FileETLService._csv_read_kwargs(dialect))
+            except UnicodeDecodeError as e:
+                if index == len(attempts) - 1:
+                    raise
+                logger.warning("CSV decoding failed, retrying with fallback encoding",
+                               encoding=encoding, fallback=attempts[index + 1], error=str(e))
+    
+    @staticmethod
+    def _default_column_names(columns) -> list:
+        """无表头文件的列名：column_1, column_2, ..."""
+        return [f"column_{i + 1}" for i in range(len(columns))]
+    
+    @staticmethod
+    def detect_parse_settings(file_path: str, filename: str, sheet_name: Optional[str] = None) -> Dict[str, Any]:
+        """
+        检测文件的解析参数（CSV：编码、分隔符、引号、表头；Excel：工作表）
+        
+        结果随上传记录保存，便于排查解析问题以及追加导入时复用同样的参数。
+        
+        Args:
+            file_path: 文件路径
+            filename: 原始文件名
+            sheet_name: Excel 工作表名称，为空时使用第一个工作表
+        """
+        import os
+        ext = os.path.splitext(filename)[1].lower()
+        if ext == '.csv':
+            return {'format': 'csv', **FileETLService.sniff_csv(file_path)}
+        if sheet_name is None:
+            sheet_name = FileETLService.list_sheets(file_path, filename)[0]
+        return {'format': ext.lstrip('.'), 'sheet_name': sheet_name, 'has_header': True}
+    
+    @staticmethod
+    def list_sheets(file_path: str, filename: str) -> list:
+        """
+        列出 Excel 文件的工作表名称（只读模式，只读取工作簿目录，不加载单元格）
+        
+        CSV 文件返回空列表。
+        """
+        import os
+        ext = os.path.splitext(filename)[1].lower()
+        if ext == '.xlsx':
+            from openpyxl import load_workbook
+            workbook = load_workbook(file_path, read_only=True)
+            try:
+                return list(workbook.sheetnames)
+            finally:
+                workbook.close()
+        if ext == '.xls':
+            with pd.ExcelFile(file_path, engine='xlrd') as excel:
+                return list(excel.sheet_names)
+        return []
+    
+    @staticmethod
+    def resolve_sheets(file_path: str, filename: str, selection: Optional[str] = None) -> list:
+        """
+        解析工作表选择
+        
+        Args:
+            file_path: 文件路径
+            filename: 原始文件名
+            selection: 为空时只导入第一个工作表；"*" 导入所有非空工作表；
+                否则为逗号分隔的工作表名称或序号（从 1 开始）
+                
+        Returns:
+            list: 工作表名称列表；CSV 文件返回 [None]
+            
+        Raises:
+            ValueError: 如果指定的工作表不存在
+        """
+        sheets = FileETLService.list_sheets(file_path, filename)
+        if not sheets:
+            return [None]
+        if not selection:
+            return sheets[:1]
+        if selection.strip() == '*':
+            non_empty = [sheet for sheet in sheets if FileETLService._sheet_has_header(file_path, filename, sheet)]
+            return non_empty or sheets[:1]
+        
+        selected = []
+        for item in (part.strip() for part in selection.split(',')):
+            if not item:
+                continue
+            if item in sheets:
+                name = item
+            elif item.isdigit() and 1 <= int(item) <= len(sheets):
+                name = sheets[int(item) - 1]
+            else:
+                raise ValueError(f"工作表不存在: {item}（可选: {', '.join(sheets)}）")
+            if name not in selected:
+                selected.append(name)
+        return selected or sheets[:1]
+    
+    @staticmethod
+    def _sheet_has_header(file_path: str, filename: str, sheet_name: str) -> bool:
+        """检查工作表首行是否有内容（用于跳过空白工作表）"""
+        import os
+        if os.path.splitext(filename)[1].lower() != '.xlsx':
+            return not pd.read_excel(file_path, sheet_name=sheet_name, engine='xlrd', nrows=1).columns.empty
+        from openpyxl import load_workbook
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            first_row = next(workbook[sheet_name].iter_rows(max_row=1, values_only=True), None)
+            return bool(first_row) and any(value is not None for value in first_row)
+        finally:
+            workbook.close()
+    
+    @staticmethod
+    def iter_file_batches(
+        file_path: str,
+        filename: str,
+        batch_size: Optional[int] = None,
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+        parse_settings: Optional[Dict[str, Any]] = None
+    ) -> Iterator[pd.DataFrame]:
+        """
+        按固定行数分批读取 CSV/Excel 文件
+        
+        每批为一个 DataFrame，列名已清理，列类型按首批样本推断（整数、小数、日期等），
+        空值保留为 NaN/None（不做 fillna，以保留数值类型）。
+        
+        Args:
+            file_path: 文件路径
+            filename: 原始文件名（用于判断格式）
+            batch_size: 每批行数，默认 INGEST_BATCH_ROWS
+            progress_callback: 每批读取后回调 (已读字节数, 文件总字节数)
+            parse_settings: detect_parse_settings 的检测结果，不传时自动检测（Excel 默认第一个工作表）
+            
+        Yields:
+            pd.DataFrame: 数据批次
+        """
+        import os
+        ext = os.path.splitext(filename)[1].lower()
+        batch_size = batch_size or FileETLService.INGEST_BATCH_ROWS
+        
+        if ext == '.csv':
+            dialect = parse_settings or FileETLService.sniff_csv(file_path)
+            batches = FileETLService._iter_csv_batches(file_path, batch_size, dialect, progress_callback)
+        elif ext == '.xlsx':
+            sheet_name = (parse_settings or {}).get('sheet_name')
+            batches = FileETLService._iter_xlsx_batches(file_path, batch_size, sheet_name, progress_callback)
+        elif ext == '.xls':
+            # xlrd 不支持流式读取，.xls 最多 65536 行，整表读取后再切分
+            sheet_name = (parse_settings or {}).get('sheet_name')
+            df = pd.read_excel(file_path, sheet_name=sheet_name if sheet_name is not None else 0, engine='xlrd')
+            df.columns = FileETLService._unique_column_names(df.columns)
+            batches = (df.iloc[i:i + batch_size] for i in range(0, len(df), batch_size))
+        else:
+            raise ValueError(f"不支持的文件格式: {ext}")
+        
+        # 在首批样本上推断列类型，后续批次沿用同样的转换；
+        # 后续批次中不符合的列保持原样，由写入端放宽列类型
+        kinds = None
+        for batch in batches:
+            batch, kinds = FileETLService.apply_inferred_types(batch, kinds, categorical=False)
+            yield batch
+    
+    @staticmethod
+    def _iter_csv_batches(
+        file_path: str,
+        batch_size: int,
+        dialect: Dict[str, Any],
+        progress_callback: Optional[Callable[[int, int], None]] = None
+    ) -> Iterator[pd.DataFrame]:
+        """
+        按块读取 CSV
+        
+        中途遇到无法解码的字节时，换用后备编码从头重新解析，跳过已经产出的行后继续
+        （dialect['encoding'] 更新为实际使用的编码，随解析参数一起保存）。
+        """
+        import os
+        total_bytes = os.path.getsize(file_path)
+        attempts = FileETLService._encoding_attempts(dialect['encoding'])
+        columns = None
+        produced = 0
+        
+        for index, encoding in enumerate(attempts):
+            dialect['encoding'] = encoding
+            skip = produced
+            try:
+                with open(file_path, 'rb') as f:
+                    reader = pd.read_csv(f, chunksize=batch_size, **FileETLService._csv_read_kwargs(dialect))
+                    for chunk in reader:
+                        if skip:
+                            if len(chunk) <= skip:
+                                skip -= len(chunk)
+                                continue
+                            chunk = chunk.iloc[skip:]
+                            skip = 0
+                        if columns is None:
+                            if dialect['has_header']:
+                                columns = FileETLService._unique_column_names(chunk.columns)
+                            else:
+                                columns = FileETLService._default_column_names(chunk.columns)
+                        chunk.columns = columns
+                        if progress_callback:
+                            progress_callback(f.tell(), total_bytes)
+                        produced += len(chunk)
+                        yield chunk
+                return
+            except UnicodeDecodeError as e:
+                if index == len(attempts) - 1:
+                    raise
+                logger.warning("CSV decoding failed mid-file, restarting with fallback encoding",
+                               encoding=encoding, fallback=attempts[index + 1], rows=produced, error=str(e))
+    
+    @staticmethod
+    def _records_to_frame(records: list, columns: list) -> pd.DataFrame:
+        """行记录转 DataFrame；同一列混有数字和文本时统一转为文本，避免写入时类型冲突"""
+        return FileETLService._unify_mixed_columns(pd.DataFrame.from_records(records, columns=columns))
+    
+    @staticmethod
+    def _unify_mixed_columns(df: pd.DataFrame) -> pd.DataFrame:
+        """同一列混有多种 Python 类型（如数字和文本）时统一转为文本"""
+        for col in df.columns[df.dtypes == object]:
+            values = df[col].dropna()
+            if values.map(type).nunique() > 1:
+                df[col] = df[col].map(lambda v: v if v is None else str(v))
+        return df
+    
+    @staticmethod
+    def _iter_xlsx_batches(
+        file_path: Union[str, BinaryIO],
+        batch_size: int,
+        sheet_name: Optional[str] = None,
+        progress_callback: Optional[Callable[[int, int], None]] = None
+    ) -> Iterator[pd.DataFrame]:
+        import os
+        from openpyxl import load_workbook
+        
+        if isinstance(file_path, str):
+            total_bytes = os.path.getsize(file_path)
+        else:
+            total_bytes = file_path.seek(0, os.SEEK_END)
+            file_path.seek(0)
+        # read_only 模式按行流式读取，不在内存中构建整个工作表
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            if sheet_name is None:
+                sheet = workbook.worksheets[0]
+            elif sheet_name in workbook.sheetnames:
+                sheet = workbook[sheet_name]
+            else:
+                raise ValueError(f"工作表不存在: {sheet_name}")
+            rows = sheet.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+            columns = FileETLService._unique_column_names(header)
+            width = len(columns)
+            total_rows = max((sheet.max_row or 1) - 1, 1)
+            
+            buffer = []
+            read_rows = 0
+            for row in rows:
+                if row is None or all(value is None for value in row):
+                    continue
+                buffer.append(row[:width])
+                if len(buffer) >= batch_size:
+                    read_rows += len(buffer)
+                    yield FileETLService._records_to_frame(buffer, columns)
+                    buffer = []
+                    if progress_callback:
+                        # 压缩文件无法按字节定位，按行数比例折算
+                        progress_callback(min(total_bytes, int(total_bytes * read_rows / total_rows)), total_bytes)
+            if buffer:
+                yield FileETLService._records_to_frame(buffer, columns)
+            if progress_callback:
+                progress_callback(total_bytes, total_bytes)
+        finally:
+            workbook.close()
+    
+    @staticmethod
+    def read_xlsx(
+        source: Union[str, BinaryIO],
+        sheet_name: Optional[str] = None,
+        max_rows: Optional[int] = None
+    ) -> pd.DataFrame:
+        """
+        以 read_only 模式流式读取 .xlsx 为 DataFrame
+        
+        不在内存中构建整个工作簿的单元格对象；超过 max_rows 时提前停止读取。
+        
+        Args:
+            source: 文件路径或二进制文件对象
+            sheet_name: 工作表名称，默认第一个工作表
+            max_rows: 最大数据行数，不传时不限制
+            
+        Raises:
+            ValueError: 如果工作表不存在或行数超过限制
+        """
+        frames = []
+        total = 0
+        batches = FileETLService._iter_xlsx_batches(source, FileETLService.INGEST_BATCH_ROWS, sheet_name)
+        try:
+            for batch in batches:
+                total += len(batch)
+                if max_rows is not None and total > max_rows:
+                    raise ValueError(f"文件行数超过限制。最大允许: {max_rows} 行")
+                frames.append(batch)
+        finally:
+            batches.close()
+        if not frames:
+            return pd.DataFrame()
+        return FileETLService._unify_mixed_columns(pd.concat(frames, ignore_index=True))
+    
     @staticmethod
     def _clean_column_name(col_name: str) -> str:
         """
@@ -150,6 +608,167 @@ class FileETLService:
         
         return col_name
     
+    # ========== 类型推断 ==========
+    
+    # 类型推断使用的样本行数：推断在样本上完成，再对整列做一次向量化转换
+    INFERENCE_SAMPLE_ROWS = 2000
+    # 低基数文本列判定为分类列：不同值数量上限及占比上限
+    CATEGORY_MAX_UNIQUE = 200
+    CATEGORY_MAX_RATIO = 0.05
+    # 小数位数不超过该值的文本数值按定点数（DECIMAL）保存，避免金额等字段出现浮点误差
+    DECIMAL_MAX_SCALE = 4
+    
+    _INTEGER_PATTERN = r'^[+-]?\d+$'
+    # 带前导零的数字（"00123"、邮编、工号等编码），转为数值会丢失前导零
+    _LEADING_ZERO_PATTERN = r'^[+-]?0\d'
+    _DECIMAL_PATTERN = r'^[+-]?\d+\.(\d+)$'
+    _BOOLEAN_VALUES = {'true': True, 'false': False}
+    
+    @staticmethod
+    def _inference_sample(series: pd.Series) -> pd.Series:
+        non_null = series.dropna()
+        return non_null.iloc[:FileETLService.INFERENCE_SAMPLE_ROWS]
+    
+    @staticmethod
+    def infer_column_kind(series: pd.Series, categorical: bool = True) -> str:
+        """
+        在样本上推断列的语义类型（全部为向量化操作）
+        
+        Args:
+            series: Pandas Series
+            categorical: 是否识别低基数分类列
+            
+        Returns:
+            str: integer, float, decimal, boolean, date, timestamp, category, text 之一
+        """
+        dtype = series.dtype
+        if pd.api.types.is_bool_dtype(dtype):
+            return 'boolean'
+        if pd.api.types.is_integer_dtype(dtype):
+            return 'integer'
+        if pd.api.types.is_float_dtype(dtype):
+            # CSV 中含缺失值的整数列会被 pandas 读成浮点数
+            sample = FileETLService._inference_sample(series)
+            return 'integer' if len(sample) and (sample % 1 == 0).all() else 'float'
+        if pd.api.types.is_datetime64_any_dtype(dtype):
+            times = series.dropna()
+            return 'date' if len(times) and (times == times.dt.normalize()).all() else 'timestamp'
+        if isinstance(dtype, pd.CategoricalDtype):
+            return 'category'
+        
+        sample = FileETLService._inference_sample(series)
+        if len(sample) == 0:
+            return 'text'
+        
+        # 只对文本值做模式匹配，Excel 中的 datetime/数字对象先转成字符串
+        text = sample.astype(str).str.strip()
+        
+        # 任一值带前导零时按编码文本处理，不识别为数值
+        if not text.str.match(FileETLService._LEADING_ZERO_PATTERN).any():
+            if text.str.match(FileETLService._INTEGER_PATTERN).all():
+                return 'integer'
+            decimals = text.str.extract(FileETLService._DECIMAL_PATTERN, expand=False)
+            if decimals.notna().all():
+                return 'decimal' if decimals.str.len().max() <= FileETLService.DECIMAL_MAX_SCALE else 'float'
+            if pd.to_numeric(text, errors='coerce').notna().all():
+                return 'float'
+        if text.str.lower().isin(FileETLService._BOOLEAN_VALUES.keys()).all():
+            return 'boolean'
+        
+        # 至少包含一个日期分隔符，避免把编码类文本误判为日期
+        if text.str.contains(r'[-/年.:]').all():
+            times = FileETLService._to_datetime(text)
+            if times.notna().all():
+                return 'date' if (times == times.dt.normalize()).all() else 'timestamp'
+        
+        if categorical and len(sample) >= 20:
+            unique = sample.nunique()
+            if unique <= FileETLService.CATEGORY_MAX_UNIQUE and unique <= len(sample) * FileETLService.CATEGORY_MAX_RATIO:
+                return 'category'
+        
+        return 'text'
+    
+    @staticmethod
+    def _to_datetime(values: pd.Series) -> pd.Series:
+        """向量化解析时间：按首个值推断格式后整列解析，无法解析的值为 NaT"""
+        import warnings
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            return pd.to_datetime(values, errors='coerce')
+    
+    @staticmethod
+    def _to_decimal(value: str) -> Optional[Decimal]:
+        """解析为 Decimal，无法解析或非有限值返回 None"""
+        try:
+            number = Decimal(value)
+        except InvalidOperation:
+            return None
+        return number if number.is_finite() else None
+    
+    @staticmethod
+    def coerce_column(series: pd.Series, kind: str) -> pd.Series:
+        """
+        按推断的类型向量化转换整列
+        
+        若转换会把原本非空的值变成空值（样本之外出现了不符合的值），保留原列不做转换，避免丢数据。
+        decimal 列转换为 Decimal 对象直到写入：转为 float64 会丢失 15 位以上的有效数字。
+        """
+        non_null = series.notna()
+        if pd.api.types.is_float_dtype(series.dtype):
+            if kind == 'integer' and (series[non_null] % 1 == 0).all():
+                return series.astype('Int64')
+            return series
+        if series.dtype != object:
+            return series
+        
+        if kind in ('integer', 'float', 'decimal'):
+            text = series.astype(str).str.strip().where(non_null)
+            # 样本之外出现带前导零的编码时保留文本
+            if text.str.match(FileETLService._LEADING_ZERO_PATTERN).any():
+                return series
+            if kind == 'decimal':
+                converted = text.map(FileETLService._to_decimal, na_action='ignore')
+                return series if converted[non_null].isna().any() else converted
+            converted = pd.to_numeric(text, errors='coerce')
+            if (kind == 'integer' and pd.api.types.is_float_dtype(converted)
+                    and converted[non_null].notna().all() and (converted.dropna() % 1 == 0).all()):
+                # 可空整数：缺失值不会让整列退化为浮点数（样本之外出现小数时保持浮点数）
+                converted = converted.astype('Int64')
+        elif kind == 'boolean':
+            converted = series.astype(str).str.strip().str.lower().map(FileETLService._BOOLEAN_VALUES).where(non_null)
+            converted = converted.astype('boolean') if converted[non_null].notna().all() else converted
+        elif kind in ('date', 'timestamp'):
+            converted = FileETLService._to_datetime(series.astype(str).str.strip().where(non_null))
+        elif kind == 'category':
+            return series.astype('category')
+        else:
+            return series
+        
+        if converted[non_null].isna().any():
+            return series
+        return converted
+    
+    @staticmethod
+    def apply_inferred_types(df: pd.DataFrame, kinds: Optional[Dict[str, str]] = None, categorical: bool = True) -> Tuple[pd.DataFrame, Dict[str, str]]:
+        """
+        推断并转换 DataFrame 中各列的类型
+        
+        Args:
+            df: 数据框
+            kinds: 已推断的列类型（分批导入时沿用首批的推断结果），为空时在样本上推断
+            categorical: 是否识别低基数分类列
+            
+        Returns:
+            (转换后的 DataFrame, {列名: 类型})
+        """
+        if kinds is None:
+            kinds = {col: FileETLService.infer_column_kind(df[col], categorical) for col in df.columns}
+        for col in df.columns:
+            kind = kinds.get(col)
+            if kind:
+                df[col] = FileETLService.coerce_column(df[col], kind)
+        return df, kinds
+    
     @staticmethod
     def infer_sql_type(series: pd.Series) -> Any:
         """
@@ -161,31 +780,40 @@ class FileETLService:
         Returns:
             SQLAlchemy类型对象
         """
-        from sqlalchemy import Integer, Float, Boolean, DateTime, Text, String
+        from sqlalchemy import Integer, BigInteger, Float, Numeric, Boolean, Date, DateTime, Text, String
         
         # 获取非空数据用于类型推断
         non_null = series.dropna()
         if len(non_null) == 0:
             return Text  # 全空列默认Text
         
-        dtype = series.dtype
+        kind = FileETLService.infer_column_kind(series)
         
-        # 数值类型
-        if pd.api.types.is_integer_dtype(dtype):
-            return Integer
-        elif pd.api.types.is_float_dtype(dtype):
+        if kind == 'integer':
+            if pd.api.types.is_numeric_dtype(non_null):
+                in_range = non_null.abs().max() < 2 ** 31
+            else:
+                in_range = non_null.astype(str).str.lstrip('+-').str.len().max() < 10
+            return Integer if in_range else BigInteger
+        elif kind == 'decimal':
+            return Numeric(38, FileETLService.DECIMAL_MAX_SCALE)
+        elif kind == 'float':
             return Float
-        elif pd.api.types.is_bool_dtype(dtype):
+        elif kind == 'boolean':
             return Boolean
-        elif pd.api.types.is_datetime64_any_dtype(dtype):
+        elif kind == 'date':
+            return Date
+        elif kind == 'timestamp':
             return DateTime
+        
+        # 字符串类型 - 检查最大长度（分类列只需检查不同值）
+        values = pd.Series(non_null.unique()) if kind == 'category' else non_null
+        lengths = values.str.len() if pd.api.types.is_string_dtype(values) else values.astype(str).str.len()
+        max_length = lengths.max()
+        if pd.isna(max_length) or max_length > 500:
+            return Text
         else:
-            # 字符串类型 - 检查最大长度
-            max_length = non_null.astype(str).str.len().max()
-            if max_length > 500:
-                return Text
-            else:
-                return String(500)
+            return String(500)
     
     @staticmethod
     def infer_field_type(series: pd.Series) -> str:
@@ -204,39 +832,23 @@ class FileETLService:
         if any(keyword in col_name_lower for keyword in geo_keywords):
             return 'geo'
         
-        # 2. 检查数值类型
-        if pd.api.types.is_numeric_dtype(series):
+        # 2. 在样本上推断类型
+        kind = FileETLService.infer_column_kind(series, categorical=False)
+        if kind in ('integer', 'float', 'decimal'):
             return 'number'
-        
-        # 3. 检查时间类型
-        if pd.api.types.is_datetime64_any_dtype(series):
+        if kind in ('date', 'timestamp'):
             return 'datetime'
         
-        # 4. 尝试解析时间类型（字符串）
-        if series.dtype == 'object':
-            non_null = series.dropna()
-            if len(non_null) > 0:
-                # 取前5个样本尝试解析
-                sample = non_null.iloc[:min(5, len(non_null))]
-                try:
-                    for val in sample:
-                        if val:
-                            pd.to_datetime(str(val))
-                    # 如果全部解析成功，认为是时间类型
-                    return 'datetime'
-                except:
-                    pass
-        
-        # 5. 默认为文本类型
+        # 3. 默认为文本类型
         return 'text'
     
     @staticmethod
-    def parse_file_with_types(file_content: bytes, filename: str) -> tuple:
+    def parse_file_with_types(file_content: Union[bytes, str, Path], filename: str) -> tuple:
         """
         解析文件并推断字段类型
         
         Args:
-            file_content: 文件内容（字节）
+            file_content: 文件内容（字节）或文件路径
             filename: 文件名
             
         Returns:
@@ -271,12 +883,12 @@ class FileETLService:
         return df, fields_info
     
     @staticmethod
-    def preview_excel(file_content: bytes, filename: str) -> dict:
+    def preview_excel(file_content: Union[bytes, str, Path], filename: str) -> dict:
         """
         预览Excel文件（不写入数据库）
         
         Args:
-            file_content: 文件内容（字节）
+            file_content: 文件内容（字节）或文件路径
             filename: 文件名
             
         Returns:
@@ -285,9 +897,10 @@ class FileETLService:
         # 解析文件和字段类型
         df, fields_info = FileETLService.parse_file_with_types(file_content, filename)
         
-        # 获取前20行数据用于预览
+        # 获取前20行数据用于预览（缺失值转为 None 以便 JSON 序列化）
         preview_rows = min(20, len(df))
-        preview_data = df.head(preview_rows).to_dict('records')
+        preview = df.head(preview_rows).astype(object)
+        preview_data = preview.where(preview.notna(), None).to_dict('records')
         
         return {
             'filename': filename,
@@ -365,6 +978,193 @@ class FileETLService:
         
         return datasource
     
+    # 批量写入时每次提交给驱动的行数
+    BULK_INSERT_ROWS = 10000
+    
+    @staticmethod
+    def _get_upload_engine(datasource: DataSource):
+        """
+        获取上传数据写入用的数据库引擎
+        
+        复用 DBInspector 按 URL 缓存的引擎（上传数据源记录的是主库的实际类型和连接信息，同样按 URL 复用连接池）。
+        """
+        from app.services.db_inspector import DBInspector
+        return DBInspector.get_engine(datasource)
+    
+    @staticmethod
+    def _create_table(engine, table_name: str, df: pd.DataFrame) -> Table:
+        """按推断的列类型重建目标表"""
+        metadata = MetaData()
+        columns = [
+            Column(col_name, FileETLService.infer_sql_type(df[col_name]), nullable=True)
+            for col_name in df.columns
+        ]
+        table = Table(table_name, metadata, *columns)
+        table.drop(engine, checkfirst=True)
+        metadata.create_all(engine)
+        return table
+    
+    # 列类型放宽顺序：数值类型按范围放宽，不兼容的类型放宽为 Text
+    _NUMERIC_TYPE_ORDER = ('integer', 'bigint', 'decimal', 'float')
+    
+    @staticmethod
+    def _sql_type_key(sql_type) -> str:
+        """SQLAlchemy 类型归类：integer, bigint, decimal, float, boolean, date, datetime, string, text"""
+        from sqlalchemy import BigInteger, Numeric, Date
+        type_class = sql_type if isinstance(sql_type, type) else type(sql_type)
+        if issubclass(type_class, BigInteger):
+            return 'bigint'
+        if issubclass(type_class, Integer):
+            return 'integer'
+        if issubclass(type_class, Float):
+            return 'float'
+        if issubclass(type_class, Numeric):
+            return 'decimal'
+        if issubclass(type_class, Boolean):
+            return 'boolean'
+        if issubclass(type_class, DateTime):
+            return 'datetime'
+        if issubclass(type_class, Date):
+            return 'date'
+        if issubclass(type_class, Text):
+            return 'text'
+        return 'string'
+    
+    @staticmethod
+    def _widen_sql_type(current: str, incoming: str) -> str:
+        """
+        返回能同时容纳两种类型的列类型
+        
+        - 数值类型：integer < bigint < decimal < float
+        - date 与 datetime 放宽为 datetime
+        - 文本列（string / text）可以容纳任意值；string 遇到超长文本时放宽为 text
+        - 其他组合放宽为 text
+        """
+        if current == incoming or current == 'text':
+            return current
+        order = FileETLService._NUMERIC_TYPE_ORDER
+        if current in order and incoming in order:
+            return max(current, incoming, key=order.index)
+        if {current, incoming} == {'date', 'datetime'}:
+            return 'datetime'
+        if current == 'string' and incoming != 'text':
+            return current
+        return 'text'
+    
+    @staticmethod
+    def _sql_type_for_key(key: str):
+        from sqlalchemy import BigInteger, Numeric, Date
+        return {
+            'integer': Integer(),
+            'bigint': BigInteger(),
+            'decimal': Numeric(38, FileETLService.DECIMAL_MAX_SCALE),
+            'float': Float(),
+            'boolean': Boolean(),
+            'date': Date(),
+            'datetime': DateTime(),
+            'string': String(500),
+            'text': Text(),
+        }[key]
+    
+    @staticmethod
+    def _widen_columns(engine, table: Table, df: pd.DataFrame):
+        """
+        后续批次的值不符合首批推断的列类型时（更长的文本、整数列中出现小数或文本等），放宽列类型
+        
+        - PostgreSQL：ALTER COLUMN ... TYPE ... USING
+        - MySQL：MODIFY COLUMN
+        - SQLite 等：列类型只是亲和性，不限制写入的值，只更新表对象上的类型
+        """
+        quote = engine.dialect.identifier_preparer.quote
+        for column in table.columns:
+            values = df[column.name]
+            # 整批为空的列不参与类型推断
+            if values.isna().all():
+                continue
+            current = FileETLService._sql_type_key(column.type)
+            widened = FileETLService._widen_sql_type(current, FileETLService._sql_type_key(FileETLService.infer_sql_type(values)))
+            if widened == current:
+                continue
+            
+            new_type = FileETLService._sql_type_for_key(widened)
+            ddl_type = new_type.compile(dialect=engine.dialect)
+            name = quote(column.name)
+            if engine.dialect.name == 'postgresql':
+                statement = f'ALTER TABLE {quote(table.name)} ALTER COLUMN {name} TYPE {ddl_type} USING {name}::{ddl_type}'
+            elif engine.dialect.name == 'mysql':
+                statement = f'ALTER TABLE {quote(table.name)} MODIFY COLUMN {name} {ddl_type} NULL'
+            else:
+                statement = None
+            if statement:
+                with engine.begin() as conn:
+                    conn.exec_driver_sql(statement)
+            column.type = new_type
+            logger.info("Widened upload column", table_name=table.name, column=column.name, from_type=current, to_type=widened)
+    
+    @staticmethod
+    def _bulk_insert(engine, table: Table, df: pd.DataFrame):
+        """
+        使用数据库原生的批量写入方式插入数据
+        
+        - PostgreSQL：COPY FROM STDIN（CSV 格式）
+        - MySQL：executemany，驱动会将其改写为多行 INSERT
+        - 其他（SQLite 等）：单个事务内 executemany
+        """
+        if df.empty:
+            return
+        if engine.dialect.name == 'postgresql':
+            FileETLService._copy_into_postgres(engine, table, df)
+            return
+        
+        with engine.begin() as conn:
+            for i in range(0, len(df), FileETLService.BULK_INSERT_ROWS):
+                chunk = df.iloc[i:i + FileETLService.BULK_INSERT_ROWS].astype(object)
+                records = chunk.where(chunk.notna(), None).to_dict('records')
+                conn.execute(table.insert(), records)
+    
+    # 缺失值占位符：PostgreSQL 文本不允许包含 NUL，不会与真实数据冲突
+    _COPY_NULL_MARKER = '\x00'
+
+    @staticmethod
+    def _copy_payload(df_chunk: pd.DataFrame) -> str:
+        """
+        生成 COPY ... WITH (FORMAT csv) 的数据块
+
+        COPY 只把未加引号的空字段解析为 NULL，加引号的 "" 是空字符串。
+        文本加引号以保留空字符串；缺失值（NaN/NaT/None/pd.NA）先写为占位符，再替换为未加引号的空字段。
+        """
+        buffer = io.StringIO()
+        df_chunk.to_csv(
+            buffer, index=False, header=False,
+            quoting=csv.QUOTE_NONNUMERIC, na_rep=FileETLService._COPY_NULL_MARKER
+        )
+        marker = FileETLService._COPY_NULL_MARKER
+        return buffer.getvalue().replace(f'"{marker}"', '').replace(marker, '')
+
+    @staticmethod
+    def _copy_into_postgres(engine, table: Table, df: pd.DataFrame):
+        """通过 COPY 写入 PostgreSQL，按块生成 CSV，避免整表 CSV 常驻内存"""
+        column_list = ', '.join(f'"{col}"' for col in df.columns)
+        copy_sql = f'COPY "{table.name}" ({column_list}) FROM STDIN WITH (FORMAT csv)'
+        
+        raw_conn = engine.raw_connection()
+        try:
+            cursor = raw_conn.cursor()
+            for i in range(0, len(df), FileETLService.BULK_INSERT_ROWS):
+                payload = FileETLService._copy_payload(df.iloc[i:i + FileETLService.BULK_INSERT_ROWS])
+                if hasattr(cursor, 'copy_expert'):
+                    cursor.copy_expert(copy_sql, io.StringIO(payload))
+                else:
+                    # psycopg 3
+                    with cursor.copy(copy_sql) as copy:
+                        copy.write(payload)
+            raw_conn.commit()
+        except Exception:
+            raw_conn.rollback()
+            raise
+        finally:
+            raw_conn.close()
+    
     @staticmethod
     def write_to_database(
         df: pd.DataFrame,
@@ -375,6 +1175,8 @@ class FileETLService:
         """
         将DataFrame写入数据库
         
+        按推断的列类型建表后使用原生批量写入（见 _bulk_insert），表结构不会被 pandas 的默认类型覆盖。
+        
         Args:
             df: 数据框
             table_name: 目标表名
@@ -387,53 +1189,23 @@ class FileETLService:
         Raises:
             ValueError: 如果数据库写入失败
         """
-        from app.core.security import decrypt_password
-        
+        start = time.perf_counter()
         try:
-            # 解密数据库密码
-            password = decrypt_password(datasource.password_encrypted)
-            
-            # 构建数据库连接字符串
-            if datasource.type == "upload":
-                # 上传类型使用主数据库
-                db_url = settings.SQLALCHEMY_DATABASE_URI
-            else:
-                # 其他类型构建连接
-                db_url = f"mysql+pymysql://{datasource.username}:{password}@{datasource.host}:{datasource.port}/{datasource.database_name}?charset=utf8mb4"
-            
-            # 创建引擎
-            engine = create_engine(db_url)
-            
-            # 创建表结构
-            metadata = MetaData()
-            columns = [Column('id', Integer, primary_key=True, autoincrement=True)]
-            
-            for col_name in df.columns:
-                sql_type = FileETLService.infer_sql_type(df[col_name])
-                columns.append(Column(col_name, sql_type, nullable=True))
-            
-            table = Table(table_name, metadata, *columns, extend_existing=True)
-            
-            # 创建表
-            metadata.create_all(engine)
-            
-            # 写入数据
-            df.to_sql(
-                name=table_name,
-                con=engine,
-                if_exists='replace',
-                index=False,
-                method='multi',
-                chunksize=1000
-            )
+            engine = FileETLService._get_upload_engine(datasource)
+            table = FileETLService._create_table(engine, table_name, df)
+            FileETLService._bulk_insert(engine, table, df)
             
             row_count = len(df)
+            elapsed = time.perf_counter() - start
             
             logger.info(
                 "Data written to database",
                 table_name=table_name,
                 rows=row_count,
-                columns=len(df.columns)
+                columns=len(df.columns),
+                dialect=engine.dialect.name,
+                elapsed_ms=round(elapsed * 1000, 2),
+                rows_per_second=round(row_count / elapsed, 1) if elapsed > 0 else None
             )
             
             return row_count
@@ -447,6 +1219,70 @@ class FileETLService:
             )
             raise ValueError(f"数据库写入失败: {str(e)}")
     
+    @staticmethod
+    def write_batches_to_database(
+        batches: Iterable[pd.DataFrame],
+        table_name: str,
+        datasource: DataSource,
+        db_session: Session,
+        progress_callback: Optional[Callable[[int], None]] = None
+    ) -> Dict[str, Any]:
+        """
+        分批将数据写入数据库
+        
+        首批数据用于推断表结构并建表，后续批次追加写入；后续批次出现不符合的值时放宽列类型
+        （见 _widen_columns）。写入失败时删除已创建的表，不会留下只有部分数据的表。
+        
+        Args:
+            batches: DataFrame 批次迭代器
+            table_name: 目标表名
+            datasource: 数据源对象
+            db_session: 数据库会话
+            progress_callback: 每批写入后回调，参数为已写入行数
+            
+        Returns:
+            {"rows": 行数, "columns": 列数, "elapsed_ms": 耗时, "rows_per_second": 写入速度}
+        """
+        start = time.perf_counter()
+        engine = FileETLService._get_upload_engine(datasource)
+        table = None
+        rows = 0
+        
+        try:
+            for batch in batches:
+                try:
+                    if table is None:
+                        table = FileETLService._create_table(engine, table_name, batch)
+                    else:
+                        FileETLService._widen_columns(engine, table, batch)
+                    FileETLService._bulk_insert(engine, table, batch)
+                except Exception as e:
+                    logger.error("Database batch write failed", table_name=table_name, rows=rows, error=str(e))
+                    raise ValueError(f"数据库写入失败（第 {rows + 1} 行之后）: {str(e)}")
+                rows += len(batch)
+                if progress_callback:
+                    progress_callback(rows)
+        except Exception:
+            if table is not None:
+                try:
+                    table.drop(engine, checkfirst=True)
+                except Exception as drop_error:
+                    logger.warning("Failed to drop partially loaded table", table_name=table_name, error=str(drop_error))
+            raise
+        
+        if table is None:
+            raise ValueError("文件内容为空")
+        
+        elapsed = time.perf_counter() - start
+        stats = {
+            "rows": rows,
+            "columns": len(table.columns),
+            "elapsed_ms": round(elapsed * 1000, 2),
+            "rows_per_second": round(rows / elapsed, 1) if elapsed > 0 else None
+        }
+        logger.info("Batched data written to database", table_name=table_name, dialect=engine.dialect.name, **stats)
+        return stats
+    
     @staticmethod
     def generate_table_name(user_id: int, filename: str) -> str:
         """
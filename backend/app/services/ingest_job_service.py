@@ -0,0 +1,689 @@
+"""
+文件导入服务
+
+- 多文件导入数据集：生成表名、创建 Dataset 和 DuckDB 文件、并行导入、失败时清理
+- 重复上传复用：按内容指纹（文件哈希 + 工作表 + 表名）查找已导入且已训练的数据集，显式开启时直接复用
+- 向已有数据集追加/按主键更新数据：校验表结构兼容性，递增数据版本
+- 异步导入任务：上传请求只负责落盘并创建任务（pending），由独立的导入工作进程（python run_ingest_worker.py）
+  认领并执行（解析在进程池的工作进程中完成），API 进程不执行导入；
+  进度写入 ingest_jobs 表，供轮询和 SSE 推送；失败的任务保留落盘文件，可直接重试而无需重新上传
+- 任务执行期间定期刷新心跳，工作进程启动时只回收本实例或心跳超时的任务（见 job_heartbeat）
+"""
+
+import asyncio
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.logger import get_logger
+from app.db.session import SessionLocal
+from app.models.metadata import Dataset, IngestJob
+from app.services.duckdb_service import DuckDBService
+from app.services import job_heartbeat
+from app.services.file_etl import FileETLService
+from app.services.parallel_ingest import import_files
+from app.utils.file_handler import file_sha256
+
+logger = get_logger(__name__)
+
+
+def sanitize_table_name(filename: str) -> str:
+    """
+    清理文件名以生成合法的表名
+
+    Args:
+        filename: 原始文件名
+
+    Returns:
+        str: 清理后的表名
+    """
+    # 移除扩展名
+    name = filename.rsplit('.', 1)[0]
+
+    # 替换特殊字符为下划线
+    name = re.sub(r'[^\w\u4e00-\u9fa5]', '_', name)
+
+    # 移除多余的下划线
+    name = re.sub(r'_+', '_', name)
+
+    # 移除首尾下划线
+    name = name.strip('_')
+
+    # 如果以数字开头，添加前缀
+    if name and name[0].isdigit():
+        name = 'tbl_' + name
+
+    # 限制长度
+    if len(name) > 50:
+        name = name[:50]
+
+    return name.lower()
+
+
+def build_import_entries(files: List[Tuple[str, str]], sheets: Optional[str] = None) -> List[Tuple]:
+    """
+    为待导入的文件生成导入项，Excel 的每个选中工作表对应一张表，重复表名添加后缀
+
+    Args:
+        files: [(文件路径, 原始文件名), ...]
+        sheets: 工作表选择，见 FileETLService.resolve_sheets
+
+    Returns:
+        [(文件路径, 原始文件名, 表名, 工作表名), ...]
+    """
+    entries = []
+    table_names = set()
+    for file_path, filename in files:
+        sheet_names = FileETLService.resolve_sheets(file_path, filename, sheets)
+        for sheet_name in sheet_names:
+            table_name = sanitize_table_name(filename)
+            if len(sheet_names) > 1:
+                table_name = f"{table_name}_{sanitize_table_name(sheet_name)}"
+            if table_name in table_names:
+                counter = 1
+                while f"{table_name}_{counter}" in table_names:
+                    counter += 1
+                table_name = f"{table_name}_{counter}"
+            table_names.add(table_name)
+            entries.append((file_path, filename, table_name, sheet_name))
+    return entries
+
+
+def content_fingerprint(entries: List[Tuple], file_hashes: Dict[str, str]) -> str:
+    """
+    计算导入内容指纹：按导入顺序组合每个文件的内容哈希、工作表名和表名
+
+    表名进入指纹是因为训练产物（DDL）中包含表名，表名不同时不能复用。
+
+    Args:
+        entries: build_import_entries 生成的导入项
+        file_hashes: {文件路径: 内容 SHA-256}
+    """
+    digest = hashlib.sha256()
+    for file_path, _, table_name, sheet_name in entries:
+        digest.update(f"{file_hashes[file_path]}\0{sheet_name or ''}\0{table_name}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def find_reusable_dataset(db: Session, owner_id: int, content_hash: str) -> Optional[Dataset]:
+    """查找同一用户下内容指纹相同、已训练完成且 DuckDB 文件仍存在的数据集"""
+    candidates = (
+        db.query(Dataset)
+        .filter(
+            Dataset.owner_id == owner_id,
+            Dataset.content_hash == content_hash,
+            Dataset.status == "completed",
+        )
+        .order_by(Dataset.id.desc())
+        .all()
+    )
+    for dataset in candidates:
+        if dataset.duckdb_path and os.path.exists(dataset.duckdb_path):
+            return dataset
+    return None
+
+
+async def import_or_reuse_dataset(
+    db: Session,
+    owner_id: int,
+    dataset_name: str,
+    entries: List[Tuple],
+    file_hashes: Dict[str, str],
+    reuse_existing: bool = False,
+    progress_reporter: Optional[Callable[[int, int], None]] = None,
+) -> Tuple[Dataset, List[Dict], float, bool]:
+    """
+    开启复用且内容和表结构与已有数据集一致时直接复用（不解析、不导入、不训练），否则导入为新数据集
+
+    Args:
+        file_hashes: {文件路径: 内容 SHA-256}
+        reuse_existing: 是否允许复用已有数据集（需调用方显式开启：复用时不会创建使用新名称的数据集）
+
+    Returns:
+        (Dataset, 每个文件的导入结果, 耗时毫秒, 是否复用)
+    """
+    content_hash = content_fingerprint(entries, file_hashes)
+    if reuse_existing:
+        start = time.perf_counter()
+        dataset = find_reusable_dataset(db, owner_id, content_hash)
+        if dataset is not None:
+            shapes = await asyncio.to_thread(DuckDBService.get_table_shapes, dataset.duckdb_path)
+            if all(entry[2] in shapes for entry in entries):
+                file_results = [
+                    {
+                        "filename": filename,
+                        "table_name": table_name,
+                        "rows": shapes[table_name]["rows"],
+                        "columns": shapes[table_name]["columns"],
+                        "parse_ms": 0.0,
+                        "load_ms": 0.0,
+                        "parse_settings": (dataset.ingest_config or {}).get(table_name) or {},
+                    }
+                    for _, filename, table_name, _ in entries
+                ]
+                elapsed_ms = round((time.perf_counter() - start) * 1000, 2)
+                logger.info(
+                    "Reused dataset with identical upload content",
+                    dataset_id=dataset.id,
+                    owner_id=owner_id,
+                    elapsed_ms=elapsed_ms
+                )
+                return dataset, file_results, elapsed_ms, True
+
+    dataset, file_results, elapsed_ms = await import_dataset(
+        db, owner_id, dataset_name, entries, progress_reporter, content_hash=content_hash
+    )
+    return dataset, file_results, elapsed_ms, False
+
+
+async def import_dataset(
+    db: Session,
+    owner_id: int,
+    dataset_name: str,
+    entries: List[Tuple],
+    progress_reporter: Optional[Callable[[int, int], None]] = None,
+    content_hash: Optional[str] = None,
+) -> Tuple[Dataset, List[Dict], float]:
+    """
+    创建 DuckDB 数据集并导入所有文件，导入失败时删除半成品数据集
+
+    Args:
+        content_hash: 导入内容指纹，见 content_fingerprint
+
+    Returns:
+        (Dataset, 每个文件的导入结果, 导入耗时毫秒)
+    """
+    table_names = [entry[2] for entry in entries]
+    dataset = Dataset(
+        name=dataset_name,
+        datasource_id=None,  # DuckDB 数据集不需要传统数据源
+        status="pending",
+        owner_id=owner_id,
+        schema_config=table_names
+    )
+    db.add(dataset)
+    db.commit()
+    db.refresh(dataset)
+
+    # 生成 collection_name（必须在获取dataset.id之后）
+    dataset.collection_name = f"vec_ds_{dataset.id}"
+
+    db_path = DuckDBService.create_dataset_database(dataset.id)
+    start = time.perf_counter()
+    try:
+        file_results = await import_files(db_path, entries, progress_reporter)
+    except Exception:
+        DuckDBService.delete_database(db_path)
+        db.delete(dataset)
+        db.commit()
+        raise
+    elapsed_ms = round((time.perf_counter() - start) * 1000, 2)
+
+    # 更新 Dataset 元数据（包括 collection_name、duckdb_path 和解析参数）
+    dataset.duckdb_path = db_path
+    dataset.ingest_config = {item["table_name"]: item["parse_settings"] for item in file_results}
+    dataset.content_hash = content_hash
+    db.commit()
+    db.refresh(dataset)
+
+    logger.info(
+        "Dataset created successfully",
+        dataset_id=dataset.id,
+        duckdb_path=db_path,
+        tables=table_names,
+        elapsed_ms=elapsed_ms
+    )
+    return dataset, file_results, elapsed_ms
+
+
+def append_to_dataset(
+    db: Session,
+    dataset: Dataset,
+    table_name: str,
+    file_path: str,
+    filename: str,
+    key_columns: Optional[List[str]] = None,
+    allow_schema_change: bool = False,
+    sheet_name: Optional[str] = None,
+) -> Dict:
+    """
+    把上传文件追加（或按主键更新）到数据集已有的 DuckDB 表中，成功后递增数据集的数据版本
+
+    Args:
+        dataset: 基于 DuckDB 文件的数据集
+        table_name: 目标表名，需在数据集的 schema_config 中
+        key_columns: 主键列，为空时直接追加
+        allow_schema_change: 是否允许新增列/放宽列类型，否则表结构不兼容时报错
+
+    Returns:
+        dict: DuckDBService.merge_batches 的结果，附加 data_version 和 parse_settings
+
+    Raises:
+        ValueError: 数据集不是上传数据集、表不存在或表结构不兼容
+    """
+    if not dataset.duckdb_path:
+        raise ValueError("仅支持向上传文件创建的数据集追加数据")
+    if table_name not in (dataset.schema_config or []):
+        raise ValueError(f"表不存在: {table_name}")
+
+    sheet = FileETLService.resolve_sheets(file_path, filename, sheet_name)[0]
+    parse_settings = FileETLService.detect_parse_settings(file_path, filename, sheet)
+    stats = DuckDBService.merge_batches(
+        dataset.duckdb_path,
+        table_name,
+        FileETLService.iter_file_batches(file_path, filename, parse_settings=parse_settings),
+        key_columns=key_columns,
+        allow_schema_change=allow_schema_change,
+    )
+
+    dataset.data_version = (dataset.data_version or 1) + 1
+    # 内容已变化，不能再作为重复上传的复用目标
+    dataset.content_hash = None
+    db.commit()
+    db.refresh(dataset)
+
+    logger.info(
+        f"Appended file to dataset table: {filename} -> {table_name}",
+        dataset_id=dataset.id,
+        inserted=stats["inserted"],
+        updated=stats["updated"],
+        schema_changed=stats["schema_changed"],
+        data_version=dataset.data_version,
+    )
+    stats["data_version"] = dataset.data_version
+    stats["parse_settings"] = parse_settings
+    return stats
+
+
+def train_uploaded_dataset(dataset_id: int, table_names: List[str]):
+    """
+    后台任务：训练上传的数据集
+
+    Args:
+        dataset_id: 数据集ID
+        table_names: 表名列表
+    """
+    from app.services.vanna import VannaTrainingService
+
+    db = SessionLocal()
+    try:
+        logger.info(
+            "Starting background training for uploaded dataset",
+            dataset_id=dataset_id,
+            tables=table_names
+        )
+
+        # 调用训练服务
+        VannaTrainingService.train_dataset(
+            dataset_id=dataset_id,
+            table_names=table_names,
+            db_session=db
+        )
+
+        logger.info(
+            "Background training completed",
+            dataset_id=dataset_id
+        )
+
+    except Exception as e:
+        logger.error(
+            "Background training failed",
+            dataset_id=dataset_id,
+            error=str(e),
+            exc_info=True
+        )
+    finally:
+        db.close()
+
+
+class JobProgressReporter:
+    """
+    在工作进程中累加导入任务的进度
+
+    使用原子的增量更新（rows = rows + delta），多个工作进程同时写同一任务也不会互相覆盖。
+    """
+
+    def __init__(self, job_id: int):
+        self.job_id = job_id
+
+    def __call__(self, rows: int, bytes_read: int):
+        db = SessionLocal()
+        try:
+            db.query(IngestJob).filter(IngestJob.id == self.job_id).update(
+                {
+                    IngestJob.rows_processed: IngestJob.rows_processed + rows,
+                    IngestJob.bytes_processed: IngestJob.bytes_processed + bytes_read,
+                },
+                synchronize_session=False,
+            )
+            db.commit()
+        except Exception as e:
+            logger.warning("Failed to report ingest progress", job_id=self.job_id, error=str(e))
+        finally:
+            db.close()
+
+
+class IngestJobService:
+    """异步文件导入任务"""
+
+    TERMINAL_STATUSES = ("completed", "failed")
+
+    @classmethod
+    def job_root(cls) -> Path:
+        root = Path(settings.UPLOAD_TEMP_DIR or tempfile.gettempdir()) / "ingest_jobs"
+        root.mkdir(parents=True, exist_ok=True)
+        return root
+
+    @classmethod
+    def create_job(
+        cls,
+        db: Session,
+        owner_id: int,
+        dataset_name: str,
+        uploads: list,
+        options: Optional[Dict] = None,
+    ) -> IngestJob:
+        """
+        创建导入任务，并把已落盘的上传文件移动到任务目录（任务成功后删除，失败时保留用于重试）
+
+        任务处于 pending 状态，由导入工作进程认领执行（见 claim_pending）。
+
+        Args:
+            uploads: SpooledUpload 列表
+        """
+        job = IngestJob(
+            owner_id=owner_id,
+            dataset_name=dataset_name,
+            status="pending",
+            files=[],
+            options=options or {},
+            total_bytes=sum(upload.size for upload in uploads),
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+
+        job_dir = cls.job_root() / str(job.id)
+        job_dir.mkdir(parents=True, exist_ok=True)
+        files = []
+        for index, upload in enumerate(uploads):
+            target = job_dir / f"{index}{upload.extension}"
+            shutil.move(upload.path, target)
+            files.append({
+                "path": str(target),
+                "filename": upload.filename,
+                "size": upload.size,
+                "sha256": upload.sha256,
+            })
+        job.files = files
+        db.commit()
+        db.refresh(job)
+
+        logger.info("Ingest job created", job_id=job.id, files=len(files), total_bytes=job.total_bytes)
+        return job
+
+    @classmethod
+    def claim_pending(cls, db: Session, limit: int, exclude: Iterable[int] = ()) -> List[int]:
+        """
+        按创建顺序认领待执行的任务
+
+        条件更新（status 仍为 pending 才改为 running）保证多个工作进程不会认领同一个任务。
+
+        Args:
+            limit: 最多认领的任务数
+            exclude: 不认领的任务 ID（本进程中仍在执行的任务）
+
+        Returns:
+            认领到的任务 ID 列表
+        """
+        if limit <= 0:
+            return []
+        query = db.query(IngestJob.id).filter(IngestJob.status == "pending")
+        exclude = list(exclude)
+        if exclude:
+            query = query.filter(IngestJob.id.notin_(exclude))
+        claimed = []
+        for (job_id,) in query.order_by(IngestJob.id).limit(limit).all():
+            updated = (
+                db.query(IngestJob)
+                .filter(IngestJob.id == job_id, IngestJob.status == "pending")
+                .update(
+                    {
+                        IngestJob.status: "running",
+                        IngestJob.worker_id: job_heartbeat.WORKER_ID,
+                        IngestJob.heartbeat_at: datetime.utcnow(),
+                    },
+                    synchronize_session=False,
+                )
+            )
+            db.commit()
+            if updated:
+                claimed.append(job_id)
+        return claimed
+
+    @classmethod
+    def _claim(cls, limit: int, exclude: Iterable[int] = ()) -> List[int]:
+        db = SessionLocal()
+        try:
+            return cls.claim_pending(db, limit, exclude)
+        finally:
+            db.close()
+
+    @classmethod
+    async def run_pending(cls) -> List[int]:
+        """认领并执行所有待执行的任务，等待完成（同时执行的任务数受 INGEST_WORKER_CONCURRENCY 限制）"""
+        semaphore = asyncio.Semaphore(max(1, settings.INGEST_WORKER_CONCURRENCY))
+
+        async def run_limited(job_id: int):
+            async with semaphore:
+                await cls.run(job_id)
+
+        job_ids = await asyncio.to_thread(cls._claim, max(1, settings.INGEST_WORKER_CONCURRENCY))
+        await asyncio.gather(*[run_limited(job_id) for job_id in job_ids])
+        return job_ids
+
+    @classmethod
+    async def run_forever(cls):
+        """
+        导入工作进程主循环：每 INGEST_WORKER_POLL_SECONDS 秒认领一次待执行的任务
+
+        认领的任务作为后台任务执行，主循环不等待完成；本进程同时执行的任务数不超过 INGEST_WORKER_CONCURRENCY。
+        """
+        concurrency = max(1, settings.INGEST_WORKER_CONCURRENCY)
+        logger.info(
+            "Ingest worker started",
+            worker_id=job_heartbeat.WORKER_ID,
+            poll_seconds=settings.INGEST_WORKER_POLL_SECONDS,
+            concurrency=concurrency,
+        )
+        running: Dict[int, asyncio.Task] = {}
+
+        def done(job_id: int, task: asyncio.Task):
+            running.pop(job_id, None)
+            if not task.cancelled() and task.exception() is not None:
+                logger.error("Ingest job task failed", job_id=job_id, error=str(task.exception()))
+
+        try:
+            while True:
+                try:
+                    for job_id in await asyncio.to_thread(cls._claim, concurrency - len(running), set(running)):
+                        task = asyncio.create_task(cls.run(job_id), name=f"ingest-job-{job_id}")
+                        running[job_id] = task
+                        task.add_done_callback(lambda finished, job_id=job_id: done(job_id, finished))
+                except Exception as e:
+                    logger.error("Ingest worker iteration failed", error=str(e), exc_info=True)
+                await asyncio.sleep(settings.INGEST_WORKER_POLL_SECONDS)
+        finally:
+            tasks = list(running.values())
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    @classmethod
+    async def run(cls, job_id: int):
+        """执行导入任务：导入文件、更新状态，成功后清理落盘文件并触发训练"""
+        db = SessionLocal()
+        try:
+            job = db.query(IngestJob).filter(IngestJob.id == job_id).first()
+            if job is None:
+                return
+            job.status = "running"
+            job.attempts = (job.attempts or 0) + 1
+            job.started_at = datetime.utcnow()
+            job.finished_at = None
+            job.error_msg = None
+            job.rows_processed = 0
+            job.bytes_processed = 0
+            job_heartbeat.claim(job)
+            db.commit()
+
+            try:
+                async with job_heartbeat.heartbeat(SessionLocal, IngestJob, job_id):
+                    options = job.options or {}
+                    files = [(item["path"], item["filename"]) for item in job.files]
+                    entries = await asyncio.to_thread(build_import_entries, files, options.get("sheets"))
+                    file_hashes = {
+                        item["path"]: item.get("sha256") or await asyncio.to_thread(file_sha256, item["path"])
+                        for item in job.files
+                    }
+                    dataset, file_results, elapsed_ms, reused = await import_or_reuse_dataset(
+                        db,
+                        job.owner_id,
+                        job.dataset_name,
+                        entries,
+                        file_hashes,
+                        reuse_existing=options.get("reuse_existing", False),
+                        progress_reporter=JobProgressReporter(job.id),
+                    )
+            except Exception as e:
+                db.rollback()
+                job = db.query(IngestJob).filter(IngestJob.id == job_id).first()
+                job.status = "failed"
+                job.error_msg = str(e)
+                job.finished_at = datetime.utcnow()
+                db.commit()
+                logger.error("Ingest job failed", job_id=job_id, attempts=job.attempts, error=str(e), exc_info=True)
+                return
+
+            db.refresh(job)
+            job.status = "completed"
+            job.dataset_id = dataset.id
+            job.result = {"files": file_results, "elapsed_ms": elapsed_ms, "reused": reused}
+            job.bytes_processed = job.total_bytes
+            job.finished_at = datetime.utcnow()
+            db.commit()
+            cls._remove_job_files(job_id)
+
+            logger.info(
+                "Ingest job completed", job_id=job_id, dataset_id=dataset.id, elapsed_ms=elapsed_ms, reused=reused
+            )
+        finally:
+            db.close()
+
+        if not reused:
+            await asyncio.to_thread(train_uploaded_dataset, dataset.id, [entry[2] for entry in entries])
+
+    @classmethod
+    def can_retry(cls, job: IngestJob) -> bool:
+        """失败且落盘文件仍然存在的任务可以重试"""
+        return job.status == "failed" and bool(job.files) and all(
+            os.path.exists(item["path"]) for item in job.files
+        )
+
+    @classmethod
+    def retry(cls, db: Session, job: IngestJob):
+        """
+        把失败的任务重新放回队列，由导入工作进程从落盘文件重新执行
+
+        Raises:
+            ValueError: 如果任务不是失败状态或文件已被清理
+        """
+        if job.status != "failed":
+            raise ValueError(f"只有失败的任务可以重试，当前状态: {job.status}")
+        if not cls.can_retry(job):
+            raise ValueError("上传文件已被清理，请重新上传")
+        job.status = "pending"
+        job.error_msg = None
+        job.worker_id = None
+        job.heartbeat_at = None
+        db.commit()
+
+    @classmethod
+    def get_progress(cls, job: IngestJob) -> int:
+        """任务进度百分比：按已读取的字节数估算，完成前最多 99"""
+        if job.status == "completed":
+            return 100
+        if not job.total_bytes:
+            return 0
+        return min(99, int((job.bytes_processed or 0) * 100 / job.total_bytes))
+
+    @classmethod
+    def to_dict(cls, job: IngestJob) -> Dict:
+        result = job.result or {}
+        return {
+            "job_id": job.id,
+            "status": job.status,
+            "progress": cls.get_progress(job),
+            "rows_processed": job.rows_processed or 0,
+            "bytes_processed": job.bytes_processed or 0,
+            "total_bytes": job.total_bytes or 0,
+            "dataset_id": job.dataset_id,
+            "dataset_name": job.dataset_name,
+            "error_msg": job.error_msg,
+            "attempts": job.attempts or 0,
+            "retryable": cls.can_retry(job),
+            "files": result.get("files"),
+            "elapsed_ms": result.get("elapsed_ms"),
+            "reused": result.get("reused", False),
+            "created_at": job.created_at,
+            "started_at": job.started_at,
+            "finished_at": job.finished_at,
+        }
+
+    @classmethod
+    def recover_interrupted(cls):
+        """
+        导入工作进程启动时处理遗留任务
+
+        - 本实例上次退出时未完成、或心跳超时的任务标记为失败（落盘文件保留，可重试）；
+          其他实例正在执行（心跳未超时）的任务不受影响，排队中（pending）的任务留给工作进程认领
+        - 超过保留期的失败任务删除落盘文件
+        """
+        db = SessionLocal()
+        try:
+            interrupted = db.query(IngestJob).filter(
+                IngestJob.status == "running",
+                job_heartbeat.orphaned(IngestJob)
+            ).all()
+            for job in interrupted:
+                job.status = "failed"
+                job.error_msg = "服务重启导致任务中断，可重试"
+                job.finished_at = datetime.utcnow()
+
+            expire_before = datetime.utcnow() - timedelta(hours=settings.INGEST_JOB_RETENTION_HOURS)
+            expired = db.query(IngestJob).filter(
+                IngestJob.status == "failed",
+                IngestJob.finished_at < expire_before
+            ).all()
+            db.commit()
+
+            for job in expired:
+                cls._remove_job_files(job.id)
+
+            if interrupted or expired:
+                logger.info("Ingest jobs recovered", interrupted=len(interrupted), expired=len(expired))
+        finally:
+            db.close()
+
+    @classmethod
+    def _remove_job_files(cls, job_id: int):
+        shutil.rmtree(cls.job_root() / str(job_id), ignore_errors=True)
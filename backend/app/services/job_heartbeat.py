@@ -0,0 +1,70 @@
+"""
+后台任务心跳（导入任务、导出任务共用）
+
+多实例部署时，一个实例重启不应把其他实例正在执行的任务标记为失败：
+- 任务创建和执行时写入本实例标识 worker_id 和心跳时间 heartbeat_at，执行期间每隔 JOB_HEARTBEAT_INTERVAL 秒刷新心跳
+- 服务启动时只回收属于本实例标识、心跳超过 JOB_HEARTBEAT_TIMEOUT 秒未更新，或迁移前遗留（没有 worker_id）的任务
+"""
+
+import asyncio
+import os
+import socket
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Callable
+
+from sqlalchemy import or_
+
+from app.core.config import settings
+from app.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 本实例标识：未配置时为 主机名:进程号（进程重启后标识变化，遗留任务按心跳超时回收）
+WORKER_ID = settings.JOB_WORKER_ID or f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim(job):
+    """把任务标记为由本实例执行，并刷新心跳"""
+    job.worker_id = WORKER_ID
+    job.heartbeat_at = datetime.utcnow()
+
+
+def touch(session_factory: Callable, model, job_id: int):
+    """刷新任务心跳"""
+    db = session_factory()
+    try:
+        db.query(model).filter(model.id == job_id).update(
+            {model.heartbeat_at: datetime.utcnow()}, synchronize_session=False
+        )
+        db.commit()
+    except Exception as e:
+        logger.warning("Failed to update job heartbeat", table=model.__tablename__, job_id=job_id, error=str(e))
+    finally:
+        db.close()
+
+
+@asynccontextmanager
+async def heartbeat(session_factory: Callable, model, job_id: int):
+    """在上下文内定期刷新任务心跳"""
+    async def beat():
+        while True:
+            await asyncio.sleep(settings.JOB_HEARTBEAT_INTERVAL)
+            await asyncio.to_thread(touch, session_factory, model, job_id)
+
+    task = asyncio.create_task(beat())
+    try:
+        yield
+    finally:
+        task.cancel()
+
+
+def orphaned(model):
+    """启动时可以判定为已中断的任务条件：本实例的任务、心跳超时的任务或迁移前遗留的任务"""
+    stale_before = datetime.utcnow() - timedelta(seconds=settings.JOB_HEARTBEAT_TIMEOUT)
+    return or_(
+        model.worker_id.is_(None),
+        model.worker_id == WORKER_ID,
+        model.heartbeat_at.is_(None),
+        model.heartbeat_at < stale_before,
+    )
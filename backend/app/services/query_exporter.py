@@ -0,0 +1,370 @@
+"""
+查询结果流式导出服务 - 在服务端重新执行 SQL，分块读取并逐块输出，内存占用与结果行数无关
+
+- DuckDB 数据集：只读连接，按 DuckDB 向量分块读取结果（fetch_df_chunk）
+- 传统数据源：SQLAlchemy stream_results 服务端游标，按 EXPORT_BATCH_ROWS 行分块读取
+- 只允许单条只读查询；第一块在返回响应之前读取，SQL 错误可以作为 HTTP 错误返回
+- Parquet / Arrow IPC 导出直接从 DuckDB 或数据库游标生成 Arrow 列式批次，不经过 pandas
+"""
+import decimal
+import itertools
+import math
+import os
+import tempfile
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import duckdb
+import pandas as pd
+from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool
+
+from app.core.config import settings
+from app.core.logger import get_logger
+from app.models.metadata import Dataset
+from app.services.db_inspector import DBInspector
+from app.utils.sql_canonical import is_select_statement
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow 为可选依赖（DuckDB 数据集导出 Parquet 不需要）
+    pa = pq = None
+
+logger = get_logger(__name__)
+
+# DuckDB 每个向量的行数
+DUCKDB_VECTOR_SIZE = 2048
+
+# 列式导出格式 -> 文件扩展名
+COLUMNAR_FORMATS = {"parquet": "parquet", "arrow": "arrow"}
+
+# 小数列统一导出为 decimal128(38, s)，后续批次的整数位数更多时也能容纳
+DECIMAL_PRECISION = 38
+# 游标描述中没有小数位数时的最小小数位数（后续批次小数位数更多时按 schema 的位数四舍五入）
+DECIMAL_DEFAULT_SCALE = 10
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ValueError("导出 Arrow / Parquet 需要安装 pyarrow")
+
+
+def _cursor_scales(result) -> Optional[List[Optional[int]]]:
+    """从 DB-API 游标描述中读取每列的小数位数（description 第 6 项，驱动未提供时为 None）"""
+    description = getattr(getattr(result, "cursor", None), "description", None)
+    if not description:
+        return None
+    return [item[5] if len(item) > 5 else None for item in description]
+
+
+def _infer_schema(
+    columns: List[str],
+    rows: Sequence[Sequence[Any]],
+    scales: Optional[Sequence[Optional[int]]] = None,
+) -> Tuple["pa.Schema", set]:
+    """
+    按第一块数据推断 Arrow schema
+
+    小数列放宽为 decimal128(38, s)：s 优先使用游标描述中的小数位数，否则取第一块的小数位数与
+    DECIMAL_DEFAULT_SCALE 中的较大者，后续批次出现更宽的小数时不会转换失败。
+
+    Args:
+        scales: 每列的小数位数（来自游标描述，未知时为 None）
+
+    Returns:
+        (schema, 第一块中全部为空的列下标)：这些列无法推断类型，按字符串导出
+    """
+    fields, stringify = [], set()
+    values = list(zip(*rows)) if rows else [()] * len(columns)
+    for idx, (col, column_values) in enumerate(zip(columns, values)):
+        dtype = pa.array(column_values).type if column_values else pa.null()
+        if pa.types.is_null(dtype):
+            dtype = pa.string()
+            stringify.add(idx)
+        elif pa.types.is_decimal(dtype):
+            scale = scales[idx] if scales and isinstance(scales[idx], int) and scales[idx] >= 0 else None
+            if scale is None:
+                scale = max(dtype.scale, DECIMAL_DEFAULT_SCALE)
+            dtype = pa.decimal128(DECIMAL_PRECISION, min(scale, DECIMAL_PRECISION))
+        fields.append(pa.field(str(col), dtype))
+    return pa.schema(fields), stringify
+
+
+def _column_array(field: "pa.Field", values: Sequence[Any]) -> "pa.Array":
+    """
+    按 schema 的列类型转换一列数据
+
+    与第一块推断的类型不一致时：文本列把其他类型的值转为文本；小数列按 schema 的小数位数四舍五入；
+    其他无法安全转换的情况抛出 ValueError，不写出错误的数据。
+    """
+    try:
+        # pyarrow 把小数写入整数列时会直接截断，需要单独检查
+        if pa.types.is_integer(field.type) and any(
+            isinstance(value, float) and not value.is_integer() for value in values
+        ):
+            raise pa.ArrowInvalid("小数无法写入整数列")
+        return pa.array(values, type=field.type)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError) as e:
+        error = e
+    if pa.types.is_string(field.type):
+        return pa.array([None if value is None else str(value) for value in values], type=field.type)
+    if pa.types.is_decimal(field.type):
+        quantum = decimal.Decimal(1).scaleb(-field.type.scale)
+        try:
+            array = pa.array([
+                None if value is None else decimal.Decimal(value).quantize(quantum, rounding=decimal.ROUND_HALF_EVEN)
+                for value in values
+            ], type=field.type)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, decimal.InvalidOperation, TypeError, ValueError) as e:
+            error = e
+        else:
+            logger.warning("Decimal values rounded to export scale", column=field.name, scale=field.type.scale)
+            return array
+    raise ValueError(f"列 {field.name} 的数据与第一批数据推断的类型 {field.type} 不一致: {error}")
+
+
+def _record_batch(schema: "pa.Schema", rows: Sequence[Sequence[Any]], stringify: set) -> "pa.RecordBatch":
+    """按列把数据库行转换为 RecordBatch"""
+    arrays = []
+    for idx, (field, values) in enumerate(zip(schema, zip(*rows))):
+        if idx in stringify:
+            values = [None if value is None else str(value) for value in values]
+        arrays.append(_column_array(field, values))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def write_record_batches(schema: "pa.Schema", batches: Iterable["pa.RecordBatch"], export_format: str, sink) -> int:
+    """
+    把 RecordBatch 逐批写入 Parquet / Arrow IPC 文件格式
+
+    Args:
+        sink: 文件路径或可写的文件对象
+
+    Returns:
+        int: 写入的行数
+    """
+    if export_format == "parquet":
+        writer = pq.ParquetWriter(sink, schema)
+    else:
+        writer = pa.ipc.new_file(sink, schema)
+    rows = 0
+    with writer:
+        for batch in batches:
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    return rows
+
+
+def rows_to_columnar(columns: List[str], rows: List[Dict[str, Any]], export_format: str) -> bytes:
+    """把接口传入的 rows 按列转换为 Parquet / Arrow IPC 文件内容"""
+    _require_pyarrow()
+    values = [tuple(row.get(col) for col in columns) for row in rows]
+    schema, stringify = _infer_schema(columns, values)
+    batches = [_record_batch(schema, values, stringify)] if values else []
+    sink = pa.BufferOutputStream()
+    write_record_batches(schema, batches, export_format, sink)
+    return sink.getvalue().to_pybytes()
+
+
+class QueryExporter:
+    """查询结果流式导出器"""
+
+    @staticmethod
+    def resolve_target(dataset: Dataset) -> Dict[str, Any]:
+        """
+        解析数据集的执行目标（与数据库会话解绑，可在响应流中使用）
+
+        Returns:
+            dict: {duckdb_path, engine}（传给子进程时使用 portable_target 转换）
+
+        Raises:
+            ValueError: 数据集既没有 DuckDB 文件也没有数据源
+        """
+        if dataset.duckdb_path:
+            return {"duckdb_path": dataset.duckdb_path, "engine": None}
+        if not dataset.datasource:
+            raise ValueError("Dataset has no datasource")
+        return {"duckdb_path": None, "engine": DBInspector.get_engine(dataset.datasource)}
+
+    @staticmethod
+    def portable_target(target: Dict[str, Any]) -> Dict[str, Any]:
+        """转换为可传给子进程的执行目标（引擎不能跨进程传递，改为连接 URL）"""
+        engine = target["engine"]
+        return {
+            "duckdb_path": target["duckdb_path"],
+            "engine": None,
+            "engine_url": engine.url.render_as_string(hide_password=False) if engine is not None else None,
+        }
+
+    @staticmethod
+    def validate_sql(sql: Optional[str]) -> str:
+        """
+        校验导出 SQL 为单条只读查询
+
+        Raises:
+            ValueError: SQL 为空或不是只读查询
+        """
+        if not sql or not sql.strip():
+            raise ValueError("缺少导出 SQL")
+        if not is_select_statement(sql):
+            raise ValueError("只允许导出单条 SELECT 查询")
+        return sql.strip().rstrip(";")
+
+    @staticmethod
+    def _engine_for(target: Dict[str, Any], sql: str):
+        """获取传统数据源的引擎，并按驱动的参数风格转义 SQL"""
+        engine = target["engine"]
+        if engine is None:
+            # 子进程中按连接 URL 临时建立连接（不使用连接池）
+            engine = create_engine(target["engine_url"], poolclass=NullPool)
+        # format / pyformat 参数风格的驱动（pymysql、psycopg2）会把 % 当作占位符
+        if engine.dialect.paramstyle in ("format", "pyformat"):
+            sql = sql.replace("%", "%%")
+        return engine, sql
+
+    @staticmethod
+    def iter_frames(target: Dict[str, Any], sql: str, batch_rows: Optional[int] = None) -> Iterator[pd.DataFrame]:
+        """
+        执行 SQL 并分块产出结果，至少产出一块（结果为空时为只有列名的空 DataFrame）
+
+        Args:
+            target: resolve_target 的返回值
+            sql: 只读查询
+            batch_rows: 每块行数，默认 EXPORT_BATCH_ROWS
+        """
+        batch_rows = batch_rows or settings.EXPORT_BATCH_ROWS
+        if target["duckdb_path"]:
+            conn = duckdb.connect(target["duckdb_path"], read_only=True)
+            try:
+                conn.execute(sql)
+                vectors = max(1, math.ceil(batch_rows / DUCKDB_VECTOR_SIZE))
+                frame = conn.fetch_df_chunk(vectors)
+                yield frame
+                while len(frame):
+                    frame = conn.fetch_df_chunk(vectors)
+                    if len(frame):
+                        yield frame
+            finally:
+                conn.close()
+            return
+
+        engine, sql = QueryExporter._engine_for(target, sql)
+        with engine.connect().execution_options(stream_results=True) as conn:
+            result = conn.exec_driver_sql(sql)
+            columns = list(result.keys())
+            empty = True
+            for rows in result.partitions(batch_rows):
+                empty = False
+                yield pd.DataFrame.from_records(rows, columns=columns)
+            if empty:
+                yield pd.DataFrame(columns=columns)
+
+    @classmethod
+    def open_frames(cls, target: Dict[str, Any], sql: str) -> Iterator[pd.DataFrame]:
+        """
+        执行 SQL 并读取第一块后返回分块迭代器，SQL 错误在此处抛出（而不是在响应流中）
+        """
+        frames = cls.iter_frames(target, sql)
+        first = next(frames)
+
+        def generate() -> Iterator[pd.DataFrame]:
+            try:
+                yield first
+                yield from frames
+            finally:
+                frames.close()
+
+        return generate()
+
+    @classmethod
+    def open_csv_stream(cls, target: Dict[str, Any], sql: str) -> Iterator[bytes]:
+        """
+        执行 SQL 并返回 CSV 字节流（UTF-8 BOM，Excel 可正确识别中文）
+
+        在返回之前执行查询并读取第一块，SQL 错误在此处抛出。
+        """
+        frames = cls.open_frames(target, sql)
+
+        def generate() -> Iterator[bytes]:
+            rows = 0
+            try:
+                for index, frame in enumerate(frames):
+                    if index == 0:
+                        yield frame.to_csv(index=False).encode("utf-8-sig")
+                    else:
+                        yield frame.to_csv(index=False, header=False).encode("utf-8")
+                    rows += len(frame)
+            finally:
+                frames.close()
+                logger.info("CSV export streamed", rows=rows)
+
+        return generate()
+
+    @classmethod
+    def fetch_all(cls, target: Dict[str, Any], sql: str) -> pd.DataFrame:
+        """执行 SQL 并返回完整结果（生成 Excel / PDF 等需要完整数据的格式）"""
+        return pd.concat(list(cls.iter_frames(target, sql)), ignore_index=True)
+
+    @classmethod
+    def write_columnar(cls, target: Dict[str, Any], sql: str, export_format: str, path: str) -> int:
+        """
+        执行 SQL 并把结果写入 Parquet / Arrow IPC 文件，数据不经过 pandas
+
+        - DuckDB 数据集导出 Parquet：COPY (sql) TO 由 DuckDB 直接写文件（不需要 pyarrow）
+        - DuckDB 数据集导出 Arrow：fetch_record_batch 按批读取 Arrow RecordBatch
+        - 传统数据源：服务端游标分块读取，按列构造 RecordBatch，列类型由第一块推断
+          （小数列按游标描述的小数位数放宽为 decimal128(38, s)）
+
+        Returns:
+            int: 导出的行数
+
+        Raises:
+            ValueError: 不支持的格式，或需要 pyarrow 但未安装
+        """
+        if export_format not in COLUMNAR_FORMATS:
+            raise ValueError(f"不支持的导出格式: {export_format}")
+        batch_rows = settings.EXPORT_BATCH_ROWS
+        if target["duckdb_path"]:
+            conn = duckdb.connect(target["duckdb_path"], read_only=True)
+            try:
+                if export_format == "parquet":
+                    escaped = str(path).replace("'", "''")
+                    # SQL 单独成行，末尾的行注释不会注释掉右括号
+                    return conn.execute(f"COPY (\n{sql}\n) TO '{escaped}' (FORMAT PARQUET)").fetchone()[0]
+                _require_pyarrow()
+                reader = conn.execute(sql).fetch_record_batch(batch_rows)
+                return write_record_batches(reader.schema, reader, export_format, str(path))
+            finally:
+                conn.close()
+
+        _require_pyarrow()
+        engine, sql = cls._engine_for(target, sql)
+        with engine.connect().execution_options(stream_results=True) as conn:
+            result = conn.exec_driver_sql(sql)
+            partitions = result.partitions(batch_rows)
+            first = next(partitions, [])
+            schema, stringify = _infer_schema(list(result.keys()), first, _cursor_scales(result))
+            batches = (
+                _record_batch(schema, rows, stringify)
+                for rows in itertools.chain([first], partitions) if rows
+            )
+            return write_record_batches(schema, batches, export_format, str(path))
+
+    @classmethod
+    def open_columnar(cls, target: Dict[str, Any], sql: str, export_format: str) -> Tuple[IO[bytes], int]:
+        """
+        执行 SQL 导出 Parquet / Arrow IPC 临时文件
+
+        Returns:
+            Tuple[IO[bytes], int]: (已定位到开头的临时文件，调用方负责关闭, 行数)
+        """
+        fd, path = tempfile.mkstemp(suffix=f".{COLUMNAR_FORMATS.get(export_format, 'tmp')}")
+        os.close(fd)
+        try:
+            rows = cls.write_columnar(target, sql, export_format, path)
+            output = open(path, "rb")
+        finally:
+            # 文件打开后即可删除，关闭句柄时释放磁盘空间
+            os.unlink(path)
+        logger.info("Columnar export written", format=export_format, rows=rows)
+        return output, rows
@@ -4,7 +4,9 @@ Vanna 基础类
 包含 VannaLegacyPGVector 类和相关辅助类，使用 PostgreSQL pgvector 扩展存储向量数据。
 """
 
+import re
 import uuid
+import threading
 import pandas as pd
 from openai import OpenAI as OpenAIClient
 
@@ -13,10 +15,101 @@ from vanna.legacy.openai import OpenAI_Chat
 from vanna.core.user import User, UserResolver, RequestContext
 
 from app.core.logger import get_logger
+from app.services.vanna.vector_index import InMemoryVectorIndex
+from app.services.vanna.vector_store_maintenance import get_vector_store_engine
 
 logger = get_logger(__name__)
 
 
+# === Embedding 后端 ===
+# torch:      原始 PyTorch 全精度模型（默认）
+# torch_int8: PyTorch 动态 int8 量化（仅量化 Linear 层，无需额外模型文件）
+# onnx:       ONNX Runtime 推理，向量与 torch 基本一致，可直接复用已存储的向量
+# onnx_int8:  ONNX Runtime + int8 量化模型文件
+EMBEDDING_BACKENDS = ("torch", "torch_int8", "onnx", "onnx_int8")
+DEFAULT_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+DEFAULT_ONNX_INT8_FILE = "onnx/model_qint8_avx2.onnx"
+
+# 进程级共享的 embedding 模型，{(backend, model_name, onnx_file): embeddings}
+_embedding_functions: dict = {}
+_embedding_lock = threading.Lock()
+
+
+def create_embedding_function(
+    backend: str = "torch",
+    model_name: str = DEFAULT_EMBEDDING_MODEL,
+    onnx_int8_file: str = DEFAULT_ONNX_INT8_FILE,
+):
+    """
+    创建 embedding function（不缓存）
+
+    Args:
+        backend: embedding 后端，见 EMBEDDING_BACKENDS
+        model_name: sentence-transformers 模型名称
+        onnx_int8_file: onnx_int8 后端使用的量化模型文件（模型仓库内的相对路径）
+
+    Returns:
+        HuggingFaceEmbeddings 实例
+    """
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unsupported embedding backend: {backend}. Supported: {', '.join(EMBEDDING_BACKENDS)}")
+
+    try:
+        from langchain_huggingface import HuggingFaceEmbeddings
+    except ImportError:
+        raise ImportError("langchain-huggingface is required for PGVector. Install with: pip install langchain-huggingface")
+
+    if backend == "onnx":
+        model_kwargs = {"device": "cpu", "backend": "onnx"}
+    elif backend == "onnx_int8":
+        model_kwargs = {"device": "cpu", "backend": "onnx", "model_kwargs": {"file_name": onnx_int8_file}}
+    else:
+        model_kwargs = {"device": "cpu"}
+
+    try:
+        embeddings = HuggingFaceEmbeddings(model_name=model_name, model_kwargs=model_kwargs)
+    except ImportError as e:
+        if backend.startswith("onnx"):
+            raise ImportError(
+                f"ONNX embedding backend requires optimum and onnxruntime. "
+                f"Install with: pip install 'sentence-transformers[onnx]' ({e})"
+            )
+        raise
+
+    if backend == "torch_int8":
+        import torch
+        # HuggingFaceEmbeddings 将 SentenceTransformer 保存在 _client 中
+        embeddings._client = torch.quantization.quantize_dynamic(
+            embeddings._client, {torch.nn.Linear}, dtype=torch.qint8
+        )
+
+    logger.info(f"Loaded embedding model {model_name} (backend: {backend})")
+    return embeddings
+
+
+def get_embedding_function(
+    backend: str = "torch",
+    model_name: str = DEFAULT_EMBEDDING_MODEL,
+    onnx_int8_file: str = DEFAULT_ONNX_INT8_FILE,
+):
+    """
+    获取进程级共享的 embedding function
+
+    模型只加载一次，所有数据集的 VannaLegacyPGVector 实例复用同一个模型。
+    """
+    key = (backend, model_name, onnx_int8_file if backend == "onnx_int8" else None)
+    embeddings = _embedding_functions.get(key)
+    if embeddings is not None:
+        return embeddings
+
+    with _embedding_lock:
+        embeddings = _embedding_functions.get(key)
+        if embeddings is None:
+            embeddings = create_embedding_function(backend, model_name, onnx_int8_file)
+            _embedding_functions[key] = embeddings
+    return embeddings
+
+
 # Custom Exception for Training Control
 class TrainingStoppedException(Exception):
     """自定义异常：训练被用户中断"""
@@ -58,34 +151,43 @@ class VannaLegacyPGVector(OpenAI_Chat):
         self.connection_string = connection_string
         collection_name = config.get('collection_name', 'vanna')
 
-        # 初始化 embedding function
-        try:
-            from langchain_huggingface import HuggingFaceEmbeddings
-            self.embedding_function = HuggingFaceEmbeddings(
-                model_name="all-MiniLM-L6-v2"
-            )
-        except ImportError:
-            raise ImportError("langchain-huggingface is required for PGVector. Install with: pip install langchain-huggingface")
+        # 初始化 embedding function（进程内共享，后端可配置）
+        self.embedding_function = get_embedding_function(
+            backend=self.config.get('embedding_backend', 'torch'),
+            model_name=self.config.get('embedding_model', DEFAULT_EMBEDDING_MODEL),
+            onnx_int8_file=self.config.get('embedding_onnx_int8_file', DEFAULT_ONNX_INT8_FILE),
+        )
 
-        # 初始化 PGVector collections
+        # 初始化 PGVector collections（共享同一个连接池）
         from langchain_postgres.vectorstores import PGVector
+        engine = get_vector_store_engine(self.connection_string)
 
         self.sql_collection = PGVector(
             embeddings=self.embedding_function,
             collection_name=f"{collection_name}_sql",
-            connection=self.connection_string,
+            connection=engine,
         )
         self.ddl_collection = PGVector(
             embeddings=self.embedding_function,
             collection_name=f"{collection_name}_ddl",
-            connection=self.connection_string,
+            connection=engine,
         )
         self.documentation_collection = PGVector(
             embeddings=self.embedding_function,
             collection_name=f"{collection_name}_documentation",
-            connection=self.connection_string,
+            connection=engine,
         )
 
+        # 可选：进程内向量索引（PGVector 仍为数据源，索引仅用于加速 top-k 检索）
+        self._vector_indexes = {}
+        if self.config.get('vector_index_enabled', False):
+            for collection in [self.sql_collection, self.ddl_collection, self.documentation_collection]:
+                self._vector_indexes[collection.collection_name] = InMemoryVectorIndex(
+                    collection,
+                    hnsw_threshold=self.config.get('vector_index_hnsw_threshold', 5000),
+                    ttl=self.config.get('vector_index_ttl', 300),
+                )
+
         logger.info(f"Initialized VannaLegacyPGVector with collection: {collection_name}")
 
         # Initialize with custom OpenAI client
@@ -135,47 +237,172 @@ class VannaLegacyPGVector(OpenAI_Chat):
         import hashlib
         return hashlib.md5(content.encode('utf-8')).hexdigest()
 
+    def _add_to_collection(self, collection, content: str, metadata: dict, doc_id: str):
+        """
+        写入 PGVector 并同步进程内索引
+
+        先计算一次 embedding，同时用于 PGVector 写入和内存索引，避免重复计算。
+        PGVector 按 ID upsert，deterministic ID 保证重复训练不会无限增长。
+        """
+        from langchain_core.documents import Document
+        embedding = self.embedding_function.embed_documents([content])[0]
+        collection.add_embeddings(texts=[content], embeddings=[embedding], metadatas=[metadata], ids=[doc_id])
+
+        index = self._vector_indexes.get(collection.collection_name)
+        if index is not None:
+            index.upsert(doc_id, Document(page_content=content, metadata=metadata), embedding)
+
+    def _similarity_search(self, collection, question: str, k: int) -> list:
+        """优先使用进程内索引检索，失败时回退到 PGVector"""
+        index = self._vector_indexes.get(collection.collection_name)
+        if index is not None:
+            try:
+                return index.search(self.generate_embedding(question), k)
+            except Exception as e:
+                logger.warning(f"Vector index search failed for {collection.collection_name}, falling back to PGVector: {e}")
+                index.invalidate()
+        return collection.similarity_search(question, k=k)
+
+    def build_ddl_item(self, ddl: str, **metadata) -> tuple:
+        """构造 DDL 训练项 (doc_id, content, metadata)，doc_id 即内容指纹"""
+        doc_id = self._generate_id(ddl)
+        return doc_id, ddl, {"id": doc_id, **metadata}
+
+    def build_documentation_item(self, documentation: str, **metadata) -> tuple:
+        """构造文档训练项 (doc_id, content, metadata)"""
+        doc_id = self._generate_id(documentation)
+        return doc_id, documentation, {"id": doc_id, **metadata}
+
+    def build_question_sql_item(self, question: str, sql: str, **metadata) -> tuple:
+        """构造问答对训练项 (doc_id, content, metadata)"""
+        content = f"Question: {question}\nSQL: {sql}"
+        doc_id = self._generate_id(content)
+        return doc_id, content, {"id": doc_id, "question": question, "sql": sql, **metadata}
+
     def add_ddl(self, ddl: str, **kwargs) -> str:
         """Add DDL to PGVector"""
-        from langchain_core.documents import Document
         # Use content hash for deterministic ID to prevent duplicates
-        doc_id = self._generate_id(ddl)
-        doc = Document(page_content=ddl, metadata={"id": doc_id})
-        # PGVector's add_documents will update if ID exists (upsert behavior usually depends on impl, 
-        # but deterministic ID prevents infinite growth)
-        self.ddl_collection.add_documents([doc], ids=[doc_id])
+        doc_id, content, metadata = self.build_ddl_item(ddl)
+        self._add_to_collection(self.ddl_collection, content, metadata, doc_id)
         return doc_id
 
     def add_documentation(self, documentation: str, **kwargs) -> str:
         """Add documentation to PGVector"""
-        from langchain_core.documents import Document
-        doc_id = self._generate_id(documentation)
-        doc = Document(page_content=documentation, metadata={"id": doc_id})
-        self.documentation_collection.add_documents([doc], ids=[doc_id])
+        doc_id, content, metadata = self.build_documentation_item(documentation)
+        self._add_to_collection(self.documentation_collection, content, metadata, doc_id)
         return doc_id
 
     def add_question_sql(self, question: str, sql: str, **kwargs) -> str:
         """Add question-SQL pair to PGVector"""
-        from langchain_core.documents import Document
-        content = f"Question: {question}\nSQL: {sql}"
-        doc_id = self._generate_id(content)
-        doc = Document(page_content=content, metadata={"id": doc_id, "question": question, "sql": sql})
-        self.sql_collection.add_documents([doc], ids=[doc_id])
+        doc_id, content, metadata = self.build_question_sql_item(question, sql)
+        self._add_to_collection(self.sql_collection, content, metadata, doc_id)
         return doc_id
 
+    # === 增量训练 ===
+    def get_stored_items(self, collection) -> dict:
+        """
+        读取 collection 中已存储条目的指纹信息（不读取向量）
+
+        Returns:
+            dict: {doc_id: (source, document)}，source 为 metadata 中的来源标记（旧数据为 None）
+        """
+        store = collection.EmbeddingStore
+        with collection.session_maker() as session:
+            stored = collection.get_collection(session)
+            if stored is None:
+                return {}
+            rows = (
+                session.query(store.id, store.cmetadata, store.document)
+                .filter(store.collection_id == stored.uuid)
+                .all()
+            )
+        return {doc_id: ((metadata or {}).get("source"), document or "") for doc_id, metadata, document in rows}
+
+    def diff_training_items(
+        self,
+        collection,
+        items: list[tuple],
+        source: str,
+        legacy_prefixes: tuple = (),
+        legacy_patterns: tuple = (),
+    ) -> dict:
+        """
+        将期望的训练项与 collection 中已存储的内容对比
+
+        条目 ID 是内容哈希，因此 ID 相同即内容未变化。只有由 source 写入的条目才会被判定为过期删除，
+        其他途径写入的数据（用户反馈问答对、表关系等）不受影响。
+
+        引入来源标记之前写入的条目没有 source：
+        - 内容匹配 legacy_prefixes / legacy_patterns 的旧条目视为由 source 管理，不再需要时删除
+        - 与期望训练项 ID 相同的旧条目重新写入（补上来源标记），之后按正常流程管理
+
+        Args:
+            collection: PGVector collection
+            items: 期望的训练项列表 [(doc_id, content, metadata), ...]
+            source: 本次训练写入条目的来源标记
+            legacy_prefixes: 没有来源标记的旧条目中，内容以这些前缀开头的也视为由 source 管理（"" 表示全部）
+            legacy_patterns: 同上，内容匹配这些正则（re.fullmatch）的旧条目
+
+        Returns:
+            dict: {"new": [item, ...], "stale": [doc_id, ...], "unchanged": int}
+        """
+        stored = self.get_stored_items(collection)
+        desired = {item[0]: item for item in items}
+
+        def is_legacy(document: str) -> bool:
+            return any(document.startswith(prefix) for prefix in legacy_prefixes) or any(
+                re.fullmatch(pattern, document) for pattern in legacy_patterns
+            )
+
+        new_items = [
+            item for doc_id, item in desired.items()
+            if doc_id not in stored or stored[doc_id][0] is None
+        ]
+        stale_ids = [
+            doc_id for doc_id, (item_source, document) in stored.items()
+            if doc_id not in desired and (item_source == source or (item_source is None and is_legacy(document)))
+        ]
+        return {"new": new_items, "stale": stale_ids, "unchanged": len(desired) - len(new_items)}
+
+    def add_training_items(self, collection, items: list[tuple]):
+        """批量写入训练项：一次 embedding 调用 + 一次 upsert"""
+        if not items:
+            return
+        from langchain_core.documents import Document
+        ids = [item[0] for item in items]
+        texts = [item[1] for item in items]
+        metadatas = [item[2] for item in items]
+        embeddings = self.embedding_function.embed_documents(texts)
+        collection.add_embeddings(texts=texts, embeddings=embeddings, metadatas=metadatas, ids=ids)
+
+        index = self._vector_indexes.get(collection.collection_name)
+        if index is not None:
+            for doc_id, text, metadata, embedding in zip(ids, texts, metadatas, embeddings):
+                index.upsert(doc_id, Document(page_content=text, metadata=metadata), embedding)
+
+    def delete_training_items(self, collection, ids: list[str]):
+        """批量删除训练项"""
+        if not ids:
+            return
+        collection.delete(ids=list(ids))
+        index = self._vector_indexes.get(collection.collection_name)
+        if index is not None:
+            for doc_id in ids:
+                index.remove(doc_id)
+
     def get_related_ddl(self, question: str, **kwargs) -> list:
         """Get related DDL from PGVector"""
-        results = self.ddl_collection.similarity_search(question, k=self.n_results_ddl)
+        results = self._similarity_search(self.ddl_collection, question, self.n_results_ddl)
         return [doc.page_content for doc in results]
 
     def get_related_documentation(self, question: str, **kwargs) -> list:
         """Get related documentation from PGVector"""
-        results = self.documentation_collection.similarity_search(question, k=self.n_results_documentation)
+        results = self._similarity_search(self.documentation_collection, question, self.n_results_documentation)
         return [doc.page_content for doc in results]
 
     def get_similar_question_sql(self, question: str, **kwargs) -> list:
         """Get similar question-SQL pairs from PGVector"""
-        results = self.sql_collection.similarity_search(question, k=self.n_results_sql)
+        results = self._similarity_search(self.sql_collection, question, self.n_results_sql)
         qa_pairs = []
         for doc in results:
             if hasattr(doc, 'metadata') and 'question' in doc.metadata and 'sql' in doc.metadata:
@@ -236,7 +463,10 @@ class VannaLegacyPGVector(OpenAI_Chat):
                 try:
                     collection.delete(ids=[id])
                 except Exception:
-                    pass
+                    continue
+                index = self._vector_indexes.get(collection.collection_name)
+                if index is not None:
+                    index.remove(id)
             return True
         except Exception as e:
             logger.error(f"Failed to remove training data {id}: {e}")
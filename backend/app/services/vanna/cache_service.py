@@ -22,12 +22,13 @@ class VannaCacheService:
     DEFAULT_TTL = 86400
 
     @classmethod
-    async def clear_cache(cls, dataset_id: int) -> int:
+    async def clear_cache(cls, dataset_id: int, include_sql: bool = True) -> int:
         """
         清除指定数据集的所有缓存查询
 
         Args:
             dataset_id: 数据集ID
+            include_sql: 是否同时清除问题到 SQL 的缓存（仅数据变化、表结构不变时 SQL 仍然有效）
 
         Returns:
             int: 删除的键数量, -1 表示 Redis 不可用
@@ -36,17 +37,18 @@ class VannaCacheService:
             total_deleted = 0
 
             if redis_service.redis_client:
-                # 1. 清除结果缓存
-                result_pattern = f"bi:cache:{dataset_id}:*"
-                async for key in redis_service.redis_client.scan_iter(match=result_pattern):
-                    await redis_service.delete(key)
-                    total_deleted += 1
+                # 1. 清除结果缓存（问答结果和看板卡片结果）
+                for result_pattern in (f"bi:cache:{dataset_id}:*", f"bi:card_cache:{dataset_id}:*"):
+                    async for key in redis_service.redis_client.scan_iter(match=result_pattern):
+                        await redis_service.delete(key)
+                        total_deleted += 1
 
                 # 2. 清除 SQL 缓存
-                sql_pattern = f"bi:sql_cache:{dataset_id}:*"
-                async for key in redis_service.redis_client.scan_iter(match=sql_pattern):
-                    await redis_service.delete(key)
-                    total_deleted += 1
+                if include_sql:
+                    sql_pattern = f"bi:sql_cache:{dataset_id}:*"
+                    async for key in redis_service.redis_client.scan_iter(match=sql_pattern):
+                        await redis_service.delete(key)
+                        total_deleted += 1
 
                 logger.info(f"Cleared {total_deleted} cache entries for dataset {dataset_id}")
             else:
@@ -11,6 +11,7 @@ from vanna.integrations.openai import OpenAILlmService
 from app.core.config import settings
 from app.core.logger import get_logger
 from app.services.vanna.base import VannaLegacyPGVector, SimpleUserResolver
+from app.services.vanna.vector_store_maintenance import VectorStoreMaintenance, COLLECTION_SUFFIXES
 
 logger = get_logger(__name__)
 
@@ -55,7 +56,13 @@ class VannaInstanceManager:
                 'n_results': settings.VECTOR_N_RESULTS,
                 'collection_name': collection_name,
                 'connection_string': settings.PG_CONNECTION_STRING,
-                'api_base': 'https://dashscope.aliyuncs.com/compatible-mode/v1'
+                'api_base': 'https://dashscope.aliyuncs.com/compatible-mode/v1',
+                'embedding_backend': settings.EMBEDDING_BACKEND,
+                'embedding_model': settings.EMBEDDING_MODEL,
+                'embedding_onnx_int8_file': settings.EMBEDDING_ONNX_INT8_FILE,
+                'vector_index_enabled': settings.VECTOR_INDEX_ENABLED,
+                'vector_index_hnsw_threshold': settings.VECTOR_INDEX_HNSW_THRESHOLD,
+                'vector_index_ttl': settings.VECTOR_INDEX_TTL,
             }
         )
 
@@ -143,7 +150,7 @@ class VannaInstanceManager:
     @classmethod
     def _delete_pgvector_collection(cls, collection_name: str) -> bool:
         """
-        删除 PGVector 中的 collection
+        删除 PGVector 中的 collection（_ddl / _documentation / _sql 一次性删除）
 
         Args:
             collection_name: collection 名称
@@ -152,43 +159,9 @@ class VannaInstanceManager:
             bool: 是否成功删除
         """
         try:
-            from sqlalchemy import create_engine, text
-
-            engine = create_engine(settings.PG_CONNECTION_STRING)
-
-            # 删除 langchain_pg_embedding 表中的相关记录
-            # PGVector 使用 langchain_pg_collection 和 langchain_pg_embedding 表
-            with engine.connect() as conn:
-                for suffix in ['_ddl', '_documentation', '_sql']:
-                    coll_name = f"{collection_name}{suffix}"
-                    try:
-                        # 先获取 collection uuid
-                        result = conn.execute(
-                            text("SELECT uuid FROM langchain_pg_collection WHERE name = :name"),
-                            {"name": coll_name}
-                        )
-                        row = result.fetchone()
-
-                        if row:
-                            collection_uuid = row[0]
-                            # 删除 embedding 记录
-                            conn.execute(
-                                text("DELETE FROM langchain_pg_embedding WHERE collection_id = :uuid"),
-                                {"uuid": collection_uuid}
-                            )
-                            # 删除 collection 记录
-                            conn.execute(
-                                text("DELETE FROM langchain_pg_collection WHERE uuid = :uuid"),
-                                {"uuid": collection_uuid}
-                            )
-                            conn.commit()
-                            logger.info(f"Deleted PGVector collection: {coll_name}")
-                        else:
-                            logger.debug(f"PGVector collection not found: {coll_name}")
-
-                    except Exception as e:
-                        logger.warning(f"Failed to delete PGVector collection {coll_name}: {e}")
-
+            VectorStoreMaintenance.delete_collections(
+                [f"{collection_name}{suffix}" for suffix in COLLECTION_SUFFIXES]
+            )
             return True
 
         except Exception as e:
@@ -19,6 +19,7 @@ from app.services.vanna.instance_manager import VannaInstanceManager
 from app.services.vanna.cache_service import VannaCacheService
 from app.services.vanna import utils
 from app.services.chart_recommender import ChartRecommender
+from app.services.chart_downsampler import ChartDownsampler
 from app.services.query_rewriter import QueryRewriter
 from typing import Optional, List, Dict
 
@@ -324,8 +325,9 @@ UNION ALL
                             # 推断图表类型
                             chart_type = utils.infer_chart_type(df)
 
-                            # 序列化数据
-                            cleaned_rows = utils.serialize_dataframe(df)
+                            # 图表数据降采样后序列化（df 保留完整结果用于分析）
+                            chart_df, downsample_method = ChartDownsampler.reduce(df, chart_type)
+                            cleaned_rows = utils.serialize_dataframe(chart_df)
 
                             # 生成业务分析
                             insight = None
@@ -386,7 +388,7 @@ UNION ALL
                                         current_question=question,
                                         current_result={
                                             "sql": cached_sql,
-                                            "columns": df.columns.tolist(),
+                                            "columns": chart_df.columns.tolist(),
                                             "rows": cleaned_rows,
                                             "chart_type": chart_type,
                                             "data_interpretation": data_interpretation,
@@ -411,9 +413,11 @@ UNION ALL
 
                             return {
                                 "sql": cached_sql,
-                                "columns": df.columns.tolist(),
+                                "columns": chart_df.columns.tolist(),
                                 "rows": cleaned_rows,
                                 "chart_type": chart_type,
+                                "total_rows": len(df),
+                                "downsample_method": downsample_method,
                                 "summary": None,
                                 "steps": execution_steps,
                                 "is_cached": True,
@@ -641,6 +645,9 @@ UNION ALL
                                 )
                                 execution_steps.append(f"已自动替换为 {target_table_name}")
 
+                # 导出时在服务端重新执行未追加 LIMIT 的 SQL，获取完整结果
+                export_sql = cleaned_sql.rstrip(';').strip()
+
                 # 添加LIMIT子句防止查询过多数据导致超时
                 sql_upper = cleaned_sql.upper()
                 has_limit = 'LIMIT' in sql_upper
@@ -681,7 +688,9 @@ UNION ALL
                     # 获取备用图表类型
                     alternative_charts = ChartRecommender.get_alternative_charts(df, chart_type)
 
-                    cleaned_rows = utils.serialize_dataframe(df)
+                    # 图表数据降采样后序列化（df 保留完整结果用于分析）
+                    chart_df, downsample_method = ChartDownsampler.reduce(df, chart_type)
+                    cleaned_rows = utils.serialize_dataframe(chart_df)
 
                     # Generate Business Insight
                     insight = None
@@ -741,7 +750,7 @@ UNION ALL
                                 current_question=question,
                                 current_result={
                                     "sql": cleaned_sql,
-                                    "columns": df.columns.tolist(),
+                                    "columns": chart_df.columns.tolist(),
                                     "rows": cleaned_rows,
                                     "chart_type": chart_type,
                                     "data_interpretation": data_interpretation,
@@ -772,9 +781,12 @@ UNION ALL
 
                     result = {
                         "sql": cleaned_sql,
-                        "columns": df.columns.tolist(),
+                        "export_sql": export_sql,
+                        "columns": chart_df.columns.tolist(),
                         "rows": cleaned_rows,
                         "chart_type": chart_type,
+                        "total_rows": len(df),
+                        "downsample_method": downsample_method,
                         "alternative_charts": alternative_charts,
                         "summary": None,
                         "steps": execution_steps,
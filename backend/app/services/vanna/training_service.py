@@ -5,6 +5,7 @@ Vanna 训练服务
 """
 
 import asyncio
+import re
 from datetime import datetime
 from sqlalchemy.orm import Session
 
@@ -18,6 +19,30 @@ from app.services.vanna.cache_service import VannaCacheService
 
 logger = get_logger(__name__)
 
+# 数据集训练写入条目的来源标记（metadata.source），用于增量训练时识别可删除的过期条目
+TRAINING_SOURCE = "dataset_training"
+# 增量训练每批计算 embedding 的条目数
+TRAINING_BATCH_SIZE = 32
+# 引入来源标记之前由训练自动生成的示例问答对（内容格式见 build_question_sql_item），用户反馈的问答对不匹配这些模板
+LEGACY_EXAMPLE_QA_PATTERNS = (
+    r"Question: 查询 [\w.]+ 表的所有数据\nSQL: SELECT \* FROM [\w.]+ LIMIT 100",
+    r"Question: 统计 [\w.]+ 表的总数\nSQL: SELECT COUNT\(\*\) as total FROM [\w.]+",
+    r"Question: 按[\w.]+分组统计[\w.]+\nSQL: SELECT [\w.]+, COUNT\(\*\) as count FROM [\w.]+ GROUP BY [\w.]+ LIMIT 100",
+    r"Question: 按[\w.]+排序查看[\w.]+最新记录\nSQL: SELECT \* FROM [\w.]+ ORDER BY [\w.]+ DESC LIMIT 10",
+    r"Question: 查询[\w.]+中[\w.]+最大的记录\nSQL: SELECT \* FROM [\w.]+ ORDER BY [\w.]+ DESC LIMIT 10",
+)
+# 引入来源标记之前由训练自动生成的表结构概览文档（完整内容匹配，用户手工添加的文档不受影响）
+LEGACY_OVERVIEW_PATTERN = r"数据库表结构：\n本数据集包含以下表：[^\n]*\n\n请根据表名和字段名生成 SQL 查询。\n"
+
+
+def legacy_term_patterns(terms: list[str]) -> tuple:
+    """
+    引入来源标记之前由训练写入的业务术语文档
+
+    只匹配当前业务术语表中的术语（定义已修改的旧版本），已删除术语的旧文档无法与用户手工添加的文档区分，予以保留。
+    """
+    return tuple(rf"业务术语: {re.escape(term)}\n定义: (?s:.*)" for term in terms)
+
 
 class VannaTrainingService:
     """
@@ -63,6 +88,56 @@ class VannaTrainingService:
             logger.warning(f"Training interrupted by user for dataset {dataset_id}")
             raise TrainingStoppedException(f"训练被用户中断 (Dataset {dataset_id})")
 
+    @classmethod
+    def _sync_training_items(
+        cls,
+        db_session: Session,
+        dataset_id: int,
+        vn,
+        collection,
+        items: list[tuple],
+        label: str,
+        progress_start: int,
+        progress_end: int,
+        legacy_prefixes: tuple = (),
+        legacy_patterns: tuple = (),
+        remove_stale: bool = True,
+    ) -> dict:
+        """
+        增量同步一组训练项到 collection
+
+        删除过期条目，按批次为新增条目计算 embedding，每批一个检查点（可中断）。
+        没有来源标记的旧条目按 legacy_prefixes / legacy_patterns 识别（见 diff_training_items）。
+
+        Returns:
+            dict: {"added": int, "removed": int, "unchanged": int}
+        """
+        diff = vn.diff_training_items(collection, items, TRAINING_SOURCE, legacy_prefixes, legacy_patterns)
+        new_items = diff["new"]
+        stale_ids = diff["stale"] if remove_stale else []
+
+        if stale_ids:
+            vn.delete_training_items(collection, stale_ids)
+            logger.info(f"Removed {len(stale_ids)} stale {label} items for dataset {dataset_id}")
+
+        if not new_items:
+            cls._checkpoint_and_check_interrupt(
+                db_session, dataset_id, progress_end,
+                f"{label}: 无变化（未变更 {diff['unchanged']}，删除 {len(stale_ids)}）"
+            )
+        for start in range(0, len(new_items), TRAINING_BATCH_SIZE):
+            batch = new_items[start:start + TRAINING_BATCH_SIZE]
+            vn.add_training_items(collection, batch)
+
+            done = start + len(batch)
+            progress = progress_start + int(done / len(new_items) * (progress_end - progress_start))
+            cls._checkpoint_and_check_interrupt(
+                db_session, dataset_id, progress,
+                f"训练 {label}: 新增 {done}/{len(new_items)}（未变更 {diff['unchanged']}，删除 {len(stale_ids)}）"
+            )
+
+        return {"added": len(new_items), "removed": len(stale_ids), "unchanged": diff["unchanged"]}
+
     @classmethod
     def train_dataset(cls, dataset_id: int, table_names: list[str], db_session: Session):
         """
@@ -90,6 +165,8 @@ class VannaTrainingService:
         - Step 10-40%: 训练 DDL 到 Vanna
         - Step 40-80%: 训练文档/业务术语
         - Step 80-100%: 生成示例 SQLQA 对并训练
+
+        训练是增量的：只为新增/变化的条目计算 embedding，已删除的表、术语和示例会从 collection 中移除。
         
         Args:
             dataset_id: 数据集ID
@@ -175,50 +252,37 @@ class VannaTrainingService:
 
             # 使用 Legacy API 进行训练
             vn = VannaInstanceManager.get_legacy_vanna(dataset_id)
-            
-            # 【重要】清理旧的训练数据，防止重复叠加
-            # 注意：由于现在使用了基于内容的哈希 ID，重复训练相同内容不再是问题，
-            # 但如果表结构发生了变化，旧的 DDL 仍然会保留。
-            # 理想情况下，我们应该清理与该数据集相关的所有旧数据。
-            # 但目前 PGVector 实现不支持按 metadata 批量删除（需要遍历）。
-            # 鉴于我们已实现了幂等 ID，这里暂时依赖 ID 去重机制。
-            # 如果需要彻底重置，建议在 VannaLegacyPGVector 中实现 reset_collection()
-            
-            # === Step 3: 训练 DDL (10-40%) ===
-            for i, (table_name, ddl) in enumerate(ddls):
-                if ddl:
-                    vn.train(ddl=ddl)
 
-                    # 更新进度
-                    progress = 10 + int((i + 1) / len(ddls) * 30)
-                    cls._checkpoint_and_check_interrupt(
-                        db_session, dataset_id, progress,
-                        f"训练 DDL: {table_name} ({i+1}/{len(ddls)})"
-                    )
+            # 增量训练：训练项 ID 为内容哈希，与 collection 中已存储的 ID 对比，
+            # 只对新增/变化的条目计算 embedding，并删除本流程此前写入但已不存在的条目
+            sync_stats = {}
+
+            # === Step 3: 训练 DDL (10-40%) ===
+            ddl_items = [
+                vn.build_ddl_item(ddl, source=TRAINING_SOURCE, table=table_name)
+                for table_name, ddl in ddls if ddl
+            ]
+            # DDL collection 只由数据集训练写入，旧数据（无来源标记）全部纳入管理；
+            # 有表 DDL 提取失败时不删除，避免临时错误导致已训练的表被移除
+            sync_stats["DDL"] = cls._sync_training_items(
+                db_session, dataset_id, vn, vn.ddl_collection, ddl_items,
+                label="DDL", progress_start=10, progress_end=40, legacy_prefixes=("",),
+                remove_stale=not failed_tables
+            )
 
             # === Step 4: 训练文档/业务术语 (40-80%) ===
             cls._checkpoint_and_check_interrupt(db_session, dataset_id, 40, "开始训练业务术语")
 
-            # 获取并训练业务术语
+            # 获取业务术语
             business_terms = db_session.query(BusinessTerm).filter(
                 BusinessTerm.dataset_id == dataset_id
             ).all()
-
-            if business_terms:
-                for i, term in enumerate(business_terms):
-                    doc_content = f"业务术语: {term.term}\n定义: {term.definition}"
-                    vn.train(documentation=doc_content)
-
-                    progress = 40 + int((i + 1) / len(business_terms) * 20)
-                    cls._checkpoint_and_check_interrupt(
-                        db_session, dataset_id, progress,
-                        f"训练业务术语: {term.term} ({i+1}/{len(business_terms)})"
-                    )
-            else:
-                cls._checkpoint_and_check_interrupt(db_session, dataset_id, 60, "无业务术语，跳过")
-
-            # 训练表关系文档
-            cls._checkpoint_and_check_interrupt(db_session, dataset_id, 70, "生成表关系文档")
+            doc_items = [
+                vn.build_documentation_item(
+                    f"业务术语: {term.term}\n定义: {term.definition}", source=TRAINING_SOURCE, kind="term"
+                )
+                for term in business_terms
+            ]
 
             # 生成表关系描述
             table_relationships_doc = f"""数据库表结构：
@@ -226,8 +290,15 @@ class VannaTrainingService:
 
 请根据表名和字段名生成 SQL 查询。
 """
-            vn.train(documentation=table_relationships_doc)
-            cls._checkpoint_and_check_interrupt(db_session, dataset_id, 80, "表关系文档训练完成")
+            doc_items.append(
+                vn.build_documentation_item(table_relationships_doc, source=TRAINING_SOURCE, kind="overview")
+            )
+            # 表关系（"表关系: ..."）由建模配置单独训练，不在此处删除
+            sync_stats["文档"] = cls._sync_training_items(
+                db_session, dataset_id, vn, vn.documentation_collection, doc_items,
+                label="业务术语/文档", progress_start=40, progress_end=80,
+                legacy_patterns=(LEGACY_OVERVIEW_PATTERN, *legacy_term_patterns([t.term for t in business_terms]))
+            )
 
             # === Step 5: 生成示例 SQLQA 对 (80-100%) ===
             cls._checkpoint_and_check_interrupt(db_session, dataset_id, 85, "生成示例 SQL 查询")
@@ -285,14 +356,16 @@ class VannaTrainingService:
                 except Exception as parse_err:
                     logger.debug(f"Failed to parse DDL for {table_name}: {parse_err}")
 
-            for i, (question, sql) in enumerate(example_queries):
-                vn.train(question=question, sql=sql)
-
-                progress = 85 + int((i + 1) / len(example_queries) * 15)
-                cls._checkpoint_and_check_interrupt(
-                    db_session, dataset_id, progress,
-                    f"训练示例查询 ({i+1}/{len(example_queries)})"
-                )
+            qa_items = [
+                vn.build_question_sql_item(question, sql, source=TRAINING_SOURCE)
+                for question, sql in example_queries
+            ]
+            # 用户反馈的问答对没有来源标记，不会被删除；旧的自动示例按生成模板识别
+            sync_stats["示例查询"] = cls._sync_training_items(
+                db_session, dataset_id, vn, vn.sql_collection, qa_items,
+                label="示例查询", progress_start=85, progress_end=100,
+                legacy_patterns=LEGACY_EXAMPLE_QA_PATTERNS
+            )
 
             # === 完成 (100%) ===
             dataset.status = "completed"
@@ -300,7 +373,11 @@ class VannaTrainingService:
             dataset.last_train_at = datetime.utcnow()
             db_session.commit()
 
-            cls._checkpoint_and_check_interrupt(db_session, dataset_id, 100, "训练完成")
+            summary = ", ".join(
+                f"{name} +{stats['added']}/-{stats['removed']}/={stats['unchanged']}"
+                for name, stats in sync_stats.items()
+            )
+            cls._checkpoint_and_check_interrupt(db_session, dataset_id, 100, f"训练完成（新增/删除/未变更: {summary}）")
 
             logger.info(f"Training completed successfully for dataset {dataset_id}")
 
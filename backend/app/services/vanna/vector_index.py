@@ -0,0 +1,274 @@
+"""
+进程内向量索引
+
+为单个 PGVector collection 维护内存镜像，用于 top-k 相似度检索加速。
+PGVector 始终是唯一数据源：索引在首次检索时从 langchain_pg_embedding 懒加载，
+在 add_*/remove_training_data 时同步更新，并按 TTL 定期重新加载以感知其他进程的写入。
+
+检索策略：
+- 小规模 collection：NumPy 稠密矩阵暴力计算余弦相似度
+- 大规模 collection（超过阈值）：HNSW 近似检索（需要安装 hnswlib，否则回退到稠密矩阵）
+"""
+
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+from langchain_core.documents import Document
+
+from app.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+try:
+    import hnswlib
+except ImportError:  # hnswlib 为可选依赖
+    hnswlib = None
+
+
+class InMemoryVectorIndex:
+    """
+    单个 PGVector collection 的内存向量索引
+
+    向量按行存放在预分配的矩阵中，行号即 HNSW 的 label。
+    删除操作只做墓碑标记，墓碑过多时在下次重新加载时自然压缩。
+    """
+
+    # 初始容量和扩容倍数
+    _INITIAL_CAPACITY = 64
+    _GROWTH_FACTOR = 2
+
+    # HNSW 构建参数
+    _HNSW_M = 16
+    _HNSW_EF_CONSTRUCTION = 200
+    _HNSW_EF_SEARCH = 64
+
+    def __init__(self, store, hnsw_threshold: int = 5000, ttl: int = 300):
+        """
+        Args:
+            store: langchain_postgres PGVector 实例（数据源）
+            hnsw_threshold: 向量数量达到该值时切换到 HNSW
+            ttl: 索引有效期（秒），过期后下次检索时重新从 PGVector 加载，0 表示不过期
+        """
+        self.store = store
+        self.collection_name = store.collection_name
+        self.hnsw_threshold = hnsw_threshold
+        self.ttl = ttl
+
+        self._lock = threading.RLock()
+        self._loaded_at: Optional[float] = None
+        self._reset()
+
+    # ========== 状态管理 ==========
+
+    def _reset(self, dim: int = 0, capacity: int = 0):
+        """清空索引"""
+        self._dim = dim
+        self._vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self._documents: list[Optional[Document]] = []
+        self._label_by_id: dict[str, int] = {}
+        self._deleted = np.zeros(capacity, dtype=bool)
+        self._hnsw = None
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._loaded_at is not None
+
+    @property
+    def size(self) -> int:
+        """有效向量数量"""
+        return len(self._label_by_id)
+
+    def _is_expired(self) -> bool:
+        if self._loaded_at is None:
+            return True
+        return self.ttl > 0 and (time.monotonic() - self._loaded_at) > self.ttl
+
+    def invalidate(self):
+        """使索引失效，下次检索时重新加载"""
+        with self._lock:
+            self._loaded_at = None
+            self._reset()
+
+    # ========== 加载 ==========
+
+    def ensure_loaded(self):
+        """按需从 PGVector 加载（首次访问或 TTL 过期）"""
+        if not self._is_expired():
+            return
+        with self._lock:
+            if self._is_expired():
+                self._load()
+
+    def _load(self):
+        """从 PGVector 全量加载当前 collection 的向量"""
+        start = time.perf_counter()
+        store = self.store
+        embedding_store = store.EmbeddingStore
+
+        with store.session_maker() as session:
+            collection = store.get_collection(session)
+            if collection is None:
+                rows = []
+            else:
+                rows = (
+                    session.query(
+                        embedding_store.id,
+                        embedding_store.document,
+                        embedding_store.cmetadata,
+                        embedding_store.embedding,
+                    )
+                    .filter(embedding_store.collection_id == collection.uuid)
+                    .all()
+                )
+
+        if rows:
+            matrix = np.asarray([np.asarray(row[3], dtype=np.float32) for row in rows], dtype=np.float32)
+            self._reset(dim=matrix.shape[1], capacity=max(len(rows), self._INITIAL_CAPACITY))
+            self._vectors[:len(rows)] = self._normalize(matrix)
+            for label, (doc_id, content, metadata, _) in enumerate(rows):
+                self._documents.append(Document(page_content=content or "", metadata=metadata or {}))
+                self._label_by_id[doc_id] = label
+        else:
+            self._reset()
+
+        self._rebuild_hnsw()
+        self._loaded_at = time.monotonic()
+
+        logger.info(
+            "Vector index loaded",
+            collection=self.collection_name,
+            vectors=len(rows),
+            backend="hnsw" if self._hnsw is not None else "dense",
+            load_time_ms=round((time.perf_counter() - start) * 1000, 2),
+        )
+
+    def _rebuild_hnsw(self):
+        """向量数量超过阈值时构建 HNSW 索引"""
+        self._hnsw = None
+        count = len(self._documents)
+        if count < self.hnsw_threshold:
+            return
+        if hnswlib is None:
+            logger.warning(
+                "hnswlib not installed, falling back to dense vector index",
+                collection=self.collection_name,
+                vectors=count,
+            )
+            return
+
+        index = hnswlib.Index(space="ip", dim=self._dim)
+        index.init_index(
+            max_elements=self._vectors.shape[0],
+            ef_construction=self._HNSW_EF_CONSTRUCTION,
+            M=self._HNSW_M,
+        )
+        index.set_ef(self._HNSW_EF_SEARCH)
+        index.add_items(self._vectors[:count], np.arange(count))
+        for label in np.flatnonzero(self._deleted[:count]):
+            index.mark_deleted(int(label))
+        self._hnsw = index
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        """L2 归一化，使内积等价于余弦相似度（与 PGVector 默认的 COSINE 距离一致）"""
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    # ========== 同步写入 ==========
+
+    def upsert(self, doc_id: str, document: Document, embedding: list):
+        """
+        同步新增/更新的向量
+
+        索引尚未加载时直接忽略，下次懒加载会从 PGVector 读取到该条数据。
+        """
+        with self._lock:
+            if not self.is_loaded:
+                return
+
+            vector = self._normalize(np.asarray(embedding, dtype=np.float32))
+            if self._dim == 0:
+                self._reset(dim=vector.shape[0], capacity=self._INITIAL_CAPACITY)
+
+            label = self._label_by_id.get(doc_id)
+            if label is None:
+                label = len(self._documents)
+                self._ensure_capacity(label + 1)
+                self._documents.append(document)
+                self._label_by_id[doc_id] = label
+            else:
+                self._documents[label] = document
+
+            self._vectors[label] = vector
+            self._deleted[label] = False
+
+            if self._hnsw is not None:
+                self._hnsw.add_items(vector.reshape(1, -1), np.asarray([label]))
+            elif len(self._documents) >= self.hnsw_threshold:
+                self._rebuild_hnsw()
+
+    def remove(self, doc_id: str) -> bool:
+        """同步删除向量，返回该 ID 是否存在于索引中"""
+        with self._lock:
+            label = self._label_by_id.pop(doc_id, None)
+            if label is None:
+                return False
+            self._deleted[label] = True
+            self._documents[label] = None
+            if self._hnsw is not None:
+                self._hnsw.mark_deleted(label)
+            return True
+
+    def _ensure_capacity(self, required: int):
+        capacity = self._vectors.shape[0]
+        if required <= capacity:
+            return
+        new_capacity = max(required, capacity * self._GROWTH_FACTOR, self._INITIAL_CAPACITY)
+
+        vectors = np.zeros((new_capacity, self._dim), dtype=np.float32)
+        vectors[:capacity] = self._vectors
+        self._vectors = vectors
+
+        deleted = np.zeros(new_capacity, dtype=bool)
+        deleted[:capacity] = self._deleted
+        self._deleted = deleted
+
+        if self._hnsw is not None:
+            self._hnsw.resize_index(new_capacity)
+
+    # ========== 检索 ==========
+
+    def search(self, embedding: list, k: int) -> list[Document]:
+        """
+        返回与查询向量最相似的 k 个文档（按相似度降序）
+
+        Args:
+            embedding: 查询向量（未归一化）
+            k: 返回数量
+        """
+        self.ensure_loaded()
+
+        with self._lock:
+            live = self.size
+            if live == 0 or k <= 0:
+                return []
+            k = min(k, live)
+            query = self._normalize(np.asarray(embedding, dtype=np.float32))
+
+            if self._hnsw is not None:
+                labels, _ = self._hnsw.knn_query(query.reshape(1, -1), k=k)
+                ordered = [int(label) for label in labels[0]]
+            else:
+                count = len(self._documents)
+                scores = self._vectors[:count] @ query
+                scores[self._deleted[:count]] = -np.inf
+                if k < count:
+                    top = np.argpartition(-scores, k - 1)[:k]
+                else:
+                    top = np.arange(count)
+                ordered = top[np.argsort(-scores[top], kind="stable")].tolist()
+
+            return [self._documents[label] for label in ordered if self._documents[label] is not None]
@@ -0,0 +1,429 @@
+"""
+PGVector 向量存储维护
+
+所有数据集的向量都存放在同一张 langchain_pg_embedding 表中（按 collection_id 区分）。
+本模块负责：
+- 共享 SQLAlchemy Engine（所有 PGVector collection 复用同一个连接池）
+- 创建并校验索引：collection_id B-Tree 索引 + HNSW / IVFFlat 向量索引
+- 检索会话开启迭代扫描（pgvector >= 0.8），按 collection 过滤时小数据集也能返回 k 行
+- 集合式批量删除 collection（单条 SQL），大批量删除后在后台线程中执行 VACUUM
+- 统计表和索引的大小
+"""
+
+import math
+import threading
+from typing import Optional
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine
+
+from app.core.config import settings
+from app.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+EMBEDDING_TABLE = "langchain_pg_embedding"
+COLLECTION_TABLE = "langchain_pg_collection"
+
+# 索引名称
+COLLECTION_ID_INDEX = "ix_langchain_pg_embedding_collection_id"
+HNSW_INDEX = "ix_langchain_pg_embedding_hnsw"
+IVFFLAT_INDEX = "ix_langchain_pg_embedding_ivfflat"
+
+# 每个数据集对应的三个 collection 后缀
+COLLECTION_SUFFIXES = ("_ddl", "_documentation", "_sql")
+
+ANN_INDEX_METHODS = ("hnsw", "ivfflat", "none")
+
+ITERATIVE_SCAN_MODES = ("off", "strict_order", "relaxed_order")
+
+_engines: dict[str, Engine] = {}
+_engine_lock = threading.Lock()
+# 同时只执行一个后台 VACUUM
+_vacuum_lock = threading.Lock()
+
+
+def _version_tuple(version: Optional[str]) -> tuple:
+    parts = []
+    for part in (version or "").split("."):
+        digits = "".join(ch for ch in part if ch.isdigit())
+        if not digits:
+            break
+        parts.append(int(digits))
+    return tuple(parts)
+
+
+def iterative_scan_settings(extension_version: Optional[str], mode: Optional[str] = None) -> dict[str, str]:
+    """
+    检索会话的迭代扫描参数
+
+    所有数据集共享一个全局向量索引，检索时按 collection_id 过滤：近似扫描只取 ef_search / probes 范围内的候选再过滤，
+    小数据集的候选大多属于其他数据集，返回的行数少于 k。开启迭代扫描（pgvector >= 0.8）后，
+    索引会继续扫描直到过滤后满足 k 行。ivfflat 只支持 relaxed_order。
+
+    Args:
+        extension_version: pg_extension 中 vector 扩展的版本，未安装时为 None
+        mode: off / strict_order / relaxed_order，默认使用 settings.PGVECTOR_ITERATIVE_SCAN
+
+    Returns:
+        dict: {参数名: 值}，不需要或不支持时为空
+    """
+    mode = (mode or settings.PGVECTOR_ITERATIVE_SCAN).lower()
+    if mode not in ITERATIVE_SCAN_MODES:
+        raise ValueError(f"Unsupported iterative scan mode: {mode}. Supported: {', '.join(ITERATIVE_SCAN_MODES)}")
+    if mode == "off" or _version_tuple(extension_version) < (0, 8):
+        return {}
+    return {"hnsw.iterative_scan": mode, "ivfflat.iterative_scan": "relaxed_order"}
+
+
+def _configure_session(dbapi_connection, connection_record):
+    """新建连接时设置迭代扫描参数（在事务中执行后提交，连接归还时的回滚不会撤销）"""
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+        row = cursor.fetchone()
+        for name, value in iterative_scan_settings(row[0] if row else None).items():
+            cursor.execute(f"SET {name} = {value}")
+        dbapi_connection.commit()
+    except Exception as e:
+        dbapi_connection.rollback()
+        logger.warning("Failed to configure PGVector iterative scan", error=str(e))
+    finally:
+        cursor.close()
+
+
+def get_vector_store_engine(connection_string: Optional[str] = None) -> Engine:
+    """
+    获取共享的向量库 Engine（按连接字符串缓存）
+
+    Args:
+        connection_string: PostgreSQL 连接字符串，默认使用 settings.PG_CONNECTION_STRING
+    """
+    connection_string = connection_string or settings.PG_CONNECTION_STRING
+    engine = _engines.get(connection_string)
+    if engine is not None:
+        return engine
+
+    with _engine_lock:
+        engine = _engines.get(connection_string)
+        if engine is None:
+            engine = create_engine(
+                connection_string,
+                pool_size=10,
+                max_overflow=20,
+                pool_pre_ping=True,
+                pool_recycle=3600,
+            )
+            event.listen(engine, "connect", _configure_session)
+            _engines[connection_string] = engine
+    return engine
+
+
+def dataset_collection_names(dataset_id: int) -> list[str]:
+    """数据集对应的全部 PGVector collection 名称"""
+    return [f"vec_ds_{dataset_id}{suffix}" for suffix in COLLECTION_SUFFIXES]
+
+
+class VectorStoreMaintenance:
+    """
+    PGVector 维护操作
+
+    DDL 和 VACUUM 需要在事务外执行，统一使用 AUTOCOMMIT 连接。
+    """
+
+    # ========== 索引 ==========
+
+    @classmethod
+    def ensure_indexes(cls, method: Optional[str] = None, fix_dimension: bool = False) -> dict:
+        """
+        创建缺失的索引并返回校验结果（管理员显式执行的迁移步骤，不在服务启动时自动执行）
+
+        - collection_id B-Tree：检索时先按 collection 过滤，避免全表（所有租户）顺序扫描
+        - HNSW / IVFFlat：collection 较大时的近似最近邻检索（余弦距离，与 PGVector 默认一致）；
+          索引是全局的，按 collection 过滤依赖检索会话的迭代扫描（见 iterative_scan_settings）
+
+        向量索引要求 embedding 列声明固定维度。langchain_postgres 默认创建不带维度的 vector 列，
+        收紧为 vector(N) 需要 ALTER TABLE：持有 ACCESS EXCLUSIVE 锁并重写整张共享表，
+        且此后只能写入 N 维向量（更换 EMBEDDING_MODEL 前需先改回 vector 类型）。
+        因此只有 fix_dimension 为 True 时才修改列类型，否则列未声明维度时跳过向量索引。
+
+        Args:
+            method: hnsw / ivfflat / none，默认使用 settings.PGVECTOR_INDEX_METHOD
+            fix_dimension: 列未声明维度且表中向量维度一致时，是否将列类型收紧为 vector(N)
+
+        Returns:
+            dict: verify_indexes() 的结果
+        """
+        method = (method or settings.PGVECTOR_INDEX_METHOD).lower()
+        if method not in ANN_INDEX_METHODS:
+            raise ValueError(f"Unsupported PGVector index method: {method}. Supported: {', '.join(ANN_INDEX_METHODS)}")
+
+        engine = get_vector_store_engine()
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            if not cls._table_exists(conn):
+                logger.info("PGVector tables not created yet, skipping index provisioning")
+                return cls.verify_indexes()
+
+            conn.execute(text(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {COLLECTION_ID_INDEX} "
+                f"ON {EMBEDDING_TABLE} (collection_id)"
+            ))
+
+            if method != "none" and cls._ensure_fixed_dimension(conn, fix_dimension):
+                if method == "hnsw":
+                    conn.execute(text(
+                        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {HNSW_INDEX} "
+                        f"ON {EMBEDDING_TABLE} USING hnsw (embedding vector_cosine_ops) "
+                        f"WITH (m = {int(settings.PGVECTOR_HNSW_M)}, "
+                        f"ef_construction = {int(settings.PGVECTOR_HNSW_EF_CONSTRUCTION)})"
+                    ))
+                else:
+                    conn.execute(text(
+                        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {IVFFLAT_INDEX} "
+                        f"ON {EMBEDDING_TABLE} USING ivfflat (embedding vector_cosine_ops) "
+                        f"WITH (lists = {cls._ivfflat_lists(conn)})"
+                    ))
+
+            conn.execute(text(f"ANALYZE {EMBEDDING_TABLE}"))
+
+        result = cls.verify_indexes()
+        logger.info("PGVector indexes ensured", method=method, indexes=[idx["name"] for idx in result["indexes"]])
+        return result
+
+    @classmethod
+    def verify_indexes(cls) -> dict:
+        """
+        校验 langchain_pg_embedding 上的索引
+
+        CREATE INDEX CONCURRENTLY 中断会留下 INVALID 索引，这里一并报告。
+
+        Returns:
+            dict: {embedding_type, indexes: [{name, method, valid, size_bytes, definition}],
+                   has_collection_index, has_ann_index}
+        """
+        engine = get_vector_store_engine()
+        with engine.connect() as conn:
+            if not cls._table_exists(conn):
+                return {"embedding_type": None, "indexes": [], "has_collection_index": False, "has_ann_index": False}
+
+            embedding_type = cls._embedding_type(conn)
+            rows = conn.execute(text("""
+                SELECT i.relname, am.amname, ix.indisvalid, pg_relation_size(i.oid), pg_get_indexdef(i.oid)
+                FROM pg_index ix
+                JOIN pg_class i ON i.oid = ix.indexrelid
+                JOIN pg_am am ON am.oid = i.relam
+                WHERE ix.indrelid = CAST(:table AS regclass)
+                ORDER BY i.relname
+            """), {"table": EMBEDDING_TABLE}).fetchall()
+
+        indexes = [
+            {"name": name, "method": method, "valid": valid, "size_bytes": size, "definition": definition}
+            for name, method, valid, size, definition in rows
+        ]
+        for index in indexes:
+            if not index["valid"]:
+                logger.warning("Invalid PGVector index found, drop and recreate it", index=index["name"])
+
+        return {
+            "embedding_type": embedding_type,
+            "indexes": indexes,
+            "has_collection_index": any(
+                idx["valid"] and idx["name"] == COLLECTION_ID_INDEX for idx in indexes
+            ),
+            "has_ann_index": any(
+                idx["valid"] and idx["method"] in ("hnsw", "ivfflat") for idx in indexes
+            ),
+        }
+
+    @staticmethod
+    def _table_exists(conn) -> bool:
+        return conn.execute(
+            text("SELECT to_regclass(:table) IS NOT NULL"), {"table": EMBEDDING_TABLE}
+        ).scalar()
+
+    @staticmethod
+    def _embedding_type(conn) -> Optional[str]:
+        return conn.execute(text("""
+            SELECT format_type(atttypid, atttypmod)
+            FROM pg_attribute
+            WHERE attrelid = CAST(:table AS regclass) AND attname = 'embedding'
+        """), {"table": EMBEDDING_TABLE}).scalar()
+
+    @classmethod
+    def _ensure_fixed_dimension(cls, conn, fix_dimension: bool) -> bool:
+        """确保 embedding 列为 vector(N)，返回是否可以创建向量索引"""
+        embedding_type = cls._embedding_type(conn)
+        if embedding_type and embedding_type != "vector":
+            return True
+        if not fix_dimension:
+            logger.warning(
+                "Skipping ANN index on untyped embedding column",
+                reason="fix_dimension not requested (ALTER TABLE rewrites the shared table)",
+            )
+            return False
+
+        dims = [row[0] for row in conn.execute(text(
+            f"SELECT DISTINCT vector_dims(embedding) FROM {EMBEDDING_TABLE} WHERE embedding IS NOT NULL"
+        )).fetchall()]
+        if len(dims) != 1:
+            logger.warning(
+                "Cannot create ANN index on untyped embedding column",
+                reason="table is empty" if not dims else "mixed embedding dimensions",
+                dimensions=dims,
+            )
+            return False
+
+        conn.execute(text(f"ALTER TABLE {EMBEDDING_TABLE} ALTER COLUMN embedding TYPE vector({int(dims[0])})"))
+        logger.info("Fixed embedding column dimension", dimension=dims[0])
+        return True
+
+    @staticmethod
+    def _ivfflat_lists(conn) -> int:
+        """pgvector 推荐值：100 万行以内 rows / 1000，以上 sqrt(rows)"""
+        rows = conn.execute(text(f"SELECT count(*) FROM {EMBEDDING_TABLE}")).scalar() or 0
+        if rows > 1_000_000:
+            return int(math.sqrt(rows))
+        return max(10, rows // 1000)
+
+    # ========== 删除 ==========
+
+    @classmethod
+    def delete_collections(cls, collection_names: list[str], vacuum: Optional[bool] = None) -> dict:
+        """
+        用一条集合式 SQL 删除多个 collection 及其全部向量
+
+        Args:
+            collection_names: collection 名称列表
+            vacuum: 删除后是否同步 VACUUM；None 表示删除向量数达到 PGVECTOR_VACUUM_THRESHOLD 时
+                在后台线程中执行（删除数据集等请求不等待 VACUUM）
+
+        Returns:
+            dict: {collections: 删除的 collection 数, embeddings: 删除的向量数,
+                   vacuumed: 是否已同步 VACUUM, vacuum_scheduled: 是否已在后台启动 VACUUM}
+        """
+        result = {"collections": 0, "embeddings": 0, "vacuumed": False, "vacuum_scheduled": False}
+        if not collection_names:
+            return result
+
+        engine = get_vector_store_engine()
+        with engine.begin() as conn:
+            if not cls._table_exists(conn):
+                return result
+            row = conn.execute(text(f"""
+                WITH target AS (
+                    SELECT uuid FROM {COLLECTION_TABLE} WHERE name = ANY(:names)
+                ),
+                deleted_embeddings AS (
+                    DELETE FROM {EMBEDDING_TABLE}
+                    WHERE collection_id IN (SELECT uuid FROM target)
+                    RETURNING 1
+                ),
+                deleted_collections AS (
+                    DELETE FROM {COLLECTION_TABLE}
+                    WHERE uuid IN (SELECT uuid FROM target)
+                    RETURNING 1
+                )
+                SELECT (SELECT count(*) FROM deleted_collections), (SELECT count(*) FROM deleted_embeddings)
+            """), {"names": list(collection_names)}).fetchone()
+
+        result["collections"], result["embeddings"] = int(row[0]), int(row[1])
+        logger.info(
+            "Deleted PGVector collections",
+            requested=len(collection_names),
+            collections=result["collections"],
+            embeddings=result["embeddings"],
+        )
+
+        if result["embeddings"] == 0:
+            return result
+        if vacuum is None:
+            if result["embeddings"] >= settings.PGVECTOR_VACUUM_THRESHOLD:
+                result["vacuum_scheduled"] = cls.schedule_vacuum() is not None
+        elif vacuum:
+            # 删除已提交，VACUUM 失败不影响删除结果，由 autovacuum 或管理员稍后回收空间
+            try:
+                cls.vacuum()
+                result["vacuumed"] = True
+            except Exception as e:
+                logger.warning("PGVector vacuum after delete failed", error=str(e))
+        return result
+
+    @classmethod
+    def schedule_vacuum(cls) -> Optional[threading.Thread]:
+        """在后台线程中执行 VACUUM；已有 VACUUM 在执行时跳过并返回 None"""
+        if not _vacuum_lock.acquire(blocking=False):
+            return None
+
+        def run():
+            try:
+                cls.vacuum()
+            except Exception as e:
+                logger.warning("Background PGVector vacuum failed", error=str(e))
+            finally:
+                _vacuum_lock.release()
+
+        thread = threading.Thread(target=run, name="pgvector-vacuum", daemon=True)
+        try:
+            thread.start()
+        except Exception:
+            _vacuum_lock.release()
+            raise
+        return thread
+
+    @classmethod
+    def delete_dataset_collections(cls, dataset_ids: list[int], vacuum: Optional[bool] = None) -> dict:
+        """删除一个或多个数据集的全部 collection"""
+        names = [name for dataset_id in dataset_ids for name in dataset_collection_names(dataset_id)]
+        return cls.delete_collections(names, vacuum=vacuum)
+
+    @classmethod
+    def vacuum(cls):
+        """回收已删除向量占用的空间并更新统计信息（需在事务外执行）"""
+        engine = get_vector_store_engine()
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            for table in (EMBEDDING_TABLE, COLLECTION_TABLE):
+                conn.execute(text(f"VACUUM (ANALYZE) {table}"))
+        logger.info("Vacuumed PGVector tables")
+
+    # ========== 统计 ==========
+
+    @classmethod
+    def get_storage_stats(cls) -> dict:
+        """
+        统计向量表和索引大小
+
+        Returns:
+            dict: {collections, embeddings, dead_tuples, table_bytes, indexes_bytes, total_bytes,
+                   last_vacuum, last_autovacuum, indexes}
+        """
+        engine = get_vector_store_engine()
+        with engine.connect() as conn:
+            if not cls._table_exists(conn):
+                return {"collections": 0, "embeddings": 0, "total_bytes": 0, "indexes": []}
+
+            row = conn.execute(text(f"""
+                SELECT
+                    (SELECT count(*) FROM {COLLECTION_TABLE}),
+                    s.n_live_tup,
+                    s.n_dead_tup,
+                    pg_table_size(s.relid),
+                    pg_indexes_size(s.relid),
+                    pg_total_relation_size(s.relid),
+                    s.last_vacuum,
+                    s.last_autovacuum
+                FROM pg_stat_user_tables s
+                WHERE s.relid = CAST(:table AS regclass)
+            """), {"table": EMBEDDING_TABLE}).fetchone()
+
+        stats = {
+            "collections": int(row[0]),
+            "embeddings": int(row[1]),
+            "dead_tuples": int(row[2]),
+            "table_bytes": int(row[3]),
+            "indexes_bytes": int(row[4]),
+            "total_bytes": int(row[5]),
+            "last_vacuum": row[6].isoformat() if row[6] else None,
+            "last_autovacuum": row[7].isoformat() if row[7] else None,
+        }
+        stats["indexes"] = cls.verify_indexes()["indexes"]
+        return stats
@@ -0,0 +1,173 @@
+"""
+启动预热服务
+
+部署后第一个问答请求需要加载 embedding 模型、创建 VannaLegacyPGVector 实例、
+连接 PGVector 以及打开数据集的数据库文件，耗时明显。预热阶段在服务启动时提前完成这些工作：
+- 加载共享的 embedding 模型并执行一次推理
+- 为最近活跃（按 ChatMessage 最新时间）的 N 个数据集创建 Vanna 实例
+- 打开这些数据集的数据源连接池或 DuckDB 文件
+
+预热在后台线程执行，/ready 在预热完成（或超时）后才返回就绪，便于滚动发布时由负载均衡摘流。
+"""
+
+import asyncio
+import time
+from typing import Optional
+
+from sqlalchemy import func, text
+
+from app.core.config import settings
+from app.core.logger import get_logger
+from app.db.session import SessionLocal
+from app.models.metadata import ChatMessage, Dataset
+
+logger = get_logger(__name__)
+
+
+class WarmupService:
+    """
+    启动预热
+
+    状态保存在类属性中（进程级），供就绪检查读取。
+    """
+
+    # pending -> running -> completed / failed / timeout；disabled 表示未启用预热
+    _state: str = "pending"
+    _started_at: Optional[float] = None
+    _finished_at: Optional[float] = None
+    _datasets: list = []
+    _errors: list = []
+
+    @classmethod
+    def is_ready(cls) -> bool:
+        """预热结束（无论成功与否）即视为就绪，预热失败不应阻止服务接流"""
+        return cls._state in ("completed", "failed", "timeout", "disabled")
+
+    @classmethod
+    def get_status(cls) -> dict:
+        duration_ms = None
+        if cls._started_at is not None:
+            end = cls._finished_at or time.monotonic()
+            duration_ms = round((end - cls._started_at) * 1000, 2)
+        return {
+            "ready": cls.is_ready(),
+            "state": cls._state,
+            "datasets": list(cls._datasets),
+            "errors": list(cls._errors),
+            "duration_ms": duration_ms,
+        }
+
+    @classmethod
+    async def run(cls):
+        """在后台线程中执行预热，超过 WARMUP_TIMEOUT 后放弃等待并标记就绪"""
+        if not settings.WARMUP_ENABLED:
+            cls._state = "disabled"
+            return
+
+        cls._state = "running"
+        cls._started_at = time.monotonic()
+        cls._datasets = []
+        cls._errors = []
+
+        try:
+            await asyncio.wait_for(asyncio.to_thread(cls._warmup), timeout=settings.WARMUP_TIMEOUT)
+            cls._state = "completed"
+        except asyncio.TimeoutError:
+            # 线程仍会在后台继续执行完，只是不再阻塞就绪
+            cls._state = "timeout"
+            logger.warning("Warm-up timed out, marking service ready", timeout=settings.WARMUP_TIMEOUT)
+        except Exception as e:
+            cls._state = "failed"
+            cls._errors.append(str(e))
+            logger.warning("Warm-up failed, marking service ready", error=str(e))
+        finally:
+            cls._finished_at = time.monotonic()
+
+        logger.info("Warm-up finished", **cls.get_status())
+
+    @classmethod
+    def _warmup(cls):
+        cls._warmup_embedding_model()
+
+        dataset_ids = cls.get_recent_dataset_ids(settings.WARMUP_DATASET_LIMIT)
+        for dataset_id in dataset_ids:
+            try:
+                cls._warmup_dataset(dataset_id)
+                cls._datasets.append(dataset_id)
+            except Exception as e:
+                cls._errors.append(f"dataset {dataset_id}: {e}")
+                logger.warning("Failed to warm up dataset", dataset_id=dataset_id, error=str(e))
+
+    @classmethod
+    def _warmup_embedding_model(cls):
+        """加载共享 embedding 模型，并执行一次推理以完成图初始化"""
+        from app.services.vanna.base import get_embedding_function
+
+        start = time.perf_counter()
+        embeddings = get_embedding_function(
+            backend=settings.EMBEDDING_BACKEND,
+            model_name=settings.EMBEDDING_MODEL,
+            onnx_int8_file=settings.EMBEDDING_ONNX_INT8_FILE,
+        )
+        embeddings.embed_query("warm up")
+        logger.info(
+            "Embedding model warmed up",
+            backend=settings.EMBEDDING_BACKEND,
+            load_time_ms=round((time.perf_counter() - start) * 1000, 2),
+        )
+
+    @classmethod
+    def get_recent_dataset_ids(cls, limit: int) -> list[int]:
+        """按最近一条聊天消息的时间，返回最近活跃的已训练数据集 ID"""
+        if limit <= 0:
+            return []
+
+        db = SessionLocal()
+        try:
+            last_active = func.max(ChatMessage.created_at)
+            rows = (
+                db.query(ChatMessage.dataset_id, last_active)
+                .join(Dataset, Dataset.id == ChatMessage.dataset_id)
+                .filter(Dataset.status == "completed")
+                .group_by(ChatMessage.dataset_id)
+                .order_by(last_active.desc())
+                .limit(limit)
+                .all()
+            )
+            return [row[0] for row in rows]
+        finally:
+            db.close()
+
+    @classmethod
+    def _warmup_dataset(cls, dataset_id: int):
+        """创建 Vanna 实例、加载进程内向量索引，并打开数据源连接"""
+        from app.services.db_inspector import DBInspector
+        from app.services.duckdb_service import DuckDBService
+        from app.services.vanna.instance_manager import VannaInstanceManager
+
+        start = time.perf_counter()
+        vn = VannaInstanceManager.get_legacy_vanna(dataset_id)
+        for index in vn._vector_indexes.values():
+            index.ensure_loaded()
+
+        db = SessionLocal()
+        try:
+            dataset = db.query(Dataset).filter(Dataset.id == dataset_id).first()
+            if dataset is None:
+                return
+            if dataset.duckdb_path:
+                # 只读打开一次，加载 catalog 并让文件进入操作系统页缓存
+                DuckDBService.list_tables(dataset.duckdb_path)
+            elif dataset.datasource:
+                # 引擎按 URL 缓存，这里建立第一个连接放入连接池
+                engine = DBInspector.get_engine(dataset.datasource)
+                with engine.connect() as conn:
+                    conn.execute(text("SELECT 1"))
+        finally:
+            db.close()
+
+        logger.info(
+            "Dataset warmed up",
+            dataset_id=dataset_id,
+            time_ms=round((time.perf_counter() - start) * 1000, 2),
+        )
@@ -5,21 +5,147 @@ Handles file uploads (CSV, Excel) and converts them to pandas DataFrames.
 Provides utilities for sanitizing column names for SQL compatibility.
 """
 
+import hashlib
+import os
 import re
+import tempfile
 import pandas as pd
 from fastapi import UploadFile, HTTPException
-from typing import Optional
+from typing import Optional, Iterable
 import logging
 
+from app.core.config import settings
+
 logger = logging.getLogger(__name__)
 
+# 文件头签名：读取第一个分块时即可拒绝扩展名与内容不符的文件
+_FILE_SIGNATURES = {
+    '.xlsx': (b'PK\x03\x04',),
+    '.xls': (b'\xd0\xcf\x11\xe0',),
+}
+
+
+class SpooledUpload:
+    """
+    已落盘的上传文件
+
+    支持 with 语句，退出时删除临时文件。
+    sha256 为文件内容哈希（落盘时顺带计算），用于识别重复上传。
+    """
+
+    def __init__(self, path: str, filename: str, size: int, sha256: Optional[str] = None):
+        self.path = path
+        self.filename = filename
+        self.size = size
+        self.sha256 = sha256
+
+    @property
+    def extension(self) -> str:
+        return os.path.splitext(self.filename)[1].lower()
+
+    def cleanup(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Failed to remove spooled upload {self.path}: {e}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cleanup()
+
+
+async def spool_upload(
+    file: UploadFile,
+    allowed_extensions: Optional[Iterable[str]] = None,
+    max_size: Optional[int] = None,
+    chunk_size: Optional[int] = None,
+) -> SpooledUpload:
+    """
+    将上传文件按块写入临时文件，边写边校验
+
+    - 扩展名在读取内容前校验
+    - 文件头签名在第一个分块校验
+    - 大小在每个分块后校验，超限立即停止读取
+    - 边写边计算内容 SHA-256，无需再次读取文件
+
+    内存占用只有一个分块，与文件大小无关。
+
+    Args:
+        file: FastAPI UploadFile
+        allowed_extensions: 允许的扩展名（如 {'.csv', '.xlsx'}），None 表示不限制
+        max_size: 最大字节数，None 表示不限制
+        chunk_size: 分块大小，默认 settings.UPLOAD_CHUNK_SIZE
+
+    Returns:
+        SpooledUpload: 临时文件信息（调用方负责 cleanup）
+
+    Raises:
+        ValueError: 扩展名、文件头或大小校验失败，或文件为空
+    """
+    filename = file.filename or ""
+    ext = os.path.splitext(filename)[1].lower()
+    if allowed_extensions is not None and ext not in allowed_extensions:
+        raise ValueError(f"不支持的文件格式。支持的格式: {', '.join(sorted(allowed_extensions))}")
+
+    chunk_size = chunk_size or settings.UPLOAD_CHUNK_SIZE
+    temp_dir = settings.UPLOAD_TEMP_DIR or None
+    if temp_dir:
+        os.makedirs(temp_dir, exist_ok=True)
+
+    fd, path = tempfile.mkstemp(suffix=ext, prefix="upload_", dir=temp_dir)
+    size = 0
+    digest = hashlib.sha256()
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                if size == 0:
+                    signatures = _FILE_SIGNATURES.get(ext)
+                    if signatures and not chunk.startswith(signatures):
+                        raise ValueError(f"文件内容与扩展名 {ext} 不匹配: {filename}")
+                size += len(chunk)
+                if max_size is not None and size > max_size:
+                    raise ValueError(f"文件大小超过限制。最大允许: {max_size / (1024 * 1024)}MB")
+                out.write(chunk)
+                digest.update(chunk)
+
+        if size == 0:
+            raise ValueError(f"文件内容为空: {filename}")
+    except BaseException:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        raise
+
+    logger.info(f"Spooled upload {filename} to {path} ({size} bytes)")
+    return SpooledUpload(path, filename, size, digest.hexdigest())
+
+
+def file_sha256(path: str, chunk_size: Optional[int] = None) -> str:
+    """按块计算文件内容的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size or settings.UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
 
 def read_file_to_df(file: UploadFile) -> pd.DataFrame:
     """
     Read uploaded file (CSV or Excel) to pandas DataFrame.
     
     Supports:
-    - CSV files (.csv) with automatic encoding detection
+    - CSV files (.csv) with encoding/dialect sniffed from a bounded sample (parsed once)
     - Excel files (.xlsx, .xls)
     
     Args:
@@ -35,32 +161,37 @@ def read_file_to_df(file: UploadFile) -> pd.DataFrame:
     file_ext = filename.lower().split('.')[-1]
     
     try:
-        # Read file content
-        file_content = file.file.read()
+        # 直接从上传的临时文件读取，不复制到内存
+        source = file.file
         
         if file_ext == 'csv':
-            # Try multiple encodings for CSV
-            encodings = ['utf-8', 'gbk', 'gb2312', 'gb18030', 'latin1']
-            df = None
-            
-            for encoding in encodings:
-                try:
-                    import io
-                    df = pd.read_csv(io.BytesIO(file_content), encoding=encoding)
-                    logger.info(f"Successfully read CSV with encoding: {encoding}")
-                    break
-                except (UnicodeDecodeError, pd.errors.ParserError):
-                    continue
-            
-            if df is None:
+            from app.services.file_etl import FileETLService
+            # 从样本检测编码和格式后只解析一次；样本之后出现无法解码的字节时才换用后备编码
+            try:
+                dialect = FileETLService.sniff_csv(source)
+                df = FileETLService._read_csv_with_fallback(source, dialect)
+            except (UnicodeDecodeError, ValueError, pd.errors.ParserError):
                 raise HTTPException(
                     status_code=400,
                     detail="无法解析 CSV 文件，请检查文件编码（支持 UTF-8, GBK, GB2312）"
                 )
+            if not dialect['has_header']:
+                df.columns = FileETLService._default_column_names(df.columns)
+            # 按文本读取后推断列类型（保留 "00123" 这类编码的前导零）
+            df, _ = FileETLService.apply_inferred_types(df, categorical=False)
+            logger.info(f"Successfully read CSV with encoding: {dialect['encoding']}")
                 
-        elif file_ext in ['xlsx', 'xls']:
-            import io
-            df = pd.read_excel(io.BytesIO(file_content), engine='openpyxl' if file_ext == 'xlsx' else None)
+        elif file_ext == 'xlsx':
+            from app.services.file_etl import FileETLService
+            # read_only 模式流式读取，不构建整个工作簿
+            source.seek(0)
+            df = FileETLService.read_xlsx(source)
+            logger.info(f"Successfully read Excel file: {filename}")
+            
+        elif file_ext == 'xls':
+            # xlrd 不支持流式读取，整表读取（.xls 最多 65536 行）
+            source.seek(0)
+            df = pd.read_excel(source, engine='xlrd')
             logger.info(f"Successfully read Excel file: {filename}")
             
         else:
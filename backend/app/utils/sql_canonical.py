@@ -0,0 +1,195 @@
+"""
+SQL 规范化
+
+用于判断卡片 SQL 是否等价、是否共享同一个分组查询：
+- 去掉注释、合并空白、去掉结尾分号，结构关键字统一为大写（字符串常量和标识符保持原样）
+- 拆分简单的 SELECT ... FROM ... GROUP BY ... 查询为投影列表和其余部分（分组基础查询）
+- 判断 SQL 是否为单条只读查询（服务端重新执行导出 SQL 前校验）
+- 判断查询结果是否被 LIMIT / OFFSET 截取（增量刷新不能按时间窗口合并这类结果）
+"""
+
+from functools import lru_cache
+from typing import List, NamedTuple, Optional
+
+import sqlparse
+from sqlparse import sql as sql_tree
+from sqlparse import tokens as T
+
+# 只统一这些关键字的大小写：sqlparse 会把 day、events 等常见列名识别为关键字，改变其大小写会影响结果列名
+_STRUCTURAL_KEYWORDS = {
+    "SELECT", "FROM", "WHERE", "GROUP BY", "ORDER BY", "HAVING", "LIMIT", "OFFSET", "AS", "AND", "OR", "NOT",
+    "IN", "IS", "NULL", "LIKE", "BETWEEN", "CASE", "WHEN", "THEN", "ELSE", "END", "ASC", "DESC", "DISTINCT",
+    "JOIN", "LEFT JOIN", "RIGHT JOIN", "INNER JOIN", "FULL JOIN", "CROSS JOIN", "LEFT OUTER JOIN",
+    "RIGHT OUTER JOIN", "FULL OUTER JOIN", "ON", "USING", "UNION", "UNION ALL", "WITH", "OVER", "PARTITION BY",
+}
+
+
+# 截取结果行的关键字（只看最外层查询，子查询中的 LIMIT 不影响结果行数）
+_ROW_LIMIT_KEYWORDS = {"LIMIT", "OFFSET", "FETCH", "FETCH FIRST", "FETCH NEXT"}
+
+
+class GroupedSelect(NamedTuple):
+    """拆分后的分组查询：items 为规范化的投影项，names 为对应的输出列名，base 为 FROM 及之后的部分"""
+
+    items: List[str]
+    names: List[str]
+    base: str
+
+
+def _normalize(tokens) -> str:
+    parts: List[str] = []
+    pending_space = after_name = after_keyword = False
+    for token in tokens:
+        if token.is_whitespace or token.ttype in T.Comment:
+            pending_space = bool(parts)
+            continue
+        value = token.value
+        structural = token.ttype in T.Keyword and " ".join(value.split()).upper() in _STRUCTURAL_KEYWORDS
+        if structural:
+            value = " ".join(value.split()).upper()
+        elif token.ttype in T.Name and isinstance(token.parent.parent, sql_tree.Function):
+            # 函数名大小写不敏感
+            value = value.upper()
+        previous = parts[-1] if parts else ""
+        if parts and value not in (",", ")", ".") and previous not in ("(", ".") and (
+            previous == "," or after_keyword or (pending_space and not (value == "(" and after_name))
+        ):
+            parts.append(" ")
+        parts.append(value)
+        pending_space = False
+        # 函数名（包括 CAST 等关键字形式的函数）与括号之间不留空格
+        after_name = token.ttype in T.Name or (token.ttype in T.Keyword and not structural)
+        after_keyword = structural
+    return "".join(parts)
+
+
+def _statement(sql: str) -> Optional[sql_tree.Statement]:
+    statements = [stmt for stmt in sqlparse.parse(sql) if stmt.value.strip(" \t\r\n;")]
+    return statements[0] if len(statements) == 1 else None
+
+
+@lru_cache(maxsize=1024)
+def canonicalize_sql(sql: str) -> str:
+    """
+    规范化 SQL 文本，只有空白、注释、结构关键字大小写或结尾分号不同的 SQL 得到相同结果
+    """
+    statement = _statement(sql)
+    if statement is None:
+        return " ".join(sql.split()).rstrip("; ")
+    return _normalize(statement.flatten()).rstrip("; ")
+
+
+def _output_name(item) -> Optional[str]:
+    """投影项的输出列名：别名或普通列名，表达式没有别名时返回 None"""
+    if not isinstance(item, sql_tree.Identifier):
+        return None
+    alias = item.get_alias()
+    if alias:
+        return alias
+    if any(isinstance(token, (sql_tree.Function, sql_tree.Parenthesis)) for token in item.tokens):
+        return None
+    return item.get_real_name()
+
+
+def _has_positional_reference(tokens) -> bool:
+    """GROUP BY / ORDER BY 中使用列序号（合并投影后序号会变化）"""
+    for index, token in enumerate(tokens[:-1]):
+        if token.ttype in T.Keyword and " ".join(token.value.split()).upper() in ("GROUP BY", "ORDER BY"):
+            following = tokens[index + 1]
+            if isinstance(following, sql_tree.IdentifierList):
+                items = list(following.get_identifiers())
+            else:
+                items = [following]
+            if any(str(item).split()[0].isdigit() for item in items if str(item).strip()):
+                return True
+    return False
+
+
+@lru_cache(maxsize=1024)
+def split_grouped_select(sql: str) -> Optional[GroupedSelect]:
+    """
+    拆分 SELECT <投影> FROM ... GROUP BY ... 形式的查询
+
+    只处理可以安全合并投影的查询：单条语句、没有 WITH / DISTINCT / *、每个投影项都有输出列名、
+    包含 GROUP BY 且 GROUP BY / ORDER BY 不使用列序号。其他查询返回 None。
+    """
+    statement = _statement(sql)
+    if statement is None or statement.get_type() != "SELECT":
+        return None
+    tokens = [
+        token for token in statement.tokens
+        if not token.is_whitespace and token.ttype not in T.Comment and token.ttype is not T.Punctuation
+    ]
+    if len(tokens) < 3 or tokens[0].ttype is not T.DML or tokens[2].ttype is not T.Keyword:
+        return None
+    if tokens[2].value.upper() != "FROM":
+        return None
+
+    projection = tokens[1]
+    if isinstance(projection, sql_tree.IdentifierList):
+        items = list(projection.get_identifiers())
+    else:
+        items = [projection]
+    names = [_output_name(item) for item in items]
+    if not items or None in names or len({name.lower() for name in names}) != len(names):
+        return None
+
+    rest = tokens[2:]
+    if not any(t.ttype in T.Keyword and " ".join(t.value.split()).upper() == "GROUP BY" for t in rest):
+        return None
+    if _has_positional_reference(rest):
+        return None
+
+    start = statement.tokens.index(tokens[2])
+    base = _normalize(sql_tree.TokenList(statement.tokens[start:]).flatten()).rstrip("; ")
+    return GroupedSelect([_normalize(item.flatten()) for item in items], names, base)
+
+
+def is_select_statement(sql: str) -> bool:
+    """
+    是否为单条只读查询（SELECT / WITH ... SELECT），不包含数据修改或 DDL 语句
+
+    按词法单元判断，字符串常量中的关键字不影响结果。
+    """
+    statement = _statement(sql or "")
+    if statement is None or statement.get_type() != "SELECT":
+        return False
+    for token in statement.flatten():
+        if token.ttype in T.Keyword.DDL:
+            return False
+        if token.ttype in T.Keyword.DML and token.value.upper() != "SELECT":
+            return False
+    return True
+
+
+def _outer_tokens(tokens):
+    """最外层查询的词法单元（跳过括号内的子查询、CTE 和窗口定义）"""
+    for token in tokens:
+        if isinstance(token, sql_tree.Parenthesis):
+            continue
+        if token.is_group:
+            yield from _outer_tokens(token.tokens)
+        elif not token.is_whitespace and token.ttype not in T.Comment:
+            yield token
+
+
+@lru_cache(maxsize=1024)
+def has_row_limit(sql: str) -> bool:
+    """
+    最外层查询是否用 LIMIT / OFFSET / FETCH / TOP 截取结果行
+
+    无法解析为单条语句时返回 True（调用方按有截取处理）。
+    """
+    statement = _statement(sql or "")
+    if statement is None:
+        return True
+    recent: List[str] = []
+    for token in _outer_tokens(statement.tokens):
+        value = " ".join(token.value.split()).upper()
+        if token.ttype in T.Keyword and value in _ROW_LIMIT_KEYWORDS:
+            return True
+        # SQL Server 的 SELECT [DISTINCT] TOP n（sqlparse 不把 TOP 识别为关键字）
+        if token.ttype in T.Number and recent[-2:] in (["SELECT", "TOP"], ["DISTINCT", "TOP"]):
+            return True
+        recent.append(value)
+    return False
@@ -0,0 +1,12 @@
+-- Migration: 008_add_dataset_ingest_config.sql
+-- Description: 记录上传文件时检测到的解析参数（编码、分隔符、引号、表头）
+-- Date: 2026-10-18
+
+-- MySQL 语法
+ALTER TABLE datasets ADD COLUMN ingest_config JSON NULL COMMENT '上传文件时检测到的解析参数，按表名存储';
+
+-- =====================================================
+-- PostgreSQL 语法 (如果使用 PostgreSQL)
+-- =====================================================
+
+-- ALTER TABLE datasets ADD COLUMN IF NOT EXISTS ingest_config JSON;
@@ -0,0 +1,51 @@
+-- Migration: 009_add_ingest_jobs.sql
+-- Description: 异步文件导入任务表（进度、结果、重试）
+-- Date: 2026-10-18
+
+CREATE TABLE IF NOT EXISTS ingest_jobs (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    owner_id INT NULL,
+    dataset_id INT NULL COMMENT '导入成功后创建的数据集',
+    dataset_name VARCHAR(255) NOT NULL,
+    status VARCHAR(50) DEFAULT 'pending' COMMENT 'pending, running, completed, failed',
+    files JSON NOT NULL COMMENT '落盘文件列表，保留到任务成功',
+    options JSON NULL COMMENT '导入选项',
+    total_bytes BIGINT DEFAULT 0,
+    bytes_processed BIGINT DEFAULT 0,
+    rows_processed INT DEFAULT 0,
+    result JSON NULL COMMENT '每个文件的导入结果',
+    error_msg TEXT NULL,
+    attempts INT DEFAULT 0,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    started_at DATETIME NULL,
+    finished_at DATETIME NULL,
+
+    INDEX idx_ingest_jobs_status (status),
+
+    FOREIGN KEY (owner_id) REFERENCES users(id) ON DELETE SET NULL,
+    FOREIGN KEY (dataset_id) REFERENCES datasets(id) ON DELETE SET NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='文件导入任务表';
+
+-- =====================================================
+-- PostgreSQL 语法 (如果使用 PostgreSQL)
+-- =====================================================
+
+-- CREATE TABLE IF NOT EXISTS ingest_jobs (
+--     id SERIAL PRIMARY KEY,
+--     owner_id INTEGER REFERENCES users(id) ON DELETE SET NULL,
+--     dataset_id INTEGER REFERENCES datasets(id) ON DELETE SET NULL,
+--     dataset_name VARCHAR(255) NOT NULL,
+--     status VARCHAR(50) DEFAULT 'pending',
+--     files JSON NOT NULL,
+--     options JSON,
+--     total_bytes BIGINT DEFAULT 0,
+--     bytes_processed BIGINT DEFAULT 0,
+--     rows_processed INTEGER DEFAULT 0,
+--     result JSON,
+--     error_msg TEXT,
+--     attempts INTEGER DEFAULT 0,
+--     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+--     started_at TIMESTAMP,
+--     finished_at TIMESTAMP
+-- );
+-- CREATE INDEX IF NOT EXISTS idx_ingest_jobs_status ON ingest_jobs(status);
@@ -0,0 +1,12 @@
+-- Migration: 010_add_dataset_data_version.sql
+-- Description: 数据集数据版本号，追加/更新数据后递增，用于缓存失效
+-- Date: 2026-10-18
+
+-- MySQL 语法
+ALTER TABLE datasets ADD COLUMN data_version INT DEFAULT 1 COMMENT '数据版本，追加/更新数据后递增，用于缓存失效';
+
+-- =====================================================
+-- PostgreSQL 语法 (如果使用 PostgreSQL)
+-- =====================================================
+
+-- ALTER TABLE datasets ADD COLUMN IF NOT EXISTS data_version INTEGER DEFAULT 1;
@@ -0,0 +1,14 @@
+-- Migration: 011_add_dataset_content_hash.sql
+-- Description: 数据集上传内容指纹，重复上传相同内容时直接复用已导入和已训练的数据集
+-- Date: 2026-10-18
+
+-- MySQL 语法
+ALTER TABLE datasets ADD COLUMN content_hash VARCHAR(64) NULL COMMENT '上传内容指纹（文件哈希+工作表+表名），用于复用重复上传';
+CREATE INDEX ix_datasets_content_hash ON datasets (content_hash);
+
+-- =====================================================
+-- PostgreSQL 语法 (如果使用 PostgreSQL)
+-- =====================================================
+
+-- ALTER TABLE datasets ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64);
+-- CREATE INDEX IF NOT EXISTS ix_datasets_content_hash ON datasets (content_hash);
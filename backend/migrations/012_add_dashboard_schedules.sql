@@ -0,0 +1,72 @@
+-- Migration: 012_add_dashboard_schedules.sql
+-- Description: 看板预计算计划与执行记录
+-- Date: 2026-10-18
+
+CREATE TABLE IF NOT EXISTS dashboard_schedules (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    dashboard_id INT NOT NULL,
+    cron VARCHAR(100) NULL COMMENT '5 段 cron 表达式（分 时 日 月 周），与 interval_seconds 二选一',
+    interval_seconds INT NULL COMMENT '固定间隔（秒）',
+    jitter_seconds INT DEFAULT 0 COMMENT '随机延后 0~N 秒',
+    enabled BOOLEAN DEFAULT TRUE,
+    next_run_at DATETIME NULL COMMENT '下次执行时间（UTC）',
+    last_run_at DATETIME NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+
+    UNIQUE KEY uk_dashboard_schedules_dashboard (dashboard_id),
+    INDEX idx_dashboard_schedules_enabled (enabled),
+    INDEX idx_dashboard_schedules_next_run (next_run_at),
+
+    FOREIGN KEY (dashboard_id) REFERENCES dashboards(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='看板预计算计划表';
+
+CREATE TABLE IF NOT EXISTS dashboard_refresh_runs (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    dashboard_id INT NOT NULL,
+    status VARCHAR(50) DEFAULT 'running' COMMENT 'running, completed, partial, failed',
+    cards_total INT DEFAULT 0,
+    cards_failed INT DEFAULT 0,
+    elapsed_ms INT NULL,
+    details JSON NULL COMMENT '每张卡片的结果',
+    error_msg TEXT NULL,
+    started_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    finished_at DATETIME NULL,
+
+    INDEX idx_dashboard_refresh_runs_dashboard (dashboard_id),
+
+    FOREIGN KEY (dashboard_id) REFERENCES dashboards(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='看板预计算执行记录表';
+
+-- =====================================================
+-- PostgreSQL 语法 (如果使用 PostgreSQL)
+-- =====================================================
+
+-- CREATE TABLE IF NOT EXISTS dashboard_schedules (
+--     id SERIAL PRIMARY KEY,
+--     dashboard_id INTEGER NOT NULL UNIQUE REFERENCES dashboards(id) ON DELETE CASCADE,
+--     cron VARCHAR(100),
+--     interval_seconds INTEGER,
+--     jitter_seconds INTEGER DEFAULT 0,
+--     enabled BOOLEAN DEFAULT TRUE,
+--     next_run_at TIMESTAMP,
+--     last_run_at TIMESTAMP,
+--     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+--     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+-- );
+-- CREATE INDEX IF NOT EXISTS idx_dashboard_schedules_enabled ON dashboard_schedules(enabled);
+-- CREATE INDEX IF NOT EXISTS idx_dashboard_schedules_next_run ON dashboard_schedules(next_run_at);
+
+-- CREATE TABLE IF NOT EXISTS dashboard_refresh_runs (
+--     id SERIAL PRIMARY KEY,
+--     dashboard_id INTEGER NOT NULL REFERENCES dashboards(id) ON DELETE CASCADE,
+--     status VARCHAR(50) DEFAULT 'running',
+--     cards_total INTEGER DEFAULT 0,
+--     cards_failed INTEGER DEFAULT 0,
+--     elapsed_ms INTEGER,
+--     details JSON,
+--     error_msg TEXT,
+--     started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+--     finished_at TIMESTAMP
+-- );
+-- CREATE INDEX IF NOT EXISTS idx_dashboard_refresh_runs_dashboard ON dashboard_refresh_runs(dashboard_id);
@@ -0,0 +1,16 @@
+-- Migration: 013_add_dashboard_card_refresh_mode.sql
+-- Description: 看板卡片增量刷新配置（只重算最近的时间窗口）
+-- Date: 2026-10-18
+
+-- MySQL 语法
+ALTER TABLE dashboard_cards ADD COLUMN refresh_mode VARCHAR(20) DEFAULT 'full' COMMENT 'full: 全量重算, incremental: 只重算最近的时间窗口';
+ALTER TABLE dashboard_cards ADD COLUMN time_column VARCHAR(255) NULL COMMENT '增量刷新的时间列，为空时自动识别';
+ALTER TABLE dashboard_cards ADD COLUMN incremental_window_days INT NULL COMMENT '增量重算窗口（天），为空时使用默认值';
+
+-- =====================================================
+-- PostgreSQL 语法 (如果使用 PostgreSQL)
+-- =====================================================
+
+-- ALTER TABLE dashboard_cards ADD COLUMN IF NOT EXISTS refresh_mode VARCHAR(20) DEFAULT 'full';
+-- ALTER TABLE dashboard_cards ADD COLUMN IF NOT EXISTS time_column VARCHAR(255);
+-- ALTER TABLE dashboard_cards ADD COLUMN IF NOT EXISTS incremental_window_days INTEGER;
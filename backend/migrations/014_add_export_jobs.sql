@@ -0,0 +1,51 @@
+-- Migration: 014_add_export_jobs.sql
+-- Description: 异步导出任务表（进程池渲染，导出文件按查询、数据版本和格式缓存）
+-- Date: 2026-10-19
+
+CREATE TABLE IF NOT EXISTS export_jobs (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    owner_id INT NULL,
+    dataset_id INT NULL,
+    format VARCHAR(50) NOT NULL COMMENT 'excel, excel_with_chart, pdf, csv',
+    status VARCHAR(50) DEFAULT 'pending' COMMENT 'pending, running, completed, failed',
+    cache_key VARCHAR(64) NOT NULL COMMENT 'sha256(查询 + 数据版本 + 格式 + 报告内容)，导出文件的存储键',
+    params JSON NULL COMMENT '导出参数',
+    filename VARCHAR(255) NULL COMMENT '下载文件名',
+    row_count INT NULL,
+    size_bytes BIGINT NULL,
+    from_cache BOOLEAN DEFAULT FALSE COMMENT '直接复用了已缓存的导出文件',
+    error_msg TEXT NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    started_at DATETIME NULL,
+    finished_at DATETIME NULL,
+
+    INDEX idx_export_jobs_status (status),
+    INDEX idx_export_jobs_cache_key (cache_key),
+
+    FOREIGN KEY (owner_id) REFERENCES users(id) ON DELETE SET NULL,
+    FOREIGN KEY (dataset_id) REFERENCES datasets(id) ON DELETE SET NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='异步导出任务表';
+
+-- =====================================================
+-- PostgreSQL 语法 (如果使用 PostgreSQL)
+-- =====================================================
+
+-- CREATE TABLE IF NOT EXISTS export_jobs (
+--     id SERIAL PRIMARY KEY,
+--     owner_id INTEGER REFERENCES users(id) ON DELETE SET NULL,
+--     dataset_id INTEGER REFERENCES datasets(id) ON DELETE SET NULL,
+--     format VARCHAR(50) NOT NULL,
+--     status VARCHAR(50) DEFAULT 'pending',
+--     cache_key VARCHAR(64) NOT NULL,
+--     params JSON,
+--     filename VARCHAR(255),
+--     row_count INTEGER,
+--     size_bytes BIGINT,
+--     from_cache BOOLEAN DEFAULT FALSE,
+--     error_msg TEXT,
+--     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+--     started_at TIMESTAMP,
+--     finished_at TIMESTAMP
+-- );
+-- CREATE INDEX IF NOT EXISTS idx_export_jobs_status ON export_jobs(status);
+-- CREATE INDEX IF NOT EXISTS idx_export_jobs_cache_key ON export_jobs(cache_key);
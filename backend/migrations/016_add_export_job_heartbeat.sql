@@ -0,0 +1,14 @@
+-- Migration: 016_add_export_job_heartbeat.sql
+-- Description: 导出任务记录执行实例和心跳，启动时只回收本实例或心跳超时的任务
+-- Date: 2026-10-19
+
+-- MySQL 语法
+ALTER TABLE export_jobs ADD COLUMN worker_id VARCHAR(255) NULL COMMENT '执行任务的实例标识';
+ALTER TABLE export_jobs ADD COLUMN heartbeat_at DATETIME NULL COMMENT '执行期间定期刷新的心跳时间';
+
+-- =====================================================
+-- PostgreSQL 语法 (如果使用 PostgreSQL)
+-- =====================================================
+
+-- ALTER TABLE export_jobs ADD COLUMN IF NOT EXISTS worker_id VARCHAR(255);
+-- ALTER TABLE export_jobs ADD COLUMN IF NOT EXISTS heartbeat_at TIMESTAMP;
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+看板预计算工作进程
+
+按看板的刷新计划在后台执行卡片查询并写入结果缓存，与 API 服务分开运行：
+
+    python run_dashboard_scheduler.py
+"""
+
+import asyncio
+import sys
+
+from app.core.logger import get_logger, setup_logging
+from app.core.redis import redis_service
+from app.services.dashboard_scheduler import DashboardScheduler
+
+setup_logging()
+logger = get_logger(__name__)
+
+
+async def main():
+    try:
+        await redis_service.init()
+    except Exception as e:
+        # 没有 Redis 时预计算结果无处保存，以非零状态退出，由进程管理器发现并重启
+        logger.error("Redis initialization failed, dashboard scheduler cannot run", error=str(e))
+        sys.exit(1)
+    try:
+        await DashboardScheduler.run_forever()
+    finally:
+        await redis_service.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
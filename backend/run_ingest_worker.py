@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+文件导入工作进程
+
+认领上传请求创建的导入任务（ingest_jobs）并执行解析、导入和训练，与 API 服务分开运行：
+
+    python run_ingest_worker.py
+
+需要与 API 服务共享 UPLOAD_TEMP_DIR（任务落盘文件）和 DUCKDB_DATABASE_DIR（数据集文件）。
+"""
+
+import asyncio
+
+from app.core.logger import get_logger, setup_logging
+from app.core.redis import redis_service
+from app.services.ingest_job_service import IngestJobService
+from app.services.parallel_ingest import shutdown_ingest_pool
+
+setup_logging()
+logger = get_logger(__name__)
+
+
+async def main():
+    try:
+        await redis_service.init()
+    except Exception as e:
+        # Redis 只用于训练后清理查询缓存，不可用时仍可导入
+        logger.warning("Redis initialization failed, running without cache", error=str(e))
+
+    # 上次退出时未完成的导入任务标记为失败（可重试），并清理过期的落盘文件
+    try:
+        await asyncio.to_thread(IngestJobService.recover_interrupted)
+    except Exception as e:
+        logger.warning("Ingest job recovery failed", error=str(e))
+
+    try:
+        await IngestJobService.run_forever()
+    finally:
+        shutdown_ingest_pool()
+        await redis_service.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
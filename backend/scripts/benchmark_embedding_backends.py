@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Embedding 后端基准测试
+
+用途：
+    在切换 EMBEDDING_BACKEND 之前，用 PGVector 中已存储的训练文档对比各后端：
+    - 模型加载耗时
+    - 批量编码吞吐（docs/s）
+    - 单条查询编码延迟（p50 / p95）
+    - 与 torch 基准向量的余弦一致性（平均 / 最小）
+    - 检索召回一致性：以 torch 向量的 top-k 近邻为基准，计算各后端 recall@k
+      - stored@k: 新后端编码查询、检索已存储的 torch 向量（不重建直接切换）
+      - rebuilt@k: 全部向量用新后端重建后检索（切换并重新训练）
+
+    已存储的向量由 torch 后端生成，只有 stored@k 接近 1.0 的后端才可以在不重新训练的情况下直接切换；
+    否则切换后端时需要重新训练，此时以 rebuilt@k 评估检索质量。
+
+使用方法：
+    python scripts/benchmark_embedding_backends.py [--backends torch,onnx,onnx_int8,torch_int8]
+                                                   [--collection vec_ds_1_ddl] [--limit 500]
+
+参数：
+    --backends: 逗号分隔的后端列表，第一个后端作为基准（默认 torch,torch_int8,onnx,onnx_int8）
+    --collection: 只使用指定 collection 的文档（默认所有 vec_ds_ 开头的 collection）
+    --limit: 最多采样的文档数量（默认 500）
+    --queries: 用于测量延迟和召回的查询数量（默认 50）
+    --k: 召回评估的 top-k（默认 10）
+    --batch-size: 批量编码的批大小（默认 32）
+"""
+
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import create_engine, text
+
+from app.core.config import settings
+from app.core.logger import get_logger
+from app.services.vanna.base import EMBEDDING_BACKENDS, create_embedding_function
+
+logger = get_logger(__name__)
+
+
+def load_documents(collection: str | None, limit: int) -> list[str]:
+    """
+    从 langchain_pg_embedding 采样已存储的训练文档
+
+    Args:
+        collection: collection 名称，None 表示所有数据集 collection
+        limit: 最大文档数
+
+    Returns:
+        list[str]: 文档内容
+    """
+    engine = create_engine(settings.PG_CONNECTION_STRING)
+    sql = """
+        SELECT e.document
+        FROM langchain_pg_embedding e
+        JOIN langchain_pg_collection c ON e.collection_id = c.uuid
+        WHERE c.name LIKE :pattern AND e.document IS NOT NULL AND e.document <> ''
+        ORDER BY e.id
+        LIMIT :limit
+    """
+    pattern = collection if collection else "vec_ds_%"
+    try:
+        with engine.connect() as conn:
+            rows = conn.execute(text(sql), {"pattern": pattern, "limit": limit}).fetchall()
+    finally:
+        engine.dispose()
+    return [row[0] for row in rows]
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _top_k(doc_vectors: np.ndarray, query_vectors: np.ndarray, k: int) -> list[set[int]]:
+    scores = query_vectors @ doc_vectors.T
+    k = min(k, doc_vectors.shape[0])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return [set(row.tolist()) for row in top]
+
+
+def benchmark_backend(backend: str, documents: list[str], queries: list[str], batch_size: int) -> dict:
+    """
+    测试单个后端
+
+    Returns:
+        dict: 加载耗时、吞吐、延迟以及文档/查询向量
+    """
+    start = time.perf_counter()
+    embeddings = create_embedding_function(backend, settings.EMBEDDING_MODEL, settings.EMBEDDING_ONNX_INT8_FILE)
+    load_time = time.perf_counter() - start
+
+    # 预热，避免首批次的图初始化计入吞吐
+    embeddings.embed_documents(documents[:batch_size])
+
+    start = time.perf_counter()
+    doc_vectors = []
+    for i in range(0, len(documents), batch_size):
+        doc_vectors.extend(embeddings.embed_documents(documents[i:i + batch_size]))
+    encode_time = time.perf_counter() - start
+
+    latencies = []
+    query_vectors = []
+    for query in queries:
+        start = time.perf_counter()
+        query_vectors.append(embeddings.embed_query(query))
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    return {
+        "backend": backend,
+        "load_time_s": load_time,
+        "throughput": len(documents) / encode_time if encode_time > 0 else float("inf"),
+        "latency_p50_ms": float(np.percentile(latencies, 50)),
+        "latency_p95_ms": float(np.percentile(latencies, 95)),
+        "doc_vectors": _normalize(np.asarray(doc_vectors, dtype=np.float32)),
+        "query_vectors": _normalize(np.asarray(query_vectors, dtype=np.float32)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比 embedding 后端的吞吐、延迟和召回一致性")
+    parser.add_argument("--backends", default=",".join(EMBEDDING_BACKENDS), help="逗号分隔的后端列表，第一个作为基准")
+    parser.add_argument("--collection", default=None, help="只使用指定 collection 的文档")
+    parser.add_argument("--limit", type=int, default=500, help="最多采样的文档数量")
+    parser.add_argument("--queries", type=int, default=50, help="查询数量")
+    parser.add_argument("--k", type=int, default=10, help="召回评估的 top-k")
+    parser.add_argument("--batch-size", type=int, default=32, help="批量编码的批大小")
+
+    args = parser.parse_args()
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+
+    logger.info("=" * 60)
+    logger.info("Embedding 后端基准测试")
+    logger.info("=" * 60)
+    logger.info(f"模型: {settings.EMBEDDING_MODEL}")
+    logger.info(f"后端: {', '.join(backends)}（基准: {backends[0]}）")
+
+    documents = load_documents(args.collection, args.limit)
+    if len(documents) < 2:
+        logger.error("❌ PGVector 中可用的训练文档不足，请先训练至少一个数据集")
+        return
+    # 以文档本身作为查询：检索场景中问题与 DDL/文档的分布接近，且无需额外标注
+    rng = np.random.default_rng(0)
+    query_idx = rng.choice(len(documents), size=min(args.queries, len(documents)), replace=False)
+    queries = [documents[i] for i in query_idx]
+    logger.info(f"采样文档: {len(documents)}，查询: {len(queries)}")
+
+    results = []
+    for backend in backends:
+        try:
+            results.append(benchmark_backend(backend, documents, queries, args.batch_size))
+            logger.info(f"✅ {backend} 完成")
+        except Exception as e:
+            logger.error(f"❌ {backend} 失败: {e}")
+
+    if not results:
+        return
+
+    reference = results[0]
+    reference_top_k = _top_k(reference["doc_vectors"], reference["query_vectors"], args.k)
+
+    header = f"{'backend':<12}{'load(s)':>10}{'docs/s':>10}{'p50(ms)':>10}{'p95(ms)':>10}{'cos_avg':>10}{'cos_min':>10}{'stored@k':>10}{'rebuilt@k':>11}"
+    print("\n" + header)
+    print("-" * len(header))
+    for result in results:
+        cosine = np.sum(result["doc_vectors"] * reference["doc_vectors"], axis=1)
+        top_k = _top_k(reference["doc_vectors"], result["query_vectors"], args.k)
+        own_top_k = _top_k(result["doc_vectors"], result["query_vectors"], args.k)
+        # stored: 用新后端的查询向量检索已存储（基准）向量；rebuilt: 全部向量用新后端重建后的检索
+        recall_stored = np.mean([len(a & b) / len(b) for a, b in zip(top_k, reference_top_k)])
+        recall_rebuilt = np.mean([len(a & b) / len(b) for a, b in zip(own_top_k, reference_top_k)])
+        print(
+            f"{result['backend']:<12}{result['load_time_s']:>10.2f}{result['throughput']:>10.1f}"
+            f"{result['latency_p50_ms']:>10.2f}{result['latency_p95_ms']:>10.2f}"
+            f"{cosine.mean():>10.4f}{cosine.min():>10.4f}{recall_stored:>10.3f}{recall_rebuilt:>11.3f}"
+        )
+
+    print(f"\nstored@k: 使用该后端编码查询、检索已存储（{reference['backend']}）向量时 recall@{args.k} 与基准结果的重合度（不重建向量直接切换）")
+    print(f"rebuilt@k: 全部向量用该后端重建后检索的 recall@{args.k}（切换后端并重建向量）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Excel 导出基准测试
+
+用途：
+    对比两种 Excel 导出方式的耗时和峰值内存：
+    - legacy: 原实现，一次性读取完整结果，pandas ExcelWriter 在内存中构建工作簿，遍历全部单元格计算列宽
+    - streaming: QueryExporter 分块读取 + StreamingExcelWriter（write-only 模式，样本行估算列宽，写入临时文件）
+
+    每个用例在独立子进程中运行，峰值内存为子进程的最大常驻内存（ru_maxrss）。
+
+使用方法：
+    python scripts/benchmark_excel_export.py [--rows 100000,1000000] [--modes streaming,legacy]
+
+参数：
+    --rows: 逗号分隔的行数列表（默认 100000,1000000）
+    --modes: 逗号分隔的导出方式（默认 streaming,legacy）
+    --legacy-max-rows: legacy 方式的最大行数，超过时跳过（默认 1000000）
+"""
+
+import sys
+import time
+import argparse
+import resource
+import tempfile
+import multiprocessing
+from pathlib import Path
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import duckdb
+
+from app.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+SQL = "SELECT * FROM orders"
+
+
+def prepare_dataset(path: str, rows: int):
+    """生成测试数据：整数、日期、分类文本、金额和备注"""
+    conn = duckdb.connect(path)
+    conn.execute(f"""
+        CREATE TABLE orders AS
+        SELECT
+            range AS order_id,
+            DATE '2024-01-01' + CAST(range % 365 AS INTEGER) AS order_date,
+            '区域' || CAST(range % 20 AS VARCHAR) AS region,
+            ROUND(random() * 10000, 2) AS amount,
+            'note-' || md5(CAST(range AS VARCHAR)) AS note
+        FROM range({rows})
+    """)
+    conn.close()
+
+
+def export_legacy(path: str, output_path: str):
+    import pandas as pd
+
+    conn = duckdb.connect(path, read_only=True)
+    df = conn.execute(SQL).fetchdf()
+    conn.close()
+    # 原接口从 rows 列表重建 DataFrame
+    rows = df.to_dict(orient="records")
+    df = pd.DataFrame(rows, columns=list(df.columns))
+    with pd.ExcelWriter(output_path, engine="openpyxl") as writer:
+        df.to_excel(writer, index=False, sheet_name="数据")
+        worksheet = writer.sheets["数据"]
+        for idx, col in enumerate(df.columns):
+            max_length = max(df[col].astype(str).apply(len).max(), len(str(col)))
+            worksheet.column_dimensions[chr(65 + idx)].width = min(max_length + 2, 50)
+
+
+def export_streaming(path: str, output_path: str):
+    import shutil
+
+    from app.services.data_exporter import DataExporter
+    from app.services.query_exporter import QueryExporter
+
+    target = {"duckdb_path": path, "engine": None}
+    output, _ = DataExporter.export_frames_to_excel(QueryExporter.open_frames(target, SQL))
+    with output, open(output_path, "wb") as f:
+        shutil.copyfileobj(output, f)
+
+
+def _run_case(mode: str, path: str, output_path: str, queue):
+    start = time.perf_counter()
+    {"legacy": export_legacy, "streaming": export_streaming}[mode](path, output_path)
+    elapsed = time.perf_counter() - start
+    # Linux 下 ru_maxrss 单位为 KB
+    queue.put((elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+
+def run_case(mode: str, path: str, output_path: str) -> tuple[float, float]:
+    """在独立子进程中运行一个用例，返回 (耗时秒数, 峰值内存 MB)"""
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    process = ctx.Process(target=_run_case, args=(mode, path, output_path, queue))
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        raise RuntimeError(f"子进程退出码 {process.exitcode}")
+    return queue.get()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比 Excel 导出方式的耗时和峰值内存")
+    parser.add_argument("--rows", default="100000,1000000", help="逗号分隔的行数列表")
+    parser.add_argument("--modes", default="streaming,legacy", help="逗号分隔的导出方式")
+    parser.add_argument("--legacy-max-rows", type=int, default=1000000, help="legacy 方式的最大行数")
+
+    args = parser.parse_args()
+    row_counts = [int(r) for r in args.rows.split(",") if r.strip()]
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+
+    logger.info("=" * 60)
+    logger.info("Excel 导出基准测试")
+    logger.info("=" * 60)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in row_counts:
+            path = str(Path(tmp) / f"orders_{rows}.db")
+            prepare_dataset(path, rows)
+            logger.info(f"已生成 {rows} 行测试数据")
+            for mode in modes:
+                if mode == "legacy" and rows > args.legacy_max_rows:
+                    logger.info(f"跳过 legacy（{rows} 行超过 --legacy-max-rows）")
+                    continue
+                output_path = str(Path(tmp) / f"{mode}_{rows}.xlsx")
+                try:
+                    elapsed, peak_mb = run_case(mode, path, output_path)
+                except Exception as e:
+                    logger.error(f"❌ {mode} {rows} 行失败: {e}")
+                    continue
+                size_mb = Path(output_path).stat().st_size / 1024 / 1024
+                results.append((mode, rows, elapsed, rows / elapsed, peak_mb, size_mb))
+                logger.info(f"✅ {mode} {rows} 行完成")
+
+    header = f"{'mode':<12}{'rows':>10}{'time(s)':>10}{'rows/s':>12}{'peak(MB)':>10}{'file(MB)':>10}"
+    print("\n" + header)
+    print("-" * len(header))
+    for mode, rows, elapsed, throughput, peak_mb, size_mb in results:
+        print(f"{mode:<12}{rows:>10}{elapsed:>10.1f}{throughput:>12.0f}{peak_mb:>10.0f}{size_mb:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+创建并校验 PGVector 索引（部署后的显式迁移步骤）
+
+用途：
+    在共享的 langchain_pg_embedding 表上创建 collection_id 索引和向量索引（CONCURRENTLY，不阻塞读写）。
+    embedding 列未声明维度时，向量索引需要先将列类型收紧为 vector(N)：
+    ALTER TABLE 持有 ACCESS EXCLUSIVE 锁并重写整张表，且此后只能写入 N 维向量，
+    因此需要显式传入 --fix-dimension，并应在维护窗口执行。
+
+使用方法：
+    python scripts/ensure_vector_indexes.py [--method hnsw] [--fix-dimension]
+
+参数：
+    --method: 向量索引类型 hnsw / ivfflat / none（默认使用 PGVECTOR_INDEX_METHOD）
+    --fix-dimension: 允许将未声明维度的 embedding 列收紧为 vector(N)
+"""
+
+import sys
+import argparse
+from pathlib import Path
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core.logger import get_logger
+from app.services.vanna.vector_store_maintenance import VectorStoreMaintenance
+
+logger = get_logger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="创建并校验 PGVector 索引")
+    parser.add_argument("--method", default=None, help="向量索引类型: hnsw, ivfflat, none")
+    parser.add_argument("--fix-dimension", action="store_true", help="将未声明维度的 embedding 列收紧为 vector(N)")
+    args = parser.parse_args()
+
+    result = VectorStoreMaintenance.ensure_indexes(args.method, fix_dimension=args.fix_dimension)
+
+    print(f"\nembedding 列类型: {result['embedding_type']}")
+    for index in result["indexes"]:
+        status = "valid" if index["valid"] else "INVALID"
+        print(f"  {index['name']:<45}{index['method']:<10}{status:<10}{index['size_bytes'] / 1024 / 1024:>8.1f} MB")
+    if not result["has_ann_index"]:
+        logger.warning("未创建向量索引：embedding 列未声明维度时需要 --fix-dimension")
+
+
+if __name__ == "__main__":
+    main()
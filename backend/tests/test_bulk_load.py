@@ -0,0 +1,104 @@
+"""
+上传数据批量写入测试（SQLite）
+"""
+import pandas as pd
+import pytest
+from sqlalchemy import inspect, text
+
+from app.models.metadata import DataSource
+from app.services.file_etl import FileETLService
+
+
+def _sqlite_datasource(tmp_path) -> DataSource:
+    return DataSource(name="local", type="sqlite", host=str(tmp_path / "upload.db"), port=0,
+                      username="", password_encrypted=None, database_name="")
+
+
+class TestBulkLoad:
+    """测试按推断类型建表并批量写入"""
+
+    def test_write_keeps_inferred_schema(self, tmp_path):
+        """测试写入后表结构为推断的类型，而不是 pandas 默认类型"""
+        datasource = _sqlite_datasource(tmp_path)
+        df = FileETLService.parse_file(
+            "id,amount,day,name\n1,10.50,2024-01-01,a\n2,,2024-01-02,\n".encode("utf-8"), "t.csv"
+        )
+
+        rows = FileETLService.write_to_database(df, "t_sales", datasource, db_session=None)
+
+        engine = FileETLService._get_upload_engine(datasource)
+        types = {c["name"]: str(c["type"]) for c in inspect(engine).get_columns("t_sales")}
+        assert rows == 2
+        assert types["id"] == "INTEGER"
+        assert types["day"] == "DATE"
+        with engine.connect() as conn:
+            values = conn.execute(text('SELECT amount, name FROM t_sales ORDER BY id')).fetchall()
+        assert values[1] == (None, None)
+
+    def test_batches_reuse_engine_and_report_speed(self, tmp_path):
+        """测试分批写入复用同一个引擎并返回写入速度，重复上传时替换旧表"""
+        datasource = _sqlite_datasource(tmp_path)
+        batches = [pd.DataFrame({"k": range(i, i + 3), "v": ["x"] * 3}) for i in (0, 3)]
+
+        for _ in range(2):
+            stats = FileETLService.write_batches_to_database(iter(batches), "t_batch", datasource, db_session=None)
+
+        assert stats["rows"] == 6
+        assert stats["columns"] == 2
+        assert stats["rows_per_second"] > 0
+        assert FileETLService._get_upload_engine(datasource) is FileETLService._get_upload_engine(datasource)
+        with FileETLService._get_upload_engine(datasource).connect() as conn:
+            assert conn.execute(text("SELECT count(*) FROM t_batch")).scalar() == 6
+
+    def test_later_batches_widen_column_types(self, tmp_path):
+        """测试后续批次出现小数、文本和超长文本时放宽列类型，数据完整写入"""
+        datasource = _sqlite_datasource(tmp_path)
+        batches = [
+            pd.DataFrame({"n": [1, 2], "s": ["a", "b"], "d": pd.to_datetime(["2024-01-01", "2024-01-02"])}),
+            pd.DataFrame({"n": [2.5, None], "s": ["x" * 600, None], "d": [None, None]}),
+            pd.DataFrame({"n": ["N/A", "3"], "s": ["c", "d"], "d": pd.to_datetime(["2024-01-03 08:30", None])}),
+        ]
+        stats = FileETLService.write_batches_to_database(iter(batches), "t_widen", datasource, db_session=None)
+        assert stats["rows"] == 6
+        with FileETLService._get_upload_engine(datasource).connect() as conn:
+            values = conn.execute(text("SELECT n, length(s) FROM t_widen")).fetchall()
+        assert [v[0] for v in values][:5] == [1, 2, 2.5, None, "N/A"]
+        assert values[2][1] == 600
+
+        assert FileETLService._widen_sql_type("integer", "float") == "float"
+        assert FileETLService._widen_sql_type("decimal", "bigint") == "decimal"
+        assert FileETLService._widen_sql_type("date", "datetime") == "datetime"
+        assert FileETLService._widen_sql_type("string", "integer") == "string"
+        assert FileETLService._widen_sql_type("string", "text") == "text"
+        assert FileETLService._widen_sql_type("integer", "string") == "text"
+        assert FileETLService._widen_sql_type("boolean", "date") == "text"
+
+    def test_failed_load_drops_partial_table(self, tmp_path):
+        """测试写入中途失败时删除已创建的表"""
+        datasource = _sqlite_datasource(tmp_path)
+
+        def batches():
+            yield pd.DataFrame({"k": [1, 2]})
+            raise ValueError("解析失败")
+
+        with pytest.raises(ValueError, match="解析失败"):
+            FileETLService.write_batches_to_database(batches(), "t_partial", datasource, db_session=None)
+        assert not inspect(FileETLService._get_upload_engine(datasource)).has_table("t_partial")
+
+    def test_copy_payload_writes_missing_values_as_null(self):
+        """测试 COPY 数据块中缺失值写为未加引号的空字段（NULL），空字符串写为加引号的空字段"""
+        df = pd.DataFrame({
+            "amount": [1.5, float("nan"), 2.0],
+            "qty": pd.array([1, None, 3], dtype="Int64"),
+            "day": pd.to_datetime(["2024-01-01", None, "2024-01-03"]),
+            "name": ["a,b", None, ""],
+        })
+        lines = FileETLService._copy_payload(df).splitlines()
+        assert lines[0] == '1.5,1,"2024-01-01","a,b"'
+        assert lines[1] == ',,,'
+        assert lines[2] == '2.0,3,"2024-01-03",""'
+
+    def test_copy_payload_keeps_decimal_digits(self):
+        """测试定点数按原始文本写入 COPY 数据块，不经过浮点数"""
+        df = FileETLService.parse_file("amount\n12345678901234567.1234\n\n".encode("utf-8"), "a.csv")
+        assert FileETLService._copy_payload(df).splitlines()[0] == '12345678901234567.1234'
@@ -0,0 +1,85 @@
+"""
+图表降采样测试
+"""
+import numpy as np
+import pandas as pd
+
+from app.services.chart_downsampler import ChartDownsampler
+
+
+def _series(n: int = 20000) -> pd.DataFrame:
+    values = np.sin(np.arange(n) / 300.0)
+    values[n // 3] = 50.0  # 尖峰
+    return pd.DataFrame({"ts": pd.date_range("2024-01-01", periods=n, freq="min"), "value": values})
+
+
+class TestChartDownsampler:
+    """测试按图表类型降采样"""
+
+    def test_small_result_unchanged(self):
+        """测试未超过上限或不支持的图表类型不做处理"""
+        df = _series(500)
+        assert ChartDownsampler.reduce(df, "line", max_points=1000)[1] is None
+        assert ChartDownsampler.reduce(_series(), "pie", max_points=1000)[1] is None
+
+    def test_lttb_keeps_shape_and_peaks(self):
+        """测试 LTTB 保留首尾点和尖峰，点数不超过上限"""
+        df = _series()
+        reduced, method = ChartDownsampler.reduce(df, "line", max_points=500)
+        assert method == "lttb"
+        assert len(reduced) == 500
+        assert reduced["value"].max() == 50.0
+        assert reduced.index[0] == 0 and reduced.index[-1] == len(df) - 1
+        assert reduced.index.is_monotonic_increasing
+
+    def test_minmax_per_series(self):
+        """测试多个数值列使用分桶最小/最大值，分类列拆分为多条序列"""
+        df = _series()
+        df["other"] = -df["value"]
+        df["region"] = np.where(np.arange(len(df)) % 2, "east", "west")
+        reduced, method = ChartDownsampler.reduce(df, "area", max_points=400)
+        assert method == "minmax"
+        assert len(reduced) <= 400
+        assert set(reduced["region"]) == {"east", "west"}
+        assert reduced["value"].max() == 50.0 and reduced["other"].min() == -50.0
+
+    def test_iso_string_axis(self):
+        """测试缓存中的 ISO 字符串时间列可以作为横轴"""
+        df = _series()
+        df["ts"] = df["ts"].dt.strftime("%Y-%m-%dT%H:%M:%S")
+        reduced, method = ChartDownsampler.reduce(df, "line", max_points=300)
+        assert method == "lttb" and len(reduced) == 300
+
+    def test_scatter_grid(self):
+        """测试散点图网格抽稀保留离群点"""
+        rng = np.random.default_rng(0)
+        df = pd.DataFrame({"x": rng.normal(size=20000), "y": rng.normal(size=20000)})
+        df.loc[123, ["x", "y"]] = [40.0, 40.0]
+        reduced, method = ChartDownsampler.reduce(df, "scatter", max_points=400)
+        assert method == "grid"
+        assert len(reduced) <= 400
+        assert 123 in reduced.index
+
+    def test_histogram_binning(self):
+        """测试直方图按数值横轴分箱，分类横轴不处理"""
+        df = pd.DataFrame({"price": np.arange(5000, dtype=float)})
+        reduced, method = ChartDownsampler.reduce(df, "histogram", max_points=1000)
+        assert method == "binning"
+        assert reduced.columns.tolist() == ["price", "count"]
+        assert reduced["count"].sum() == 5000
+
+        weighted = pd.DataFrame({"price": np.arange(5000, dtype=float), "qty": 2.0})
+        assert ChartDownsampler.reduce(weighted, "histogram", max_points=1000)[0]["qty"].sum() == 10000
+
+        categories = pd.DataFrame({"region": [f"r{i}" for i in range(5000)], "qty": 1})
+        assert ChartDownsampler.reduce(categories, "histogram", max_points=1000)[1] is None
+
+    def test_bar_and_non_additive_measures_not_binned(self):
+        """测试普通柱状图不分箱，直方图的指标为平均值或比率时不分箱"""
+        df = pd.DataFrame({"year": np.arange(5000), "qty": 2.0})
+        reduced, method = ChartDownsampler.reduce(df, "bar", max_points=1000)
+        assert method is None and reduced is df
+
+        for column in ("avg_price", "conversion_rate", "客单价均值"):
+            averages = pd.DataFrame({"price": np.arange(5000, dtype=float), column: 1.5})
+            assert ChartDownsampler.reduce(averages, "histogram", max_points=1000)[1] is None
@@ -0,0 +1,276 @@
+"""
+分批流式导入测试
+"""
+import duckdb
+import pytest
+from openpyxl import Workbook
+
+from app.services.duckdb_service import DuckDBService
+from app.services.file_etl import FileETLService
+
+
+class TestFileBatches:
+    """测试按固定行数分批读取文件"""
+
+    def test_csv_batches(self, tmp_path):
+        """测试 CSV 分批读取、列名清理与进度回调"""
+        path = tmp_path / "sales.csv"
+        path.write_text("Order ID,amount\n" + "".join(f"{i},{i * 1.5}\n" for i in range(10)), encoding="gbk")
+
+        progress = []
+        batches = list(FileETLService.iter_file_batches(
+            str(path), "sales.csv", batch_size=4, progress_callback=lambda done, total: progress.append((done, total))
+        ))
+
+        assert [len(b) for b in batches] == [4, 4, 2]
+        assert list(batches[0].columns) == ["Order_ID", "amount"]
+        assert progress[-1][0] == progress[-1][1]
+
+    def test_encoding_fallback_after_sample(self, tmp_path):
+        """测试非 ASCII 字节出现在检测样本之后时换用后备编码，不丢行也不重复"""
+        path = tmp_path / "late_gbk.csv"
+        rows = "id,city\n" + "".join(f"{i},city{i}\n" for i in range(30000))
+        path.write_bytes(rows.encode("ascii") + "30000,北京\n".encode("gbk"))
+        assert path.stat().st_size > FileETLService.ENCODING_SAMPLE_BYTES
+
+        settings = FileETLService.detect_parse_settings(str(path), "late_gbk.csv")
+        assert settings["encoding"] == "utf-8"
+        batches = list(FileETLService.iter_file_batches(str(path), "late_gbk.csv", batch_size=10000, parse_settings=settings))
+        ids = [i for batch in batches for i in batch["id"].tolist()]
+        assert ids == list(range(30001))
+        assert batches[-1]["city"].iloc[-1] == "北京"
+        assert settings["encoding"] == "gbk"
+
+        df = FileETLService.parse_file(str(path), "late_gbk.csv")
+        assert len(df) == 30001 and df["city"].iloc[-1] == "北京"
+
+    def test_xlsx_batches_streaming(self, tmp_path):
+        """测试 XLSX 只读模式流式读取，跳过空行，混合类型列转为文本"""
+        path = tmp_path / "orders.xlsx"
+        wb = Workbook()
+        ws = wb.active
+        ws.append(["code", "qty"])
+        ws.append([1, 10])
+        ws.append([None, None])
+        ws.append(["A-2", 20])
+        ws.append([3, 30])
+        wb.save(path)
+
+        batches = list(FileETLService.iter_file_batches(str(path), "orders.xlsx", batch_size=2))
+
+        assert [len(b) for b in batches] == [2, 1]
+        assert batches[0]["code"].tolist() == ["1", "A-2"]
+        assert batches[1]["qty"].tolist() == [30]
+
+    def test_parse_xlsx_streams_with_row_limit(self, tmp_path, monkeypatch):
+        """测试解析 XLSX 走只读流式读取，跨批次的混合类型列统一为文本，超过行数上限时报错"""
+        path = tmp_path / "orders.xlsx"
+        wb = Workbook()
+        ws = wb.active
+        ws.append(["code", "qty"])
+        for i in range(5):
+            ws.append([i if i < 3 else f"A-{i}", i * 10])
+        wb.save(path)
+        monkeypatch.setattr(FileETLService, "INGEST_BATCH_ROWS", 2)
+
+        df = FileETLService.parse_file(path.read_bytes(), "orders.xlsx")
+        assert df["code"].tolist() == ["0", "1", "2", "A-3", "A-4"]
+        assert df["qty"].tolist() == [0, 10, 20, 30, 40]
+
+        monkeypatch.setattr(FileETLService, "MAX_ROWS", 3)
+        with pytest.raises(ValueError, match="行数超过限制"):
+            FileETLService.parse_file(str(path), "orders.xlsx")
+
+
+class TestImportBatches:
+    """测试 DuckDB 分批导入"""
+
+    def test_widens_column_types_across_batches(self, tmp_path):
+        """测试后续批次出现不兼容类型时放宽列类型"""
+        path = tmp_path / "data.csv"
+        path.write_text("id,value\n1,1\n2,2\n3,2.5\n4,3.5\n5,abc\n", encoding="utf-8")
+        db_path = str(tmp_path / "dataset.db")
+
+        rows_seen = []
+        result = DuckDBService.import_batches(
+            db_path,
+            "data",
+            FileETLService.iter_file_batches(str(path), "data.csv", batch_size=2),
+            progress_callback=rows_seen.append,
+        )
+
+        assert result["rows"] == 5
+        assert result["batches"] == 3
+        assert rows_seen == [2, 4, 5]
+        conn = duckdb.connect(db_path, read_only=True)
+        try:
+            types = dict(conn.execute('SELECT column_name, data_type FROM information_schema.columns').fetchall())
+            assert types["id"] == "BIGINT"
+            assert types["value"] == "VARCHAR"
+            assert conn.execute('SELECT count(*) FROM "data"').fetchone()[0] == 5
+        finally:
+            conn.close()
+
+    def test_decimal_batches_keep_precision(self, tmp_path):
+        """测试各批次定点数精度不同时放宽为 DECIMAL 而不是 DOUBLE，大数值不丢失精度"""
+        path = tmp_path / "money.csv"
+        path.write_text("id,amount\n1,1.50\n2,2.25\n3,12345678901234567.1234\n", encoding="utf-8")
+        db_path = str(tmp_path / "dataset.db")
+
+        DuckDBService.import_batches(
+            db_path, "money", FileETLService.iter_file_batches(str(path), "money.csv", batch_size=2)
+        )
+        conn = duckdb.connect(db_path, read_only=True)
+        try:
+            types = dict(conn.execute('SELECT column_name, data_type FROM information_schema.columns').fetchall())
+            assert types["amount"] == "DECIMAL(38,4)"
+            assert str(conn.execute('SELECT amount FROM "money" WHERE id = 3').fetchone()[0]) == "12345678901234567.1234"
+        finally:
+            conn.close()
+
+    def test_empty_input_rolls_back(self, tmp_path):
+        """测试没有任何批次时报错且不建表"""
+        db_path = str(tmp_path / "dataset.db")
+        with pytest.raises(ValueError, match="文件内容为空"):
+            DuckDBService.import_batches(db_path, "empty", iter([]))
+        assert DuckDBService.list_tables(db_path) == []
+
+
+class TestParallelImport:
+    """测试多文件并行导入"""
+
+    def test_import_files_in_parallel(self, tmp_path, monkeypatch):
+        """测试多个文件并行解析后全部导入到同一个 DuckDB，并返回每个文件的耗时"""
+        import asyncio
+        from app.services import parallel_ingest
+
+        monkeypatch.setattr(parallel_ingest.settings, "UPLOAD_PARSE_WORKERS", 2)
+        files = []
+        for i in range(3):
+            path = tmp_path / f"t{i}.csv"
+            path.write_text("a,b\n" + "".join(f"{j},{j}\n" for j in range(i + 1)), encoding="utf-8")
+            files.append((str(path), f"t{i}.csv", f"t{i}", None))
+        db_path = str(tmp_path / "dataset.db")
+
+        try:
+            results = asyncio.run(parallel_ingest.import_files(db_path, files))
+        finally:
+            parallel_ingest.shutdown_ingest_pool()
+
+        assert [r["table_name"] for r in results] == ["t0", "t1", "t2"]
+        assert [r["rows"] for r in results] == [1, 2, 3]
+        assert all(r["parse_ms"] >= 0 and r["load_ms"] >= 0 for r in results)
+        assert sorted(DuckDBService.list_tables(db_path)) == ["t0", "t1", "t2"]
+
+
+class TestExcelSheets:
+    """测试 Excel 工作表选择"""
+
+    def _workbook(self, path):
+        wb = Workbook()
+        wb.active.title = "orders"
+        wb.active.append(["id", "qty"])
+        wb.active.append([1, 10])
+        users = wb.create_sheet("users")
+        users.append(["uid", "name"])
+        users.append([7, "a"])
+        users.append([8, "b"])
+        wb.create_sheet("blank")
+        wb.save(path)
+
+    def test_resolve_sheets(self, tmp_path):
+        """测试默认第一个工作表、全部非空工作表、按名称/序号选择"""
+        path = str(tmp_path / "book.xlsx")
+        self._workbook(path)
+
+        assert FileETLService.resolve_sheets(path, "book.xlsx") == ["orders"]
+        assert FileETLService.resolve_sheets(path, "book.xlsx", "*") == ["orders", "users"]
+        assert FileETLService.resolve_sheets(path, "book.xlsx", "2, orders") == ["users", "orders"]
+        with pytest.raises(ValueError, match="工作表不存在"):
+            FileETLService.resolve_sheets(path, "book.xlsx", "missing")
+
+    def test_import_selected_sheet(self, tmp_path):
+        """测试按工作表流式读取"""
+        path = str(tmp_path / "book.xlsx")
+        self._workbook(path)
+
+        settings = FileETLService.detect_parse_settings(path, "book.xlsx", "users")
+        batches = list(FileETLService.iter_file_batches(path, "book.xlsx", parse_settings=settings))
+
+        assert settings["sheet_name"] == "users"
+        assert list(batches[0].columns) == ["uid", "name"]
+        assert len(batches[0]) == 2
+
+
+class TestMergeBatches:
+    """测试向已有表追加与按主键更新"""
+
+    def _create(self, tmp_path):
+        path = tmp_path / "base.csv"
+        path.write_text("id,name,amount\n1,a,10\n2,b,20\n", encoding="utf-8")
+        db_path = str(tmp_path / "dataset.db")
+        DuckDBService.import_batches(db_path, "orders", FileETLService.iter_file_batches(str(path), "base.csv"))
+        return db_path
+
+    def _batches(self, tmp_path, content: str):
+        path = tmp_path / "new.csv"
+        path.write_text(content, encoding="utf-8")
+        return FileETLService.iter_file_batches(str(path), "new.csv")
+
+    def _rows(self, db_path):
+        conn = duckdb.connect(db_path, read_only=True)
+        try:
+            return conn.execute('SELECT * FROM "orders" ORDER BY id').fetchall()
+        finally:
+            conn.close()
+
+    def test_upsert_by_key(self, tmp_path):
+        """测试按主键替换已有行、插入新行，重复主键保留最后一行"""
+        db_path = self._create(tmp_path)
+        result = DuckDBService.merge_batches(
+            db_path, "orders", self._batches(tmp_path, "id,name,amount\n2,x,1\n2,y,2\n3,c,30\n"), key_columns=["id"]
+        )
+
+        assert result["updated"] == 1
+        assert result["inserted"] == 1
+        assert result["schema_changed"] is False
+        assert self._rows(db_path) == [(1, "a", 10), (2, "y", 2), (3, "c", 30)]
+
+    def test_append_without_key(self, tmp_path):
+        """测试未指定主键时直接追加，列顺序可以不同"""
+        db_path = self._create(tmp_path)
+        result = DuckDBService.merge_batches(db_path, "orders", self._batches(tmp_path, "amount,id,name\n5,1,a\n"))
+
+        assert result["inserted"] == 1
+        assert len(self._rows(db_path)) == 3
+
+    def test_incompatible_schema_rejected(self, tmp_path):
+        """测试列类型不兼容或出现新列时报错且不修改数据"""
+        db_path = self._create(tmp_path)
+        with pytest.raises(ValueError, match="不兼容"):
+            DuckDBService.merge_batches(db_path, "orders", self._batches(tmp_path, "id,name,amount\n3,c,abc\n"))
+        with pytest.raises(ValueError, match="不兼容"):
+            DuckDBService.merge_batches(db_path, "orders", self._batches(tmp_path, "id,name,amount,note\n3,c,1,x\n"))
+        assert len(self._rows(db_path)) == 2
+
+    def test_allow_schema_change_adds_column(self, tmp_path):
+        """测试允许结构变化时新增列，已有行的新列为空"""
+        db_path = self._create(tmp_path)
+        result = DuckDBService.merge_batches(
+            db_path, "orders", self._batches(tmp_path, "id,name,amount,note\n3,c,1,x\n"), allow_schema_change=True
+        )
+
+        assert result["schema_changed"] is True
+        assert result["schema_changes"][0]["column"] == "note"
+        assert self._rows(db_path)[-1] == (3, "c", 1, "x")
+        assert self._rows(db_path)[0][-1] is None
+
+    def test_missing_table_or_key(self, tmp_path):
+        """测试目标表或主键列不存在时报错"""
+        db_path = self._create(tmp_path)
+        with pytest.raises(ValueError, match="表不存在"):
+            DuckDBService.merge_batches(db_path, "missing", self._batches(tmp_path, "id\n1\n"))
+        with pytest.raises(ValueError, match="主键"):
+            DuckDBService.merge_batches(
+                db_path, "orders", self._batches(tmp_path, "id,name,amount\n1,a,1\n"), key_columns=["code"]
+            )
@@ -0,0 +1,363 @@
+"""
+看板批量刷新与卡片结果缓存测试（SQLite 元数据库 + SQLite/DuckDB 数据源）
+"""
+import asyncio
+import sqlite3
+import threading
+import time
+
+import duckdb
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.models.base import Base
+from app.models.metadata import Dashboard, DashboardCard, DataSource, Dataset, User
+from app.services import dashboard_service
+from app.services.dashboard_service import DashboardService, frame_to_payload
+from app.utils.sql_canonical import canonicalize_sql, has_row_limit, split_grouped_select
+
+
+@pytest.fixture(autouse=True)
+def cache(monkeypatch):
+    """内存中的 Redis 替身"""
+    store = {}
+
+    async def get(key):
+        return store.get(key)
+
+    async def set_(key, value, expire=None):
+        store[key] = value
+        return True
+
+    monkeypatch.setattr(dashboard_service.redis_service, "get", get)
+    monkeypatch.setattr(dashboard_service.redis_service, "set", set_)
+    return store
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+
+    source_path = tmp_path / "source.db"
+    conn = sqlite3.connect(source_path)
+    conn.execute("CREATE TABLE sales (region TEXT, amount REAL)")
+    conn.executemany("INSERT INTO sales VALUES (?, ?)", [("east", 1.5), ("west", 2.5), ("east", 3.0)])
+    conn.commit()
+    conn.close()
+
+    duckdb_path = str(tmp_path / "dataset.db")
+    conn = duckdb.connect(duckdb_path)
+    conn.execute("CREATE TABLE orders AS SELECT range AS id FROM range(5)")
+    conn.close()
+
+    session.add(User(id=1, username="u1"))
+    session.add(DataSource(id=1, name="src", type="sqlite", host=str(source_path), port=0))
+    session.add(Dataset(id=1, name="sales", datasource_id=1, collection_name="c1"))
+    session.add(Dataset(id=2, name="orders", duckdb_path=duckdb_path, collection_name="c2"))
+    session.add(Dashboard(id=1, name="board", owner_id=1))
+    session.add_all([
+        DashboardCard(id=1, dashboard_id=1, dataset_id=1, title="by region", chart_type="bar",
+                      sql="SELECT region, SUM(amount) AS total FROM sales GROUP BY region ORDER BY region"),
+        DashboardCard(id=2, dashboard_id=1, dataset_id=2, title="orders", chart_type="table",
+                      sql="SELECT count(*) AS n FROM orders"),
+        DashboardCard(id=3, dashboard_id=1, dataset_id=1, title="broken", chart_type="table",
+                      sql="SELECT * FROM missing_table"),
+    ])
+    session.commit()
+    yield session
+    session.close()
+
+
+async def _collect(queries):
+    return [result async for result in DashboardService.iter_card_results(queries)]
+
+
+class TestDashboardBatch:
+    """测试看板卡片批量执行"""
+
+    def test_runs_all_cards_and_isolates_errors(self, db):
+        """测试一次加载全部卡片，SQLite 与 DuckDB 卡片均返回结果，失败卡片只影响自身"""
+        queries = DashboardService.load_dashboard_queries(db, 1)
+        results = {r["card_id"]: r for r in asyncio.run(_collect(queries))}
+
+        assert [q["card_id"] for q in queries] == [1, 2, 3]
+        assert results[1]["rows"] == [{"region": "east", "total": 4.5}, {"region": "west", "total": 2.5}]
+        assert results[2]["rows"] == [{"n": 5}]
+        assert results[3]["error"].startswith("SQL 执行错误")
+        assert results[1]["error"] is None and results[2]["row_count"] == 1
+
+    def test_per_datasource_concurrency_cap(self, db, monkeypatch):
+        """测试同一数据源同时执行的查询数不超过上限"""
+        monkeypatch.setattr(dashboard_service.settings, "DASHBOARD_DATASOURCE_CONCURRENCY", 2)
+        lock = threading.Lock()
+        running, peak = [0], [0]
+
+        def slow_query(cls, query):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+            return pd.DataFrame({"v": [1]})
+
+        monkeypatch.setattr(DashboardService, "execute_card_query", classmethod(slow_query))
+        query = DashboardService.load_dashboard_queries(db, 1)[0]
+        results = asyncio.run(_collect([dict(query, card_id=i, sql=f"SELECT {i}") for i in range(6)]))
+
+        assert len(results) == 6
+        assert peak[0] == 2
+
+    def test_payload_is_json_safe(self):
+        """测试缺失值和日期序列化"""
+        df = pd.DataFrame({"d": pd.to_datetime(["2024-01-01", None]), "v": [1.5, float("nan")]})
+        payload = frame_to_payload(df)
+        assert payload["rows"][0]["d"].startswith("2024-01-01")
+        assert payload["rows"][1] == {"d": None, "v": None}
+
+
+class TestCardResultCache:
+    """测试卡片结果缓存与 stale-while-revalidate"""
+
+    def _counting(self, monkeypatch):
+        calls = []
+        original = DashboardService.execute_card_query.__func__
+
+        def counted(cls, query):
+            calls.append(query["card_id"])
+            return original(cls, query)
+
+        monkeypatch.setattr(DashboardService, "execute_card_query", classmethod(counted))
+        return calls
+
+    def test_fresh_cache_serves_without_query(self, db, monkeypatch):
+        """测试新鲜期内直接返回缓存，并发的相同查询只执行一次"""
+        calls = self._counting(monkeypatch)
+        query = DashboardService.load_card_query(db, 1)
+
+        async def run():
+            first = await asyncio.gather(*[DashboardService.get_card_data(query) for _ in range(3)])
+            return first, await DashboardService.get_card_data(query)
+
+        first, second = asyncio.run(run())
+        assert calls == [1]
+        assert [r["cache_status"] for r in first] == ["miss"] * 3
+        assert second["cache_status"] == "fresh"
+        assert second["rows"] == first[0]["rows"]
+
+    def test_stale_served_then_refreshed(self, db, monkeypatch, cache):
+        """测试过期缓存先返回旧数据并在后台刷新"""
+        calls = self._counting(monkeypatch)
+        query = DashboardService.load_card_query(db, 2)
+        key = DashboardService.cache_key(query)
+        cache[key] = {"columns": ["n"], "rows": [{"n": 0}], "row_count": 1, "cached_at": time.time() - 120}
+
+        async def run():
+            stale = await DashboardService.get_card_data(query)
+            await asyncio.gather(*DashboardService._tasks)
+            return stale
+
+        stale = asyncio.run(run())
+        assert stale["cache_status"] == "stale"
+        assert stale["rows"] == [{"n": 0}] and stale["data_age_seconds"] >= 120
+        assert calls == [2]
+        assert cache[key]["rows"] == [{"n": 5}]
+
+    def test_data_version_and_max_age(self, db, cache):
+        """测试数据版本变化后使用新的缓存键，缓存超过最大时长时重新查询"""
+        query = DashboardService.load_card_query(db, 2)
+        assert DashboardService.cache_key(query) != DashboardService.cache_key(dict(query, data_version=2))
+
+        cache[DashboardService.cache_key(query)] = {
+            "columns": ["n"], "rows": [{"n": 0}], "row_count": 1, "cached_at": time.time() - 7200
+        }
+        result = asyncio.run(DashboardService.get_card_data(query))
+        assert result["cache_status"] == "miss"
+        assert result["rows"] == [{"n": 5}]
+
+    def test_downsampled_chart_keeps_full_result(self, db, monkeypatch):
+        """测试超过上限的折线图返回降采样数据，缓存中保留完整结果"""
+        monkeypatch.setattr(dashboard_service.settings, "CHART_MAX_POINTS", 50)
+        query = dict(DashboardService.load_card_query(db, 2), chart_type="line",
+                     sql="SELECT range AS x, sin(range / 10.0) AS y FROM range(500)")
+
+        async def run():
+            return await DashboardService.get_card_data(query), await DashboardService.get_card_data(query, full=True)
+
+        sampled, full = asyncio.run(run())
+        assert sampled["downsample_method"] == "lttb"
+        assert len(sampled["rows"]) == 50 and sampled["row_count"] == 500
+        assert full["downsample_method"] is None and len(full["rows"]) == 500
+
+
+class TestIncrementalRefresh:
+    """测试按时间分组卡片的增量刷新"""
+
+    @pytest.fixture
+    def events(self, db, tmp_path):
+        path = str(tmp_path / "events.db")
+        conn = duckdb.connect(path)
+        conn.execute(
+            "CREATE TABLE events AS "
+            "SELECT TIMESTAMP '2024-01-01 08:00:00' + INTERVAL (range % 10) DAY AS ts FROM range(20)"
+        )
+        conn.close()
+        db.add(Dataset(id=3, name="events", duckdb_path=path, collection_name="c3"))
+        db.add(DashboardCard(id=4, dashboard_id=1, dataset_id=3, title="daily", chart_type="line",
+                             refresh_mode="incremental", incremental_window_days=2,
+                             sql="SELECT CAST(ts AS DATE) AS day, count(*) AS n FROM events GROUP BY 1 ORDER BY 1"))
+        db.commit()
+        return path
+
+    def _insert(self, path: str, *timestamps: str):
+        conn = duckdb.connect(path)
+        for ts in timestamps:
+            conn.execute("INSERT INTO events VALUES (CAST(? AS TIMESTAMP))", [ts])
+        conn.close()
+
+    def test_recomputes_trailing_window_only(self, db, events, monkeypatch):
+        """测试只重算最近的时间桶并与缓存中更早的时间桶合并"""
+        executed = []
+        original = DashboardService.execute_card_query.__func__
+
+        def spy(cls, query):
+            executed.append(query["sql"])
+            return original(cls, query)
+
+        monkeypatch.setattr(DashboardService, "execute_card_query", classmethod(spy))
+        query = DashboardService.load_card_query(db, 4)
+
+        first = asyncio.run(DashboardService.precompute(query))
+        assert first == {**first, "row_count": 10, "incremental": False}
+
+        # 窗口外的变更不参与重算（直到下次全量重算），窗口内和新增的时间桶被重算
+        self._insert(events, "2024-01-02 09:00:00", "2024-01-09 09:00:00", "2024-01-11 09:00:00")
+        second = asyncio.run(DashboardService.precompute(query))
+        assert second["incremental"] is True
+        assert "WHERE \"day\" >= '2024-01-08'" in executed[-1]
+
+        data = asyncio.run(DashboardService.get_card_data(query))
+        counts = {row["day"][:10]: row["n"] for row in data["rows"]}
+        assert [row["day"][:10] for row in data["rows"]] == sorted(counts)
+        assert (counts["2024-01-02"], counts["2024-01-09"], counts["2024-01-11"]) == (2, 3, 1)
+        assert data["row_count"] == 11
+
+    def test_full_recompute_on_schema_or_version_change(self, db, events, cache, monkeypatch):
+        """测试结果列变化、数据版本变化或超过全量重算间隔时全量重算"""
+        query = DashboardService.load_card_query(db, 4)
+        assert asyncio.run(DashboardService.precompute(query))["incremental"] is False
+        assert asyncio.run(DashboardService.precompute(query))["incremental"] is True
+
+        key = DashboardService.cache_key(query)
+        cache[key] = dict(cache[key], columns=["day", "total"])
+        assert asyncio.run(DashboardService.precompute(query))["incremental"] is False
+
+        assert asyncio.run(DashboardService.precompute(dict(query, data_version=2)))["incremental"] is False
+
+        monkeypatch.setattr(dashboard_service.settings, "DASHBOARD_INCREMENTAL_FULL_REFRESH_SECONDS", 0)
+        cache[key]["full_computed_at"] -= 1
+        assert asyncio.run(DashboardService.precompute(query))["incremental"] is False
+
+    def test_full_mode_and_missing_time_column(self, db, events):
+        """测试全量模式和结果中没有时间列时不做增量刷新"""
+        query = DashboardService.load_card_query(db, 4)
+        for variant in (dict(query, refresh_mode="full"), dict(query, sql="SELECT count(*) AS n FROM events")):
+            asyncio.run(DashboardService.precompute(variant))
+            assert asyncio.run(DashboardService.precompute(variant))["incremental"] is False
+
+    def test_limited_query_falls_back_to_full_refresh(self, db, events):
+        """测试卡片 SQL 带 LIMIT 时全量重算，合并结果不会超过 LIMIT"""
+        query = DashboardService.load_card_query(db, 4)
+        limited = dict(
+            query, sql="SELECT CAST(ts AS DATE) AS day, count(*) AS n FROM events GROUP BY 1 ORDER BY 1 DESC LIMIT 5"
+        )
+        assert asyncio.run(DashboardService.precompute(limited))["row_count"] == 5
+
+        self._insert(events, "2024-01-11 09:00:00", "2024-01-12 09:00:00")
+        second = asyncio.run(DashboardService.precompute(limited))
+        assert second["incremental"] is False
+        assert second["row_count"] == 5
+        data = asyncio.run(DashboardService.get_card_data(limited))
+        assert [row["day"][:10] for row in data["rows"]] == [
+            "2024-01-12", "2024-01-11", "2024-01-10", "2024-01-09", "2024-01-08"
+        ]
+
+    def test_row_limit_detection(self):
+        """测试只识别最外层查询的 LIMIT / OFFSET / FETCH / TOP，子查询、字符串和注释中的不算"""
+        assert has_row_limit("SELECT d, n FROM t ORDER BY d DESC LIMIT 30")
+        assert has_row_limit("SELECT d FROM t ORDER BY d OFFSET 5 ROWS FETCH FIRST 10 ROWS ONLY")
+        assert has_row_limit("SELECT TOP 10 d FROM t")
+        assert not has_row_limit("SELECT d FROM t WHERE d IN (SELECT d FROM u LIMIT 3)")
+        assert not has_row_limit("WITH c AS (SELECT * FROM t LIMIT 5) SELECT * FROM c")
+        assert not has_row_limit("SELECT 'limit 5' AS s, top FROM t -- limit 5")
+
+
+class TestSharedQueries:
+    """测试跨卡片查询去重与共享分组基础查询"""
+
+    def _spy(self, monkeypatch):
+        executed = []
+        original = DashboardService.execute_card_query.__func__
+
+        def spy(cls, query):
+            executed.append(query["sql"])
+            return original(cls, query)
+
+        monkeypatch.setattr(DashboardService, "execute_card_query", classmethod(spy))
+        return executed
+
+    def test_canonicalize_sql(self):
+        """测试空白、注释、关键字大小写和结尾分号不影响规范化结果，字符串常量保持原样"""
+        sql = "SELECT region, SUM(amount) AS total FROM sales WHERE region = 'a  b' GROUP BY region"
+        variant = "select region,sum( amount ) as total -- 按地区\nfrom sales\n where region = 'a  b'  group by region;"
+        assert canonicalize_sql(variant) == canonicalize_sql(sql) == sql
+        assert canonicalize_sql(sql.replace("'a  b'", "'a b'")) != canonicalize_sql(sql)
+
+    def test_split_grouped_select(self):
+        """测试只拆分可以安全合并投影的分组查询"""
+        parsed = split_grouped_select("SELECT s.region, COUNT(*) AS n FROM sales s GROUP BY s.region ORDER BY n DESC")
+        assert parsed.items == ["s.region", "COUNT(*) AS n"]
+        assert parsed.names == ["region", "n"]
+        assert parsed.base == "FROM sales s GROUP BY s.region ORDER BY n DESC"
+        for sql in (
+            "SELECT count(*) AS n FROM sales",
+            "SELECT region, SUM(amount) FROM sales GROUP BY region",
+            "SELECT region, COUNT(*) AS n FROM sales GROUP BY 1",
+            "SELECT * FROM sales GROUP BY region",
+            "WITH t AS (SELECT 1) SELECT region, COUNT(*) AS n FROM t GROUP BY region",
+        ):
+            assert split_grouped_select(sql) is None
+
+    def test_identical_cards_run_once(self, db, monkeypatch):
+        """测试格式不同但等价的卡片 SQL 只执行一次"""
+        executed = self._spy(monkeypatch)
+        query = DashboardService.load_card_query(db, 2)
+        variant = dict(query, card_id=9, sql="select COUNT(*) as n\nfrom orders;")
+        results = asyncio.run(_collect([query, variant]))
+
+        assert len(executed) == 1
+        assert [r["rows"] for r in results] == [[{"n": 5}], [{"n": 5}]]
+
+    def test_cards_share_grouped_base(self, db, monkeypatch):
+        """测试只有投影不同的卡片合并为一个查询，各卡片得到自己的列"""
+        executed = self._spy(monkeypatch)
+        query = DashboardService.load_card_query(db, 1)
+        count = dict(query, card_id=8, sql="SELECT region, COUNT(*) AS n FROM sales GROUP BY region ORDER BY region")
+        # 同名列对应不同表达式，不参与合并
+        conflict = dict(query, card_id=9,
+                        sql="SELECT region, MAX(amount) AS total FROM sales GROUP BY region ORDER BY region")
+        planned = DashboardService.plan_shared_queries([query, count, conflict])
+        assert "shared" in planned[0] and "shared" in planned[1] and "shared" not in planned[2]
+
+        results = {r["card_id"]: r for r in asyncio.run(_collect([query, count, conflict]))}
+        assert len(executed) == 2
+        assert "SUM(amount) AS total, COUNT(*) AS n" in executed[0] + executed[1]
+        assert results[1]["columns"] == ["region", "total"]
+        assert results[1]["rows"] == [{"region": "east", "total": 4.5}, {"region": "west", "total": 2.5}]
+        assert results[8]["rows"] == [{"region": "east", "n": 2}, {"region": "west", "n": 1}]
+        assert results[9]["rows"][0] == {"region": "east", "total": 3.0}
@@ -0,0 +1,181 @@
+"""
+看板预计算调度测试
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import duckdb
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.models.base import Base
+from app.models.metadata import Dashboard, DashboardCard, DashboardRefreshRun, DashboardSchedule, Dataset, User
+from app.services import dashboard_scheduler, dashboard_service
+from app.services.dashboard_scheduler import (
+    CronExpression,
+    DashboardScheduler,
+    compute_next_run,
+    validate_schedule,
+)
+from app.services.dashboard_service import DashboardService
+
+
+class TestCronExpression:
+    """测试 cron 表达式解析"""
+
+    def test_next_after(self):
+        """测试工作日定时、步长和月末"""
+        friday = datetime(2026, 10, 16, 8, 0)  # 周五
+        assert CronExpression("0 7 * * 1-5").next_after(friday) == datetime(2026, 10, 19, 7, 0)
+        assert CronExpression("*/15 * * * *").next_after(datetime(2026, 1, 1, 10, 7)) == datetime(2026, 1, 1, 10, 15)
+        assert CronExpression("30 6 31 * *").next_after(datetime(2026, 2, 1)) == datetime(2026, 3, 31, 6, 30)
+        assert CronExpression("0 0 * * 0").next_after(friday) == datetime(2026, 10, 18, 0, 0)
+
+    def test_invalid(self):
+        """测试无效表达式和计划配置"""
+        for expression in ("* * *", "61 * * * *", "*/0 * * * *", "a * * * *"):
+            with pytest.raises(ValueError):
+                CronExpression(expression)
+        with pytest.raises(ValueError, match="只能设置一个"):
+            validate_schedule("0 7 * * *", 3600)
+        with pytest.raises(ValueError, match="不能小于"):
+            validate_schedule(None, 10)
+
+    def test_next_run_timezone_and_jitter(self, monkeypatch):
+        """测试 cron 按配置时区解释并转换为 UTC，间隔计划加入随机延后"""
+        monkeypatch.setattr(dashboard_scheduler.settings, "DASHBOARD_SCHEDULE_TIMEZONE", "Asia/Shanghai")
+        now = datetime(2026, 10, 18, 0, 0)  # UTC，上海 8:00
+        next_run = compute_next_run(DashboardSchedule(cron="0 7 * * *", jitter_seconds=0), now)
+        local = next_run.replace(tzinfo=timezone.utc).astimezone(ZoneInfo("Asia/Shanghai"))
+        assert (local.day, local.hour) == (19, 7)
+
+        interval = DashboardSchedule(interval_seconds=600, jitter_seconds=30)
+        for _ in range(20):
+            delay = (compute_next_run(interval, now) - now).total_seconds()
+            assert 600 <= delay <= 630
+
+
+@pytest.fixture
+def session_factory(tmp_path, monkeypatch):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine)
+    monkeypatch.setattr(dashboard_scheduler, "SessionLocal", factory)
+
+    store = {}
+
+    async def get(key):
+        return store.get(key)
+
+    async def set_(key, value, expire=None):
+        store[key] = value
+        return True
+
+    monkeypatch.setattr(dashboard_service.redis_service, "get", get)
+    monkeypatch.setattr(dashboard_service.redis_service, "set", set_)
+
+    duckdb_path = str(tmp_path / "dataset.db")
+    conn = duckdb.connect(duckdb_path)
+    conn.execute("CREATE TABLE orders AS SELECT range AS id FROM range(3)")
+    conn.close()
+
+    db = factory()
+    db.add(User(id=1, username="u1"))
+    db.add(Dataset(id=1, name="orders", duckdb_path=duckdb_path, collection_name="c1"))
+    db.add(Dashboard(id=1, name="morning", owner_id=1))
+    db.add_all([
+        DashboardCard(id=1, dashboard_id=1, dataset_id=1, title="n", chart_type="table",
+                      sql="SELECT count(*) AS n FROM orders"),
+        DashboardCard(id=2, dashboard_id=1, dataset_id=1, title="bad", chart_type="table",
+                      sql="SELECT * FROM missing"),
+    ])
+    db.add(DashboardSchedule(id=1, dashboard_id=1, interval_seconds=3600, jitter_seconds=0,
+                             enabled=True, next_run_at=datetime.utcnow() - timedelta(seconds=1)))
+    db.commit()
+    db.close()
+    return factory
+
+
+class TestDashboardScheduler:
+    """测试到期计划的认领、预计算与执行记录"""
+
+    def test_run_due_precomputes_and_records_history(self, session_factory, monkeypatch):
+        """测试到期计划只执行一次，结果写入缓存并在下次计划前保持新鲜"""
+        runs = asyncio.run(DashboardScheduler.run_due())
+        assert len(runs) == 1
+        assert asyncio.run(DashboardScheduler.run_due()) == []
+
+        run = runs[0]
+        assert run.status == "partial"
+        assert (run.cards_total, run.cards_failed) == (2, 1)
+        assert {d["card_id"]: d["row_count"] for d in run.details}[1] == 1
+
+        db = session_factory()
+        schedule = db.get(DashboardSchedule, 1)
+        assert schedule.next_run_at > datetime.utcnow() + timedelta(minutes=59)
+        query = DashboardService.load_card_query(db, 1)
+        db.close()
+
+        # 超过普通新鲜期，但未到下次计划时间
+        monkeypatch.setattr(dashboard_service.settings, "DASHBOARD_CACHE_FRESH_SECONDS", 0)
+        result = asyncio.run(DashboardService.get_card_data(query))
+        assert result["cache_status"] == "fresh"
+        assert result["rows"] == [{"n": 3}]
+
+    def test_disabled_schedule_and_history_limit(self, session_factory, monkeypatch):
+        """测试停用的计划不执行，执行记录只保留最近 N 条"""
+        monkeypatch.setattr(dashboard_scheduler.settings, "DASHBOARD_REFRESH_HISTORY_LIMIT", 2)
+        for _ in range(3):
+            asyncio.run(DashboardScheduler.refresh_dashboard(1))
+
+        db = session_factory()
+        assert db.query(DashboardRefreshRun).count() == 2
+        db.get(DashboardSchedule, 1).enabled = False
+        db.commit()
+        db.close()
+        assert asyncio.run(DashboardScheduler.run_due()) == []
+
+    def test_run_forever_refreshes_in_background(self, session_factory, monkeypatch):
+        """测试主循环把刷新作为后台任务执行：同时刷新的看板数受限，刷新期间继续轮询"""
+        db = session_factory()
+        db.add(Dashboard(id=2, name="evening", owner_id=1))
+        db.add(DashboardSchedule(id=2, dashboard_id=2, interval_seconds=3600, jitter_seconds=0,
+                                 enabled=True, next_run_at=datetime.utcnow() - timedelta(seconds=1)))
+        db.commit()
+        db.close()
+        monkeypatch.setattr(dashboard_scheduler.settings, "DASHBOARD_SCHEDULER_POLL_SECONDS", 0.01)
+        monkeypatch.setattr(dashboard_scheduler.settings, "DASHBOARD_SCHEDULER_CONCURRENCY", 1)
+
+        active, finished, claims = [], [], []
+        peak = 0
+
+        async def fake_refresh(dashboard_id, fresh_until=None):
+            nonlocal peak
+            active.append(dashboard_id)
+            peak = max(peak, len(active))
+            await asyncio.sleep(0.1)
+            active.remove(dashboard_id)
+            finished.append(dashboard_id)
+
+        original_claim = DashboardScheduler._claim
+
+        def counting_claim(*args):
+            claims.append(args)
+            return original_claim(*args)
+
+        monkeypatch.setattr(DashboardScheduler, "refresh_dashboard", fake_refresh)
+        monkeypatch.setattr(DashboardScheduler, "_claim", counting_claim)
+
+        async def scenario():
+            loop_task = asyncio.create_task(DashboardScheduler.run_forever())
+            await asyncio.sleep(0.5)
+            loop_task.cancel()
+            await asyncio.gather(loop_task, return_exceptions=True)
+
+        asyncio.run(scenario())
+        assert sorted(finished) == [1, 2]
+        assert peak == 1
+        assert len(claims) > 5
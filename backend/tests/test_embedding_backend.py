@@ -0,0 +1,34 @@
+"""
+Embedding 后端配置测试
+"""
+import pytest
+
+from app.services.vanna import base
+
+
+class TestEmbeddingBackend:
+    """测试 embedding 后端工厂"""
+
+    def test_unknown_backend_raises(self):
+        """测试不支持的后端直接报错，不尝试加载模型"""
+        with pytest.raises(ValueError, match="Unsupported embedding backend"):
+            base.create_embedding_function(backend="tensorrt")
+
+    def test_shared_per_backend_and_model(self, monkeypatch):
+        """测试相同后端和模型只加载一次，不同后端分别加载"""
+        created = []
+
+        def fake_create(backend, model_name, onnx_int8_file):
+            created.append((backend, model_name))
+            return object()
+
+        monkeypatch.setattr(base, "create_embedding_function", fake_create)
+        monkeypatch.setattr(base, "_embedding_functions", {})
+
+        first = base.get_embedding_function("onnx", "all-MiniLM-L6-v2")
+        second = base.get_embedding_function("onnx", "all-MiniLM-L6-v2")
+        other = base.get_embedding_function("torch", "all-MiniLM-L6-v2")
+
+        assert first is second
+        assert other is not first
+        assert created == [("onnx", "all-MiniLM-L6-v2"), ("torch", "all-MiniLM-L6-v2")]
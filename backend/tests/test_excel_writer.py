@@ -0,0 +1,99 @@
+"""
+流式 Excel 写入测试
+"""
+import asyncio
+import io
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+
+from app.services import excel_writer
+from app.services.enhanced_exporter import EnhancedExporter
+from app.services.excel_writer import StreamingExcelWriter
+
+
+def _frames(total: int, size: int):
+    for start in range(0, total, size):
+        ids = np.arange(start, min(start + size, total))
+        yield pd.DataFrame({"id": ids, "name": [f"行{i}" for i in ids]})
+
+
+class TestStreamingExcelWriter:
+    """测试 write-only 模式分块写入"""
+
+    def test_values_and_column_widths(self, monkeypatch):
+        """测试缺失值、带时区时间的写入，列宽只按样本行估算"""
+        monkeypatch.setattr(excel_writer.settings, "EXPORT_EXCEL_WIDTH_SAMPLE_ROWS", 2)
+        df = pd.DataFrame({
+            "amount": [1.5, None, 3.0],
+            "ts": pd.to_datetime(["2024-01-01 08:00", None, "2024-01-03 00:00"]).tz_localize("Asia/Shanghai"),
+            "note": ["a", "bb", "x" * 40],
+        })
+        writer = StreamingExcelWriter()
+        assert writer.write_frames([df]) == 3
+        ws = load_workbook(writer.save())["数据"]
+
+        rows = list(ws.iter_rows(values_only=True))
+        assert rows[0] == ("amount", "ts", "note")
+        assert rows[1][1].hour == 8
+        assert rows[2][:2] == (None, None)
+        assert ws.freeze_panes == "A2"
+        # 第 3 行不在样本中，列宽按表头和前 2 行估算
+        assert ws.column_dimensions["C"].width == 6
+
+    def test_sheet_rollover(self, monkeypatch):
+        """测试超过工作表行数上限时续写到新工作表"""
+        monkeypatch.setattr(excel_writer, "EXCEL_MAX_ROWS", 101)
+        writer = StreamingExcelWriter()
+        assert writer.write_frames(_frames(250, 30)) == 250
+        wb = load_workbook(writer.save(), read_only=True)
+
+        assert wb.sheetnames == ["数据", "数据_2", "数据_3"]
+        counts = [sum(1 for _ in wb[name].iter_rows(min_row=2)) for name in wb.sheetnames]
+        assert counts == [100, 100, 50]
+        assert next(wb["数据_3"].iter_rows(values_only=True))[0] == "id"
+
+    def test_empty_result_and_spool(self, monkeypatch):
+        """测试空结果只写表头，超过内存阈值的文件转存到磁盘"""
+        writer = StreamingExcelWriter()
+        assert writer.write_frames(iter([]), columns=["a", "b"]) == 0
+        assert list(load_workbook(writer.save())["数据"].iter_rows(values_only=True)) == [("a", "b")]
+
+        monkeypatch.setattr(excel_writer.settings, "EXPORT_SPOOL_MAX_BYTES", 1024)
+        writer = StreamingExcelWriter()
+        writer.write_frames(_frames(2000, 500))
+        output = writer.save()
+        assert output._rolled
+        assert output.read(2) == b"PK"
+        output.close()
+
+
+class TestEnhancedExcelExport:
+    """测试带分析报告的 Excel 导出"""
+
+    def test_report_sheet(self):
+        """测试数据和分析报告两个工作表，报告中行数为完整行数"""
+        file, filename = EnhancedExporter.export_excel_file(
+            "月度销售", "SELECT * FROM sales", _frames(120, 50), "line",
+            insight="环比增长", data_interpretation={"summary": "平稳", "key_findings": ["三月最高"]},
+        )
+        assert filename.endswith(".xlsx")
+        wb = load_workbook(io.BytesIO(file.read()))
+        file.close()
+
+        assert wb.sheetnames == ["数据", "分析报告"]
+        assert wb["数据"].max_row == 121
+        report = [row[0] for row in wb["分析报告"].iter_rows(values_only=True)]
+        assert "共 120 行数据，2 个字段" in report
+        assert "• 三月最高" in report
+        assert "A1:D1" in {str(r) for r in wb["分析报告"].merged_cells.ranges}
+
+    def test_legacy_rows_export(self):
+        """测试按 rows 导出的接口返回字节内容"""
+        content, _ = asyncio.run(EnhancedExporter.export_with_metadata(
+            question="q", sql=None, columns=["a"], rows=[{"a": 1}, {"a": 2}],
+            chart_type="table", export_format="excel",
+        ))
+        wb = load_workbook(io.BytesIO(content))
+        assert [row[0] for row in wb["数据"].iter_rows(values_only=True)] == ["a", 1, 2]
@@ -0,0 +1,191 @@
+"""
+异步导出任务测试（SQLite 元数据库 + 临时 DuckDB 数据集 + 临时导出文件目录）
+"""
+import asyncio
+import io
+import json
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import duckdb
+import pandas as pd
+import pytest
+from openpyxl import load_workbook
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.models.base import Base
+from app.models.metadata import Dataset, ExportJob, User
+from app.services import export_job_service, job_heartbeat
+from app.services.export_job_service import ExportArtifactStore, ExportJobService
+
+SQL = "SELECT id, amount FROM orders ORDER BY id"
+PARAMS = {"question": "订单金额", "chart_type": "bar", "insight": "稳定"}
+
+
+@pytest.fixture
+def session_factory(tmp_path, monkeypatch):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine)
+    monkeypatch.setattr(export_job_service, "SessionLocal", factory)
+    monkeypatch.setattr(export_job_service.settings, "EXPORT_ARTIFACT_DIR", str(tmp_path / "artifacts"))
+    monkeypatch.setattr(export_job_service.settings, "EXPORT_JOB_WORKERS", 0)
+    # 测试中不在后台线程清理导出文件（需要时由测试显式触发）
+    monkeypatch.setattr(ExportJobService, "_last_prune", time.time())
+
+    duckdb_path = str(tmp_path / "dataset.db")
+    conn = duckdb.connect(duckdb_path)
+    conn.execute("CREATE TABLE orders AS SELECT range AS id, range * 1.5 AS amount FROM range(500)")
+    conn.close()
+
+    db = factory()
+    db.add(User(id=1, username="u1"))
+    db.add(Dataset(id=1, name="orders", duckdb_path=duckdb_path, collection_name="c1", data_version=1))
+    db.commit()
+    db.close()
+    return factory
+
+
+def _run_job(factory, export_format: str = "excel", sql: str = SQL, params=None) -> ExportJob:
+    db = factory()
+    dataset = db.get(Dataset, 1)
+    target = {"duckdb_path": dataset.duckdb_path, "engine": None}
+    job = ExportJobService.create_job(db, 1, dataset, sql, export_format, params or PARAMS)
+    if job.status == "pending":
+        asyncio.run(ExportJobService.run(job.id, target))
+    db.expire_all()
+    job = db.get(ExportJob, job.id)
+    db.expunge(job)
+    db.close()
+    return job
+
+
+class TestExportJobs:
+    """测试导出任务的渲染、缓存复用与失败"""
+
+    def test_job_renders_and_repeat_uses_cache(self, session_factory):
+        """测试任务渲染带报告的 Excel，相同导出直接复用缓存文件"""
+        job = _run_job(session_factory)
+        data = ExportJobService.to_dict(job)
+        assert data["status"] == "completed"
+        assert data["row_count"] == 500
+        assert data["download_ready"] and not data["from_cache"]
+
+        with open(ExportJobService.artifact_path(job), "rb") as f:
+            wb = load_workbook(io.BytesIO(f.read()))
+        assert wb.sheetnames == ["数据", "分析报告"]
+        assert wb["数据"].max_row == 501
+
+        # 只有空白和关键字大小写不同的 SQL 命中同一个导出文件
+        repeat = _run_job(session_factory, sql="select id, amount  from orders order by id")
+        assert repeat.from_cache and repeat.cache_key == job.cache_key
+        assert repeat.status == "completed" and repeat.row_count == 500
+
+        # 报告内容不同时重新渲染；CSV 不受报告内容影响
+        assert _run_job(session_factory, params={**PARAMS, "insight": "下降"}).cache_key != job.cache_key
+        csv_job = _run_job(session_factory, "csv")
+        other = _run_job(session_factory, "csv", params={"question": "其他"})
+        # 复用其他任务的导出文件时，下载文件名仍按本任务的问题生成
+        assert other.from_cache and other.filename.startswith("其他_") and other.filename.endswith(".csv")
+        assert csv_job.filename.startswith("订单金额_")
+        df = pd.read_csv(ExportJobService.artifact_path(csv_job), encoding="utf-8-sig")
+        assert len(df) == 500
+
+        parquet_job = _run_job(session_factory, "parquet")
+        assert parquet_job.row_count == 500 and parquet_job.filename.endswith(".parquet")
+        assert _run_job(session_factory, "parquet", params={"question": "其他"}).from_cache
+        assert len(pd.read_parquet(ExportJobService.artifact_path(parquet_job))) == 500
+
+    def test_data_version_invalidates_cache(self, session_factory):
+        """测试数据版本递增后不再命中旧的导出文件"""
+        job = _run_job(session_factory)
+        db = session_factory()
+        db.get(Dataset, 1).data_version = 2
+        db.commit()
+        db.close()
+        updated = _run_job(session_factory)
+        assert updated.cache_key != job.cache_key and not updated.from_cache
+
+    def test_concurrent_jobs_render_once(self, session_factory, monkeypatch):
+        """测试同一个键同时只渲染一次"""
+        calls = []
+        original = export_job_service.render_export
+
+        def counting_render(*args):
+            calls.append(args[4])
+            time.sleep(0.2)
+            return original(*args)
+
+        monkeypatch.setattr(export_job_service, "render_export", counting_render)
+
+        async def run_both():
+            db = session_factory()
+            dataset = db.get(Dataset, 1)
+            target = {"duckdb_path": dataset.duckdb_path, "engine": None}
+            jobs = [ExportJobService.create_job(db, 1, dataset, SQL, "excel", PARAMS) for _ in range(2)]
+            await asyncio.gather(*[ExportJobService.run(job.id, target) for job in jobs])
+            db.expire_all()
+            statuses = [db.get(ExportJob, job.id).status for job in jobs]
+            db.close()
+            return statuses
+
+        assert asyncio.run(run_both()) == ["completed", "completed"]
+        assert len(calls) == 1
+
+    def test_failed_job_and_expired_artifact(self, session_factory):
+        """测试 SQL 错误时任务失败，过期的导出文件不再提供下载并在启动时清理"""
+        failed = _run_job(session_factory, sql="SELECT * FROM missing")
+        assert failed.status == "failed" and "missing" in failed.error_msg
+        assert not ExportJobService.to_dict(failed)["download_ready"]
+
+        job = _run_job(session_factory)
+        meta_path = ExportArtifactStore.root() / f"{job.cache_key}.json"
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        meta["expires_at"] = time.time() - 1
+        meta_path.write_text(json.dumps(meta), encoding="utf-8")
+        assert ExportJobService.artifact_path(job) is None
+
+        db = session_factory()
+        db.add_all([
+            ExportJob(owner_id=1, dataset_id=1, format="pdf", status="running", cache_key="x"),
+            ExportJob(owner_id=1, dataset_id=1, format="pdf", status="running", cache_key="stale",
+                      worker_id="other:1", heartbeat_at=datetime.utcnow() - timedelta(hours=1)),
+            ExportJob(owner_id=1, dataset_id=1, format="pdf", status="running", cache_key="alive",
+                      worker_id="other:1", heartbeat_at=datetime.utcnow()),
+        ])
+        db.commit()
+        ExportJobService.recover_interrupted()
+        statuses = dict(db.query(ExportJob.cache_key, ExportJob.status).filter(
+            ExportJob.cache_key.in_(("x", "stale", "alive"))
+        ).all())
+        # 迁移前遗留和心跳超时的任务标记为失败，其他实例正在执行的任务不受影响
+        assert statuses == {"x": "failed", "stale": "failed", "alive": "running"}
+        db.close()
+        assert not meta_path.exists()
+
+    def test_periodic_prune(self, session_factory, monkeypatch):
+        """测试创建任务时按间隔在后台清理过期的导出文件"""
+        job = _run_job(session_factory, "csv")
+        meta_path = ExportArtifactStore.root() / f"{job.cache_key}.json"
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        meta["expires_at"] = time.time() - 1
+        meta_path.write_text(json.dumps(meta), encoding="utf-8")
+
+        assert ExportJobService.schedule_prune() is None
+        monkeypatch.setattr(export_job_service.settings, "EXPORT_ARTIFACT_PRUNE_INTERVAL_SECONDS", 0)
+        thread = ExportJobService.schedule_prune()
+        thread.join()
+        assert not meta_path.exists() and not Path(meta["path"]).exists()
+
+    def test_process_pool_render(self, session_factory, monkeypatch):
+        """测试在进程池中渲染导出文件"""
+        monkeypatch.setattr(export_job_service.settings, "EXPORT_JOB_WORKERS", 1)
+        try:
+            job = _run_job(session_factory, "csv")
+        finally:
+            export_job_service.shutdown_export_pool()
+        assert job.status == "completed" and job.row_count == 500
+        assert job.filename.endswith(".csv")
@@ -0,0 +1,103 @@
+"""
+文件上传落盘与解析测试
+"""
+import asyncio
+import hashlib
+import io
+import os
+
+import pandas as pd
+import pytest
+from fastapi import UploadFile
+
+from app.services.file_etl import FileETLService
+from app.utils.file_handler import file_sha256, read_file_to_df, spool_upload
+
+
+def _upload(content: bytes, filename: str) -> UploadFile:
+    return UploadFile(file=io.BytesIO(content), filename=filename)
+
+
+class TestSpoolUpload:
+    """测试上传文件分块落盘"""
+
+    def test_spool_and_parse_from_path(self):
+        """测试落盘后从路径解析，退出 with 后删除临时文件"""
+        content = "name,amount\na,1\nb,2\n".encode("utf-8")
+        upload = asyncio.run(spool_upload(_upload(content, "sales.csv"), chunk_size=4))
+        with upload:
+            assert upload.size == len(content)
+            assert upload.sha256 == hashlib.sha256(content).hexdigest() == file_sha256(upload.path)
+            df = FileETLService.parse_file(upload.path, "sales.csv")
+            assert list(df.columns) == ["name", "amount"]
+            assert len(df) == 2
+        assert not os.path.exists(upload.path)
+
+    def test_rejects_oversized_file(self):
+        """测试超过大小限制时中止并清理"""
+        with pytest.raises(ValueError, match="文件大小超过限制"):
+            asyncio.run(spool_upload(_upload(b"x" * 100, "big.csv"), max_size=10, chunk_size=8))
+
+    def test_rejects_unsupported_extension(self):
+        """测试不支持的扩展名在读取前拒绝"""
+        with pytest.raises(ValueError, match="不支持的文件格式"):
+            asyncio.run(spool_upload(_upload(b"a,b", "data.txt"), allowed_extensions={".csv"}))
+
+    def test_rejects_fake_xlsx(self):
+        """测试文件头与扩展名不符时拒绝"""
+        with pytest.raises(ValueError, match="不匹配"):
+            asyncio.run(spool_upload(_upload(b"a,b\n1,2", "data.xlsx")))
+
+    def test_rejects_empty_file(self):
+        """测试空文件"""
+        with pytest.raises(ValueError, match="文件内容为空"):
+            asyncio.run(spool_upload(_upload(b"", "empty.csv")))
+
+
+class TestCsvSniffing:
+    """测试 CSV 编码与格式检测"""
+
+    def test_detects_gbk_semicolon_and_quotes(self):
+        """测试检测 GBK 编码、分号分隔和引号"""
+        content = '名称;金额\n"华东;一区";1\n华南;2\n'.encode("gbk")
+        dialect = FileETLService.sniff_csv(content)
+        assert dialect["encoding"] == "gbk"
+        assert dialect["delimiter"] == ";"
+        assert dialect["has_header"] is True
+
+        df = FileETLService.parse_file(content, "sales.csv")
+        assert list(df.columns) == ["名称", "金额"]
+        assert df["名称"].tolist() == ["华东;一区", "华南"]
+
+    def test_detects_missing_header(self, tmp_path):
+        """测试首行为数据时生成默认列名"""
+        path = tmp_path / "raw.csv"
+        path.write_text("1\t2.5\tx\n2\t3.5\ty\n3\t4.5\tz\n", encoding="utf-8")
+        settings = FileETLService.detect_parse_settings(str(path), "raw.csv")
+        assert settings["delimiter"] == "\t"
+        assert settings["has_header"] is False
+
+        batches = list(FileETLService.iter_file_batches(str(path), "raw.csv", parse_settings=settings))
+        assert list(batches[0].columns) == ["column_1", "column_2", "column_3"]
+        assert len(batches[0]) == 3
+
+    def test_utf8_bom(self):
+        """测试带 BOM 的 UTF-8 文件"""
+        content = "\ufeffid,name\n1,a\n".encode("utf-8")
+        assert FileETLService.sniff_csv(content)["encoding"] == "utf-8-sig"
+        assert list(FileETLService.parse_file(content, "a.csv").columns) == ["id", "name"]
+
+    def test_read_file_to_df_parses_once(self, monkeypatch):
+        """测试直接读取上传文件时按检测到的编码只解析一次，数值列仍转换为数值类型"""
+        calls = []
+        read_csv = pd.read_csv
+
+        def counting_read_csv(*args, **kwargs):
+            calls.append(kwargs.get("encoding"))
+            return read_csv(*args, **kwargs)
+
+        monkeypatch.setattr(pd, "read_csv", counting_read_csv)
+        df = read_file_to_df(_upload("区域;金额\n华东;1\n华南;2\n".encode("gbk"), "sales.csv"))
+        assert calls == ["gbk"]
+        assert list(df.columns) == ["区域", "金额"]
+        assert df["金额"].tolist() == [1, 2]
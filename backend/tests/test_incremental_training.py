@@ -0,0 +1,134 @@
+"""
+增量训练测试
+"""
+import hashlib
+from types import SimpleNamespace
+
+from app.services.vanna.base import VannaLegacyPGVector
+from app.services.vanna.training_service import (
+    LEGACY_EXAMPLE_QA_PATTERNS,
+    LEGACY_OVERVIEW_PATTERN,
+    TRAINING_SOURCE,
+    VannaTrainingService,
+    legacy_term_patterns,
+)
+
+
+class _FakeVanna:
+    """只实现增量训练用到的方法，stored 模拟 collection 中已存储的条目 {doc_id: (source, document)}"""
+
+    _generate_id = VannaLegacyPGVector._generate_id
+    build_ddl_item = VannaLegacyPGVector.build_ddl_item
+    build_documentation_item = VannaLegacyPGVector.build_documentation_item
+    build_question_sql_item = VannaLegacyPGVector.build_question_sql_item
+    diff_training_items = VannaLegacyPGVector.diff_training_items
+
+    def __init__(self, stored=None):
+        self.stored = stored or {}
+        self.embedded = []
+        self.deleted = []
+
+    def get_stored_items(self, collection):
+        return self.stored
+
+    def add_training_items(self, collection, items):
+        self.embedded.extend(item[0] for item in items)
+        for doc_id, content, metadata in items:
+            self.stored[doc_id] = (metadata.get("source"), content)
+
+    def delete_training_items(self, collection, ids):
+        self.deleted.extend(ids)
+        for doc_id in ids:
+            self.stored.pop(doc_id, None)
+
+
+def _md5(content):
+    return hashlib.md5(content.encode("utf-8")).hexdigest()
+
+
+def _sync(vn, items, monkeypatch, **kwargs):
+    monkeypatch.setattr(VannaTrainingService, "_checkpoint_and_check_interrupt", classmethod(lambda *args: None))
+    return VannaTrainingService._sync_training_items(
+        None, 1, vn, SimpleNamespace(), items, label="DDL", progress_start=10, progress_end=40, **kwargs
+    )
+
+
+class TestIncrementalTraining:
+    """测试训练项指纹对比"""
+
+    def test_only_new_items_are_embedded(self, monkeypatch):
+        """测试新增一张表只计算一次 embedding"""
+        vn = _FakeVanna()
+        ddls = [f"CREATE TABLE t{i} (id INT)" for i in range(200)]
+        _sync(vn, [vn.build_ddl_item(ddl, source=TRAINING_SOURCE) for ddl in ddls], monkeypatch)
+        assert len(vn.embedded) == 200
+
+        vn.embedded.clear()
+        ddls.append("CREATE TABLE t200 (id INT)")
+        stats = _sync(vn, [vn.build_ddl_item(ddl, source=TRAINING_SOURCE) for ddl in ddls], monkeypatch)
+        assert vn.embedded == [_md5("CREATE TABLE t200 (id INT)")]
+        assert stats == {"added": 1, "removed": 0, "unchanged": 200}
+
+    def test_changed_and_removed_items_are_deleted(self, monkeypatch):
+        """测试表结构变化和删除的表从 collection 中移除"""
+        vn = _FakeVanna()
+        _sync(vn, [vn.build_ddl_item(ddl, source=TRAINING_SOURCE) for ddl in ["CREATE TABLE a (id INT)", "CREATE TABLE b (id INT)"]], monkeypatch)
+
+        stats = _sync(vn, [vn.build_ddl_item("CREATE TABLE a (id INT, name TEXT)", source=TRAINING_SOURCE)], monkeypatch)
+        assert stats == {"added": 1, "removed": 2, "unchanged": 0}
+        assert set(vn.stored) == {_md5("CREATE TABLE a (id INT, name TEXT)")}
+
+    def test_items_from_other_sources_are_kept(self, monkeypatch):
+        """测试其他途径写入的条目（如用户反馈）不会被删除，旧数据按前缀纳入管理"""
+        vn = _FakeVanna({
+            "feedback": (None, "Question: q\nSQL: SELECT 1"),
+            "legacy_term": (None, "业务术语: 旧\n定义: 旧定义"),
+        })
+        stats = _sync(vn, [], monkeypatch, legacy_prefixes=("业务术语:",))
+        assert stats["removed"] == 1
+        assert set(vn.stored) == {"feedback"}
+
+    def test_remove_stale_disabled(self, monkeypatch):
+        """测试禁用删除时保留过期条目"""
+        vn = _FakeVanna({"old": (TRAINING_SOURCE, "CREATE TABLE old (id INT)")})
+        stats = _sync(vn, [], monkeypatch, remove_stale=False)
+        assert stats["removed"] == 0
+        assert "old" in vn.stored
+
+    def test_legacy_untagged_items_are_migrated(self, monkeypatch):
+        """测试旧的自动示例问答对按模板删除，与期望内容相同的旧条目补上来源标记，用户反馈不受影响"""
+        vn = _FakeVanna()
+        kept = vn.build_question_sql_item("查询 orders 表的所有数据", "SELECT * FROM orders LIMIT 100")
+        old_example = vn.build_question_sql_item("统计 users 表的总数", "SELECT COUNT(*) as total FROM users")
+        feedback = vn.build_question_sql_item("上月销售额", "SELECT SUM(amount) FROM orders")
+        vn.stored = {item[0]: (None, item[1]) for item in (kept, old_example, feedback)}
+
+        desired = [vn.build_question_sql_item(
+            "查询 orders 表的所有数据", "SELECT * FROM orders LIMIT 100", source=TRAINING_SOURCE
+        )]
+        stats = _sync(vn, desired, monkeypatch, legacy_patterns=LEGACY_EXAMPLE_QA_PATTERNS)
+        assert stats == {"added": 1, "removed": 1, "unchanged": 0}
+        assert vn.stored == {kept[0]: (TRAINING_SOURCE, kept[1]), feedback[0]: (None, feedback[1])}
+
+        # 补上标记后再次训练没有变化
+        assert _sync(vn, desired, monkeypatch, legacy_patterns=LEGACY_EXAMPLE_QA_PATTERNS)["unchanged"] == 1
+
+    def test_legacy_documentation_cleanup_keeps_user_documents(self, monkeypatch):
+        """测试旧的自动生成文档按完整内容识别，用户手工添加的同前缀文档不被删除"""
+        vn = _FakeVanna()
+        old_overview = vn.build_documentation_item(
+            "数据库表结构：\n本数据集包含以下表：orders, users\n\n请根据表名和字段名生成 SQL 查询。\n"
+        )
+        old_term = vn.build_documentation_item("业务术语: GMV\n定义: 成交总额")
+        user_overview = vn.build_documentation_item("数据库表结构：orders 按天分区，查询时请带上日期条件")
+        user_term = vn.build_documentation_item("业务术语: 复购率\n定义: 30 天内再次下单的用户占比")
+        vn.stored = {item[0]: (None, item[1]) for item in (old_overview, old_term, user_overview, user_term)}
+
+        desired = [vn.build_documentation_item("业务术语: GMV\n定义: 含退款的成交总额", source=TRAINING_SOURCE)]
+        stats = _sync(
+            vn, desired, monkeypatch,
+            legacy_patterns=(LEGACY_OVERVIEW_PATTERN, *legacy_term_patterns(["GMV"])),
+        )
+        assert stats == {"added": 1, "removed": 2, "unchanged": 0}
+        assert sorted(vn.deleted) == sorted([old_overview[0], old_term[0]])
+        assert user_overview[0] in vn.stored and user_term[0] in vn.stored
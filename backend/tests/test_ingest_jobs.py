@@ -0,0 +1,243 @@
+"""
+异步导入任务测试（SQLite 元数据库 + 临时 DuckDB 目录）
+"""
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.models.base import Base
+from app.models.metadata import Dataset, IngestJob, User
+from app.services import ingest_job_service, job_heartbeat, parallel_ingest
+from app.services.duckdb_service import DuckDBService
+from app.services.ingest_job_service import IngestJobService
+from app.utils.file_handler import SpooledUpload
+
+
+@pytest.fixture
+def session_factory(tmp_path, monkeypatch):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine)
+    monkeypatch.setattr(ingest_job_service, "SessionLocal", factory)
+    monkeypatch.setattr(ingest_job_service.settings, "UPLOAD_TEMP_DIR", str(tmp_path / "tmp"))
+    monkeypatch.setattr(DuckDBService, "STORAGE_ROOT", tmp_path / "duckdb")
+    monkeypatch.setattr(ingest_job_service, "train_uploaded_dataset", lambda *args: None)
+    # 进度回调在解析进程中写入 SessionLocal，测试中用线程池代替 spawn 进程池，使其写入测试数据库
+    pool = ThreadPoolExecutor(max_workers=2)
+    monkeypatch.setattr(parallel_ingest, "get_ingest_pool", lambda: pool)
+
+    db = factory()
+    db.add(User(id=1, username="u1"))
+    db.commit()
+    db.close()
+    yield factory
+    pool.shutdown()
+
+
+def _spooled(tmp_path, name: str, content: bytes) -> SpooledUpload:
+    path = tmp_path / f"spool_{name}"
+    path.write_bytes(content)
+    return SpooledUpload(str(path), name, len(content))
+
+
+class TestIngestJobs:
+    """测试导入任务的执行、失败与重试"""
+
+    def test_job_completes_and_removes_files(self, tmp_path, session_factory):
+        """测试任务完成后创建数据集、进度为 100 并删除落盘文件"""
+        db = session_factory()
+        upload = _spooled(tmp_path, "sales.csv", b"id,amount\n1,2\n3,4\n")
+        job = IngestJobService.create_job(db, 1, "sales", [upload])
+        job_file = job.files[0]["path"]
+        assert os.path.exists(job_file) and not os.path.exists(upload.path)
+
+        asyncio.run(IngestJobService.run(job.id))
+
+        db.expire_all()
+        job = db.get(IngestJob, job.id)
+        data = IngestJobService.to_dict(job)
+        assert data["status"] == "completed"
+        assert data["progress"] == 100
+        assert data["rows_processed"] == 2
+        assert data["files"][0]["table_name"] == "sales"
+        assert db.get(Dataset, job.dataset_id).duckdb_path
+        assert not os.path.exists(job_file)
+        db.close()
+
+    def test_failed_job_can_retry_from_spooled_file(self, tmp_path, session_factory):
+        """测试失败任务保留文件，修复后可重试"""
+        db = session_factory()
+        upload = _spooled(tmp_path, "broken.csv", b"")
+        job = IngestJobService.create_job(db, 1, "broken", [upload])
+
+        asyncio.run(IngestJobService.run(job.id))
+        db.expire_all()
+        job = db.get(IngestJob, job.id)
+        assert job.status == "failed"
+        assert IngestJobService.can_retry(job)
+        assert db.query(Dataset).count() == 0
+
+        with open(job.files[0]["path"], "wb") as f:
+            f.write(b"a\n1\n")
+
+        IngestJobService.retry(db, job)
+        assert job.status == "pending" and job.worker_id is None
+        assert asyncio.run(IngestJobService.run_pending()) == [job.id]
+        db.expire_all()
+        job = db.get(IngestJob, job.id)
+        assert job.status == "completed"
+        assert job.attempts == 2
+        db.close()
+
+    def test_recover_interrupted(self, tmp_path, session_factory):
+        """测试工作进程启动时只回收本实例、心跳超时或迁移前遗留的任务，其他实例正在执行和排队中的任务不受影响"""
+        now = datetime.utcnow()
+        db = session_factory()
+        db.add_all([
+            IngestJob(owner_id=1, dataset_name="legacy", status="running", files=[]),
+            IngestJob(owner_id=1, dataset_name="own", status="running", files=[],
+                      worker_id=job_heartbeat.WORKER_ID, heartbeat_at=now),
+            IngestJob(owner_id=1, dataset_name="stale", status="running", files=[],
+                      worker_id="other:1", heartbeat_at=now - timedelta(hours=1)),
+            IngestJob(owner_id=1, dataset_name="queued", status="pending", files=[]),
+            IngestJob(owner_id=1, dataset_name="alive", status="running", files=[],
+                      worker_id="other:1", heartbeat_at=now),
+        ])
+        db.commit()
+
+        IngestJobService.recover_interrupted()
+
+        db.expire_all()
+        statuses = {job.dataset_name: job.status for job in db.query(IngestJob).all()}
+        assert statuses == {
+            "legacy": "failed", "own": "failed", "stale": "failed", "alive": "running", "queued": "pending"
+        }
+        assert "中断" in db.query(IngestJob).filter(IngestJob.dataset_name == "own").one().error_msg
+        db.close()
+
+    def test_worker_claims_pending_jobs_once(self, tmp_path, session_factory):
+        """测试创建任务只入队，工作进程按创建顺序认领，同一任务不会被重复认领"""
+        db = session_factory()
+        first = IngestJobService.create_job(db, 1, "a", [_spooled(tmp_path, "a.csv", b"id\n1\n")])
+        second = IngestJobService.create_job(db, 1, "b", [_spooled(tmp_path, "b.csv", b"id\n2\n")])
+        assert first.status == second.status == "pending"
+        assert first.worker_id is None
+
+        assert IngestJobService.claim_pending(db, limit=1) == [first.id]
+        assert IngestJobService.claim_pending(db, limit=5, exclude=[second.id]) == []
+        db.expire_all()
+        assert db.get(IngestJob, first.id).status == "running"
+        assert db.get(IngestJob, first.id).worker_id == job_heartbeat.WORKER_ID
+
+        assert asyncio.run(IngestJobService.run_pending()) == [second.id]
+        db.expire_all()
+        assert db.get(IngestJob, second.id).status == "completed"
+        assert IngestJobService.claim_pending(db, limit=5) == []
+        db.close()
+
+    def test_heartbeat_refreshes_while_running(self, session_factory, monkeypatch):
+        """测试任务执行期间定期刷新心跳"""
+        monkeypatch.setattr(ingest_job_service.settings, "JOB_HEARTBEAT_INTERVAL", 0.01)
+        db = session_factory()
+        job = IngestJob(owner_id=1, dataset_name="x", status="running", files=[],
+                        worker_id="w", heartbeat_at=datetime(2000, 1, 1))
+        db.add(job)
+        db.commit()
+
+        async def work():
+            async with job_heartbeat.heartbeat(session_factory, IngestJob, job.id):
+                await asyncio.sleep(0.1)
+
+        asyncio.run(work())
+        db.expire_all()
+        assert db.get(IngestJob, job.id).heartbeat_at > datetime.utcnow() - timedelta(seconds=5)
+        db.close()
+
+
+class TestAppendToDataset:
+    """测试向已有数据集追加数据"""
+
+    def test_append_bumps_data_version(self, tmp_path, session_factory):
+        """测试追加成功后数据版本递增，表结构不兼容时版本不变"""
+        db = session_factory()
+        job = IngestJobService.create_job(db, 1, "sales", [_spooled(tmp_path, "sales.csv", b"id,amount\n1,2\n")])
+        asyncio.run(IngestJobService.run(job.id))
+        db.expire_all()
+        dataset = db.get(Dataset, db.get(IngestJob, job.id).dataset_id)
+        assert dataset.data_version == 1
+
+        path = tmp_path / "more.csv"
+        path.write_bytes(b"id,amount\n1,5\n2,6\n")
+        stats = ingest_job_service.append_to_dataset(db, dataset, "sales", str(path), "more.csv", ["id"])
+        assert (stats["inserted"], stats["updated"], stats["data_version"]) == (1, 1, 2)
+
+        path.write_bytes(b"id,amount\n3,abc\n")
+        with pytest.raises(ValueError, match="不兼容"):
+            ingest_job_service.append_to_dataset(db, dataset, "sales", str(path), "more.csv")
+        with pytest.raises(ValueError, match="表不存在"):
+            ingest_job_service.append_to_dataset(db, dataset, "other", str(path), "more.csv")
+        db.refresh(dataset)
+        assert dataset.data_version == 2
+        db.close()
+
+
+class TestUploadDeduplication:
+    """测试按内容指纹复用重复上传"""
+
+    def _run_job(self, tmp_path, factory, name: str, content: bytes, **options):
+        db = factory()
+        job = IngestJobService.create_job(
+            db, 1, name, [_spooled(tmp_path, "sales.csv", content)], options=options
+        )
+        asyncio.run(IngestJobService.run(job.id))
+        db.expire_all()
+        job = db.get(IngestJob, job.id)
+        data = IngestJobService.to_dict(job)
+        db.close()
+        return data
+
+    def _mark_trained(self, factory, dataset_id: int):
+        db = factory()
+        db.get(Dataset, dataset_id).status = "completed"
+        db.commit()
+        db.close()
+
+    def test_reuses_trained_dataset_with_same_content(self, tmp_path, session_factory, monkeypatch):
+        """测试开启复用后相同内容重复上传时复用已训练的数据集，不再导入和训练"""
+        first = self._run_job(tmp_path, session_factory, "v1", b"id,amount\n1,2\n3,4\n")
+        assert first["reused"] is False
+        self._mark_trained(session_factory, first["dataset_id"])
+
+        trained = []
+        monkeypatch.setattr(ingest_job_service, "train_uploaded_dataset", lambda *args: trained.append(args))
+        second = self._run_job(tmp_path, session_factory, "v2", b"id,amount\n1,2\n3,4\n", reuse_existing=True)
+
+        assert second["reused"] is True
+        assert second["dataset_id"] == first["dataset_id"]
+        assert second["files"][0]["rows"] == 2
+        assert trained == []
+        db = session_factory()
+        assert db.query(Dataset).count() == 1
+        db.close()
+
+    def test_different_content_or_opt_out_imports(self, tmp_path, session_factory):
+        """测试内容不同、未训练完成或未开启复用（默认）时导入为新数据集"""
+        first = self._run_job(tmp_path, session_factory, "v1", b"id,amount\n1,2\n")
+        # 尚未训练完成的数据集不复用
+        assert self._run_job(
+            tmp_path, session_factory, "v2", b"id,amount\n1,2\n", reuse_existing=True
+        )["reused"] is False
+        self._mark_trained(session_factory, first["dataset_id"])
+
+        assert self._run_job(
+            tmp_path, session_factory, "v3", b"id,amount\n1,3\n", reuse_existing=True
+        )["reused"] is False
+        by_default = self._run_job(tmp_path, session_factory, "v4", b"id,amount\n1,2\n")
+        assert by_default["reused"] is False
+        assert by_default["dataset_id"] != first["dataset_id"]
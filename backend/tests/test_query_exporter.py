@@ -0,0 +1,182 @@
+"""
+查询结果流式导出测试
+"""
+import asyncio
+import io
+import sqlite3
+from decimal import Decimal
+
+import duckdb
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, text
+
+from app.core.config import settings
+from app.services.enhanced_exporter import EnhancedExporter
+from app.services.query_exporter import QueryExporter, _column_array
+
+
+@pytest.fixture
+def duckdb_target(tmp_path):
+    path = str(tmp_path / "dataset.db")
+    conn = duckdb.connect(path)
+    conn.execute("CREATE TABLE orders AS SELECT range AS id, '订单' || range AS name FROM range(10000)")
+    conn.close()
+    return {"duckdb_path": path, "engine": None}
+
+
+def _read_csv(chunks) -> pd.DataFrame:
+    data = b"".join(chunks)
+    assert data.startswith(b"\xef\xbb\xbf")
+    return pd.read_csv(io.BytesIO(data), encoding="utf-8-sig")
+
+
+class TestQueryExporter:
+    """测试服务端重新执行 SQL 分块导出"""
+
+    def test_validate_sql(self):
+        """测试只允许单条只读查询"""
+        assert QueryExporter.validate_sql(" SELECT 1; ") == "SELECT 1"
+        assert QueryExporter.validate_sql("WITH t AS (SELECT 1 AS a) SELECT a FROM t")
+        assert QueryExporter.validate_sql("SELECT 'drop table x' AS note")
+        for sql in ("", "DELETE FROM orders", "DROP TABLE orders", "SELECT 1; DROP TABLE orders",
+                    "WITH d AS (DELETE FROM orders RETURNING *) SELECT * FROM d"):
+            with pytest.raises(ValueError):
+                QueryExporter.validate_sql(sql)
+
+    def test_duckdb_chunks(self, duckdb_target):
+        """测试 DuckDB 结果按块读取，CSV 只在第一块输出表头"""
+        frames = list(QueryExporter.iter_frames(duckdb_target, "SELECT * FROM orders ORDER BY id", batch_rows=2048))
+        assert len(frames) == 5
+        assert max(len(frame) for frame in frames) == 2048
+
+        chunks = list(QueryExporter.open_csv_stream(duckdb_target, "SELECT * FROM orders ORDER BY id"))
+        df = _read_csv(chunks)
+        assert len(df) == 10000
+        assert df["id"].tolist() == list(range(10000))
+        assert df["name"].iloc[-1] == "订单9999"
+
+    def test_empty_result_keeps_header(self, duckdb_target):
+        """测试结果为空时仍输出表头"""
+        df = _read_csv(QueryExporter.open_csv_stream(duckdb_target, "SELECT * FROM orders WHERE id < 0"))
+        assert list(df.columns) == ["id", "name"]
+        assert len(df) == 0
+
+    def test_sql_error_raised_before_streaming(self, duckdb_target):
+        """测试 SQL 错误在返回字节流之前抛出"""
+        with pytest.raises(duckdb.Error):
+            QueryExporter.open_csv_stream(duckdb_target, "SELECT * FROM missing")
+
+    def test_sqlalchemy_partitions(self, tmp_path):
+        """测试传统数据源通过服务端游标分块读取"""
+        engine = create_engine(f"sqlite:///{tmp_path / 'source.db'}")
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE sales (id INTEGER, note TEXT)"))
+            conn.execute(text("INSERT INTO sales VALUES (:id, :note)"),
+                         [{"id": i, "note": f"{i}%"} for i in range(25)])
+        target = {"duckdb_path": None, "engine": engine}
+
+        frames = list(QueryExporter.iter_frames(target, "SELECT * FROM sales ORDER BY id", batch_rows=10))
+        assert [len(frame) for frame in frames] == [10, 10, 5]
+
+        df = QueryExporter.fetch_all(target, "SELECT * FROM sales WHERE note LIKE '1%' ORDER BY id")
+        assert df["id"].tolist() == [1] + list(range(10, 20))
+
+        empty = list(QueryExporter.iter_frames(target, "SELECT * FROM sales WHERE id < 0"))
+        assert len(empty) == 1 and list(empty[0].columns) == ["id", "note"]
+
+
+class TestColumnarExport:
+    """测试 Parquet / Arrow IPC 导出"""
+
+    def test_duckdb_parquet_and_arrow(self, duckdb_target):
+        """测试 DuckDB 数据集直接写出 Parquet 和 Arrow IPC 文件，SQL 末尾的行注释不影响 COPY"""
+        pa = pytest.importorskip("pyarrow")
+        import pyarrow.parquet as pq
+
+        output, rows = QueryExporter.open_columnar(
+            duckdb_target, "SELECT * FROM orders ORDER BY id -- 全部订单", "parquet"
+        )
+        with output:
+            table = pq.read_table(io.BytesIO(output.read()))
+        assert rows == 10000 and table.num_rows == 10000
+        assert table.column_names == ["id", "name"]
+        assert table.column("name")[-1].as_py() == "订单9999"
+
+        output, rows = QueryExporter.open_columnar(duckdb_target, "SELECT * FROM orders WHERE id < 3", "arrow")
+        with output:
+            table = pa.ipc.open_file(pa.BufferReader(output.read())).read_all()
+        assert rows == 3 and table.column("id").to_pylist() == [0, 1, 2]
+
+        with pytest.raises(duckdb.Error):
+            QueryExporter.open_columnar(duckdb_target, "SELECT * FROM missing", "parquet")
+
+    def test_sqlalchemy_record_batches(self, tmp_path, monkeypatch):
+        """测试传统数据源按列构造 RecordBatch，第一块中全部为空的列按字符串导出"""
+        pa = pytest.importorskip("pyarrow")
+        import pyarrow.parquet as pq
+
+        engine = create_engine(f"sqlite:///{tmp_path / 'source.db'}")
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE sales (id INTEGER, amount REAL, memo TEXT)"))
+            conn.execute(text("INSERT INTO sales VALUES (:id, :amount, :memo)"),
+                         [{"id": i, "amount": i * 1.5, "memo": None if i < 10 else i} for i in range(25)])
+        target = {"duckdb_path": None, "engine": engine}
+
+        path = tmp_path / "sales.parquet"
+        monkeypatch.setattr(settings, "EXPORT_BATCH_ROWS", 10)
+        assert QueryExporter.write_columnar(target, "SELECT * FROM sales ORDER BY id", "parquet", path) == 25
+        table = pq.read_table(path)
+        assert table.schema.field("id").type == pa.int64()
+        assert table.schema.field("memo").type == pa.string()
+        assert table.column("memo").to_pylist()[9:11] == [None, "10"]
+
+        path = tmp_path / "empty.arrow"
+        assert QueryExporter.write_columnar(target, "SELECT id FROM sales WHERE id < 0", "arrow", path) == 0
+        assert pa.ipc.open_file(str(path)).read_all().column_names == ["id"]
+
+    def test_later_batches_with_wider_values(self, tmp_path, monkeypatch):
+        """测试后续批次出现更宽的小数或不同类型的值时，按放宽后的 schema 导出"""
+        pa = pytest.importorskip("pyarrow")
+        import pyarrow.parquet as pq
+
+        # NUMERIC 亲和性的 MONEY 列通过转换器读取为 Decimal
+        monkeypatch.setitem(sqlite3.converters, "MONEY", lambda raw: Decimal(raw.decode()))
+        engine = create_engine(f"sqlite:///{tmp_path / 'source.db'}",
+                               connect_args={"detect_types": sqlite3.PARSE_DECLTYPES})
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE prices (id INTEGER, price MONEY, tag)"))
+            conn.execute(text("INSERT INTO prices VALUES (:id, :price, :tag)"), [
+                {"id": 1, "price": "99.5", "tag": "a"},
+                {"id": 2, "price": "12.25", "tag": "b"},
+                {"id": 3, "price": "12345.678", "tag": 3},
+            ])
+        target = {"duckdb_path": None, "engine": engine}
+
+        path = tmp_path / "prices.parquet"
+        monkeypatch.setattr(settings, "EXPORT_BATCH_ROWS", 2)
+        assert QueryExporter.write_columnar(target, "SELECT * FROM prices ORDER BY id", "parquet", path) == 3
+        table = pq.read_table(path)
+        assert table.schema.field("price").type == pa.decimal128(38, 10)
+        assert table.column("price").to_pylist() == [Decimal("99.5"), Decimal("12.25"), Decimal("12345.678")]
+        assert table.column("tag").to_pylist() == ["a", "b", "3"]
+
+        # 小数位数超过 schema 时四舍五入，无法安全转换的值报错而不是写出错误的数据
+        rounded = _column_array(pa.field("p", pa.decimal128(38, 2)), [Decimal("1.005"), None])
+        assert rounded.to_pylist() == [Decimal("1.00"), None]
+        with pytest.raises(ValueError, match="不一致"):
+            _column_array(pa.field("n", pa.int64()), [1.5])
+
+    def test_rows_export(self):
+        """测试按 rows 导出的接口生成 Parquet，列顺序与 columns 一致"""
+        pytest.importorskip("pyarrow")
+        import pyarrow.parquet as pq
+
+        content, filename = asyncio.run(EnhancedExporter.export_with_metadata(
+            question="q", sql=None, columns=["b", "a"], rows=[{"a": 1, "b": "x"}, {"a": 2, "b": None}],
+            chart_type="table", export_format="parquet",
+        ))
+        assert filename.endswith(".parquet")
+        table = pq.read_table(io.BytesIO(content))
+        assert table.column_names == ["b", "a"]
+        assert table.column("a").to_pylist() == [1, 2]
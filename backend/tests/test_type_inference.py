@@ -0,0 +1,95 @@
+"""
+上传文件列类型推断测试
+"""
+from decimal import Decimal
+
+import pandas as pd
+from sqlalchemy import BigInteger, Date, DateTime, Float, Integer, Numeric, String
+
+from app.services.file_etl import FileETLService
+
+
+class TestInferColumnKind:
+    """测试基于样本的列类型推断"""
+
+    def test_numeric_text(self):
+        """测试文本形式的整数、定点数和浮点数"""
+        assert FileETLService.infer_column_kind(pd.Series(["1", "-2", "+30"])) == "integer"
+        assert FileETLService.infer_column_kind(pd.Series(["1.50", "20.05", None])) == "decimal"
+        assert FileETLService.infer_column_kind(pd.Series(["1.123456", "2e3"])) == "float"
+
+    def test_leading_zero_codes_stay_text(self):
+        """测试带前导零的编码（邮编、工号）保持文本，不丢失前导零；0 和 0.5 仍为数值"""
+        assert FileETLService.infer_column_kind(pd.Series(["00123", "45678", "1"])) == "text"
+        assert FileETLService.infer_column_kind(pd.Series(["0", "10", "-3"])) == "integer"
+        assert FileETLService.infer_column_kind(pd.Series(["0.5", "1.25"])) == "decimal"
+        # 样本之外出现带前导零的值时不转换
+        series = pd.Series(["1", "2", "007"])
+        assert FileETLService.coerce_column(series, "integer").tolist() == ["1", "2", "007"]
+
+        df = FileETLService.parse_file("zip,n\n00123,1\n10001,2\n".encode("utf-8"), "codes.csv")
+        assert df["zip"].tolist() == ["00123", "10001"]
+        assert str(df["n"].dtype) == "int64"
+
+    def test_integer_with_missing_values(self):
+        """测试含缺失值的整数列（pandas 读为浮点数）仍推断为整数"""
+        series = pd.Series([1.0, None, 3.0])
+        assert FileETLService.infer_column_kind(series) == "integer"
+        assert str(FileETLService.coerce_column(series, "integer").dtype) == "Int64"
+
+    def test_dates_and_timestamps(self):
+        """测试日期与时间戳"""
+        assert FileETLService.infer_column_kind(pd.Series(["2024-01-01", "2024-02-15"])) == "date"
+        assert FileETLService.infer_column_kind(pd.Series(["2024-01-01 08:30:00", "2024-01-02 09:00:00"])) == "timestamp"
+        # 编码类文本不应被误判为日期
+        assert FileETLService.infer_column_kind(pd.Series(["A001", "B002"])) == "text"
+
+    def test_low_cardinality_category(self):
+        """测试低基数文本列识别为分类列"""
+        series = pd.Series(["华东", "华南", "华北"] * 100)
+        assert FileETLService.infer_column_kind(series) == "category"
+        assert FileETLService.infer_column_kind(series, categorical=False) == "text"
+
+    def test_coerce_keeps_text_when_values_outside_sample_fail(self):
+        """测试样本之外出现无法转换的值时保留原列"""
+        series = pd.Series(["1", "2", "n/a-value"])
+        result = FileETLService.coerce_column(series, "integer")
+        assert result.tolist() == ["1", "2", "n/a-value"]
+
+
+class TestTypedParsing:
+    """测试解析结果保留类型"""
+
+    def test_parse_file_keeps_types(self):
+        """测试解析后数值和日期列保持类型，缺失值不被填充为空字符串"""
+        content = "id,amount,day,region\n1,10.50,2024-01-01,华东\n2,,2024-01-02,华南\n".encode("utf-8")
+        df = FileETLService.parse_file(content, "sales.csv")
+
+        assert str(df["id"].dtype) == "int64"
+        assert df.loc[0, "amount"] == Decimal("10.50")
+        assert pd.isna(df.loc[1, "amount"])
+        assert pd.api.types.is_datetime64_any_dtype(df["day"])
+
+    def test_decimal_keeps_precision(self):
+        """测试定点数保留为 Decimal，超过 15 位有效数字不丢失精度"""
+        content = "id,amount\n1,12345678901234567.1234\n2,0.0001\n".encode("utf-8")
+        df = FileETLService.parse_file(content, "big.csv")
+        assert df["amount"].tolist() == [Decimal("12345678901234567.1234"), Decimal("0.0001")]
+        assert isinstance(FileETLService.infer_sql_type(df["amount"]), Numeric)
+
+    def test_sql_types(self):
+        """测试 SQL 类型映射"""
+        assert FileETLService.infer_sql_type(pd.Series([1, 2])) is Integer
+        assert FileETLService.infer_sql_type(pd.Series([1, 2 ** 40])) is BigInteger
+        assert isinstance(FileETLService.infer_sql_type(pd.Series(["1.25", "3.50"])), Numeric)
+        assert FileETLService.infer_sql_type(pd.Series([0.1, 0.25])) is Float
+        assert FileETLService.infer_sql_type(pd.to_datetime(pd.Series(["2024-01-01"]))) is Date
+        assert FileETLService.infer_sql_type(pd.to_datetime(pd.Series(["2024-01-01 10:00"]))) is DateTime
+        assert isinstance(FileETLService.infer_sql_type(pd.Series(["a", "b"])), String)
+
+    def test_preview_is_json_safe(self):
+        """测试预览数据中的缺失值为 None"""
+        content = "id,amount\n1,\n2,3.5\n".encode("utf-8")
+        preview = FileETLService.preview_excel(content, "a.csv")
+        assert preview["preview_data"][0]["amount"] is None
+        assert preview["fields"][1]["field_type"] == "number"
@@ -0,0 +1,83 @@
+"""
+进程内向量索引测试
+"""
+import contextlib
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+from app.services.vanna import vector_index
+from app.services.vanna.vector_index import InMemoryVectorIndex
+
+
+class _EmptyStore:
+    """最小化的 PGVector 替身：collection 不存在，加载结果为空"""
+    collection_name = "vec_ds_test_ddl"
+    EmbeddingStore = None
+
+    def session_maker(self):
+        return contextlib.nullcontext(None)
+
+    def get_collection(self, session):
+        return None
+
+
+def _build_index(vectors, hnsw_threshold=5000):
+    index = InMemoryVectorIndex(_EmptyStore(), hnsw_threshold=hnsw_threshold, ttl=0)
+    index.ensure_loaded()
+    for i, vec in enumerate(vectors):
+        index.upsert(f"id_{i}", Document(page_content=f"doc_{i}", metadata={"id": f"id_{i}"}), vec)
+    return index
+
+
+class TestInMemoryVectorIndex:
+    """测试内存向量索引"""
+
+    def test_search_returns_nearest_by_cosine(self):
+        """测试按余弦相似度返回 top-k"""
+        index = _build_index([[1, 0, 0], [0, 1, 0], [0.9, 0.1, 0], [0, 0, 1]])
+        results = index.search([1, 0, 0], k=2)
+        assert [doc.page_content for doc in results] == ["doc_0", "doc_2"]
+
+    def test_upsert_replaces_existing_id(self):
+        """测试相同 ID 覆盖写入"""
+        index = _build_index([[1, 0], [0, 1]])
+        index.upsert("id_0", Document(page_content="doc_0_v2"), [0, 1])
+        assert index.size == 2
+        contents = {doc.page_content for doc in index.search([0, 1], k=2)}
+        assert contents == {"doc_0_v2", "doc_1"}
+
+    def test_remove_excludes_document(self):
+        """测试删除后不再被检索到"""
+        index = _build_index([[1, 0], [0, 1]])
+        assert index.remove("id_0") is True
+        assert index.remove("missing") is False
+        results = index.search([1, 0], k=5)
+        assert [doc.page_content for doc in results] == ["doc_1"]
+
+    def test_upsert_ignored_before_load(self):
+        """测试未加载时写入被忽略（由懒加载从 PGVector 读取）"""
+        index = InMemoryVectorIndex(_EmptyStore(), ttl=0)
+        index.upsert("id_0", Document(page_content="doc_0"), [1, 0])
+        assert not index.is_loaded
+        assert index.size == 0
+
+    def test_capacity_growth(self):
+        """测试超过初始容量后自动扩容"""
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(200, 8))
+        index = _build_index(vectors)
+        assert index.size == 200
+        assert index.search(vectors[123], k=1)[0].page_content == "doc_123"
+
+    @pytest.mark.skipif(vector_index.hnswlib is None, reason="hnswlib not installed")
+    def test_hnsw_backend_above_threshold(self):
+        """测试超过阈值后切换到 HNSW 并保持检索结果正确"""
+        rng = np.random.default_rng(1)
+        vectors = rng.normal(size=(300, 16))
+        index = _build_index(vectors, hnsw_threshold=100)
+        assert index._hnsw is not None
+        assert index.search(vectors[250], k=1)[0].page_content == "doc_250"
+        index.remove("id_250")
+        assert all(doc.page_content != "doc_250" for doc in index.search(vectors[250], k=3))
@@ -0,0 +1,45 @@
+"""
+启动预热测试
+"""
+import asyncio
+
+from app.core.config import settings
+from app.services.warmup_service import WarmupService
+
+
+class TestWarmupService:
+    """测试预热状态与就绪检查"""
+
+    def test_disabled_is_ready(self, monkeypatch):
+        """测试未启用预热时直接就绪"""
+        monkeypatch.setattr(settings, "WARMUP_ENABLED", False)
+        asyncio.run(WarmupService.run())
+        assert WarmupService.is_ready()
+        assert WarmupService.get_status()["state"] == "disabled"
+
+    def test_not_ready_until_finished(self, monkeypatch):
+        """测试预热执行期间未就绪，完成后就绪"""
+        monkeypatch.setattr(settings, "WARMUP_ENABLED", True)
+        observed = {}
+
+        def fake_warmup():
+            observed["ready_during_warmup"] = WarmupService.is_ready()
+
+        monkeypatch.setattr(WarmupService, "_warmup", fake_warmup)
+        asyncio.run(WarmupService.run())
+        assert observed["ready_during_warmup"] is False
+        assert WarmupService.get_status()["state"] == "completed"
+        assert WarmupService.is_ready()
+
+    def test_failure_still_ready(self, monkeypatch):
+        """测试预热失败不阻止服务就绪"""
+        monkeypatch.setattr(settings, "WARMUP_ENABLED", True)
+
+        def failing_warmup():
+            raise RuntimeError("model download failed")
+
+        monkeypatch.setattr(WarmupService, "_warmup", failing_warmup)
+        asyncio.run(WarmupService.run())
+        status = WarmupService.get_status()
+        assert status["ready"] and status["state"] == "failed"
+        assert "model download failed" in status["errors"][0]
@@ -30,6 +30,9 @@ export interface ChatResponse {
   data_interpretation?: DataInterpretation  // 数据解读
   fluctuation_analysis?: FluctuationAnalysis  // 波动归因
   followup_questions?: string[]  // 后续推荐问题
+  total_rows?: number  // 查询结果总行数
+  downsample_method?: string | null  // 图表数据降采样方法
+  export_sql?: string | null  // 导出完整结果使用的 SQL（未自动追加 LIMIT）
 }
 
 export interface SummaryRequest {
@@ -106,6 +109,7 @@ export const submitFeedback = async (data: FeedbackRequest): Promise<FeedbackRes
 export interface ExportRequest {
   dataset_id: number
   question: string
+  sql?: string  // 提供时后端重新执行 SQL 导出完整结果，忽略 columns / rows
   columns: string[]
   rows: any[]
 }
@@ -161,6 +165,7 @@ export const suggestFollowup = async (data: FollowupSuggestRequest): Promise<Fol
 export interface EnhancedExportRequest {
   question: string
   sql?: string
+  dataset_id?: number  // 与 sql 一起提供时后端重新执行 SQL 导出完整结果
   columns: string[]
   rows: any[]
   chart_type: string
@@ -168,7 +173,7 @@ export interface EnhancedExportRequest {
   insight?: string
   data_interpretation?: DataInterpretation
   fluctuation_analysis?: FluctuationAnalysis
-  format: 'excel' | 'excel_with_chart' | 'pdf' | 'csv'
+  format: 'excel' | 'excel_with_chart' | 'pdf' | 'csv' | 'parquet' | 'arrow'
 }
 
 export const exportEnhanced = async (data: EnhancedExportRequest): Promise<Blob> => {
@@ -177,3 +182,35 @@ export const exportEnhanced = async (data: EnhancedExportRequest): Promise<Blob>
   })
   return response as unknown as Blob
 }
+
+// 异步导出任务（大结果的 PDF / Excel 在后台渲染，完成后下载）
+export interface ExportJob {
+  job_id: number
+  status: 'pending' | 'running' | 'completed' | 'failed'
+  format: string
+  dataset_id?: number
+  filename?: string
+  row_count?: number
+  size_bytes?: number
+  from_cache: boolean
+  download_ready: boolean
+  error_msg?: string
+  created_at?: string
+  started_at?: string
+  finished_at?: string
+}
+
+export const createExportJob = async (data: EnhancedExportRequest & { sql: string; dataset_id: number }): Promise<ExportJob> => {
+  return await http.post<ExportJob, EnhancedExportRequest>('/chat/export-jobs', data)
+}
+
+export const getExportJob = async (jobId: number): Promise<ExportJob> => {
+  return await http.get<ExportJob, any>(`/chat/export-jobs/${jobId}`)
+}
+
+export const downloadExportJob = async (jobId: number): Promise<Blob> => {
+  const response = await http.get(`/chat/export-jobs/${jobId}/download`, {
+    responseType: 'blob'
+  })
+  return response as unknown as Blob
+}